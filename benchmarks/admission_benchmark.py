@@ -0,0 +1,147 @@
+# benchmarks/admission_benchmark.py
+
+"""
+Load test of admission control with a simulated slow model.
+
+The fake model takes 200-400ms per call and, like the real quota, fails with
+a 429 when more than QUOTA calls are in flight. One user fires a burst of
+requests at once while ordinary users send a request about every second.
+Without admission control every request goes straight to the model; with it,
+requests pass the per-user token bucket and take a per-model slot from the
+fair queue. A second run sends a flash crowd of distinct users at once, which
+fills the queue and exercises deadline-aware rejection. Per class of user the
+benchmark reports completed requests, local 429s (with Retry-After), upstream
+429s and latency, followed by the controller's queue metrics:
+
+    python -m benchmarks.admission_benchmark
+"""
+
+import asyncio
+import random
+import time
+
+from benchmarks.common import print_table, summarize
+from functions.services.admission_control import AdmissionController, AdmissionRejected
+
+QUOTA = 8
+MODEL = "fake-pro"
+BURST_REQUESTS = 150
+NORMAL_USERS = 20
+NORMAL_REQUESTS_EACH = 5
+CROWD_USERS = 120
+
+
+class _UpstreamQuotaError(Exception):
+    pass
+
+
+class _SlowModel:
+    def __init__(self, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.in_flight = 0
+
+    async def generate(self, prompt: str) -> str:
+        self.in_flight += 1
+        try:
+            if self.in_flight > QUOTA:
+                await asyncio.sleep(0.02)
+                raise _UpstreamQuotaError("429 quota exceeded")
+            await asyncio.sleep(self.rng.uniform(0.2, 0.4))
+            return "ok"
+        finally:
+            self.in_flight -= 1
+
+
+async def _request(uid: str, model: _SlowModel, controller: AdmissionController | None, outcomes: dict) -> None:
+    started = time.perf_counter()
+    try:
+        if controller is None:
+            await model.generate("prompt")
+        else:
+            controller.admit(uid)
+            async with controller.model_slot(MODEL):
+                await model.generate("prompt")
+        outcomes["ok"].append(time.perf_counter() - started)
+    except AdmissionRejected:
+        outcomes["rejected"] += 1
+    except _UpstreamQuotaError:
+        outcomes["upstream_429"] += 1
+
+
+async def _run(controller: AdmissionController | None) -> dict:
+    model = _SlowModel()
+    rng = random.Random(1)
+    outcomes = {name: {"ok": [], "rejected": 0, "upstream_429": 0} for name in ("burst user", "normal users")}
+    tasks = [
+        asyncio.create_task(_request("spammer", model, controller, outcomes["burst user"]))
+        for _ in range(BURST_REQUESTS)
+    ]
+
+    async def _normal_user(uid: str) -> None:
+        for _ in range(NORMAL_REQUESTS_EACH):
+            await asyncio.sleep(rng.uniform(0.5, 1.5))
+            tasks.append(asyncio.create_task(_request(uid, model, controller, outcomes["normal users"])))
+
+    await asyncio.gather(*(_normal_user(f"user-{i}") for i in range(NORMAL_USERS)))
+    await asyncio.gather(*tasks)
+    return outcomes
+
+
+async def _crowd(controller: AdmissionController | None) -> dict:
+    model = _SlowModel()
+    outcomes = {"ok": [], "rejected": 0, "upstream_429": 0}
+    await asyncio.gather(*(_request(f"crowd-{i}", model, controller, outcomes) for i in range(CROWD_USERS)))
+    return outcomes
+
+
+def _controller() -> AdmissionController:
+    return AdmissionController(
+        user_rate=1.0, user_burst=5, model_max_in_flight={MODEL: QUOTA},
+        max_queued=100, max_wait_seconds=3.0, expected_call_seconds=0.3,
+    )
+
+
+def _row(result: dict) -> dict:
+    total = len(result["ok"]) + result["rejected"] + result["upstream_429"]
+    return summarize(result["ok"]) | {
+        "completed": f"{len(result['ok'])}/{total}",
+        "local_429": result["rejected"],
+        "upstream_429": result["upstream_429"],
+    }
+
+
+def _queue_summary(controller: AdmissionController) -> str:
+    stats = controller.stats()
+    model = stats["models"][MODEL]
+    return (
+        f"Queue: max depth {model['max_queued_seen']}, wait p50 {model['wait_p50_ms']:.0f}ms, "
+        f"p95 {model['wait_p95_ms']:.0f}ms, rejected {model['rejected']}, rate limited {stats['rate_limited']}"
+    )
+
+
+async def main() -> None:
+    columns = ["completed", "local_429", "upstream_429", "p50_ms", "p95_ms"]
+    controller = _controller()
+    rows = {}
+    for mode, admission in (("no admission control", None), ("admission control", controller)):
+        for name, result in (await _run(admission)).items():
+            rows[f"{mode}: {name}"] = _row(result)
+    print_table(
+        f"{BURST_REQUESTS}-request burst from one user + {NORMAL_USERS} users x {NORMAL_REQUESTS_EACH} requests "
+        f"(model quota {QUOTA} in flight)",
+        rows,
+        columns,
+    )
+    print(_queue_summary(controller))
+
+    controller = _controller()
+    rows = {
+        "no admission control": _row(await _crowd(None)),
+        "admission control": _row(await _crowd(controller)),
+    }
+    print_table(f"Flash crowd: {CROWD_USERS} users at once (3s deadline)", rows, columns)
+    print(_queue_summary(controller))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
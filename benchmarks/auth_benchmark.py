@@ -0,0 +1,124 @@
+# benchmarks/auth_benchmark.py
+
+"""
+Compares Firebase ID-token verification latency for the current path
+(a synchronous signature check on the event loop for every request, which is
+what `firebase_admin.auth.verify_id_token` does once its certificates are
+cached) against `FirebaseTokenVerifier` (thread-offloaded checks plus a
+decoded-token cache).
+
+Signing keys and tokens are generated locally, so no network access or
+Firebase project is needed:
+
+    python -m benchmarks.auth_benchmark
+"""
+
+import asyncio
+import datetime
+import time
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from google.auth import crypt, jwt
+
+from benchmarks.common import print_table, run_concurrently, summarize
+from functions.services.token_service import FIREBASE_ISSUER_PREFIX, FirebaseTokenVerifier
+
+PROJECT_ID = "careerpilot-benchmark"
+KEY_ID = "benchmark-key"
+TOTAL_REQUESTS = 2000
+CONCURRENCY = 50
+SESSIONS = 50
+# Simulated downstream work per request, so event-loop blocking shows up in latency.
+HANDLER_AWAIT_SECONDS = 0.002
+
+
+def generate_signing_material() -> tuple[crypt.RSASigner, dict[str, str]]:
+    """Creates an RSA key pair and a self-signed certificate, like the ones Google publishes."""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken.benchmark")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(private_key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(private_key, hashes.SHA256())
+    )
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    signer = crypt.RSASigner.from_string(private_pem, key_id=KEY_ID)
+    certs = {KEY_ID: certificate.public_bytes(serialization.Encoding.PEM).decode("utf-8")}
+    return signer, certs
+
+
+def make_token(signer: crypt.RSASigner, uid: str) -> str:
+    """Signs a Firebase-shaped ID token for `uid`."""
+    now = int(time.time())
+    payload = {
+        "iss": FIREBASE_ISSUER_PREFIX + PROJECT_ID,
+        "aud": PROJECT_ID,
+        "sub": uid,
+        "email": f"{uid}@example.com",
+        "iat": now,
+        "exp": now + 3600,
+        "auth_time": now,
+    }
+    return jwt.encode(signer, payload).decode("utf-8")
+
+
+class LocalKeyVerifier(FirebaseTokenVerifier):
+    """Serves the locally generated certificate instead of calling Google."""
+
+    def __init__(self, certs: dict[str, str]):
+        super().__init__(project_id=PROJECT_ID)
+        self._local_certs = certs
+
+    def _fetch_certs(self) -> tuple[dict[str, str], int]:
+        return self._local_certs, 3600
+
+
+async def run_scenario(verify, tokens: list[str]) -> dict:
+    """Drives TOTAL_REQUESTS authenticated 'requests' and summarizes their latency."""
+    async def _request(i: int) -> None:
+        claims = await verify(tokens[i % len(tokens)])
+        assert claims["uid"]
+        await asyncio.sleep(HANDLER_AWAIT_SECONDS)
+
+    latencies, wall = await run_concurrently(_request, TOTAL_REQUESTS, CONCURRENCY)
+    return summarize(latencies, wall)
+
+
+async def main() -> None:
+    signer, certs = generate_signing_material()
+    session_tokens = [make_token(signer, f"user-{i}") for i in range(SESSIONS)]
+    unique_tokens = [make_token(signer, f"user-{i}") for i in range(TOTAL_REQUESTS)]
+
+    async def current_path(token: str) -> dict:
+        # The existing dependency verifies synchronously inside the coroutine.
+        claims = jwt.decode(token, certs=certs, audience=PROJECT_ID)
+        claims["uid"] = claims["sub"]
+        return claims
+
+    rows = {
+        "current (sync, session tokens)": await run_scenario(current_path, session_tokens),
+        "verifier (unique tokens)": await run_scenario(LocalKeyVerifier(certs).verify, unique_tokens),
+        "verifier (session tokens)": await run_scenario(LocalKeyVerifier(certs).verify, session_tokens),
+    }
+    print_table(
+        f"Auth latency: {TOTAL_REQUESTS} requests, concurrency {CONCURRENCY}",
+        rows,
+        ["count", "p50_ms", "p99_ms", "throughput_per_s"],
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,120 @@
+# benchmarks/batch_generation_benchmark.py
+
+"""
+One user generating documents for many job descriptions: separate requests against one batch.
+
+The whole app runs in-process against the fake backends (see `fake_backends`),
+with admission control, caching and retrieval as in production. Each scenario
+uses its own user and job descriptions, so no scenario benefits from another's
+caches:
+
+1. Sequential: one /generate call after another, as a client loop would send them.
+2. Concurrent: every /generate call at once.
+3. Batch: one /generate/batch request.
+4. Batch with half of all model calls failing, which shows failures reported
+   per job while the other jobs complete.
+
+Reports the total time, the time to the first result, the jobs completed,
+failed and rejected (429), and the embedder calls and vector queries made.
+
+    python -m benchmarks.batch_generation_benchmark
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import time
+
+from benchmarks.common import print_table
+from benchmarks.e2e_benchmark import call_app
+from benchmarks.fake_backends import install_fake_backends
+
+JOBS = 10
+JOB_TEMPLATES = [
+    "Senior Backend Engineer at a payments company: Python, distributed systems, on-call ownership.",
+    "Product Designer for a healthcare startup: user research, prototyping, design systems.",
+    "Data Analyst in retail: SQL, dashboards, experimentation and stakeholder reporting.",
+    "Site Reliability Engineer: Kubernetes, observability, incident response, capacity planning.",
+    "Marketing Manager for a B2B SaaS product: demand generation, content strategy, analytics.",
+]
+
+
+def _job_descriptions(scenario: str) -> list[str]:
+    return [f"{JOB_TEMPLATES[i % len(JOB_TEMPLATES)]} ({scenario} posting #{i})" for i in range(JOBS)]
+
+
+def _sse_events(body: str) -> list[tuple[str, dict]]:
+    events = []
+    for block in body.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if "event" in fields:
+            events.append((fields["event"], json.loads(fields.get("data", "null"))))
+    return events
+
+
+async def _separate(app, scenario: str, concurrent: bool) -> dict:
+    payloads = [{"job_description": text} for text in _job_descriptions(scenario)]
+    started = time.perf_counter()
+    if concurrent:
+        results = await asyncio.gather(*(call_app(app, "/generate", payload, scenario) for payload in payloads))
+    else:
+        results = [await call_app(app, "/generate", payload, scenario) for payload in payloads]
+    ok = [result for result in results if result["error"] is None]
+    return {
+        "total_s": time.perf_counter() - started,
+        "first_result_s": min(result["seconds"] for result in ok) if ok else 0.0,
+        "jobs_ok": len(ok),
+        "jobs_failed": sum(1 for result in results if result["error"] not in (None, "http_429")),
+        "rejected_429": sum(1 for result in results if result["error"] == "http_429"),
+    }
+
+
+async def _batch(app, scenario: str) -> dict:
+    payload = {"jobs": [{"job_description": text} for text in _job_descriptions(scenario)]}
+    started = time.perf_counter()
+    result = await call_app(app, "/generate/batch", payload, scenario, keep_body=True)
+    jobs = [data for event, data in _sse_events(result["body"]) if event == "job"]
+    return {
+        "total_s": time.perf_counter() - started,
+        "first_result_s": result["ttfb"] or 0.0,
+        "jobs_ok": sum(1 for job in jobs if job["status"] != "error"),
+        "jobs_failed": sum(1 for job in jobs if job["status"] == "error"),
+        "rejected_429": 1 if result["error"] == "http_429" else 0,
+    }
+
+
+async def _run() -> dict:
+    fakes = install_fake_backends("default", seed=0)
+    from functions.main import app
+
+    rows = {}
+    async with app.router.lifespan_context(app):
+        scenarios = (
+            ("sequential /generate", lambda: _separate(app, "sequential", concurrent=False)),
+            ("concurrent /generate", lambda: _separate(app, "concurrent", concurrent=True)),
+            ("/generate/batch", lambda: _batch(app, "batch")),
+            ("batch, 50% model errors", lambda: _batch(app, "failing")),
+        )
+        for name, run in scenarios:
+            fakes["models"].set_error_rate(0.5 if "errors" in name else 0.0)
+            embedder_calls, pinecone_queries = fakes["embedder"].calls, fakes["pinecone"].queries
+            rows[name] = await run()
+            rows[name]["embedder_calls"] = fakes["embedder"].calls - embedder_calls
+            rows[name]["vector_queries"] = fakes["pinecone"].queries - pinecone_queries
+    return rows
+
+
+def main() -> None:
+    # The flows log every step; keep the table readable.
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        rows = asyncio.run(_run())
+    print_table(
+        f"{JOBS} job descriptions for one user",
+        rows,
+        ["total_s", "first_result_s", "jobs_ok", "jobs_failed", "rejected_429", "embedder_calls", "vector_queries"],
+    )
+
+
+if __name__ == "__main__":
+    main()
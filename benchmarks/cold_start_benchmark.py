@@ -0,0 +1,166 @@
+# benchmarks/cold_start_benchmark.py
+
+"""
+Cold-start benchmark for service initialization.
+
+The Google Cloud, Firebase, Pinecone and Genkit SDKs are replaced by stubs
+that sleep for a realistic amount of time in their constructors and network
+calls, so the benchmark runs anywhere. Every scenario runs in a fresh Python
+process so module imports are really cold:
+
+* lazy import       - importing the service modules (nothing is created yet)
+* sequential init   - creating every client one after another, as the old
+                      import-time singletons did
+* concurrent warm-up - `services.warm_up()`, as done on application startup
+
+    python -m benchmarks.cold_start_benchmark
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import types
+
+# Simulated SDK latencies, in seconds.
+LATENCIES = {
+    "google_auth_default": 0.05,
+    "secret_manager_client": 0.25,
+    "access_secret_version": 0.06,
+    "pinecone_init": 0.10,
+    "pinecone_list_indexes": 0.15,
+    "firebase_initialize_app": 0.08,
+    "firestore_client": 0.20,
+}
+SCENARIOS = ["lazy import", "sequential init", "concurrent warm-up"]
+SERVICE_MODULES = [
+    "functions.services.secret_service",
+    "functions.services.ai_service",
+    "functions.services.vector_db_service",
+    "functions.services.firebase_service",
+]
+
+
+def _module(name: str, **attrs) -> types.ModuleType:
+    """Creates a stub module, registers it in sys.modules and attaches it to its parent."""
+    module = types.ModuleType(name)
+    module.__path__ = []
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    parent_name, _, child = name.rpartition(".")
+    if parent_name:
+        parent = sys.modules.get(parent_name) or _module(parent_name)
+        setattr(parent, child, module)
+    return module
+
+
+def install_stub_sdks() -> None:
+    """Replaces every external SDK touched during service initialization with a slow stub."""
+
+    def _sleep(key):
+        time.sleep(LATENCIES[key])
+
+    def google_auth_default():
+        _sleep("google_auth_default")
+        return None, "benchmark-project"
+
+    class SecretManagerServiceClient:
+        def __init__(self):
+            _sleep("secret_manager_client")
+
+        def access_secret_version(self, request):
+            _sleep("access_secret_version")
+            payload = types.SimpleNamespace(data=b"benchmark-secret")
+            return types.SimpleNamespace(payload=payload)
+
+    def pinecone_init(api_key, environment):
+        _sleep("pinecone_init")
+
+    def pinecone_list_indexes():
+        _sleep("pinecone_list_indexes")
+        return ["career-pilot-index"]
+
+    apps = {}
+
+    def initialize_app():
+        _sleep("firebase_initialize_app")
+        apps["[DEFAULT]"] = types.SimpleNamespace(project_id="benchmark-project")
+
+    def firestore_client(app=None):
+        _sleep("firestore_client")
+        return object()
+
+    _module("google.auth", default=google_auth_default)
+    _module("google.api_core.exceptions", AlreadyExists=type("AlreadyExists", (Exception,), {}))
+    _module("google.cloud.secretmanager", SecretManagerServiceClient=SecretManagerServiceClient)
+    _module("dotenv", load_dotenv=lambda: None)
+    _module("pinecone", init=pinecone_init, list_indexes=pinecone_list_indexes, Index=lambda name: object())
+    _module(
+        "firebase_admin",
+        _apps=apps,
+        initialize_app=initialize_app,
+        get_app=lambda: apps["[DEFAULT]"],
+        App=object,
+    )
+    _module("firebase_admin.credentials")
+    _module("firebase_admin.firestore", client=firestore_client)
+    _module("genkit", get_embedder=lambda name: None)
+
+
+def run_scenario(scenario: str) -> dict:
+    """Runs one scenario in the current (fresh) process and returns its timings."""
+    os.environ["GOOGLE_CLOUD_PROJECT"] = "benchmark-project"
+    install_stub_sdks()
+
+    started = time.perf_counter()
+    for module in SERVICE_MODULES:
+        __import__(module)
+    from functions.services.registry import services
+    import_seconds = time.perf_counter() - started
+
+    names = ["perplexity", "pinecone", "firebase_service"]
+    started = time.perf_counter()
+    if scenario == "sequential init":
+        for name in names:
+            services.get(name)
+    elif scenario == "concurrent warm-up":
+        asyncio.run(services.warm_up(names))
+    init_seconds = time.perf_counter() - started
+
+    return {
+        "import_ms": import_seconds * 1000,
+        "init_ms": init_seconds * 1000,
+        "total_ms": (import_seconds + init_seconds) * 1000,
+        "services": {name: seconds * 1000 for name, seconds in services.timing_report().items()},
+    }
+
+
+def main() -> None:
+    rows = {}
+    for scenario in SCENARIOS:
+        completed = subprocess.run(
+            [sys.executable, "-m", "benchmarks.cold_start_benchmark", scenario],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        rows[scenario] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    print("\nCold start with stubbed SDKs (ms)")
+    print("---------------------------------")
+    print("scenario".ljust(22) + "import".rjust(10) + "init".rjust(10) + "total".rjust(10))
+    for scenario, row in rows.items():
+        print(scenario.ljust(22) + "".join(f"{row[key]:10.1f}" for key in ("import_ms", "init_ms", "total_ms")))
+
+    print("\nPer-service initialization time during concurrent warm-up (ms):")
+    for name, ms in rows["concurrent warm-up"]["services"].items():
+        print(f"  {name.ljust(20)}{ms:8.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        print(json.dumps(run_scenario(sys.argv[1])))
+    else:
+        main()
@@ -0,0 +1,79 @@
+# benchmarks/common.py
+
+"""
+Small helpers shared by the benchmark scripts: latency percentiles, a
+concurrent request driver and a plain-text results table.
+
+Run any benchmark from the repository root, e.g.:
+
+    python -m benchmarks.auth_benchmark
+"""
+
+import asyncio
+import time
+
+# Benchmarks report percentiles exactly as the service's own metrics do.
+from functions.services.telemetry import percentile
+
+
+def summarize(latencies: list[float], wall_seconds: float | None = None) -> dict:
+    """
+    Summarizes a list of latencies (in seconds) as milliseconds.
+
+    Args:
+        latencies: One latency sample per completed call.
+        wall_seconds: Total elapsed time, used to derive throughput when given.
+
+    Returns:
+        A dictionary with count, mean, p50, p95, p99 and max latency (ms),
+        plus calls per second when `wall_seconds` is provided.
+    """
+    summary = {
+        "count": len(latencies),
+        "mean_ms": (sum(latencies) / len(latencies) * 1000) if latencies else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000 if latencies else 0.0,
+    }
+    if wall_seconds is not None:
+        summary["wall_s"] = wall_seconds
+        summary["throughput_per_s"] = len(latencies) / wall_seconds if wall_seconds > 0 else 0.0
+    return summary
+
+
+async def run_concurrently(call, total: int, concurrency: int) -> tuple[list[float], float]:
+    """
+    Awaits `call(i)` for i in range(total) with at most `concurrency` calls in flight.
+
+    Returns:
+        A tuple of (per-call latencies in seconds, wall-clock seconds for the whole run).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async def _one(i: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await call(i)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_one(i) for i in range(total)))
+    return latencies, time.perf_counter() - started
+
+
+def print_table(title: str, rows: dict[str, dict], columns: list[str] | None = None) -> None:
+    """Prints one row per scenario with the selected summary columns."""
+    columns = columns or ["count", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+    name_width = max([len(name) for name in rows] + [len("scenario")])
+    print(f"\n{title}")
+    print("-" * len(title))
+    header = "scenario".ljust(name_width) + "".join(column.rjust(18) for column in columns)
+    print(header)
+    for name, row in rows.items():
+        cells = []
+        for column in columns:
+            value = row.get(column, "")
+            cells.append((f"{value:.2f}" if isinstance(value, float) else str(value)).rjust(18))
+        print(name.ljust(name_width) + "".join(cells))
@@ -0,0 +1,106 @@
+# benchmarks/context_cache_benchmark.py
+
+"""
+Input tokens and latency of interview-prep generations with and without the context cache.
+
+Each simulated user prepares for several jobs with the same resume and cover
+letter, so the prompt's prefix (instructions, schema, resume, cover letter) is
+identical across that user's calls and only the company insights and job
+description change. The model is the fake provider from `fake_backends`: it
+supports context caches, reports the tokens it served from them, and spends
+prefill time only on the input tokens that were not cached. Three runs:
+
+1. Inline: every call sends the whole prompt (the previous behaviour).
+2. Cached: prefixes are cached once sent twice, as configured in production.
+3. Cached, with each user editing their resume halfway through, which
+   invalidates their cache and creates a new one.
+
+"billed_tokens" counts input tokens read from a cache at a quarter of the
+input rate, roughly what providers charge for them, plus the tokens written
+when each cache is created at the full rate (cache storage is not included).
+
+    python -m benchmarks.context_cache_benchmark
+"""
+
+import asyncio
+import time
+import types
+
+from benchmarks.common import print_table, summarize
+from benchmarks.fake_backends import PROFILES, FakeModels, _filler, _seeded
+from functions.flows.context_cache import ContextCache
+from functions.flows.interview_flow import FALLBACK_COMPANY_INSIGHTS, build_interview_prompt
+from functions.flows.model_router import ModelRouter
+from functions.services.admission_control import AdmissionController
+
+USERS = 40
+JOBS_PER_USER = 6
+RESUME_CHARS = 8_000
+COVER_LETTER_CHARS = 3_000
+JOB_DESCRIPTION_CHARS = 2_500
+CACHED_TOKEN_PRICE = 0.25
+
+
+def _data(user: int, job: int, resume_version: int) -> types.SimpleNamespace:
+    return types.SimpleNamespace(
+        resume=_filler(_seeded("resume", user, resume_version), RESUME_CHARS),
+        cover_letter=_filler(_seeded("cover_letter", user), COVER_LETTER_CHARS),
+        job_description=_filler(_seeded("job", user, job), JOB_DESCRIPTION_CHARS),
+    )
+
+
+async def _scenario(cache: ContextCache, edit_resume: bool) -> dict:
+    models = FakeModels(PROFILES["default"], seed=0)
+    router = ModelRouter(get_model=models.get, admission=AdmissionController(), context_cache=cache)
+    latencies = []
+
+    async def _user(user: int) -> None:
+        for job in range(JOBS_PER_USER):
+            resume_version = 1 if edit_resume and job >= JOBS_PER_USER // 2 else 0
+            prompt = build_interview_prompt(_data(user, job, resume_version), FALLBACK_COMPANY_INSIGHTS, f"user-{user}")
+            started = time.perf_counter()
+            await router.generate(prompt, task="interview_prep", quality="fast")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_user(user) for user in range(USERS)))
+    summary = summarize(latencies, time.perf_counter() - started)
+
+    usage = {key: sum(model[key] for model in models.usage().values())
+             for key in ("input_tokens", "cached_tokens", "cache_creations", "cache_write_tokens")}
+    cache_stats = cache.stats()
+    return {
+        "calls": summary["count"],
+        "input_tokens": usage["input_tokens"],
+        "cached_tokens": usage["cached_tokens"],
+        "billed_tokens": (usage["input_tokens"] - usage["cached_tokens"] * (1 - CACHED_TOKEN_PRICE)
+                          + usage["cache_write_tokens"]),
+        "cache_creations": usage["cache_creations"],
+        "invalidations": cache_stats["invalidations"],
+        "p50_ms": summary["p50_ms"],
+        "p95_ms": summary["p95_ms"],
+    }
+
+
+async def _run() -> dict:
+    return {
+        "inline (no context cache)": await _scenario(ContextCache(enabled=False), edit_resume=False),
+        "context cache": await _scenario(ContextCache(enabled=True), edit_resume=False),
+        "context cache, resume edited": await _scenario(ContextCache(enabled=True), edit_resume=True),
+    }
+
+
+def main() -> None:
+    rows = asyncio.run(_run())
+    print_table(
+        f"Interview prep: {USERS} users x {JOBS_PER_USER} jobs, same resume and cover letter",
+        rows,
+        ["calls", "input_tokens", "cached_tokens", "billed_tokens", "cache_creations", "invalidations",
+         "p50_ms", "p95_ms"],
+    )
+    inline, cached = rows["inline (no context cache)"], rows["context cache"]
+    print(f"\nBilled input tokens saved by the context cache: {1 - cached['billed_tokens'] / inline['billed_tokens']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# benchmarks/context_selection_benchmark.py
+
+"""
+Compares the old top-3 RAG join with hybrid re-ranking and token budgeting.
+
+A user's history is simulated as past cover letters that reuse the same
+paragraphs (so dense top-k returns near-duplicates), plus long unrelated
+chunks. Dense scores come from a hashed bag-of-words embedding. For each job
+description the benchmark reports context tokens, how many distinct
+paragraphs reach the prompt, and the time spent selecting:
+
+    python -m benchmarks.context_selection_benchmark
+"""
+
+import random
+import time
+import zlib
+
+import numpy as np
+
+from benchmarks.common import print_table
+from functions.flows.context_retrieval import CONTEXT_SEPARATOR, select_context, tokenize
+from functions.flows.token_utils import estimate_tokens
+
+DIMENSIONS = 256
+QUERIES = 100
+SKILLS = [
+    "behaviour support plans", "NDIS plan reviews", "manual handling", "medication administration",
+    "community access", "incident reporting", "complex care", "mental health first aid",
+    "rostering", "family liaison", "goal setting", "daily living skills",
+]
+
+
+def _embed(text: str) -> np.ndarray:
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    for word in tokenize(text):
+        vector[zlib.crc32(word.encode('utf-8')) % DIMENSIONS] += 1.0
+    return vector / max(np.linalg.norm(vector), 1e-12)
+
+
+def _history(rng: random.Random) -> list[tuple[str, str]]:
+    """Returns (paragraph key, chunk text) pairs; the same paragraph appears in several letters."""
+    paragraphs = {
+        skill: f"In my previous role I was responsible for {skill}, working closely with participants and "
+               f"their families to deliver safe, person-centred support around {skill}."
+        for skill in SKILLS
+    }
+    chunks = []
+    for letter in range(30):
+        for skill in rng.sample(SKILLS, 4):
+            suffix = rng.choice(["", " I enjoyed this work.", " This was a key part of the role."])
+            chunks.append((skill, paragraphs[skill] + suffix))
+        chunks.append((f"filler-{letter}", "General experience. " * rng.randint(40, 80)))
+    return chunks
+
+
+def main() -> None:
+    rng = random.Random(3)
+    chunks = _history(rng)
+    vectors = np.stack([_embed(text) for _, text in chunks])
+
+    totals = {"top-3 join": [], "hybrid + budget": []}
+    distinct = {"top-3 join": [], "hybrid + budget": []}
+    selection_ms = []
+    for _ in range(QUERIES):
+        wanted = rng.sample(SKILLS, 3)
+        query = f"Seeking a support worker experienced in {', '.join(wanted)}."
+        scores = vectors @ _embed(query)
+        order = np.argsort(-scores)[:20]
+        matches = [{"id": str(i), "score": float(scores[i]), "metadata": {"text": chunks[i][1]}} for i in order]
+
+        top3 = [chunks[i] for i in order[:3]]
+        totals["top-3 join"].append(estimate_tokens(CONTEXT_SEPARATOR.join(text for _, text in top3)))
+        distinct["top-3 join"].append(len({key for key, _ in top3} & set(wanted)))
+
+        started = time.perf_counter()
+        chosen, report = select_context(query, matches)
+        selection_ms.append((time.perf_counter() - started) * 1000)
+        keys = {key for key, text in chunks if text in chosen}
+        totals["hybrid + budget"].append(report["context_tokens"])
+        distinct["hybrid + budget"].append(len(keys & set(wanted)))
+
+    rows = {
+        name: {
+            "avg_context_tokens": sum(totals[name]) / QUERIES,
+            "avg_skills_covered": sum(distinct[name]) / QUERIES,
+        }
+        for name in totals
+    }
+    rows["hybrid + budget"]["avg_selection_ms"] = sum(selection_ms) / QUERIES
+    print_table(
+        f"RAG context for {QUERIES} job descriptions (3 wanted skills each, 20 candidates)",
+        rows,
+        ["avg_context_tokens", "avg_skills_covered", "avg_selection_ms"],
+    )
+
+
+if __name__ == "__main__":
+    main()
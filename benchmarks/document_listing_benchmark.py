@@ -0,0 +1,103 @@
+# benchmarks/document_listing_benchmark.py
+
+"""
+Benchmark for listing a user's documents with 10k saved documents.
+
+Runs against the in-memory fake Firestore in `benchmarks/fake_firestore.py`,
+which charges a round trip plus a per-KB transfer cost for every read:
+
+* get_user_documents      - the old unbounded listing (every document, every field)
+* page, full documents    - `list_user_documents` first page
+* page, projected         - first page with only title and created_at
+* 5 pages, projected      - following `next_cursor` through five pages
+* page, cached            - the same first page again, served from the per-user cache
+
+    python -m benchmarks.document_listing_benchmark
+"""
+
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import print_table, summarize
+from benchmarks.fake_firestore import FakeFirestore
+from functions.services.firebase_service import FirebaseService
+
+USER_ID = "user-with-history"
+DOCUMENTS = 10_000
+BODY_CHARS = 3_000
+REPEATS = 10
+FIELDS = ["title", "created_at"]
+
+
+def _seed(db: FakeFirestore) -> None:
+    started = datetime(2024, 1, 1)
+    db.seed(
+        f"users/{USER_ID}/documents",
+        {
+            f"doc-{i:05d}": {
+                "title": f"Application {i}",
+                "job_title": "Support Worker",
+                "cover_letter": "x" * BODY_CHARS,
+                "resume_summary": "y" * BODY_CHARS,
+                "created_at": started + timedelta(minutes=i),
+            }
+            for i in range(DOCUMENTS)
+        },
+    )
+
+
+async def _measure(call) -> dict:
+    latencies = []
+    payload = 0
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        result = await call()
+        latencies.append(time.perf_counter() - started)
+        payload = len(json.dumps(result, default=str))
+    return summarize(latencies) | {"payload_kb": payload / 1024}
+
+
+async def main() -> None:
+    db = FakeFirestore()
+    _seed(db)
+    rows = {}
+
+    service = FirebaseService(db)
+    rows["get_user_documents"] = await _measure(lambda: asyncio.to_thread(service.get_user_documents, USER_ID))
+
+    async def _first_page(fields=None):
+        # A fresh service per call, so the cache does not hide the Firestore read.
+        return await FirebaseService(db).list_user_documents(USER_ID, page_size=20, fields=fields)
+
+    rows["page, full documents"] = await _measure(lambda: _first_page())
+    rows["page, projected"] = await _measure(lambda: _first_page(FIELDS))
+
+    async def _five_pages():
+        paged_service = FirebaseService(db)
+        documents, cursor = [], None
+        for _ in range(5):
+            page = await paged_service.list_user_documents(USER_ID, page_size=20, cursor=cursor, fields=FIELDS)
+            documents += page["documents"]
+            cursor = page["next_cursor"]
+        return documents
+
+    rows["5 pages, projected"] = await _measure(_five_pages)
+
+    cached_service = FirebaseService(db)
+    await cached_service.list_user_documents(USER_ID, page_size=20, fields=FIELDS)
+    rows["page, cached"] = await _measure(
+        lambda: cached_service.list_user_documents(USER_ID, page_size=20, fields=FIELDS)
+    )
+
+    print_table(
+        f"Listing documents for a user with {DOCUMENTS:,} documents ({REPEATS} runs each)",
+        rows,
+        ["p50_ms", "p95_ms", "max_ms", "payload_kb"],
+    )
+    print(f"\nCache after the cached run: {cached_service.list_cache.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,459 @@
+# benchmarks/e2e_benchmark.py
+
+"""
+End-to-end load test of the API, in process, against fake backends.
+
+Boots the real FastAPI `app` from `functions/main.py`, runs its startup and
+shutdown, and replaces only the external backends (Firebase Auth, Firestore,
+Pinecone, Perplexity, Secret Manager and the Genkit model and embedder) with
+the deterministic fakes from `benchmarks.fake_backends`. Requests are sent
+straight to the ASGI app, with no sockets, so the numbers reflect the
+application's own behaviour under load. The app's dependencies
+(functions/requirements.txt) must be installed.
+
+Each scenario is driven at one or more load levels:
+
+* fixed RPS (`--rps 2,5`): open loop; arrivals follow the schedule no matter
+  how slowly the app answers, and latency is measured from the scheduled time;
+* fixed concurrency (`--concurrency 8,32`): closed loop; each client sends its
+  next request as soon as the previous one finishes.
+
+Per level it reports throughput, latency and time-to-first-byte percentiles,
+errors, event-loop lag and process memory. `--output` writes the results (plus
+the server's per-operation latency breakdown) as JSON; `--baseline` compares a
+run against an earlier JSON file and exits with status 1 on a regression:
+
+    python -m benchmarks.e2e_benchmark --scenario generate --rps 2,5 --duration 20 --output run.json
+    python -m benchmarks.e2e_benchmark --scenario generate --rps 2,5 --duration 20 --baseline run.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from benchmarks.common import percentile, print_table
+from benchmarks.fake_backends import PROFILES, install_fake_backends
+
+LOOP_LAG_INTERVAL_SECONDS = 0.01
+# Regressions smaller than these absolute amounts are treated as noise.
+NOISE_FLOORS = {"ms": 1.0, "rps": 0.05, "mb": 2.0, "rate": 0.01}
+# Compared metric -> (unit for the noise floor, True if higher is better).
+COMPARED_METRICS = {
+    "throughput_rps": ("rps", True),
+    "p50_ms": ("ms", False),
+    "p95_ms": ("ms", False),
+    "p99_ms": ("ms", False),
+    "ttfb_p95_ms": ("ms", False),
+    "error_rate": ("rate", False),
+    "loop_lag_p99_ms": ("ms", False),
+    "rss_end_mb": ("mb", False),
+}
+
+_JOBS = [
+    "Senior Backend Engineer at a payments company: Python, distributed systems, on-call ownership.",
+    "Product Designer for a healthcare startup: user research, prototyping, design systems.",
+    "Data Analyst in retail: SQL, dashboards, experimentation and stakeholder reporting.",
+    "Site Reliability Engineer: Kubernetes, observability, incident response, capacity planning.",
+    "Marketing Manager for a B2B SaaS product: demand generation, content strategy, analytics.",
+]
+
+
+def _generate_payload(i: int, unique: bool) -> dict:
+    job = _JOBS[i % len(_JOBS)]
+    return {"job_description": f"{job} (posting #{i})" if unique else job}
+
+
+def _interview_payload(i: int, unique: bool) -> dict:
+    return _generate_payload(i, unique) | {
+        "resume": "Eight years building web platforms; led a team of five; Python, Go and PostgreSQL.",
+        "cover_letter": "I am excited to apply my platform experience to your team.",
+    }
+
+
+# Scenario -> (path, payload factory, streamed). The Genkit-mounted flow endpoints take
+# the flow input as the JSON body, like the streaming variants.
+SCENARIOS = {
+    "generate": ("/generate", _generate_payload, False),
+    "generate-stream": ("/generate/stream", _generate_payload, True),
+    "interview-prep": ("/interview-prep", _interview_payload, False),
+    "interview-prep-stream": ("/interview-prep/stream", _interview_payload, True),
+}
+
+
+def _rss_mb() -> float:
+    """The process's current resident memory, or its peak where the current value is unavailable."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+async def call_app(app, path: str, payload: dict, token: str, keep_body: bool = False) -> dict:
+    """
+    Sends one POST request straight to the ASGI app and reads the whole response.
+
+    Returns:
+        A dictionary with "status", "ttfb" and "seconds" (from the call), "error"
+        (None, an "http_<status>" code, or "stream_error" for an in-band SSE error)
+        and, with `keep_body`, the response "body" as text.
+    """
+    body = json.dumps(payload).encode("utf-8")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("ascii"),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"host", b"benchmark"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+            (b"authorization", f"Bearer {token}".encode("ascii")),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("benchmark", 80),
+    }
+    started = time.perf_counter()
+    finished = asyncio.Event()
+    sent_body = False
+    response = {"status": None, "ttfb": None}
+    chunks = []
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            if message.get("body"):
+                if response["ttfb"] is None:
+                    response["ttfb"] = time.perf_counter() - started
+                chunks.append(message["body"])
+            if not message.get("more_body", False):
+                finished.set()
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        finished.set()
+    response["seconds"] = time.perf_counter() - started
+    status = response["status"] or 500
+    text = b"".join(chunks)
+    if status >= 400:
+        response["error"] = f"http_{status}"
+    elif b"event: error" in text:
+        response["error"] = "stream_error"
+    else:
+        response["error"] = None
+    if keep_body:
+        response["body"] = text.decode("utf-8", "replace")
+    return response
+
+
+async def _monitor_loop_lag(samples: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL_SECONDS)
+        samples.append(max(0.0, time.perf_counter() - started - LOOP_LAG_INTERVAL_SECONDS))
+
+
+class LoadRun:
+    """Drives one scenario at one load level and collects its measurements."""
+
+    def __init__(self, app, scenario: str, mode: str, level: float, duration: float, users: int, unique: bool,
+                 max_in_flight: int, offset: int):
+        self.app = app
+        self.scenario = scenario
+        self.path, self.payload, self.streamed = SCENARIOS[scenario]
+        self.mode = mode
+        self.level = level
+        self.duration = duration
+        self.users = users
+        self.unique = unique
+        self.max_in_flight = max_in_flight
+        # Keeps request numbers (and so payloads) distinct across levels.
+        self.offset = offset
+        self.latencies: list[float] = []
+        self.ttfbs: list[float] = []
+        self.errors: dict[str, int] = {}
+        self.sent = 0
+        self.dropped = 0
+        self.in_flight = 0
+
+    async def _one(self, i: int, scheduled: float) -> None:
+        self.in_flight += 1
+        call_started = time.perf_counter()
+        try:
+            n = self.offset + i
+            result = await call_app(self.app, self.path, self.payload(n, self.unique), f"bench-user-{n % self.users}")
+        except Exception as e:
+            result = {"error": type(e).__name__}
+        finally:
+            self.in_flight -= 1
+        if result["error"]:
+            self.errors[result["error"]] = self.errors.get(result["error"], 0) + 1
+            return
+        # Measured from the scheduled start, so a lagging event loop cannot hide queueing.
+        self.latencies.append(time.perf_counter() - scheduled)
+        if result["ttfb"] is not None:
+            self.ttfbs.append(call_started - scheduled + result["ttfb"])
+
+    async def _fixed_rps(self) -> None:
+        started = time.perf_counter()
+        tasks = []
+        total = int(self.level * self.duration)
+        for i in range(total):
+            scheduled = started + i / self.level
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.sent += 1
+            if self.in_flight >= self.max_in_flight:
+                self.dropped += 1
+                continue
+            tasks.append(asyncio.create_task(self._one(i, scheduled)))
+        await asyncio.gather(*tasks)
+
+    async def _fixed_concurrency(self) -> None:
+        deadline = time.perf_counter() + self.duration
+        counter = iter(range(sys.maxsize))
+
+        async def _client() -> None:
+            while time.perf_counter() < deadline:
+                self.sent += 1
+                await self._one(next(counter), time.perf_counter())
+
+        await asyncio.gather(*(_client() for _ in range(int(self.level))))
+
+    async def run(self, trace_memory: bool) -> dict:
+        lag: list[float] = []
+        stop = asyncio.Event()
+        monitor = asyncio.create_task(_monitor_loop_lag(lag, stop))
+        rss_start = _rss_mb()
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            await (self._fixed_rps() if self.mode == "rps" else self._fixed_concurrency())
+        finally:
+            wall = time.perf_counter() - started
+            heap_peak = tracemalloc.get_traced_memory()[1] / 2**20 if trace_memory else None
+            if trace_memory:
+                tracemalloc.stop()
+            stop.set()
+            await monitor
+
+        ok = len(self.latencies)
+        failed = sum(self.errors.values())
+        result = {
+            "scenario": self.scenario,
+            "mode": self.mode,
+            "level": self.level,
+            "duration_s": wall,
+            "sent": self.sent,
+            "ok": ok,
+            "dropped": self.dropped,
+            "errors": dict(sorted(self.errors.items())),
+            "error_rate": (failed + self.dropped) / self.sent if self.sent else 0.0,
+            "throughput_rps": ok / wall if wall > 0 else 0.0,
+            "p50_ms": percentile(self.latencies, 50) * 1000,
+            "p95_ms": percentile(self.latencies, 95) * 1000,
+            "p99_ms": percentile(self.latencies, 99) * 1000,
+            "max_ms": max(self.latencies) * 1000 if self.latencies else 0.0,
+            "ttfb_p50_ms": percentile(self.ttfbs, 50) * 1000,
+            "ttfb_p95_ms": percentile(self.ttfbs, 95) * 1000,
+            "loop_lag_p50_ms": percentile(lag, 50) * 1000,
+            "loop_lag_p99_ms": percentile(lag, 99) * 1000,
+            "loop_lag_max_ms": max(lag) * 1000 if lag else 0.0,
+            "rss_start_mb": rss_start,
+            "rss_end_mb": _rss_mb(),
+        }
+        if heap_peak is not None:
+            result["heap_peak_mb"] = heap_peak
+        return result
+
+
+def _levels(args) -> list[tuple[str, float]]:
+    levels = [("rps", float(value)) for value in args.rps.split(",") if value] if args.rps else []
+    levels += [("concurrency", float(value)) for value in args.concurrency.split(",") if value] if args.concurrency else []
+    if not levels:
+        raise ValueError("Give at least one load level with --rps or --concurrency.")
+    if any(value <= 0 for _, value in levels):
+        raise ValueError("Load levels must be positive.")
+    return levels
+
+
+def _key(result: dict) -> str:
+    return f"{result['scenario']} @ {result['mode']}={result['level']:g}"
+
+
+def compare(results: list[dict], baseline: dict, tolerance: float) -> tuple[dict, list[str]]:
+    """
+    Compares results with a baseline run's, level by level.
+
+    Returns:
+        A tuple of (key -> metric -> relative change, the keys and metrics that regressed
+        by more than `tolerance` and more than the metric's noise floor).
+    """
+    previous = {_key(result): result for result in baseline.get("results", [])}
+    changes: dict[str, dict] = {}
+    regressions: list[str] = []
+    for result in results:
+        key = _key(result)
+        base = previous.get(key)
+        if base is None:
+            continue
+        changes[key] = {}
+        for metric, (unit, higher_is_better) in COMPARED_METRICS.items():
+            if metric not in result or metric not in base:
+                continue
+            delta = result[metric] - base[metric]
+            changes[key][metric] = delta / base[metric] if base[metric] else 0.0
+            worse = -delta if higher_is_better else delta
+            if worse > NOISE_FLOORS[unit] and worse > tolerance * abs(base[metric]):
+                regressions.append(f"{key}: {metric} {base[metric]:.2f} -> {result[metric]:.2f}")
+    return changes, regressions
+
+
+async def run_benchmark(args) -> dict:
+    fakes = install_fake_backends(args.profile, seed=args.seed)
+    from functions.flows.context_cache import context_cache
+    from functions.flows.model_router import model_router
+    from functions.main import app
+    from functions.services.admission_control import admission_controller
+    from functions.services.telemetry import telemetry
+
+    levels = _levels(args)
+    scenarios = [name.strip() for name in args.scenario.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise ValueError(f"Unknown scenario(s) {unknown}. Expected: {', '.join(SCENARIOS)}.")
+
+    results = []
+    log = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with log:
+        async with app.router.lifespan_context(app):
+            offset = 0
+            for scenario in scenarios:
+                path, payload, _ = SCENARIOS[scenario]
+                for i in range(args.warmup_requests):
+                    await call_app(app, path, payload(10**9 + i, True), "bench-warmup")
+                for mode, level in levels:
+                    run = LoadRun(app, scenario, mode, level, args.duration, args.users, not args.repeat,
+                                  args.max_in_flight, offset)
+                    results.append(await run.run(args.trace_memory))
+                    offset += run.sent
+                    # Let background work (write-behind flushes) settle between levels.
+                    await asyncio.sleep(args.cooldown)
+
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "profile": args.profile,
+            "seed": args.seed,
+            "duration_s": args.duration,
+            "users": args.users,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+        "server": {
+            "spans": telemetry.stats()["spans"],
+            "models": model_router.stats(),
+            "admission": admission_controller.stats(),
+            "context_cache": context_cache.stats(),
+            "model_usage": fakes["models"].usage(),
+            "fake_calls": {
+                "model": fakes["models"].calls(),
+                "embedder": fakes["embedder"].calls,
+                "pinecone": fakes["pinecone"].queries,
+                "firestore_commits": fakes["firestore"].commits,
+            },
+        },
+    }
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenario", default="generate,interview-prep",
+                        help=f"Comma-separated scenarios: {', '.join(SCENARIOS)}.")
+    parser.add_argument("--rps", default="2,5", help="Comma-separated fixed request rates (open loop).")
+    parser.add_argument("--concurrency", default="", help="Comma-separated fixed concurrency levels (closed loop).")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds per load level.")
+    parser.add_argument("--profile", default="default", choices=sorted(PROFILES), help="Fake backend latency profile.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the fakes' latencies and answers.")
+    parser.add_argument("--users", type=int, default=200, help="Distinct users the requests are spread over.")
+    parser.add_argument("--repeat", action="store_true",
+                        help="Reuse a few job descriptions (cache-friendly) instead of a unique one per request.")
+    parser.add_argument("--max-in-flight", type=int, default=1_000,
+                        help="Open-loop requests beyond this many outstanding are dropped and counted as errors.")
+    parser.add_argument("--warmup-requests", type=int, default=3, help="Unrecorded requests per scenario first.")
+    parser.add_argument("--cooldown", type=float, default=1.0, help="Seconds to wait between levels.")
+    parser.add_argument("--trace-memory", action="store_true", help="Also report the Python heap peak (slower).")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", help="Compare against the JSON results of an earlier run.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Relative change that counts as a regression.")
+    parser.add_argument("--verbose", action="store_true", help="Show the application's own log output.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    random.seed(args.seed)
+    report = asyncio.run(run_benchmark(args))
+
+    rows = {_key(result): result for result in report["results"]}
+    print_table(
+        f"End-to-end, in process, '{args.profile}' backends",
+        rows,
+        ["ok", "error_rate", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "ttfb_p95_ms"],
+    )
+    print_table("Event loop and memory", rows, ["loop_lag_p50_ms", "loop_lag_p99_ms", "loop_lag_max_ms", "rss_end_mb"])
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2, default=str)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        changes, regressions = compare(report["results"], baseline, args.tolerance)
+        print_table(
+            f"Relative change against {args.baseline}",
+            changes,
+            list(COMPARED_METRICS),
+        )
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+# benchmarks/embedding_batch_benchmark.py
+
+"""
+Compares one-embedder-call-per-request against the `EmbeddingBatcher`.
+
+The fake embedder charges a fixed per-call latency (connection, auth and
+queueing at the provider) plus a small per-text cost, and it only serves a
+limited number of calls at once, like a rate-limited API. It models a provider
+with a multi-text endpoint; the Genkit embedder the service uses today takes one
+text per call (see `EmbeddingService._embed_batch`), so there the batcher only
+de-duplicates and groups the calls:
+
+    python -m benchmarks.embedding_batch_benchmark
+"""
+
+import asyncio
+
+from benchmarks.common import print_table, run_concurrently, summarize
+from functions.services.embedding_batcher import EmbeddingBatcher
+
+REQUESTS = 1000
+CLIENT_CONCURRENCY = 100
+PER_CALL_SECONDS = 0.04
+PER_TEXT_SECONDS = 0.0002
+PROVIDER_CONCURRENCY = 16
+SETTINGS = [(16, 0.002), (64, 0.005), (64, 0.01), (128, 0.02)]
+
+
+class FakeEmbedder:
+    """Simulates an embedding API with per-call overhead and limited provider-side concurrency."""
+
+    def __init__(self):
+        self.calls = 0
+        self._slots = asyncio.Semaphore(PROVIDER_CONCURRENCY)
+
+    async def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        async with self._slots:
+            self.calls += 1
+            await asyncio.sleep(PER_CALL_SECONDS + PER_TEXT_SECONDS * len(texts))
+            return [[float(len(text))] * 8 for text in texts]
+
+
+async def main() -> None:
+    rows = {}
+
+    embedder = FakeEmbedder()
+
+    async def _unbatched(i: int) -> None:
+        await embedder.embed_batch([f"job description {i}"])
+
+    latencies, wall = await run_concurrently(_unbatched, REQUESTS, CLIENT_CONCURRENCY)
+    rows["one call per request"] = {**summarize(latencies, wall), "api_calls": embedder.calls}
+
+    for max_batch_size, max_wait_seconds in SETTINGS:
+        embedder = FakeEmbedder()
+        batcher = EmbeddingBatcher(embedder.embed_batch, max_batch_size=max_batch_size, max_wait_seconds=max_wait_seconds)
+
+        async def _batched(i: int) -> None:
+            await batcher.embed(f"job description {i}")
+
+        latencies, wall = await run_concurrently(_batched, REQUESTS, CLIENT_CONCURRENCY)
+        rows[f"batch {max_batch_size}, window {max_wait_seconds * 1000:.0f}ms"] = {
+            **summarize(latencies, wall),
+            "api_calls": embedder.calls,
+        }
+
+    print_table(
+        f"Embedding: {REQUESTS} requests, {CLIENT_CONCURRENCY} concurrent callers, "
+        f"{PER_CALL_SECONDS * 1000:.0f}ms per call",
+        rows,
+        ["count", "p50_ms", "p99_ms", "throughput_per_s", "api_calls"],
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
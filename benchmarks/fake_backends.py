@@ -0,0 +1,410 @@
+# benchmarks/fake_backends.py
+
+"""
+Deterministic, in-process fakes for every backend the API talks to.
+
+Each fake draws its latency from a seeded `LatencyDistribution`, so a run is
+repeatable and a profile can model a fast or a struggling backend.
+`install_fake_backends` puts them behind the application's own extension
+points: the service registry (Firebase token verification, Firestore,
+Pinecone, Perplexity), the secret provider's backend, and the `get_model` /
+`get_embedder` hooks of the model router and embedding service. Everything
+between the HTTP layer and the backends (admission control, routing, caches,
+retries, the write-behind queue) is the real application code.
+
+The fake model answers JSON-schema prompts with a valid object for exactly the
+fields the prompt asks for, and section prompts with plain text, so the flows
+take their normal parsing paths; a profile can make a fraction of answers
+malformed or failing to exercise the repair and fallback paths. It also
+supports context caching: each call waits an extra prefill time per 1,000
+input tokens that are not served from a cache, and reports its cached tokens.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import types
+
+import httpx
+
+from benchmarks.fake_firestore import FakeFirestore, FakeLatency
+
+SCHEMA_MARKER = "matching this JSON Schema: "
+EMBEDDING_DIMENSIONS = 768
+
+# Latency (median ms, p95 ms) per backend, and other knobs, for each named profile.
+PROFILES = {
+    "default": {
+        "token_verify": (1, 4),
+        "embedding": (40, 120),
+        "pinecone": (35, 150),
+        "perplexity": (600, 2_000),
+        "firestore": (8, 30),
+        "secret_manager": (60, 150),
+        "fast_model": (700, 1_800),
+        "pro_model": (2_500, 6_000),
+        "model_error_rate": 0.0,
+        "malformed_rate": 0.03,
+        "output_chars": 1_500,
+        "stream_chunks": 20,
+        "prefill_ms_per_1k_tokens": 40,
+    },
+    # Zero-latency backends: measures the application's own overhead.
+    "instant": {
+        "token_verify": (0, 0),
+        "embedding": (0, 0),
+        "pinecone": (0, 0),
+        "perplexity": (0, 0),
+        "firestore": (0, 0),
+        "secret_manager": (0, 0),
+        "fast_model": (0, 0),
+        "pro_model": (0, 0),
+        "model_error_rate": 0.0,
+        "malformed_rate": 0.0,
+        "output_chars": 1_500,
+        "stream_chunks": 20,
+        "prefill_ms_per_1k_tokens": 0,
+    },
+    # A degraded model provider: slow, with errors and malformed answers.
+    "degraded": {
+        "token_verify": (1, 4),
+        "embedding": (80, 400),
+        "pinecone": (60, 600),
+        "perplexity": (1_500, 6_000),
+        "firestore": (15, 80),
+        "secret_manager": (60, 150),
+        "fast_model": (1_500, 5_000),
+        "pro_model": (4_000, 12_000),
+        "model_error_rate": 0.05,
+        "malformed_rate": 0.10,
+        "output_chars": 1_500,
+        "stream_chunks": 20,
+        "prefill_ms_per_1k_tokens": 80,
+    },
+}
+
+
+class LatencyDistribution:
+    """A seeded log-normal latency, given its median and 95th percentile in milliseconds."""
+
+    def __init__(self, median_ms: float, p95_ms: float, seed: int = 0):
+        self.median = median_ms / 1000
+        # For a log-normal, p95 = median * exp(1.645 * sigma).
+        self.sigma = math.log(p95_ms / median_ms) / 1.645 if median_ms > 0 and p95_ms > median_ms else 0.0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        """Returns one latency in seconds."""
+        if self.median <= 0:
+            return 0.0
+        with self._lock:
+            return self.median * math.exp(self.sigma * self._rng.gauss(0, 1))
+
+    async def wait(self) -> None:
+        await asyncio.sleep(self.sample())
+
+
+class DistributionFirestoreLatency(FakeLatency):
+    """FakeFirestore latency drawn from a distribution instead of a fixed round trip."""
+
+    def __init__(self, distribution: LatencyDistribution, per_kb: float = 0.00002):
+        super().__init__(round_trip=0.0, per_kb=per_kb)
+        self.distribution = distribution
+
+    def charge(self, payload_bytes: int = 0) -> None:
+        time.sleep(self.distribution.sample() + self.per_kb * payload_bytes / 1024)
+
+
+def _seeded(*parts) -> random.Random:
+    digest = hashlib.sha256("\x00".join(str(part) for part in parts).encode("utf-8")).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def _filler(rng: random.Random, chars: int) -> str:
+    words = ("experience", "delivered", "team", "customers", "python", "platform", "growth",
+             "led", "designed", "metrics", "reliable", "launch", "stakeholders", "scaled")
+    text = []
+    length = 0
+    while length < chars:
+        word = rng.choice(words)
+        text.append(word)
+        length += len(word) + 1
+    return " ".join(text)[:chars]
+
+
+class FakeTokenVerifier:
+    """Accepts any bearer token; the token is the user's UID."""
+
+    def __init__(self, latency: LatencyDistribution):
+        self.latency = latency
+
+    async def verify(self, token: str) -> dict:
+        await self.latency.wait()
+        return {"uid": token, "email": f"{token}@example.com"}
+
+
+class _Result:
+    def __init__(self, text: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0):
+        self._text = text
+        self.usage = types.SimpleNamespace(
+            input_tokens=input_tokens, output_tokens=output_tokens, cached_content_tokens=cached_tokens,
+        )
+
+    def text(self) -> str:
+        return self._text
+
+
+class FakeModelError(Exception):
+    pass
+
+
+class FakeModel:
+    """A generative model answering with deterministic, schema-shaped output."""
+
+    def __init__(self, name: str, latency: LatencyDistribution, profile: dict, seed: int = 0):
+        self.name = name
+        self.latency = latency
+        self.error_rate = profile["model_error_rate"]
+        self.malformed_rate = profile["malformed_rate"]
+        self.output_chars = profile["output_chars"]
+        self.stream_chunks = profile["stream_chunks"]
+        self.prefill_seconds_per_token = profile["prefill_ms_per_1k_tokens"] / 1000 / 1000
+        self._rng = random.Random(seed)
+        # Cache name -> cached prefix.
+        self._caches: dict[str, str] = {}
+        self.calls = 0
+        self.usage = {"input_tokens": 0, "cached_tokens": 0, "output_tokens": 0, "cache_creations": 0, "cache_write_tokens": 0}
+
+    def _answer(self, prompt: str) -> str:
+        rng = _seeded(self.name, prompt)
+        position = prompt.rfind(SCHEMA_MARKER)
+        if position < 0:
+            # A section prompt: plain text.
+            return _filler(rng, min(self.output_chars // 3, 900))
+        schema, _ = json.JSONDecoder().raw_decode(prompt[position + len(SCHEMA_MARKER):])
+        properties = schema.get("properties", {})
+        per_field = max(40, self.output_chars // max(1, len(properties)))
+        answer = {}
+        for field, spec in properties.items():
+            if spec.get("type") == "array":
+                answer[field] = [_filler(rng, per_field // 5) for _ in range(5)]
+            else:
+                answer[field] = _filler(rng, per_field)
+        text = json.dumps(answer)
+        if self._rng.random() < self.malformed_rate:
+            # Truncated mid-answer, as when the model stops early.
+            text = text[: int(len(text) * 0.6)]
+        return text
+
+    def _maybe_fail(self) -> None:
+        if self._rng.random() < self.error_rate:
+            raise FakeModelError(f"{self.name}: 503 model overloaded")
+
+    async def create_cache(self, prefix: str, ttl_seconds: float) -> str:
+        # Creating a cache reads the prefix once.
+        await asyncio.sleep(len(prefix) // 4 * self.prefill_seconds_per_token)
+        name = "cachedContents/" + hashlib.sha256(f"{self.name}\x00{prefix}".encode("utf-8")).hexdigest()[:16]
+        self._caches[name] = prefix
+        self.usage["cache_creations"] += 1
+        self.usage["cache_write_tokens"] += len(prefix) // 4
+        return name
+
+    async def delete_cache(self, name: str) -> None:
+        self._caches.pop(name, None)
+
+    def _prompt(self, prompt: str, cached_content: str | None) -> tuple[str, int]:
+        """Returns the full prompt and its cached tokens, and accounts for the call's usage."""
+        prefix = ""
+        if cached_content is not None:
+            if cached_content not in self._caches:
+                raise FakeModelError(f"{self.name}: 404 cached content '{cached_content}' not found")
+            prefix = self._caches[cached_content]
+        self.usage["input_tokens"] += len(prefix + prompt) // 4
+        self.usage["cached_tokens"] += len(prefix) // 4
+        return prefix + prompt, len(prefix) // 4
+
+    def _prefill(self, prompt: str) -> float:
+        return len(prompt) // 4 * self.prefill_seconds_per_token
+
+    async def generate(self, prompt: str, cached_content: str | None = None) -> _Result:
+        self.calls += 1
+        full_prompt, cached_tokens = self._prompt(prompt, cached_content)
+        await asyncio.sleep(self.latency.sample() + self._prefill(prompt))
+        self._maybe_fail()
+        text = self._answer(full_prompt)
+        self.usage["output_tokens"] += len(text) // 4
+        return _Result(text, len(full_prompt) // 4, len(text) // 4, cached_tokens)
+
+    async def generate_stream(self, prompt: str, cached_content: str | None = None):
+        self.calls += 1
+        full_prompt, _ = self._prompt(prompt, cached_content)
+        total = self.latency.sample()
+        # Time to the first chunk, then the rest spread evenly.
+        await asyncio.sleep(total * 0.3 + self._prefill(prompt))
+        self._maybe_fail()
+        text = self._answer(full_prompt)
+        self.usage["output_tokens"] += len(text) // 4
+        size = max(1, math.ceil(len(text) / self.stream_chunks))
+        for start in range(0, len(text), size):
+            yield types.SimpleNamespace(text=lambda chunk=text[start:start + size]: chunk)
+            await asyncio.sleep(total * 0.7 / self.stream_chunks)
+
+
+class FakeModels:
+    """`get_model` for the model router: "flash" models get the fast latency, others the pro one."""
+
+    def __init__(self, profile: dict, seed: int = 0):
+        self.profile = profile
+        self.seed = seed
+        self._models: dict[str, FakeModel] = {}
+
+    def get(self, name: str) -> FakeModel:
+        model = self._models.get(name)
+        if model is None:
+            tier = "fast_model" if "flash" in name else "pro_model"
+            latency = LatencyDistribution(*self.profile[tier], seed=self.seed + len(self._models) + 1)
+            model = self._models[name] = FakeModel(name, latency, self.profile, seed=self.seed)
+        return model
+
+    def calls(self) -> dict[str, int]:
+        return {name: model.calls for name, model in self._models.items()}
+
+    def set_error_rate(self, rate: float) -> None:
+        """Makes every model, current and future, fail this share of its calls."""
+        self.profile = self.profile | {"model_error_rate": rate}
+        for model in self._models.values():
+            model.error_rate = rate
+
+    def usage(self) -> dict[str, dict]:
+        """Token usage per model, including the input tokens served from context caches."""
+        return {name: dict(model.usage) for name, model in self._models.items()}
+
+
+class FakeEmbedder:
+    """Returns a deterministic unit vector per text."""
+
+    def __init__(self, latency: LatencyDistribution, dimensions: int = EMBEDDING_DIMENSIONS):
+        self.latency = latency
+        self.dimensions = dimensions
+        self.calls = 0
+
+    async def embed(self, text: str) -> list[float]:
+        """The Genkit embedder's interface: one text per call."""
+        self.calls += 1
+        await self.latency.wait()
+        rng = _seeded("embedding", text)
+        vector = [rng.gauss(0, 1) for _ in range(self.dimensions)]
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+
+class FakePineconeIndex:
+    """The blocking Pinecone `Index` API, answering every query with the user's seeded chunks."""
+
+    def __init__(self, latency: LatencyDistribution, chunk_chars: int = 400):
+        self.latency = latency
+        self.chunk_chars = chunk_chars
+        self.queries = 0
+
+    def query(self, vector, top_k, include_metadata=True, namespace="", timeout=None):
+        self.queries += 1
+        time.sleep(self.latency.sample())
+        rng = _seeded("pinecone", namespace, vector[0] if vector else 0)
+        matches = [
+            {
+                "id": f"{namespace}-chunk-{i}",
+                "score": 0.9 - 0.05 * i + rng.uniform(-0.02, 0.02),
+                "metadata": {"text": _filler(rng, self.chunk_chars), "source": "resume"},
+            }
+            for i in range(top_k)
+        ]
+        return {"matches": matches}
+
+    def upsert(self, vectors, namespace=""):
+        time.sleep(self.latency.sample())
+
+    def delete(self, ids, namespace=""):
+        time.sleep(self.latency.sample())
+
+
+def fake_perplexity_transport(latency: LatencyDistribution) -> httpx.MockTransport:
+    """An in-process transport answering Perplexity chat completions with company research JSON."""
+
+    async def _handler(request: httpx.Request) -> httpx.Response:
+        await latency.wait()
+        content = json.dumps({
+            "culture": "Collaborative, fast-moving and customer focused.",
+            "recent_news": "Launched a new product line this quarter.",
+            "values": ["Ownership", "Curiosity", "Craft"],
+        })
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+    return httpx.MockTransport(_handler)
+
+
+def install_fake_backends(profile_name: str = "default", seed: int = 0) -> dict:
+    """
+    Replaces every external backend of the application with the fakes for a profile.
+    Must run before the application handles its first request (and before its startup,
+    whose warm-up would otherwise create the real clients).
+
+    Returns:
+        The fakes, by backend name, for reading their call counters.
+
+    Raises:
+        ValueError: If the profile is unknown.
+    """
+    if profile_name not in PROFILES:
+        raise ValueError(f"Unknown profile '{profile_name}'. Expected one of: {', '.join(PROFILES)}.")
+    profile = PROFILES[profile_name]
+
+    from functions.flows.model_router import model_router
+    from functions.services.ai_service import PerplexityClient
+    from functions.services.embedding_service import embedding_service
+    from functions.services.registry import services
+    from functions.services.secret_service import FakeSecretBackend, secret_provider
+    from functions.services.vector_db_service import PineconeClient
+
+    def _latency(backend: str, offset: int) -> LatencyDistribution:
+        return LatencyDistribution(*profile[backend], seed=seed * 100 + offset)
+
+    secret_latency = _latency("secret_manager", 1).sample()
+    secret_provider.backend = FakeSecretBackend(
+        {"PINECONE_API_KEY": "fake-pinecone-key", "PERPLEXITY_API_KEY": "fake-perplexity-key"},
+        latency_seconds=secret_latency,
+    )
+
+    firestore = FakeFirestore(DistributionFirestoreLatency(_latency("firestore", 2)))
+    pinecone_index = FakePineconeIndex(_latency("pinecone", 3))
+    pinecone_client = PineconeClient(api_key="fake", environment="fake", index=pinecone_index)
+    perplexity = PerplexityClient(
+        api_key="fake-perplexity-key",
+        http2=False,
+        transport=fake_perplexity_transport(_latency("perplexity", 4)),
+    )
+    models = FakeModels(profile, seed=seed)
+    embedder = FakeEmbedder(_latency("embedding", 5))
+
+    services.override("firebase_app", types.SimpleNamespace(project_id="benchmark-project"))
+    services.override("token_verifier", FakeTokenVerifier(_latency("token_verify", 6)))
+    services.override("firestore", firestore)
+    services.override("pinecone", pinecone_client)
+    services.override("local_index", pinecone_client)
+    services.override("retriever", pinecone_client)
+    services.override("perplexity", perplexity)
+    services.override("secret_manager", (None, "benchmark-project"))
+    model_router.get_model = models.get
+    embedding_service.get_embedder = lambda name: embedder
+
+    return {
+        "firestore": firestore,
+        "pinecone": pinecone_index,
+        "perplexity": perplexity,
+        "models": models,
+        "embedder": embedder,
+    }
@@ -0,0 +1,227 @@
+# benchmarks/fake_firestore.py
+
+"""
+An in-memory stand-in for the parts of the Firestore client the services use.
+
+It supports nested collections, auto-generated document IDs, `set`, `create`, `stream`,
+`order_by`, `select`, `start_after`, `limit` and batched writes. Reads and
+writes sleep for a simulated round trip plus a per-byte transfer cost, so
+benchmarks can show the effect of reading fewer or smaller documents.
+"""
+
+import copy
+import json
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from google.api_core.exceptions import AlreadyExists
+
+
+class FakeLatency:
+    """Simulated Firestore costs, in seconds."""
+
+    def __init__(self, round_trip: float = 0.005, per_kb: float = 0.00002):
+        self.round_trip = round_trip
+        self.per_kb = per_kb
+
+    def charge(self, payload_bytes: int = 0) -> None:
+        time.sleep(self.round_trip + self.per_kb * payload_bytes / 1024)
+
+
+def _size(data: dict) -> int:
+    return len(json.dumps(data, default=str))
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id: str, data: dict):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self) -> dict | None:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, db: "FakeFirestore", path: str, doc_id: str):
+        self._db = db
+        self.path = path
+        self.id = doc_id
+
+    def collection(self, name: str) -> "FakeQuery":
+        return FakeQuery(self._db, f"{self.path}/{name}")
+
+    def set(self, data: dict, merge: bool = False) -> None:
+        self._db.latency.charge(_size(data))
+        self._db.write(self, data, merge)
+
+    def create(self, data: dict) -> None:
+        self._db.latency.charge(_size(data))
+        self._db.insert(self, data)
+
+    def delete(self) -> None:
+        self._db.latency.charge()
+        self._db.remove(self)
+
+    def get(self) -> FakeSnapshot:
+        data = self._db.read(self)
+        self._db.latency.charge(_size(data) if data else 0)
+        return FakeSnapshot(self.id, data)
+
+
+class FakeQuery:
+    """A collection reference; query methods return narrowed copies."""
+
+    def __init__(self, db: "FakeFirestore", path: str):
+        self._db = db
+        self.path = path
+        self._orders: list[tuple[str, str]] = []
+        self._fields: list[str] | None = None
+        self._start_after: dict | None = None
+        self._limit: int | None = None
+
+    def _copy(self) -> "FakeQuery":
+        query = FakeQuery(self._db, self.path)
+        query._orders = list(self._orders)
+        query._fields = self._fields
+        query._start_after = self._start_after
+        query._limit = self._limit
+        return query
+
+    def document(self, doc_id: str | None = None) -> FakeDocument:
+        doc_id = doc_id or uuid.uuid4().hex[:20]
+        return FakeDocument(self._db, f"{self.path}/{doc_id}", doc_id)
+
+    def order_by(self, field: str, direction: str = "ASCENDING") -> "FakeQuery":
+        query = self._copy()
+        query._orders.append((field, direction))
+        return query
+
+    def select(self, fields: list[str]) -> "FakeQuery":
+        query = self._copy()
+        query._fields = list(fields)
+        return query
+
+    def start_after(self, values: dict) -> "FakeQuery":
+        query = self._copy()
+        query._start_after = values
+        return query
+
+    def limit(self, count: int) -> "FakeQuery":
+        query = self._copy()
+        query._limit = count
+        return query
+
+    def _sort_key(self, doc_id: str, data: dict) -> tuple:
+        key = []
+        for field, _ in self._orders:
+            value = doc_id if field == "__name__" else data.get(field)
+            key.append(value)
+        return tuple(key)
+
+    def stream(self):
+        documents = self._db.children(self.path)
+        for field, direction in reversed(self._orders):
+            documents.sort(
+                key=lambda item: item[0] if field == "__name__" else item[1].get(field, datetime.min),
+                reverse=direction == "DESCENDING",
+            )
+        if self._start_after is not None:
+            boundary = tuple(
+                value.id if isinstance(value, FakeDocument) else value
+                for value in (self._start_after[field] for field, _ in self._orders)
+            )
+            for position, (doc_id, data) in enumerate(documents):
+                if self._sort_key(doc_id, data) == boundary:
+                    documents = documents[position + 1:]
+                    break
+        if self._limit is not None:
+            documents = documents[:self._limit]
+
+        results = []
+        payload = 0
+        for doc_id, data in documents:
+            if self._fields is not None:
+                data = {field: data[field] for field in self._fields if field in data}
+            payload += _size(data)
+            results.append(FakeSnapshot(doc_id, data))
+        self._db.latency.charge(payload)
+        return iter(results)
+
+
+class FakeBatch:
+    def __init__(self, db: "FakeFirestore"):
+        self._db = db
+        self._writes: list[tuple[FakeDocument, dict, bool]] = []
+
+    def set(self, doc_ref: FakeDocument, data: dict, merge: bool = False) -> None:
+        if len(self._writes) >= 500:
+            raise ValueError("A batch can contain at most 500 operations.")
+        self._writes.append((doc_ref, copy.deepcopy(data), merge))
+
+    def commit(self) -> None:
+        self._db.commit_attempts += 1
+        self._db.latency.charge(sum(_size(data) for _, data, _ in self._writes))
+        if self._db.fail_next_commits > 0:
+            self._db.fail_next_commits -= 1
+            raise RuntimeError("Simulated Firestore outage")
+        for doc_ref, data, merge in self._writes:
+            self._db.write(doc_ref, data, merge)
+        self._db.commits += 1
+
+
+class FakeFirestore:
+    """The fake client: `collection(...)`, `batch()` and counters for benchmarks."""
+
+    def __init__(self, latency: FakeLatency | None = None):
+        self.latency = latency or FakeLatency()
+        self._documents: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self.commits = 0
+        self.commit_attempts = 0
+        # Makes the next N batch commits fail, to simulate an outage.
+        self.fail_next_commits = 0
+
+    def collection(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def batch(self) -> FakeBatch:
+        return FakeBatch(self)
+
+    def write(self, doc_ref: FakeDocument, data: dict, merge: bool) -> None:
+        with self._lock:
+            if merge and doc_ref.path in self._documents:
+                self._documents[doc_ref.path].update(copy.deepcopy(data))
+            else:
+                self._documents[doc_ref.path] = copy.deepcopy(data)
+
+    def insert(self, doc_ref: FakeDocument, data: dict) -> None:
+        with self._lock:
+            if doc_ref.path in self._documents:
+                raise AlreadyExists(f"Document already exists: {doc_ref.path}")
+            self._documents[doc_ref.path] = copy.deepcopy(data)
+
+    def remove(self, doc_ref: FakeDocument) -> None:
+        with self._lock:
+            self._documents.pop(doc_ref.path, None)
+
+    def read(self, doc_ref: FakeDocument) -> dict | None:
+        with self._lock:
+            return self._documents.get(doc_ref.path)
+
+    def children(self, collection_path: str) -> list[tuple[str, dict]]:
+        prefix = collection_path + "/"
+        with self._lock:
+            return [
+                (path[len(prefix):], data)
+                for path, data in self._documents.items()
+                if path.startswith(prefix) and "/" not in path[len(prefix):]
+            ]
+
+    def seed(self, collection_path: str, documents: dict[str, dict]) -> None:
+        """Stores documents directly, without simulated latency."""
+        with self._lock:
+            for doc_id, data in documents.items():
+                self._documents[f"{collection_path}/{doc_id}"] = data
@@ -0,0 +1,170 @@
+# benchmarks/ingestion_benchmark.py
+
+"""
+Throughput benchmark (chunks/sec) for the RAG ingestion pipeline.
+
+A fake embedder with the Genkit embedder's one-text-per-call interface charges
+per-call latency, and an in-memory index
+charges a round trip per upsert/delete request, like Pinecone. Scenarios:
+
+* per-chunk baseline  - one embedder call and one upsert per chunk
+* pipeline, fresh     - `IngestionService.ingest_document` for new documents
+* pipeline, edited    - the same documents with one paragraph changed each
+* pipeline, unchanged - the same documents again
+
+    python -m benchmarks.ingestion_benchmark
+"""
+
+import asyncio
+import random
+import time
+
+from benchmarks.common import print_table
+from functions.services.embedding_cache import EmbeddingCache
+from functions.services.embedding_service import EmbeddingService
+from functions.services.ingestion_service import IngestionService, InMemoryManifestStore, chunk_text
+
+DOCUMENTS = 50
+PARAGRAPHS_PER_DOCUMENT = 120
+DIMENSIONS = 256
+PER_CALL_SECONDS = 0.04
+PER_TEXT_SECONDS = 0.0005
+PROVIDER_CONCURRENCY = 8
+INDEX_ROUND_TRIP_SECONDS = 0.015
+DOCUMENT_CONCURRENCY = 8
+WORDS = (
+    "client support disability community plan care team worker NDIS goals safety "
+    "family review report shift mentor program outcome wellbeing advocate roster"
+).split()
+
+
+class FakeEmbedder:
+    """Simulates an embedding API with per-call overhead and limited provider-side concurrency."""
+
+    def __init__(self):
+        self.calls = 0
+        self.texts = 0
+        self._slots = asyncio.Semaphore(PROVIDER_CONCURRENCY)
+
+    async def embed(self, text: str) -> list[float]:
+        async with self._slots:
+            self.calls += 1
+            self.texts += 1
+            await asyncio.sleep(PER_CALL_SECONDS + PER_TEXT_SECONDS)
+            return [float(hash(text) % 997)] * DIMENSIONS
+
+
+class InMemoryIndex:
+    """A vector index keyed by namespace that charges a round trip per request."""
+
+    def __init__(self):
+        self.namespaces: dict[str, dict[str, dict]] = {}
+        self.requests = 0
+
+    async def upsert(self, user_id: str, vectors: list[dict]) -> None:
+        self.requests += 1
+        await asyncio.sleep(INDEX_ROUND_TRIP_SECONDS)
+        namespace = self.namespaces.setdefault(user_id, {})
+        for vector in vectors:
+            namespace[vector["id"]] = vector
+
+    async def delete(self, user_id: str, ids: list[str]) -> None:
+        self.requests += 1
+        await asyncio.sleep(INDEX_ROUND_TRIP_SECONDS)
+        namespace = self.namespaces.setdefault(user_id, {})
+        for vector_id in ids:
+            namespace.pop(vector_id, None)
+
+
+class FakeEmbeddingService(EmbeddingService):
+    """The real cached, micro-batched embedding service in front of the fake embedder."""
+
+    def __init__(self, embedder: FakeEmbedder):
+        cache = EmbeddingCache(max_bytes=256 * 1024 * 1024, ttl_seconds=3600)
+        super().__init__(
+            model="fake", cache=cache, max_batch_size=64, max_wait_seconds=0.005, get_embedder=lambda name: embedder,
+        )
+
+
+def _documents(seed: int = 7) -> dict[str, list[str]]:
+    rng = random.Random(seed)
+    return {
+        f"doc-{d}": [
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(15, 60))).capitalize() + "."
+            for _ in range(PARAGRAPHS_PER_DOCUMENT)
+        ]
+        for d in range(DOCUMENTS)
+    }
+
+
+def _edit(documents: dict[str, list[str]]) -> dict[str, list[str]]:
+    edited = {}
+    for doc_id, paragraphs in documents.items():
+        paragraphs = list(paragraphs)
+        paragraphs[len(paragraphs) // 2] += " Recently promoted to team leader."
+        edited[doc_id] = paragraphs
+    return edited
+
+
+async def _baseline(documents: dict[str, list[str]]) -> dict:
+    embedder, index = FakeEmbedder(), InMemoryIndex()
+    semaphore = asyncio.Semaphore(DOCUMENT_CONCURRENCY * 8)
+    chunks = [(doc_id, chunk) for doc_id, paragraphs in documents.items() for chunk in chunk_text("\n\n".join(paragraphs))]
+
+    async def _one(position: int, doc_id: str, chunk: str) -> None:
+        async with semaphore:
+            vector = await embedder.embed(chunk)
+            await index.upsert("user", [{"id": f"{doc_id}:{position}", "values": vector, "metadata": {"text": chunk}}])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_one(position, doc_id, chunk) for position, (doc_id, chunk) in enumerate(chunks)))
+    wall = time.perf_counter() - started
+    return {"chunks": len(chunks), "embedded": len(chunks), "wall_s": wall, "chunks_per_s": len(chunks) / wall,
+            "embed_calls": embedder.calls, "index_requests": index.requests}
+
+
+async def _pipeline(service: IngestionService, embedder: FakeEmbedder, index: InMemoryIndex, documents: dict[str, list[str]]) -> dict:
+    calls_before, requests_before = embedder.calls, index.requests
+    semaphore = asyncio.Semaphore(DOCUMENT_CONCURRENCY)
+
+    async def _one(doc_id: str, paragraphs: list[str]) -> dict:
+        async with semaphore:
+            return await service.ingest_document("user", doc_id, "\n\n".join(paragraphs), metadata={"source": "history"})
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(_one(doc_id, paragraphs) for doc_id, paragraphs in documents.items()))
+    wall = time.perf_counter() - started
+    chunks = sum(result["chunks"] for result in results)
+    return {
+        "chunks": chunks,
+        "embedded": sum(result["embedded"] for result in results),
+        "wall_s": wall,
+        "chunks_per_s": chunks / wall,
+        "embed_calls": embedder.calls - calls_before,
+        "index_requests": index.requests - requests_before,
+    }
+
+
+async def main() -> None:
+    documents = _documents()
+    rows = {"per-chunk baseline": await _baseline(documents)}
+
+    embedder, index = FakeEmbedder(), InMemoryIndex()
+    service = IngestionService(index=index, manifests=InMemoryManifestStore(), embed_many=FakeEmbeddingService(embedder).embed_many)
+    rows["pipeline, fresh"] = await _pipeline(service, embedder, index, documents)
+    # Clear the embedding cache so edits are measured by what the manifest skips, not the cache.
+    service.embed_many = FakeEmbeddingService(embedder).embed_many
+    rows["pipeline, edited"] = await _pipeline(service, embedder, index, _edit(documents))
+    rows["pipeline, unchanged"] = await _pipeline(service, embedder, index, _edit(documents))
+
+    print_table(
+        f"Ingesting {DOCUMENTS} documents of {PARAGRAPHS_PER_DOCUMENT} paragraphs "
+        f"({PER_CALL_SECONDS * 1000:.0f}ms per embed call, {INDEX_ROUND_TRIP_SECONDS * 1000:.0f}ms per index request)",
+        rows,
+        ["chunks", "embedded", "wall_s", "chunks_per_s", "embed_calls", "index_requests"],
+    )
+    print(f"\nVectors in the index: {len(index.namespaces['user'])}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,145 @@
+# benchmarks/job_benchmark.py
+
+"""
+Benchmark for running long generations as background jobs.
+
+A fake flow takes 0.3-3s. Each client sends its request and, like a client
+on a flaky network, sends it again shortly after. Synchronously, every request
+runs the flow inside an HTTP request with a 1.5s timeout: slow generations are
+lost, and the retry runs the whole generation again. As jobs, the submission
+returns at once, the retry (same idempotency key) is de-duplicated, and the
+client follows the job's status until the result is stored in the fake
+Firestore. Reports completed results, generations run, the time until the
+client gets an answer (acknowledgement or response) and the time to the result:
+
+    python -m benchmarks.job_benchmark
+"""
+
+import asyncio
+import random
+import time
+import types
+
+from benchmarks.common import print_table, summarize
+from benchmarks.fake_firestore import FakeFirestore, FakeLatency
+from functions.flows.jobs import JobRunner
+from functions.services.admission_control import AdmissionController
+from functions.services.firebase_service import FirebaseService
+
+CLIENTS = 60
+USERS = 20
+HTTP_TIMEOUT_SECONDS = 1.5
+RETRY_AFTER_SECONDS = 0.1
+WORKERS = 16
+LATENCY = FakeLatency(round_trip=0.01)
+
+
+class _Input:
+    def __init__(self, job_description: str):
+        self.job_description = job_description
+
+
+class _FakeFlow:
+    def __init__(self, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.runs = 0
+
+    async def __call__(self, data, user):
+        self.runs += 1
+        await asyncio.sleep(self.rng.uniform(0.3, 3.0))
+        return types.SimpleNamespace(cover_letter=f"Letter for {data.job_description}", document_id=None)
+
+
+def _user(i: int):
+    return types.SimpleNamespace(uid=f"user-{i % USERS}")
+
+
+async def _sync_mode() -> dict:
+    flow = _FakeFlow()
+    answered, results = [], []
+
+    async def _request(i: int) -> bool:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(flow(_Input(f"Job {i}"), _user(i)), timeout=HTTP_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            answered.append(time.perf_counter() - started)
+            return False
+        answered.append(time.perf_counter() - started)
+        return True
+
+    async def _client(i: int) -> None:
+        started = time.perf_counter()
+        first = asyncio.create_task(_request(i))
+        await asyncio.sleep(RETRY_AFTER_SECONDS)
+        outcomes = await asyncio.gather(first, _request(i))
+        if any(outcomes):
+            results.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(_client(i) for i in range(CLIENTS)))
+    return {"answer": answered, "result": results, "runs": flow.runs, "deduplicated": 0}
+
+
+async def _job_mode() -> dict:
+    flow = _FakeFlow()
+    service = FirebaseService(FakeFirestore(LATENCY))
+
+    async def _get_service():
+        return service
+
+    runner = JobRunner(
+        flows={"generate": (flow, _Input)},
+        max_workers=WORKERS,
+        get_service=_get_service,
+        admission=AdmissionController(),
+    )
+    answered, results = [], []
+
+    async def _submit(i: int) -> dict:
+        started = time.perf_counter()
+        job = await runner.submit("generate", {"job_description": f"Job {i}"}, _user(i), idempotency_key=f"client-{i}")
+        answered.append(time.perf_counter() - started)
+        return job
+
+    async def _client(i: int) -> None:
+        started = time.perf_counter()
+        job = await _submit(i)
+        await asyncio.sleep(RETRY_AFTER_SECONDS)
+        await _submit(i)
+        async for state in runner.watch(_user(i).uid, job["job_id"]):
+            if state["status"] == "succeeded":
+                results.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(_client(i) for i in range(CLIENTS)))
+    await runner.drain()
+    stats = runner.stats()
+    return {"answer": answered, "result": results, "runs": flow.runs, "deduplicated": stats["deduplicated"]}
+
+
+def _row(outcome: dict) -> dict:
+    answer = summarize(outcome["answer"])
+    result = summarize(outcome["result"])
+    return {
+        "completed": f"{len(outcome['result'])}/{CLIENTS}",
+        "generations": outcome["runs"],
+        "deduplicated": outcome["deduplicated"],
+        "answer_p50_ms": answer["p50_ms"],
+        "result_p50_ms": result["p50_ms"],
+        "result_p95_ms": result["p95_ms"],
+    }
+
+
+async def main() -> None:
+    rows = {
+        "synchronous request": _row(await _sync_mode()),
+        "background job": _row(await _job_mode()),
+    }
+    print_table(
+        f"{CLIENTS} clients, each sending its request twice (flow 0.3-3s, HTTP timeout {HTTP_TIMEOUT_SECONDS}s)",
+        rows,
+        ["completed", "generations", "deduplicated", "answer_p50_ms", "result_p50_ms", "result_p95_ms"],
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
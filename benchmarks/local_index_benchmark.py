@@ -0,0 +1,100 @@
+# benchmarks/local_index_benchmark.py
+
+"""
+Recall and latency of the in-process `LocalVectorIndex`.
+
+Exhaustive (brute-force) search is the ground truth; IVF mode is measured at
+several probe counts for recall@k and per-query latency. The last section
+persists a namespace, reopens it memory-mapped and times the first queries.
+Vectors are drawn around random cluster centres, like chunks of related
+documents:
+
+    python -m benchmarks.local_index_benchmark
+"""
+
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import print_table, summarize
+from functions.services.local_vector_index import LocalVectorIndex
+
+SIZES = [10_000, 100_000]
+DIMENSIONS = 384
+CLUSTERS = 200
+QUERIES = 200
+TOP_K = 10
+PROBES = [1, 4, 8, 16, 32]
+
+
+def _dataset(count: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(CLUSTERS, DIMENSIONS)).astype(np.float32)
+    vectors = centres[rng.integers(CLUSTERS, size=count)] + 1.5 * rng.normal(size=(count, DIMENSIONS)).astype(np.float32)
+    queries = vectors[rng.integers(count, size=QUERIES)] + 0.5 * rng.normal(size=(QUERIES, DIMENSIONS)).astype(np.float32)
+    return vectors, queries
+
+
+def _fill(index: LocalVectorIndex, vectors: np.ndarray) -> None:
+    for start in range(0, len(vectors), 10_000):
+        index._upsert("user", [
+            {"id": str(i), "values": vectors[i], "metadata": {"text": f"chunk {i}"}}
+            for i in range(start, min(start + 10_000, len(vectors)))
+        ])
+
+
+def _run(index: LocalVectorIndex, queries: np.ndarray) -> tuple[list[list[str]], list[float]]:
+    results, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        matches = index._search("user", query, TOP_K)
+        latencies.append(time.perf_counter() - started)
+        results.append([match["id"] for match in matches])
+    return results, latencies
+
+
+def _recall(results: list[list[str]], truth: list[list[str]]) -> float:
+    return sum(len(set(r) & set(t)) for r, t in zip(results, truth)) / sum(len(t) for t in truth)
+
+
+def main() -> None:
+    for size in SIZES:
+        vectors, queries = _dataset(size)
+        exact = LocalVectorIndex(ivf_min_vectors=None)
+        _fill(exact, vectors)
+        truth, latencies = _run(exact, queries)
+        rows = {"brute force": summarize(latencies) | {"recall": 1.0}}
+
+        for probes in PROBES:
+            ivf = LocalVectorIndex(ivf_min_vectors=0, probes=probes)
+            _fill(ivf, vectors)
+            started = time.perf_counter()
+            ivf._build_ivf("user")
+            build_ms = (time.perf_counter() - started) * 1000
+            results, latencies = _run(ivf, queries)
+            rows[f"IVF, {probes} probes"] = summarize(latencies) | {"recall": _recall(results, truth), "build_ms": build_ms}
+
+        print_table(
+            f"{size:,} vectors x {DIMENSIONS} dims, {QUERIES} queries, recall@{TOP_K} vs brute force",
+            rows,
+            ["p50_ms", "p95_ms", "recall", "build_ms"],
+        )
+
+    with tempfile.TemporaryDirectory() as directory:
+        vectors, queries = _dataset(SIZES[-1])
+        writer = LocalVectorIndex(directory=directory, ivf_min_vectors=None)
+        _fill(writer, vectors)
+        writer._flush()
+        started = time.perf_counter()
+        reader = LocalVectorIndex(directory=directory, ivf_min_vectors=None)
+        results, latencies = _run(reader, queries)
+        print(
+            f"\nReopened {SIZES[-1]:,} persisted vectors (memory-mapped): first query "
+            f"{latencies[0] * 1000:.1f}ms, p50 {summarize(latencies)['p50_ms']:.2f}ms, "
+            f"total {(time.perf_counter() - started) * 1000:.0f}ms for {QUERIES} queries"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# benchmarks/model_router_benchmark.py
+
+"""
+Latency of routed generations against always using the pro model.
+
+The models are fakes whose latency grows with prompt and output size (the pro
+model is several times slower per token). A workload of short and long prompts
+is run three ways: everything on pro (the previous behaviour), routed by the
+`ModelRouter`, and routed while the fast model fails or stalls on a share of
+calls, which exercises the fallback to the other tier:
+
+    python -m benchmarks.model_router_benchmark
+"""
+
+import asyncio
+import random
+
+from benchmarks.common import print_table, run_concurrently, summarize
+from functions.flows.model_router import ModelRouter
+
+REQUESTS = 400
+CONCURRENCY = 32
+# Seconds per 1,000 prompt tokens and fixed overhead, per model.
+PROFILES = {"fake-flash": (0.02, 0.05), "fake-pro": (0.08, 0.20)}
+
+
+class _Result:
+    def __init__(self, text: str):
+        self._text = text
+
+    def text(self) -> str:
+        return self._text
+
+
+class _FakeModel:
+    def __init__(self, name: str, failure_rate: float = 0.0, stall_rate: float = 0.0, seed: int = 0):
+        self.per_k_tokens, self.overhead = PROFILES[name]
+        self.failure_rate = failure_rate
+        self.stall_rate = stall_rate
+        self.rng = random.Random(seed)
+
+    async def generate(self, prompt: str) -> _Result:
+        roll = self.rng.random()
+        if roll < self.stall_rate:
+            await asyncio.sleep(10)
+        await asyncio.sleep(self.overhead + self.per_k_tokens * len(prompt) / 4 / 1000)
+        if roll < self.stall_rate + self.failure_rate:
+            raise RuntimeError("503 model overloaded")
+        return _Result('{"analysis": "ok"}')
+
+
+def _prompts(rng: random.Random) -> list[str]:
+    """Three in four requests are short (a brief job ad and little context); the rest are long."""
+    return ["word " * (rng.randint(400, 1_200) if rng.random() < 0.75 else rng.randint(3_000, 8_000))
+            for _ in range(REQUESTS)]
+
+
+async def _scenario(router: ModelRouter, prompts: list[str], quality: str | None) -> dict:
+    async def _call(i: int) -> None:
+        await router.generate(prompts[i], task="generate", quality=quality)
+
+    latencies, wall = await run_concurrently(_call, REQUESTS, CONCURRENCY)
+    stats = router.stats()
+    return summarize(latencies, wall) | {
+        "fast_share": stats.get("fake-flash", {}).get("calls", 0) / REQUESTS,
+        "fallbacks": sum(model["fallbacks"] for model in stats.values()),
+    }
+
+
+def _router(fast_failure_rate: float = 0.0, fast_stall_rate: float = 0.0) -> ModelRouter:
+    models = {
+        "fake-flash": _FakeModel("fake-flash", fast_failure_rate, fast_stall_rate, seed=1),
+        "fake-pro": _FakeModel("fake-pro", seed=2),
+    }
+    return ModelRouter(
+        models={"fast": "fake-flash", "pro": "fake-pro"},
+        timeouts={"fast": 1.0, "pro": 3.0},
+        get_model=models.__getitem__,
+    )
+
+
+async def main() -> None:
+    prompts = _prompts(random.Random(0))
+    rows = {
+        "always pro": await _scenario(_router(), prompts, quality="best"),
+        "routed": await _scenario(_router(), prompts, quality=None),
+        "routed, fast 10% errors": await _scenario(_router(fast_failure_rate=0.1), prompts, quality=None),
+        "routed, fast 5% stalls": await _scenario(_router(fast_stall_rate=0.05), prompts, quality=None),
+    }
+    print_table(
+        f"{REQUESTS} generations, {CONCURRENCY} concurrent (fast tier up to 1,500 prompt tokens)",
+        rows,
+        ["p50_ms", "p95_ms", "p99_ms", "fast_share", "fallbacks"],
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
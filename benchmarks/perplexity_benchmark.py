@@ -0,0 +1,115 @@
+# benchmarks/perplexity_benchmark.py
+
+"""
+Benchmark for the async Perplexity client against the local stub server.
+
+* baseline        - a new connection per request and no result cache
+* pooled + cache  - the shared `PerplexityClient` (keep-alive pool, per-company cache)
+* flaky upstream  - 30% of requests fail with 503; retries keep requests succeeding
+* outage          - every request fails; the circuit opens and later calls fail fast
+
+Requests are spread over a small set of companies, since many users apply to
+the same employers:
+
+    python -m benchmarks.perplexity_benchmark
+"""
+
+import asyncio
+import random
+import time
+
+import httpx
+
+from benchmarks.common import print_table, run_concurrently, summarize
+from benchmarks.perplexity_stub_server import StubPerplexityServer
+from functions.services.ai_service import DEEP_DIVE_PROMPT, PerplexityClient
+from functions.services.circuit_breaker import CircuitBreaker
+
+REQUESTS = 300
+CONCURRENCY = 32
+COMPANIES = 40
+LATENCY_SECONDS = 0.1
+
+
+def _company(i: int) -> str:
+    return f"Company {random.Random(i).randrange(COMPANIES)}"
+
+
+async def _baseline(server: StubPerplexityServer) -> dict:
+    async def _call(i: int) -> None:
+        async with httpx.AsyncClient(base_url=server.url) as http:
+            prompt = DEEP_DIVE_PROMPT.format(company_name=_company(i))
+            response = await http.post("/chat/completions", json={"model": "sonar", "messages": [{"role": "user", "content": prompt}]})
+            response.raise_for_status()
+
+    latencies, wall = await run_concurrently(_call, REQUESTS, CONCURRENCY)
+    return summarize(latencies, wall) | {"upstream_calls": server.requests}
+
+
+async def _client_run(server: StubPerplexityServer, client: PerplexityClient) -> dict:
+    errors = 0
+
+    async def _call(i: int) -> None:
+        nonlocal errors
+        try:
+            await client.company_deep_dive(_company(i))
+        except Exception:
+            errors += 1
+
+    latencies, wall = await run_concurrently(_call, REQUESTS, CONCURRENCY)
+    stats = client.stats()
+    await client.close()
+    return summarize(latencies, wall) | {
+        "upstream_calls": server.requests,
+        "errors": errors,
+        "retries": stats["retries"],
+        "cache_hit_rate": stats["cache_hit_rate"],
+    }
+
+
+async def main() -> None:
+    rows = {}
+
+    server = StubPerplexityServer(latency_seconds=LATENCY_SECONDS).start()
+    rows["baseline"] = await _baseline(server)
+    server.stop()
+
+    server = StubPerplexityServer(latency_seconds=LATENCY_SECONDS).start()
+    rows["pooled + cache"] = await _client_run(server, PerplexityClient("bench", base_url=server.url))
+    server.stop()
+
+    # A short cache TTL so every request reaches the flaky upstream.
+    server = StubPerplexityServer(latency_seconds=LATENCY_SECONDS, failure_rate=0.3).start()
+    client = PerplexityClient(
+        "bench",
+        base_url=server.url,
+        backoff_base_seconds=0.02,
+        cache_ttl_seconds=0,
+        circuit_breaker=CircuitBreaker("perplexity", failure_threshold=50, reset_timeout_seconds=1.0),
+    )
+    rows["flaky upstream (30% 503)"] = await _client_run(server, client)
+    server.stop()
+
+    server = StubPerplexityServer(latency_seconds=LATENCY_SECONDS, failure_rate=1.0).start()
+    client = PerplexityClient(
+        "bench",
+        base_url=server.url,
+        max_retries=1,
+        backoff_base_seconds=0.02,
+        circuit_breaker=CircuitBreaker("perplexity", failure_threshold=5, reset_timeout_seconds=60.0),
+    )
+    started = time.perf_counter()
+    rows["outage"] = await _client_run(server, client)
+    rows["outage"]["wall_s"] = time.perf_counter() - started
+    server.stop()
+
+    print_table(
+        f"Company research: {REQUESTS} requests over {COMPANIES} companies, {CONCURRENCY} concurrent, "
+        f"{LATENCY_SECONDS * 1000:.0f}ms upstream latency",
+        rows,
+        ["p50_ms", "p95_ms", "throughput_per_s", "upstream_calls", "errors", "retries", "cache_hit_rate"],
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+# benchmarks/perplexity_stub_server.py
+
+"""
+A local stand-in for the Perplexity chat completions API.
+
+It answers `POST /chat/completions` with a company-research JSON answer after a
+configurable latency, and can be told to fail a fraction of requests with 503
+(or every request, to simulate an outage). Point the client at it with
+`PerplexityClient(base_url=server.url)` or `PERPLEXITY_BASE_URL`:
+
+    python -m benchmarks.perplexity_stub_server --port 8765 --latency-ms 300
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Accept bursts of concurrent connections instead of resetting them.
+    request_queue_size = 256
+
+
+class StubPerplexityServer:
+    """Runs the stub API in a background thread."""
+
+    def __init__(self, port: int = 0, latency_seconds: float = 0.2, failure_rate: float = 0.0):
+        """
+        Initializes the server (bound, but not yet serving).
+
+        Args:
+            port: The port to listen on; 0 picks a free one.
+            latency_seconds: How long each request takes to answer.
+            failure_rate: The fraction of requests answered with HTTP 503 (1.0 is a full outage).
+        """
+        self.latency_seconds = latency_seconds
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._httpd = _Server(("127.0.0.1", port), self._handler_class())
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                time.sleep(server.latency_seconds)
+                with server._lock:
+                    server.requests += 1
+                    failed = random.random() < server.failure_rate
+                    server.failures += failed
+                if failed:
+                    self._reply(503, {"error": "service unavailable"})
+                    return
+                prompt = body["messages"][-1]["content"]
+                company = prompt.split('"')[1] if '"' in prompt else "Unknown"
+                answer = {
+                    "culture": f"{company} is known for a collaborative culture.",
+                    "recent_news": f"{company} recently expanded its services.",
+                    "values": ["Integrity", "Community Impact"],
+                }
+                self._reply(200, {"choices": [{"message": {"role": "assistant", "content": json.dumps(answer)}}]})
+
+            def _reply(self, status: int, payload: dict):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def start(self) -> "StubPerplexityServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = StubPerplexityServer(args.port, args.latency_ms / 1000, args.failure_rate).start()
+    print(f"Stub Perplexity API listening on {server.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,78 @@
+# benchmarks/pinecone_load_test.py
+
+"""
+Load test for the thread-pooled Pinecone query path.
+
+An in-process fake index sleeps for a fixed round-trip time inside `query`,
+just like the synchronous Pinecone client blocks on the network. The test
+compares the old behaviour (calling `index.query` directly on the event loop)
+with `BlockingExecutor` at increasing worker counts, and shows throughput
+scaling with the concurrency limit:
+
+    python -m benchmarks.pinecone_load_test
+"""
+
+import asyncio
+import time
+
+from benchmarks.common import print_table, run_concurrently, summarize
+from functions.services.blocking_executor import BlockingExecutor
+
+QUERIES = 200
+CLIENT_CONCURRENCY = 64
+ROUND_TRIP_SECONDS = 0.02
+WORKER_COUNTS = [1, 2, 4, 8, 16, 32]
+
+
+class FakeIndex:
+    """Mimics `pinecone.Index.query`: blocks for one round trip and returns matches."""
+
+    def __init__(self, round_trip_seconds: float):
+        self.round_trip_seconds = round_trip_seconds
+
+    def query(self, vector, top_k, include_metadata, namespace):
+        time.sleep(self.round_trip_seconds)
+        return {"matches": [{"metadata": {"text": f"{namespace} chunk {i}"}} for i in range(top_k)]}
+
+
+async def main() -> None:
+    index = FakeIndex(ROUND_TRIP_SECONDS)
+    vector = [0.1] * 768
+    rows = {}
+
+    async def _blocking_query(i: int) -> None:
+        index.query(vector=vector, top_k=3, include_metadata=True, namespace=f"user-{i}")
+
+    latencies, wall = await run_concurrently(_blocking_query, QUERIES, CLIENT_CONCURRENCY)
+    rows["sync on event loop"] = summarize(latencies, wall)
+
+    for workers in WORKER_COUNTS:
+        executor = BlockingExecutor(name="pinecone-bench", max_workers=workers, default_timeout=10.0)
+
+        async def _pooled_query(i: int) -> None:
+            await executor.run(index.query, vector=vector, top_k=3, include_metadata=True, namespace=f"user-{i}")
+
+        latencies, wall = await run_concurrently(_pooled_query, QUERIES, CLIENT_CONCURRENCY)
+        rows[f"executor, {workers} workers"] = summarize(latencies, wall)
+        executor.shutdown()
+
+    print_table(
+        f"Pinecone queries: {QUERIES} queries, {CLIENT_CONCURRENCY} concurrent callers, "
+        f"{ROUND_TRIP_SECONDS * 1000:.0f}ms round trip",
+        rows,
+        ["count", "p50_ms", "p99_ms", "throughput_per_s"],
+    )
+
+    # Timeouts and cancellation: a stalled index must not hold up the caller.
+    stalled = FakeIndex(round_trip_seconds=1.0)
+    executor = BlockingExecutor(name="pinecone-timeout", max_workers=1)
+    started = time.perf_counter()
+    try:
+        await executor.run(stalled.query, vector=vector, top_k=3, include_metadata=True, namespace="slow", timeout=0.05)
+    except asyncio.TimeoutError:
+        print(f"\nStalled query abandoned after {(time.perf_counter() - started) * 1000:.0f}ms (timeout 50ms).")
+    executor.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
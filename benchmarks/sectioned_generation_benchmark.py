@@ -0,0 +1,103 @@
+# benchmarks/sectioned_generation_benchmark.py
+
+"""
+Monolithic JSON generation against sectioned (per-field, concurrent) generation.
+
+The fake model's latency is a fixed overhead plus decoding time proportional
+to the text it writes, so the monolithic prompt pays for all three fields in
+sequence. A share of monolithic responses is malformed JSON (every field is
+lost); a share of section responses is empty (only that section is retried).
+For each mode the benchmark reports wall-clock latency, the share of requests
+with any error placeholder and the share of fields lost:
+
+    python -m benchmarks.sectioned_generation_benchmark
+"""
+
+import asyncio
+import json
+import random
+
+from benchmarks.common import print_table, run_concurrently, summarize
+from functions.flows.generation_flow import (
+    GENERATION_SECTIONS,
+    PARSE_ERROR,
+    SECTION_ERROR,
+    _parse_generated_content,
+    build_generation_prompt,
+    build_section_prompt,
+)
+from functions.flows.sectioned_generation import generate_sections
+
+REQUESTS = 300
+CONCURRENCY = 16
+OVERHEAD_SECONDS = 0.03
+CHARS_PER_SECOND = 20_000
+# Typical length of each field as written by the model.
+FIELD_CHARS = {"analysis": 900, "cover_letter": 1_600, "resume_summary": 500}
+MALFORMED_JSON_RATE = 0.08
+EMPTY_SECTION_RATE = 0.05
+
+JOB = "Disability support worker, NDIS, community access and behaviour support plans."
+EXPERIENCE = "Three years supporting participants with complex needs."
+
+
+class _FakeModel:
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    async def generate(self, prompt: str) -> str:
+        self.calls += 1
+        fields = [field for field, spec in GENERATION_SECTIONS.items() if spec["instructions"] in prompt]
+        if "valid JSON object" in prompt:
+            fields = list(FIELD_CHARS)
+        chars = sum(FIELD_CHARS[field] for field in fields)
+        await asyncio.sleep(OVERHEAD_SECONDS + chars / CHARS_PER_SECOND)
+        if len(fields) > 1:
+            text = json.dumps({field: "x" * FIELD_CHARS[field] for field in fields})
+            # e.g. an unescaped quote or a truncated object
+            return text[:-2] if self.rng.random() < MALFORMED_JSON_RATE else text
+        return "" if self.rng.random() < EMPTY_SECTION_RATE else "x" * chars
+
+
+async def _run(mode: str) -> dict:
+    model = _FakeModel(seed=7)
+    failed_requests = 0
+    lost_fields = 0
+
+    async def _call(i: int) -> None:
+        nonlocal failed_requests, lost_fields
+        if mode == "monolithic":
+            output = _parse_generated_content(await model.generate(build_generation_prompt(JOB, EXPERIENCE)))
+            values = [output.analysis, output.cover_letter, output.resume_summary]
+        else:
+            sections = {
+                field: {"prompt": build_section_prompt(field, JOB, EXPERIENCE), "max_chars": spec["max_chars"]}
+                for field, spec in GENERATION_SECTIONS.items()
+            }
+            result, _ = await generate_sections(sections, model.generate)
+            values = [SECTION_ERROR if value is None else value for value in result.values()]
+        lost = sum(value in (PARSE_ERROR, SECTION_ERROR) for value in values)
+        failed_requests += bool(lost)
+        lost_fields += lost
+
+    latencies, wall = await run_concurrently(_call, REQUESTS, CONCURRENCY)
+    return summarize(latencies, wall) | {
+        "failed_requests": failed_requests / REQUESTS,
+        "lost_fields": lost_fields / (REQUESTS * len(FIELD_CHARS)),
+        "model_calls": model.calls,
+    }
+
+
+async def main() -> None:
+    rows = {mode: await _run(mode) for mode in ("monolithic", "sectioned")}
+    print_table(
+        f"{REQUESTS} generateFlow calls, {CONCURRENCY} concurrent "
+        f"({MALFORMED_JSON_RATE:.0%} malformed JSON, {EMPTY_SECTION_RATE:.0%} empty sections)",
+        rows,
+        ["p50_ms", "p95_ms", "failed_requests", "lost_fields", "model_calls"],
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
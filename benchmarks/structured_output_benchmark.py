@@ -0,0 +1,144 @@
+# benchmarks/structured_output_benchmark.py
+
+"""
+Local repair and partial re-prompting against full regeneration.
+
+A fake model answers the interview-prep prompt with a realistic mix of
+defects: code fences, trailing commentary, trailing commas, truncated output,
+a list written as a bulleted string, a missing field, or no JSON at all.
+"strict + full retry" is the old `json.loads` parse followed by regenerating
+the whole answer until it parses (up to two retries); "repair + partial
+re-prompt" is `StructuredOutput.enforce`. The benchmark reports how many
+answers end up complete, extra model calls, and the tokens spent on retries:
+
+    python -m benchmarks.structured_output_benchmark
+"""
+
+import asyncio
+import json
+import random
+
+from benchmarks.common import print_table
+from functions.flows.structured_output import StructuredOutput, schema_instructions
+from functions.flows.token_utils import estimate_tokens
+from functions.schemas import INTERVIEW_PREP_FIELDS
+
+ANSWERS = 2_000
+FULL_RETRIES = 2
+PROMPT = "You are an expert career coach. " * 40 + schema_instructions(INTERVIEW_PREP_FIELDS)
+DEFECTS = {
+    "none": 0.70,
+    "code fence": 0.08,
+    "trailing text": 0.05,
+    "trailing comma": 0.04,
+    "truncated": 0.05,
+    "bulleted list": 0.03,
+    "missing field": 0.03,
+    "no JSON": 0.02,
+}
+
+
+def _answer(fields: list[str]) -> dict:
+    return {
+        field: [f"{field} item {i} " + "detail " * 8 for i in range(5)] if INTERVIEW_PREP_FIELDS[field] == "string[]"
+        else f"{field}: " + "insight " * 60
+        for field in fields
+    }
+
+
+def _render(defect: str, fields: list[str]) -> str:
+    data = _answer(fields)
+    if defect == "bulleted list":
+        data["key_competencies"] = "\n".join(f"- {item}" for item in data["key_competencies"])
+    if defect == "missing field":
+        data.pop("interview_questions", None)
+    text = json.dumps(data, indent=2)
+    if defect == "code fence":
+        return f"```json\n{text}\n```"
+    if defect == "trailing text":
+        return text + "\n\nLet me know if you would like more questions!"
+    if defect == "trailing comma":
+        return text[:-2] + ",\n}"
+    if defect == "truncated":
+        return text[: int(len(text) * 0.9)]
+    if defect == "no JSON":
+        return "I'm sorry, I can only help with interview preparation."
+    return text
+
+
+class _FakeModel:
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.tokens = 0
+
+    def _defect(self) -> str:
+        return self.rng.choices(list(DEFECTS), weights=list(DEFECTS.values()))[0]
+
+    async def generate(self, prompt: str) -> str:
+        self.calls += 1
+        requested = [field for field in INTERVIEW_PREP_FIELDS if f'"{field}"' in prompt.rsplit("JSON Schema", 1)[-1]]
+        text = _render(self._defect(), requested or list(INTERVIEW_PREP_FIELDS))
+        self.tokens += estimate_tokens(prompt) + estimate_tokens(text)
+        return text
+
+
+def _complete(values: dict | None) -> bool:
+    return values is not None and all(field in values for field in INTERVIEW_PREP_FIELDS)
+
+
+async def _strict(model: _FakeModel) -> tuple[bool, int]:
+    """The previous behaviour, plus full regeneration on failure."""
+    retry_tokens = 0
+    text = await model.generate(PROMPT)
+    for attempt in range(FULL_RETRIES + 1):
+        try:
+            values = json.loads(text)
+            if _complete(values) and isinstance(values["key_competencies"], list):
+                return True, retry_tokens
+        except json.JSONDecodeError:
+            pass
+        if attempt < FULL_RETRIES:
+            tokens_before = model.tokens
+            text = await model.generate(PROMPT)
+            retry_tokens += model.tokens - tokens_before
+    return False, retry_tokens
+
+
+async def _repair(model: _FakeModel, enforcer: StructuredOutput) -> tuple[bool, int]:
+    text = await model.generate(PROMPT)
+    _, report = await enforcer.enforce(text, INTERVIEW_PREP_FIELDS, PROMPT, model.generate, placeholder="Error")
+    return not report["failed_fields"], report["reprompt_tokens"]
+
+
+async def main() -> None:
+    rows = {}
+    enforcer = StructuredOutput(max_reprompts=FULL_RETRIES)
+    for name in ("strict + full retry", "repair + partial re-prompt"):
+        model = _FakeModel(seed=11)
+        complete = retry_tokens = 0
+        for _ in range(ANSWERS):
+            ok, tokens = await (_strict(model) if name.startswith("strict") else _repair(model, enforcer))
+            complete += ok
+            retry_tokens += tokens
+        rows[name] = {
+            "complete": complete / ANSWERS,
+            "extra_calls": model.calls - ANSWERS,
+            "retry_tokens": retry_tokens,
+        }
+
+    stats = enforcer.stats()
+    rows["repair + partial re-prompt"]["repair_rate"] = stats["repair_rate"]
+    print_table(
+        f"{ANSWERS} interview-prep answers, {1 - DEFECTS['none']:.0%} with a defect (up to {FULL_RETRIES} retries)",
+        rows,
+        ["complete", "extra_calls", "retry_tokens", "repair_rate"],
+    )
+    print(
+        f"\nRepaired locally: {stats['repaired_locally']}, re-prompted: {stats['reprompted']}, "
+        f"failed: {stats['failed']}; estimated tokens saved vs full retries: {stats['tokens_saved']:,}"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
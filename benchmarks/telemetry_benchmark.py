@@ -0,0 +1,116 @@
+# benchmarks/telemetry_benchmark.py
+
+"""
+Benchmark for the telemetry subsystem.
+
+1. Overhead: the cost of one span (histogram update plus trace entry) compared
+   with the bare loop.
+2. Log volume: printing every model output, as the flows used to, against the
+   sampled structured logger, for requests with a 6KB model answer. Both write
+   to a real file so the I/O cost is included.
+3. Breakdown: simulated requests whose steps (token check, embedding, Pinecone,
+   model call, Firestore write) sleep for realistic times, followed by the
+   per-operation p50/p95/p99 and an excerpt of the /metrics output.
+
+    python -m benchmarks.telemetry_benchmark
+"""
+
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import print_table
+from functions.services.telemetry import Telemetry
+
+SPANS = 200_000
+REQUESTS = 2_000
+OUTPUT_CHARS = 6_000
+SIMULATED_REQUESTS = 300
+
+
+def _span_overhead() -> dict:
+    collector = Telemetry(log_sample_rate=0.0, write=lambda line: None)
+    started = time.perf_counter()
+    for _ in range(SPANS):
+        pass
+    bare = time.perf_counter() - started
+
+    rows = {}
+    for name, in_trace in (("span (no trace)", False), ("span (in a trace)", True)):
+        started = time.perf_counter()
+        if in_trace:
+            # Traces keep at most TELEMETRY_TRACE_MAX_SPANS spans; use one trace per 100.
+            for _ in range(SPANS // 100):
+                with collector.trace("request"):
+                    for _ in range(100):
+                        with collector.span("op", labels={"model": "m"}):
+                            pass
+        else:
+            for _ in range(SPANS):
+                with collector.span("op", labels={"model": "m"}):
+                    pass
+        rows[name] = {"ns_per_span": (time.perf_counter() - started - bare) / SPANS * 1e9}
+    return rows
+
+
+def _log_volume() -> dict:
+    output = "x" * OUTPUT_CHARS
+    rows = {}
+    for name in ("print every raw output", "sampled structured log (1%)"):
+        with tempfile.NamedTemporaryFile("w", delete=False) as log_file:
+            path = log_file.name
+            collector = Telemetry(log_sample_rate=0.01, write=lambda line: print(line, file=log_file))
+            started = time.perf_counter()
+            for _ in range(REQUESTS):
+                if name.startswith("print"):
+                    print(f"LLM Raw Output: {output}", file=log_file)
+                else:
+                    with collector.trace("request"):
+                        collector.log("llm_output", task="generate", chars=len(output), preview=output)
+            log_file.flush()
+            os.fsync(log_file.fileno())
+            seconds = time.perf_counter() - started
+        size = os.path.getsize(path)
+        os.unlink(path)
+        rows[name] = {"log_kb": size / 1024, "ms_total": seconds * 1000}
+    return rows
+
+
+async def _simulated_requests(collector: Telemetry) -> None:
+    rng = random.Random(0)
+
+    async def _step(name: str, low: float, high: float, **labels) -> None:
+        with collector.span(name, labels=labels or None):
+            await asyncio.sleep(rng.uniform(low, high))
+
+    async def _request(i: int) -> None:
+        with collector.trace("http.request", route="/generate"):
+            await _step("auth.verify_token", 0.0005, 0.002)
+            await asyncio.gather(_step("embedding.embed_batch", 0.02, 0.06), _step("perplexity.chat", 0.1, 0.4))
+            await _step("pinecone.query", 0.03, 0.12)
+            await _step("llm.generate", 0.2, 0.9, model="gemini-1.5-flash", task="generate")
+            await _step("firestore.batch_write", 0.005, 0.03)
+
+    await asyncio.gather(*(_request(i) for i in range(SIMULATED_REQUESTS)))
+
+
+def main() -> None:
+    print_table(f"Span overhead ({SPANS} spans)", _span_overhead(), ["ns_per_span"])
+    print_table(f"Model output logging ({REQUESTS} requests, {OUTPUT_CHARS}-char answers)", _log_volume(), ["log_kb", "ms_total"])
+
+    collector = Telemetry(log_sample_rate=0.0, write=lambda line: None)
+    asyncio.run(_simulated_requests(collector))
+    print_table(
+        f"Where time goes ({SIMULATED_REQUESTS} simulated requests)",
+        collector.stats()["spans"],
+        ["count", "p50_ms", "p95_ms", "p99_ms"],
+    )
+    print("\n/metrics excerpt:")
+    lines = [line for line in collector.prometheus().splitlines() if "llm.generate" in line or line.startswith("#")]
+    print("\n".join(lines[:12]))
+
+
+if __name__ == "__main__":
+    main()
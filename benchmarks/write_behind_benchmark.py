@@ -0,0 +1,86 @@
+# benchmarks/write_behind_benchmark.py
+
+"""
+Benchmark for saving generated documents write-behind.
+
+Compares the caller-visible latency of the old synchronous
+`save_document_metadata` (one blocking `set` per save, run in a thread) with
+`enqueue_document_metadata`, which returns the pre-allocated document ID at
+once and commits saves in batched writes. A second run makes the first
+commits fail to show retries, and `drain` shows nothing is lost on shutdown.
+Uses the in-memory fake Firestore:
+
+    python -m benchmarks.write_behind_benchmark
+"""
+
+import asyncio
+import time
+
+from benchmarks.common import print_table, run_concurrently, summarize
+from benchmarks.fake_firestore import FakeFirestore, FakeLatency
+from functions.services.firebase_service import FirebaseService
+from functions.services.write_behind import WriteBehindQueue
+
+SAVES = 1_000
+CONCURRENCY = 50
+USERS = 100
+LATENCY = FakeLatency(round_trip=0.02, per_kb=0.00002)
+
+
+def _document(i: int) -> dict:
+    return {"flow": "generateFlow", "title": f"Application {i}", "output": {"cover_letter": "x" * 2_000}}
+
+
+def _stored(db: FakeFirestore) -> int:
+    return sum(len(db.children(f"users/user-{u}/documents")) for u in range(USERS))
+
+
+async def _sync_saves() -> dict:
+    db = FakeFirestore(LATENCY)
+    service = FirebaseService(db)
+
+    async def _save(i: int) -> None:
+        await asyncio.to_thread(service.save_document_metadata, f"user-{i % USERS}", _document(i))
+
+    latencies, wall = await run_concurrently(_save, SAVES, CONCURRENCY)
+    return summarize(latencies, wall) | {"firestore_calls": SAVES, "stored": _stored(db)}
+
+
+async def _write_behind_saves(failing_commits: int = 0) -> dict:
+    db = FakeFirestore(LATENCY)
+    db.fail_next_commits = failing_commits
+    queue = WriteBehindQueue(db, flush_interval_seconds=0.05, backoff_base_seconds=0.05)
+    service = FirebaseService(db, write_queue=queue)
+
+    async def _save(i: int) -> None:
+        service.enqueue_document_metadata(f"user-{i % USERS}", _document(i))
+
+    latencies, wall = await run_concurrently(_save, SAVES, CONCURRENCY)
+    started = time.perf_counter()
+    await queue.drain(timeout=30)
+    drain_ms = (time.perf_counter() - started) * 1000
+    stats = queue.stats()
+    return summarize(latencies, wall) | {
+        "firestore_calls": db.commit_attempts,
+        "stored": _stored(db),
+        "retries": stats["retries"],
+        "drain_ms": drain_ms,
+    }
+
+
+async def main() -> None:
+    rows = {
+        "sync set per save": await _sync_saves(),
+        "write-behind": await _write_behind_saves(),
+        "write-behind, 3 commits fail": await _write_behind_saves(failing_commits=3),
+    }
+    print_table(
+        f"Saving {SAVES:,} documents for {USERS} users, {CONCURRENCY} concurrent callers, "
+        f"{LATENCY.round_trip * 1000:.0f}ms Firestore round trip",
+        rows,
+        ["p50_ms", "p99_ms", "wall_s", "firestore_calls", "stored", "retries", "drain_ms"],
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
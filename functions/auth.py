@@ -2,18 +2,27 @@
 
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import firebase_admin
-from firebase_admin import auth, credentials
 
 from functions.schemas import User
+from functions.services.registry import services
+from functions.services.token_service import FirebaseTokenVerifier
+from functions.services.admission_control import AdmissionRejected, admission_controller
+from functions.services.telemetry import telemetry
+# Registers the lazily-initialized "firebase_app" service used below.
+import functions.services.firebase_service
 
-# Initialize Firebase Admin SDK.
+bearer_scheme = HTTPBearer()
+
+# The Firebase Admin SDK is initialized through the service registry on first use.
 # It will automatically use the project's service account credentials in the cloud.
 # For local testing, you'd need to set the GOOGLE_APPLICATION_CREDENTIALS env var.
-if not firebase_admin._apps:
-    firebase_admin.initialize_app()
-
-bearer_scheme = HTTPBearer()
+#
+# The verifier checks ID tokens locally with cached Google signing keys, so repeated
+# requests from the same session skip the signature check and never block the event loop.
+services.register(
+    "token_verifier",
+    lambda: FirebaseTokenVerifier(project_id=services.get("firebase_app").project_id),
+)
 
 async def get_current_user(creds: HTTPAuthorizationCredentials = Depends(bearer_scheme)) -> User:
     """
@@ -27,10 +36,35 @@ async def get_current_user(creds: HTTPAuthorizationCredentials = Depends(bearer_
         )
     try:
         token = creds.credentials
-        decoded_token = auth.verify_id_token(token)
+        token_verifier = await services.aget("token_verifier")
+        with telemetry.span("auth.verify_token"):
+            decoded_token = await token_verifier.verify(token)
         return User(uid=decoded_token['uid'], email=decoded_token.get('email', ''))
     except Exception as e:
         raise HTTPException(
             status_code=401,
             detail=f"Invalid authentication credentials: {e}"
-        )
\ No newline at end of file
+        )
+
+async def admit_generation(user: User = Depends(get_current_user)) -> User:
+    """
+    A FastAPI dependency for endpoints that run LLM generations: verifies the user,
+    then applies admission control (per-user rate limit and queue bounds; see
+    `functions.services.admission_control`). Rejected requests get a 429 with Retry-After.
+    """
+    return admit_user(user)
+
+def admit_user(user: User, cost: int = 1) -> User:
+    """
+    Applies admission control to a request from `user` that starts `cost` generations
+    (e.g. one per job of a batch), raising a 429 with Retry-After if it is rejected.
+    """
+    try:
+        admission_controller.admit(user.uid, cost=cost)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": e.retry_after_header},
+        )
+    return user
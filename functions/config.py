@@ -1,5 +1,7 @@
 # functions/config.py
 
+import os
+
 # API metadata
 API_TITLE = "AI Career Co-Pilot API"
 API_DESCRIPTION = "Powers document generation and interview preparation for the AI Career Co-Pilot."
@@ -10,4 +12,259 @@ API_VERSION = "1.0.0"
 DEFAULT_GENERATION_MODEL = "gemini-1.5-pro-latest"
 
 # For certain tasks, you might consider the 'flash' model for speed and cost-effectiveness.
-# FAST_GENERATION_MODEL = "gemini-1.5-flash-latest"
\ No newline at end of file
+FAST_GENERATION_MODEL = "gemini-1.5-flash-latest"
+
+# Model routing
+# Each generation is routed to the "fast" (flash) or "pro" tier. A request's `quality` hint
+# ("fast", "balanced" or "best") wins; otherwise the sub-task's default tier below is used,
+# where "auto" picks the fast tier for prompts up to MODEL_ROUTER_FAST_MAX_INPUT_TOKENS.
+MODEL_ROUTER_FAST_MAX_INPUT_TOKENS = 1_500
+MODEL_ROUTER_TASK_TIERS = {
+    "generate": "auto",
+    "interview_prep": "auto",
+    "generate_section": "auto",
+    "structured_repair": "auto",
+}
+# Per-tier deadlines; a generation that times out or fails is retried once on the other tier.
+# A stream's first chunk and each gap between chunks get the same deadline.
+FAST_MODEL_TIMEOUT_SECONDS = 30.0
+PRO_MODEL_TIMEOUT_SECONDS = 90.0
+
+# Sectioned generation
+# In sectioned mode generateFlow runs one small generation per output field concurrently instead
+# of one JSON prompt; a request's `sectioned` flag overrides this default.
+GENERATION_SECTIONED = os.getenv("GENERATION_SECTIONED", "false").lower() == "true"
+# Attempts per section (only a section whose output fails validation is retried, on its own) and the
+# deadline for all of a section's attempts together. Each attempt gets what is left of it; an attempt
+# that times out or fails on both router tiers ends the section.
+SECTION_MAX_ATTEMPTS = 3
+SECTION_TIMEOUT_SECONDS = FAST_MODEL_TIMEOUT_SECONDS + PRO_MODEL_TIMEOUT_SECONDS + 5.0
+
+# Structured output
+# How many times fields that are missing or invalid in a model's JSON answer (after local repair)
+# are requested again, on their own, before they are replaced with an error placeholder.
+STRUCTURED_OUTPUT_MAX_REPROMPTS = 1
+
+# Context caching
+# Stable prompt prefixes (system instructions, output schema, the user's resume) are stored in
+# the model provider's context cache, per model and scope, and only the per-call suffix is sent.
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "true").lower() == "true"
+# Providers reject caches below a model-specific minimum size; shorter prefixes are sent inline.
+CONTEXT_CACHE_MIN_PREFIX_TOKENS = 1_024
+# A prefix is cached once it has been sent this many times within the TTL, so one-off
+# requests never pay for cache creation and storage.
+CONTEXT_CACHE_MIN_USES = 2
+CONTEXT_CACHE_TTL_SECONDS = 15 * 60
+# Caches this close to their expiry are not used, so a call never references one that expires mid-request.
+CONTEXT_CACHE_EXPIRY_MARGIN_SECONDS = 30
+CONTEXT_CACHE_MAX_ENTRIES = 2_000
+# Gemini API used for context caches (Genkit has no caching API). The key is read from the
+# first of these environment variables that is set, as the Genkit Google AI plugin does.
+GEMINI_API_BASE_URL = os.getenv("GEMINI_API_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+GEMINI_API_KEY_ENV_VARS = ("GEMINI_API_KEY", "GOOGLE_GENAI_API_KEY", "GOOGLE_API_KEY")
+GEMINI_TIMEOUT_SECONDS = 10.0
+# Gemini 1.5 models only accept caches of at least this many tokens; shorter prefixes are sent inline.
+GEMINI_CACHE_MIN_PREFIX_TOKENS = 32_768
+# Explicit caches need a stable model version; "-latest" aliases are mapped to one.
+GEMINI_CACHE_MODEL_VERSIONS = {
+    "gemini-1.5-pro-latest": "gemini-1.5-pro-002",
+    "gemini-1.5-flash-latest": "gemini-1.5-flash-002",
+}
+
+# Admission control
+# Each user may start generations at a sustained rate with some burst (a token bucket per UID).
+ADMISSION_USER_RATE_PER_SECOND = 0.5
+ADMISSION_USER_BURST = 5
+# Model calls in flight at once, per model (the upstream quota); further calls wait in a queue
+# that serves users round-robin, so one user's burst cannot starve everyone else.
+ADMISSION_MODEL_MAX_IN_FLIGHT = {
+    FAST_GENERATION_MODEL: 32,
+    DEFAULT_GENERATION_MODEL: 8,
+}
+ADMISSION_DEFAULT_MAX_IN_FLIGHT = 8
+# Model calls beyond this many queued, or whose expected wait for a slot exceeds
+# ADMISSION_MAX_WAIT_SECONDS (counted per call), are rejected straight away with 429
+# and a Retry-After header.
+ADMISSION_MAX_QUEUED = 200
+ADMISSION_MAX_WAIT_SECONDS = 20.0
+# The queue's wait estimate assumes calls take this long until real call times have been measured.
+ADMISSION_EXPECTED_CALL_SECONDS = 5.0
+# Bounds the per-user token buckets kept in memory (least recently seen users are dropped).
+ADMISSION_MAX_TRACKED_USERS = 10_000
+
+# Batch generation
+# POST /generate/batch generates up to BATCH_MAX_JOBS job descriptions for one user. Context is
+# retrieved for every job up front; at most BATCH_MAX_PARALLEL generations of a batch run at once,
+# so one batch cannot take every model slot.
+BATCH_MAX_JOBS = 20
+BATCH_MAX_PARALLEL = 4
+
+# Background jobs
+# Generations submitted as jobs run on this many workers; further submissions wait in a
+# queue of at most JOB_MAX_QUEUED jobs, beyond which they are rejected.
+JOB_MAX_WORKERS = 4
+JOB_MAX_QUEUED = 100
+# A job fails if it runs longer than this; a job whose document has not been updated for
+# JOB_STALE_SECONDS (e.g. its instance was shut down) is reported as failed and can be resubmitted.
+JOB_TIMEOUT_SECONDS = 600
+JOB_STALE_SECONDS = 900
+# Jobs are not waiting on an open connection, so their model calls may queue for longer.
+JOB_MODEL_MAX_WAIT_SECONDS = 300.0
+# How often status subscribers re-read a job that is running on another instance.
+JOB_STATUS_POLL_SECONDS = 2.0
+# How long shutdown waits for running jobs before marking them as interrupted.
+JOB_DRAIN_TIMEOUT_SECONDS = 20
+
+# Telemetry
+# Upper bounds (seconds) of the latency histogram buckets exported on /metrics.
+TELEMETRY_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Recent samples kept per operation for the in-process p50/p95/p99.
+TELEMETRY_QUANTILE_SAMPLES = 1_000
+# Fraction of requests whose structured logs (model output previews, span breakdowns) are written.
+# Sampling is per request, so a sampled request logs all of its entries.
+TELEMETRY_LOG_SAMPLE_RATE = float(os.getenv("TELEMETRY_LOG_SAMPLE_RATE", "0.01"))
+# Requests slower than this always log their span breakdown.
+TELEMETRY_SLOW_REQUEST_SECONDS = 30.0
+# Longest model output preview written to a log entry.
+TELEMETRY_LOG_MAX_CHARS = 500
+# Most spans kept per request trace.
+TELEMETRY_TRACE_MAX_SPANS = 200
+
+# Authentication settings
+# Decoded Firebase ID tokens are cached in memory until they expire; this bounds the cache size.
+AUTH_TOKEN_CACHE_MAX_ENTRIES = 10_000
+# Fallback lifetime for Google's signing keys when the response carries no Cache-Control max-age.
+AUTH_CERTS_DEFAULT_MAX_AGE_SECONDS = 300
+# Tokens signed with an unknown key ID force a key refresh at most this often, so forged
+# key IDs cannot make every request download the certificates.
+AUTH_CERTS_MIN_REFRESH_INTERVAL_SECONDS = 60
+# Tolerance for clock drift between Google and this instance when checking 'iat'/'exp'.
+AUTH_CLOCK_SKEW_SECONDS = 10
+
+# Vector database settings
+# Pinecone's client is synchronous, so queries run on a dedicated thread pool of this size.
+PINECONE_QUERY_CONCURRENCY = 8
+# Seconds to wait for a single Pinecone query before proceeding without RAG context.
+PINECONE_QUERY_TIMEOUT_SECONDS = 5.0
+
+# Retrieval backend: "pinecone", or "local" to serve RAG from the in-process vector index
+# (no network round trip; suited to local development and deployments with small users).
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "pinecone")
+# Where the local index persists each user's vectors (memory-mapped when loaded).
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "/tmp/careerpilot-vector-index")
+# Namespaces with at least this many vectors are searched approximately (IVF) instead of
+# exhaustively; a search scores the vectors in the LOCAL_INDEX_IVF_PROBES nearest clusters. After a
+# change the clustering is rebuilt in the background and searches are exhaustive until it is ready.
+LOCAL_INDEX_IVF_MIN_VECTORS = 50_000
+LOCAL_INDEX_IVF_PROBES = 8
+# The least time between two writes of a namespace to disk while it is being changed;
+# pending changes are also written on shutdown.
+LOCAL_INDEX_FLUSH_INTERVAL_SECONDS = 5.0
+
+# RAG context settings
+# Retrieval over-fetches RAG_CANDIDATES chunks, re-ranks them by a blend of dense similarity
+# (weight RAG_DENSE_WEIGHT) and BM25 keyword relevance, drops near-duplicates (MMR, trading
+# relevance against redundancy with RAG_MMR_LAMBDA) and packs the best chunks into
+# RAG_CONTEXT_TOKEN_BUDGET tokens of prompt context.
+RAG_CANDIDATES = 20
+RAG_DENSE_WEIGHT = 0.6
+RAG_MMR_LAMBDA = 0.7
+RAG_CONTEXT_TOKEN_BUDGET = 600
+# Number of chunks the previous top-k retrieval sent, used to report tokens saved.
+RAG_BASELINE_TOP_K = 3
+
+# RAG ingestion settings
+# Documents are split at paragraph/sentence boundaries into chunks of at most INGEST_CHUNK_MAX_CHARS.
+# Chunk boundaries depend only on nearby content, so editing one paragraph only changes (and
+# re-embeds) the chunks around it.
+INGEST_CHUNK_MIN_CHARS = 300
+INGEST_CHUNK_MAX_CHARS = 1_200
+# Chunks are embedded this many at a time while the previous window is being upserted.
+INGEST_EMBED_WINDOW = 128
+# Pinecone recommends at most 100 vectors per upsert request; deletes accept up to 1000 IDs.
+PINECONE_UPSERT_BATCH_SIZE = 100
+PINECONE_DELETE_BATCH_SIZE = 1_000
+
+# Firestore settings
+# The Firestore client is synchronous, so reads run on a dedicated thread pool of this size.
+FIRESTORE_QUERY_CONCURRENCY = 8
+FIRESTORE_QUERY_TIMEOUT_SECONDS = 10.0
+# Document listings are paginated; clients may ask for at most DOCUMENT_LIST_MAX_PAGE_SIZE per page.
+DOCUMENT_LIST_DEFAULT_PAGE_SIZE = 20
+DOCUMENT_LIST_MAX_PAGE_SIZE = 100
+# Listing pages are cached per user until the user saves a new document (or the TTL passes).
+DOCUMENT_LIST_CACHE_TTL_SECONDS = 5 * 60
+DOCUMENT_LIST_CACHE_MAX_USERS = 1_000
+# Generated documents are saved write-behind: saves are committed in batched writes of up to
+# FIRESTORE_WRITE_BATCH_MAX_SIZE (Firestore allows 500) or after FIRESTORE_WRITE_FLUSH_INTERVAL_SECONDS.
+FIRESTORE_WRITE_BATCH_MAX_SIZE = 500
+FIRESTORE_WRITE_FLUSH_INTERVAL_SECONDS = 0.5
+FIRESTORE_WRITE_MAX_RETRIES = 5
+FIRESTORE_WRITE_BACKOFF_BASE_SECONDS = 0.2
+# How long shutdown waits for queued writes to be committed.
+FIRESTORE_WRITE_DRAIN_TIMEOUT_SECONDS = 20.0
+
+# Embedding settings
+EMBEDDING_MODEL = "text-embedding-004"
+# In-process memory budget for cached embeddings (a 768-dim float32 vector is ~3 KB).
+EMBEDDING_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# How long a cached embedding is reused before it is recomputed.
+EMBEDDING_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+# Optional SQLite file for a persistent second cache tier (e.g. "/tmp/embeddings.db").
+EMBEDDING_CACHE_DB_PATH = os.getenv("EMBEDDING_CACHE_DB_PATH")
+# How often expired embeddings are deleted from the SQLite file, so it does not grow without bound.
+EMBEDDING_CACHE_PURGE_INTERVAL_SECONDS = 60 * 60
+# Concurrent embedding cache misses are micro-batched: a batch is sent (as concurrent embedder calls)
+# once it holds EMBEDDING_BATCH_MAX_SIZE texts or its first request has waited EMBEDDING_BATCH_MAX_WAIT_MS.
+EMBEDDING_BATCH_MAX_SIZE = 64
+EMBEDDING_BATCH_MAX_WAIT_MS = 10
+
+# LLM response cache settings
+# Cached generations are reused for "regenerate"/reload requests with the same prompt.
+RESPONSE_CACHE_TTL_SECONDS = 60 * 60
+RESPONSE_CACHE_MAX_ENTRIES = 5_000
+RESPONSE_CACHE_MAX_ENTRIES_PER_USER = 50
+# Minimum cosine similarity between job-description embeddings for a semantic cache hit.
+# Set to None to only reuse responses for byte-identical prompts.
+RESPONSE_CACHE_SEMANTIC_THRESHOLD = 0.97
+
+# Service initialization
+# When True, all service clients are created concurrently at startup instead of on first use.
+SERVICE_WARMUP_ON_STARTUP = os.getenv("SERVICE_WARMUP_ON_STARTUP", "true").lower() == "true"
+
+# Secret settings
+# Secrets the application needs; they are fetched concurrently at startup.
+SECRET_IDS = ["PINECONE_API_KEY", "PERPLEXITY_API_KEY"]
+# Cached secret values are refreshed in the background this long before they expire,
+# so rotated keys are picked up without a redeploy.
+SECRET_CACHE_TTL_SECONDS = 10 * 60
+SECRET_REFRESH_MARGIN_SECONDS = 60
+# A failed refresh is retried after this long, doubling after each consecutive failure up to the maximum.
+SECRET_REFRESH_RETRY_SECONDS = 5.0
+SECRET_REFRESH_RETRY_MAX_SECONDS = 300.0
+
+# Flow step deadlines (seconds)
+# Optional steps that miss their deadline are skipped and the flow continues with less
+# context (e.g. no RAG experience or generic company insights) instead of failing.
+EMBEDDING_STEP_TIMEOUT_SECONDS = 5.0
+RAG_STEP_TIMEOUT_SECONDS = 8.0
+COMPANY_RESEARCH_TIMEOUT_SECONDS = 10.0
+
+# Perplexity (company research) settings
+PERPLEXITY_BASE_URL = os.getenv("PERPLEXITY_BASE_URL", "https://api.perplexity.ai")
+PERPLEXITY_MODEL = "sonar"
+# One attempt must fit inside COMPANY_RESEARCH_TIMEOUT_SECONDS; timed-out attempts are not retried.
+PERPLEXITY_TIMEOUT_SECONDS = 8.0
+# Pooled keep-alive connections and the most requests in flight at once.
+PERPLEXITY_MAX_CONNECTIONS = 16
+PERPLEXITY_MAX_CONCURRENCY = 8
+# Retries on 429/5xx and connection errors, with jittered exponential backoff.
+PERPLEXITY_MAX_RETRIES = 3
+PERPLEXITY_BACKOFF_BASE_SECONDS = 0.5
+PERPLEXITY_BACKOFF_MAX_SECONDS = 8.0
+# Consecutive failures that stop calls to Perplexity for PERPLEXITY_CIRCUIT_RESET_SECONDS.
+PERPLEXITY_CIRCUIT_FAILURE_THRESHOLD = 5
+PERPLEXITY_CIRCUIT_RESET_SECONDS = 30.0
+# Company research changes slowly and many users apply to the same employers.
+COMPANY_RESEARCH_CACHE_TTL_SECONDS = 24 * 60 * 60
+COMPANY_RESEARCH_CACHE_MAX_ENTRIES = 2_000
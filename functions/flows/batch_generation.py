@@ -0,0 +1,175 @@
+# functions/flows/batch_generation.py
+
+"""
+Generates application documents for several job descriptions in one request.
+
+A user applying for many roles would otherwise call `generate` once per job,
+repeating authentication and retrieval setup each time, and their calls would
+compete with each other for the model. A batch is authenticated and admitted
+once (each job still counts against the user's rate limit), and its setup is
+shared. The retriever is looked up once, every job description is embedded in
+one batched call, and the vector searches run together; jobs with the same
+description share their retrieved context. The
+generations then run with bounded parallelism, so a batch cannot take every
+model slot. Each job's output is streamed back as soon as it is ready. A job
+that fails is reported on its own and the rest of the batch carries on.
+"""
+
+import asyncio
+
+from functions.schemas import JobDescription, User
+from functions.config import BATCH_MAX_JOBS, BATCH_MAX_PARALLEL, EMBEDDING_STEP_TIMEOUT_SECONDS, RAG_STEP_TIMEOUT_SECONDS
+from functions.services.admission_control import AdmissionRejected, admission_controller
+from functions.services.embedding_service import embedding_service
+from functions.services.vector_db_service import get_retriever
+from functions.flows.context_retrieval import retrieve_context
+from functions.flows.generation_flow import generate_with_context
+from functions.flows.streaming import schema_to_dict
+from functions.flows.task_graph import TaskGraph
+
+
+def parse_batch(payload: dict, max_jobs: int = BATCH_MAX_JOBS) -> list[JobDescription]:
+    """
+    Validates a batch request and returns one `JobDescription` per job.
+
+    Args:
+        payload: {"jobs": [...]}, each job a `JobDescription` input. Any other keys
+            ("quality", "sectioned", "bypass_cache", "refresh_cache") are defaults
+            for every job; a job's own values win.
+        max_jobs: The largest batch accepted.
+
+    Raises:
+        ValueError: If there are no jobs, too many, or a job is invalid.
+    """
+    jobs = payload.get("jobs") if isinstance(payload, dict) else None
+    if not isinstance(jobs, list) or not jobs:
+        raise ValueError("A batch needs a non-empty 'jobs' list.")
+    if len(jobs) > max_jobs:
+        raise ValueError(f"A batch may contain at most {max_jobs} jobs; got {len(jobs)}.")
+    defaults = {key: value for key, value in payload.items() if key != "jobs"}
+    parsed = []
+    for index, job in enumerate(jobs):
+        if not isinstance(job, dict):
+            raise ValueError(f"Job {index} must be an object with a 'job_description'.")
+        try:
+            parsed.append(JobDescription(**(defaults | job)))
+        except Exception as e:
+            raise ValueError(f"Invalid job {index}: {e}")
+    return parsed
+
+
+async def _retrieve_all(retriever, job_descriptions: list[str], user: User,
+                        query_embeddings: list[list[float]] | None) -> dict[str, str]:
+    """
+    Retrieves the RAG context of every distinct job description concurrently, searching
+    with the precomputed embeddings when there are any. A job whose retrieval fails is
+    generated without context.
+    """
+    if not retriever:
+        print("WARN: Retrieval backend not available. Proceeding without RAG context.")
+        return {}
+
+    print(f"Retrieving context for {len(job_descriptions)} job(s) from vector database...")
+    results = await asyncio.gather(
+        *(
+            retrieve_context(retriever, text, user.uid, query_embedding=embedding)
+            for text, embedding in zip(job_descriptions, query_embeddings or [None] * len(job_descriptions))
+        ),
+        return_exceptions=True,
+    )
+    contexts = {}
+    for text, result in zip(job_descriptions, results):
+        if isinstance(result, BaseException):
+            print(f"WARN: Retrieval failed for a batch job: {result}. Proceeding without its RAG context.")
+            continue
+        contexts[text] = result[0]
+    return contexts
+
+
+def _context_graph(job_descriptions: list[str], user: User) -> TaskGraph:
+    """
+    Declares the batch's shared setup steps. The retriever lookup and the embedding
+    of every job description run concurrently; the vector searches then use those
+    embeddings. Every step is optional, as in `generateFlow`.
+    """
+    graph = TaskGraph("generateBatch")
+    graph.step("retriever", get_retriever, timeout=RAG_STEP_TIMEOUT_SECONDS, fallback=None)
+    graph.step(
+        "query_embeddings",
+        lambda: embedding_service.embed_many(job_descriptions),
+        timeout=EMBEDDING_STEP_TIMEOUT_SECONDS,
+        fallback=None,
+    )
+    graph.step(
+        "retrieved_experience",
+        lambda retriever, query_embeddings: _retrieve_all(retriever, job_descriptions, user, query_embeddings),
+        depends_on=("retriever", "query_embeddings"),
+        timeout=RAG_STEP_TIMEOUT_SECONDS,
+        fallback={},
+    )
+    return graph
+
+
+async def _generate_job(index: int, data: JobDescription, user: User, retrieved_experience: str,
+                        semaphore: asyncio.Semaphore) -> dict:
+    """Generates one job of the batch and returns its "job" event, reporting failures instead of raising them."""
+    async with semaphore:
+        # The batch was admitted once; attribute each job's model calls to the user.
+        admission_controller.bind(user.uid)
+        try:
+            output, failed_fields = await generate_with_context(data, user, retrieved_experience)
+        except AdmissionRejected as e:
+            print(f"WARN: Batch job {index} of user '{user.uid}' rejected: {e}")
+            return {"index": index, "status": "error", "error": str(e), "retry_after": e.retry_after_header}
+        except Exception as e:
+            print(f"ERROR: Batch job {index} of user '{user.uid}' failed: {e}")
+            return {"index": index, "status": "error", "error": str(e)}
+    return {
+        "index": index,
+        "status": "incomplete" if failed_fields else "ok",
+        "failed_fields": failed_fields,
+        "output": schema_to_dict(output),
+    }
+
+
+async def generateBatchStream(jobs: list[JobDescription], user: User, max_parallel: int = BATCH_MAX_PARALLEL):
+    """
+    Runs `generateFlow` for every job of a batch.
+
+    Yields (event, data) pairs: a "job" event for each job as soon as it finishes (in
+    completion order, with the job's "index" in the batch), then a "done" event with the
+    number of jobs per outcome. A job's "status" is "ok"; "incomplete" if some fields hold
+    an error placeholder (listed in "failed_fields"); or "error", with the "error" message
+    and a "retry_after" when the model was over capacity.
+
+    Args:
+        jobs: The parsed jobs (see `parse_batch`).
+        user: The authenticated user object from the auth dependency.
+        max_parallel: The most generations of this batch running at once.
+    """
+    print(f"Agent 'generateFlow' (batch of {len(jobs)}) started for user: {user.uid} ({user.email}).")
+
+    # 1. Shared setup: embed every distinct job description in one batch and run
+    #    the vector searches together
+    job_descriptions = list(dict.fromkeys(job.job_description for job in jobs))
+    results = await _context_graph(job_descriptions, user).run()
+    contexts = results["retrieved_experience"]
+
+    # 2. Generate with bounded parallelism and report each job as it finishes
+    semaphore = asyncio.Semaphore(max_parallel)
+    tasks = [
+        asyncio.create_task(_generate_job(index, job, user, contexts.get(job.job_description, ""), semaphore))
+        for index, job in enumerate(jobs)
+    ]
+    counts = {"ok": 0, "incomplete": 0, "error": 0}
+    try:
+        for finished in asyncio.as_completed(tasks):
+            event = await finished
+            counts[event["status"]] += 1
+            yield "job", event
+    finally:
+        # The client disconnected, or the batch is done.
+        for task in tasks:
+            task.cancel()
+
+    yield "done", {"jobs": len(jobs), "succeeded": counts["ok"], "incomplete": counts["incomplete"], "failed": counts["error"]}
@@ -0,0 +1,235 @@
+# functions/flows/context_cache.py
+
+"""
+Reuses stable prompt prefixes through the model provider's context cache.
+
+Most of a prompt's input tokens repeat from call to call: the system
+instructions and output schema are the same for every request, and a user
+iterating on one application sends the same resume and cover letter each
+time. The flows assemble their prompts stable-content-first as a
+`SplitPrompt`, which records where the stable prefix ends and who it belongs
+to (its scope). For models that support it, the router then sends only the
+suffix and references a provider-side cache holding the prefix, which the
+provider neither re-reads nor bills at the full input rate. Genkit models get
+the cache methods from `functions.services.gemini_context_cache`.
+
+One cache is tracked per (model, scope). A prefix is cached once it has been
+sent `min_uses` times within the TTL; when the prefix for a scope changes
+(e.g. the user edited their resume) the old cache is invalidated and deleted.
+Caches are dropped shortly before the provider expires them, and the least
+recently used ones are evicted beyond `max_entries`.
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+from functions.config import (
+    CONTEXT_CACHE_ENABLED,
+    CONTEXT_CACHE_EXPIRY_MARGIN_SECONDS,
+    CONTEXT_CACHE_MAX_ENTRIES,
+    CONTEXT_CACHE_MIN_PREFIX_TOKENS,
+    CONTEXT_CACHE_MIN_USES,
+    CONTEXT_CACHE_TTL_SECONDS,
+)
+from functions.flows.token_utils import estimate_tokens
+
+
+class SplitPrompt(str):
+    """
+    A prompt that records its stable prefix.
+
+    Its value is the full prompt text, so it can be used wherever a prompt string is
+    (routing, response cache keys, token estimates). `prefix` is the part that is the
+    same across calls, `suffix` the per-call rest, and `scope` names who the prefix
+    belongs to (a flow, or a flow and user).
+    """
+
+    def __new__(cls, prefix: str, suffix: str, scope: str):
+        prompt = super().__new__(cls, prefix + suffix)
+        prompt.prefix = prefix
+        prompt.suffix = suffix
+        prompt.scope = scope
+        return prompt
+
+    def extend(self, text: str) -> "SplitPrompt":
+        """Returns this prompt with `text` appended, keeping the same prefix and scope."""
+        return SplitPrompt(self.prefix, self.suffix + text, self.scope)
+
+
+class ContextCache:
+    """Creates, reuses and invalidates provider-side caches of prompt prefixes."""
+
+    def __init__(
+        self,
+        ttl_seconds: float = CONTEXT_CACHE_TTL_SECONDS,
+        min_prefix_tokens: int = CONTEXT_CACHE_MIN_PREFIX_TOKENS,
+        min_uses: int = CONTEXT_CACHE_MIN_USES,
+        max_entries: int = CONTEXT_CACHE_MAX_ENTRIES,
+        expiry_margin_seconds: float = CONTEXT_CACHE_EXPIRY_MARGIN_SECONDS,
+        enabled: bool = CONTEXT_CACHE_ENABLED,
+    ):
+        """
+        Initializes the cache.
+
+        Args:
+            ttl_seconds: The lifetime requested for each provider cache.
+            min_prefix_tokens: Shorter prefixes are always sent inline.
+            min_uses: How many times a prefix must be sent within the TTL before it is cached.
+            max_entries: The number of (model, scope) caches kept; older ones are deleted.
+            expiry_margin_seconds: Caches this close to expiry are no longer used.
+            enabled: When False, every prompt is sent inline.
+        """
+        self.ttl_seconds = ttl_seconds
+        self.min_prefix_tokens = min_prefix_tokens
+        self.min_uses = min_uses
+        self.max_entries = max_entries
+        self.expiry_margin_seconds = expiry_margin_seconds
+        self.enabled = enabled
+
+        # (model name, scope) -> entry, least recently used first. An entry holds the prefix's
+        # hash and token estimate, the model object, the provider cache name (None until created),
+        # its expiry (or the end of the window in which uses are counted) and the use count.
+        self._entries: OrderedDict[tuple[str, str], dict] = OrderedDict()
+        # Background cache deletions, kept referenced until they finish.
+        self._deletions: set[asyncio.Task] = set()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "creations": 0,
+            "creation_errors": 0,
+            "invalidations": 0,
+            "expirations": 0,
+            "evictions": 0,
+            "discarded": 0,
+            "cached_tokens": 0,
+        }
+
+    def _delete(self, entry: dict) -> None:
+        """Deletes an entry's provider cache in the background, if the model supports it."""
+        name, model = entry.get("name"), entry["model"]
+        if name is None or not hasattr(model, "delete_cache"):
+            return
+
+        async def _run() -> None:
+            try:
+                await model.delete_cache(name)
+            except Exception as e:
+                print(f"WARN: Could not delete context cache '{name}': {e}")
+
+        task = asyncio.ensure_future(_run())
+        self._deletions.add(task)
+        task.add_done_callback(self._deletions.discard)
+
+    def _entry(self, key: tuple[str, str], model, digest: str, tokens: int) -> dict:
+        """Returns the live entry for `key`, replacing one whose prefix changed or that expired."""
+        entry = self._entries.get(key)
+        now = time.time()
+        if entry is not None and entry["hash"] != digest:
+            self._stats["invalidations"] += 1
+            self._delete(self._entries.pop(key))
+            entry = None
+        elif entry is not None and now >= entry["expires_at"] - self.expiry_margin_seconds:
+            if entry["name"] is not None:
+                self._stats["expirations"] += 1
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            entry = self._entries[key] = {
+                "hash": digest, "tokens": tokens, "model": model, "name": None,
+                "expires_at": now + self.ttl_seconds, "uses": 0, "failed": False,
+            }
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+                self._delete(evicted)
+        self._entries.move_to_end(key)
+        return entry
+
+    async def _create(self, key: tuple[str, str], entry: dict, prefix: str) -> str | None:
+        try:
+            handle = await entry["model"].create_cache(prefix, ttl_seconds=self.ttl_seconds)
+        except Exception as e:
+            # Not retried until the entry expires; calls meanwhile send the prompt inline.
+            print(f"WARN: Could not create a context cache for '{key[1]}' on '{key[0]}': {e}")
+            self._stats["creation_errors"] += 1
+            entry["failed"] = True
+            return None
+        finally:
+            entry.pop("creating", None)
+        entry["name"] = getattr(handle, "name", handle)
+        entry["expires_at"] = time.time() + self.ttl_seconds
+        self._stats["creations"] += 1
+        if self._entries.get(key) is not entry:
+            # The prefix was invalidated while its cache was being created.
+            self._delete(entry)
+            return None
+        return entry["name"]
+
+    async def resolve(self, model_name: str, model, prompt: str) -> str | None:
+        """
+        Returns the provider cache holding the prompt's prefix, creating it if the prefix
+        has been sent often enough, or None if the whole prompt should be sent inline.
+
+        Args:
+            model_name: The model the prompt is sent to.
+            model: The model object; caching requires a `create_cache(prefix, ttl_seconds)` method,
+                and a `min_cache_tokens` attribute, if present, raises the minimum prefix size.
+            prompt: The prompt; only a `SplitPrompt` with a long enough prefix is cached.
+
+        Returns:
+            The provider's cache name, to be sent with `prompt.suffix`, or None.
+        """
+        if not self.enabled or not isinstance(prompt, SplitPrompt) or not hasattr(model, "create_cache"):
+            return None
+        tokens = estimate_tokens(prompt.prefix)
+        if tokens < max(self.min_prefix_tokens, getattr(model, "min_cache_tokens", 0)):
+            return None
+
+        key = (model_name, prompt.scope)
+        digest = hashlib.sha256(prompt.prefix.encode("utf-8")).hexdigest()
+        entry = self._entry(key, model, digest, tokens)
+        entry["uses"] += 1
+
+        if entry["name"] is not None:
+            self._stats["hits"] += 1
+            self._stats["cached_tokens"] += tokens
+            return entry["name"]
+        if entry["failed"] or (entry["uses"] < self.min_uses and "creating" not in entry):
+            self._stats["misses"] += 1
+            return None
+
+        # Concurrent calls for the same prefix share one creation; a caller that
+        # times out does not cancel it for the others.
+        if "creating" not in entry:
+            entry["creating"] = asyncio.ensure_future(self._create(key, entry, prompt.prefix))
+        name = await asyncio.shield(entry["creating"])
+        if name is not None:
+            self._stats["cached_tokens"] += tokens
+        return name
+
+    def discard(self, model_name: str, prompt: str) -> None:
+        """
+        Forgets the cache used for a prompt whose call failed (the provider may have
+        expired or dropped it); the next call sends the prompt inline.
+        """
+        if not isinstance(prompt, SplitPrompt):
+            return
+        entry = self._entries.pop((model_name, prompt.scope), None)
+        if entry is not None and entry["name"] is not None:
+            self._stats["discarded"] += 1
+            self._delete(entry)
+
+    def stats(self) -> dict:
+        """Returns hit, creation and invalidation counts and the prefix tokens served from provider caches."""
+        stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"] + stats["creations"]
+        stats["entries"] = len(self._entries)
+        stats["active_caches"] = sum(1 for entry in self._entries.values() if entry["name"] is not None)
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+# Create the single context cache shared by all model calls.
+context_cache = ContextCache()
@@ -0,0 +1,172 @@
+# functions/flows/context_retrieval.py
+
+"""
+Builds the RAG context for a prompt from a user's retrieved document chunks.
+
+Instead of sending the top few dense matches whatever their length or overlap,
+the stage over-fetches candidates, re-ranks them by blending the dense score
+with BM25 keyword relevance over the same chunks, and selects chunks with
+Maximal Marginal Relevance so near-duplicates are dropped. Selected chunks are
+packed into a token budget, and every call reports how many prompt tokens it
+saved compared with the previous top-k join.
+"""
+
+import math
+import re
+from collections import Counter
+
+from functions.config import (
+    RAG_BASELINE_TOP_K,
+    RAG_CANDIDATES,
+    RAG_CONTEXT_TOKEN_BUDGET,
+    RAG_DENSE_WEIGHT,
+    RAG_MMR_LAMBDA,
+)
+from functions.flows.token_utils import estimate_tokens
+
+CONTEXT_SEPARATOR = "\n- "
+# Chunks at least this similar (token Jaccard) to one already selected are dropped as duplicates.
+DUPLICATE_SIMILARITY = 0.85
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("a an and are as at be by for from has have in is it of on or that the to was were will with".split())
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercases `text` and splits it into words, dropping common stopwords."""
+    return [word for word in _WORD.findall(text.lower()) if word not in _STOPWORDS]
+
+
+def bm25_scores(query: list[str], documents: list[list[str]], k1: float = 1.5, b: float = 0.75) -> list[float]:
+    """
+    Scores tokenized documents against a tokenized query with Okapi BM25.
+    Document frequencies are computed over `documents` themselves.
+    """
+    if not documents:
+        return []
+    average_length = sum(len(document) for document in documents) / len(documents) or 1.0
+    document_frequency = Counter(term for document in documents for term in set(document))
+    idf = {
+        term: math.log(1 + (len(documents) - count + 0.5) / (count + 0.5))
+        for term, count in document_frequency.items()
+    }
+    scores = []
+    for document in documents:
+        frequencies = Counter(document)
+        length_norm = k1 * (1 - b + b * len(document) / average_length)
+        scores.append(sum(
+            idf[term] * frequencies[term] * (k1 + 1) / (frequencies[term] + length_norm)
+            for term in set(query)
+            if term in frequencies
+        ))
+    return scores
+
+
+def _min_max(values: list[float]) -> list[float]:
+    low, high = min(values), max(values)
+    if high - low < 1e-12:
+        return [1.0 if high > 0 else 0.0 for _ in values]
+    return [(value - low) / (high - low) for value in values]
+
+
+def _jaccard(a: set[str], b: set[str]) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def select_context(
+    query_text: str,
+    matches: list[dict],
+    token_budget: int = RAG_CONTEXT_TOKEN_BUDGET,
+    dense_weight: float = RAG_DENSE_WEIGHT,
+    mmr_lambda: float = RAG_MMR_LAMBDA,
+    baseline_top_k: int = RAG_BASELINE_TOP_K,
+) -> tuple[list[str], dict]:
+    """
+    Re-ranks candidate chunks and packs the best, non-redundant ones into a token budget.
+
+    Args:
+        query_text: The text the chunks were retrieved for (e.g. the job description).
+        matches: Candidates from `Retriever.query_matches`, best dense score first.
+        token_budget: The most context tokens to select.
+        dense_weight: Weight of the dense score against BM25 (0 to 1) in the fused relevance.
+        mmr_lambda: Relevance against novelty in MMR selection (1 ignores redundancy).
+        baseline_top_k: Chunks the previous top-k join used, for the tokens-saved report.
+
+    Returns:
+        A tuple of (selected chunk texts in selection order, a report with candidate,
+        duplicate and token counts and `tokens_saved`).
+    """
+    texts = [match['metadata']['text'] for match in matches]
+    baseline_tokens = estimate_tokens(CONTEXT_SEPARATOR.join(texts[:baseline_top_k]))
+    report = {
+        "candidates": len(texts),
+        "selected": 0,
+        "duplicates_dropped": 0,
+        "over_budget": 0,
+        "context_tokens": 0,
+        "baseline_tokens": baseline_tokens,
+        "tokens_saved": baseline_tokens,
+    }
+    if not texts:
+        return [], report
+
+    tokens = [tokenize(text) for text in texts]
+    dense = _min_max([float(match.get('score', 0.0)) for match in matches])
+    keyword = _min_max(bm25_scores(tokenize(query_text), tokens))
+    relevance = [dense_weight * d + (1 - dense_weight) * k for d, k in zip(dense, keyword)]
+    token_sets = [set(words) for words in tokens]
+
+    selected: list[int] = []
+    remaining = set(range(len(texts)))
+    budget_left = token_budget
+    while remaining and budget_left > 0:
+        def _redundancy(i: int) -> float:
+            return max((_jaccard(token_sets[i], token_sets[j]) for j in selected), default=0.0)
+
+        best = max(remaining, key=lambda i: mmr_lambda * relevance[i] - (1 - mmr_lambda) * _redundancy(i))
+        remaining.discard(best)
+        if _redundancy(best) >= DUPLICATE_SIMILARITY:
+            report["duplicates_dropped"] += 1
+            continue
+        cost = estimate_tokens(texts[best])
+        if cost > budget_left:
+            report["over_budget"] += 1
+            continue
+        selected.append(best)
+        budget_left -= cost
+
+    chosen = [texts[i] for i in selected]
+    context_tokens = estimate_tokens(CONTEXT_SEPARATOR.join(chosen))
+    report.update(
+        selected=len(chosen),
+        context_tokens=context_tokens,
+        tokens_saved=baseline_tokens - context_tokens,
+    )
+    return chosen, report
+
+
+async def retrieve_context(retriever, query_text: str, user_id: str, candidates: int = RAG_CANDIDATES,
+                           timeout: float | None = None, query_embedding: list[float] | None = None) -> tuple[str, dict]:
+    """
+    Retrieves the user's chunks for `query_text` and builds the prompt context from them.
+
+    Args:
+        retriever: The retrieval backend (see `functions.services.retriever`).
+        query_text: The text to retrieve context for.
+        user_id: The UID of the user whose documents are searched.
+        candidates: How many chunks to over-fetch before re-ranking.
+        timeout: Seconds to wait for the backend before proceeding without context.
+        query_embedding: The embedding of `query_text`, if it was already computed.
+
+    Returns:
+        A tuple of (context text joined for the prompt, the selection report).
+    """
+    matches = await retriever.query_matches(
+        query_text, user_id, top_k=candidates, timeout=timeout, query_embedding=query_embedding,
+    )
+    chosen, report = select_context(query_text, matches)
+    print(
+        f"RAG context for user {user_id}: {report['selected']}/{report['candidates']} chunks, "
+        f"{report['duplicates_dropped']} duplicates dropped, {report['context_tokens']} tokens "
+        f"({report['tokens_saved']} saved vs top-{RAG_BASELINE_TOP_K})."
+    )
+    return CONTEXT_SEPARATOR.join(chosen), report
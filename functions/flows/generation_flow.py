@@ -1,53 +1,127 @@
 # functions/flows/generation_flow.py
 
 import genkit
+import hashlib
 import json
 
 # 1. Import all necessary modules
-from functions.schemas import JobDescription, GeneratedContent, User
-from functions.config import DEFAULT_GENERATION_MODEL
-from functions.services.vector_db_service import pinecone_client
+from functions.schemas import GENERATED_CONTENT_FIELDS, JobDescription, GeneratedContent, User
+from functions.config import EMBEDDING_STEP_TIMEOUT_SECONDS, GENERATION_SECTIONED, RAG_STEP_TIMEOUT_SECONDS
+from functions.services.embedding_service import embedding_service
+from functions.services.vector_db_service import get_retriever
+from functions.flows.streaming import IncrementalJSONParser, schema_to_dict
+from functions.flows.response_cache import response_cache, is_json_response
+from functions.flows.model_router import model_router
+from functions.flows.context_cache import SplitPrompt
+from functions.flows.task_graph import TaskGraph
+from functions.flows.context_retrieval import retrieve_context
+from functions.flows.persistence import save_output
+from functions.flows.sectioned_generation import generate_sections, iter_sections
+from functions.flows.structured_output import schema_instructions, structured_output
+from functions.services.telemetry import telemetry
 
+PARSE_ERROR = "Error: Failed to parse content from AI model."
+SECTION_ERROR = "Error: Failed to generate this section."
 
-# 2. Define the Genkit flow for the "Document Writer & Job Analyzer" agent
-@genkit.flow(
-    name="generateFlow",
-    input_schema=JobDescription,
-    output_schema=GeneratedContent,
-)
-async def generateFlow(data: JobDescription, user: User) -> GeneratedContent:
+# Sectioned mode: the instructions and length limit for each GeneratedContent field.
+GENERATION_SECTIONS = {
+    "analysis": {
+        "instructions": "Provide a brief analysis of the job: its purpose, key responsibilities and the skills it calls for.",
+        "max_chars": 2_000,
+    },
+    "cover_letter": {
+        "instructions": "Draft a paragraph for a cover letter that highlights the user's relevant experience.",
+        "max_chars": 2_500,
+    },
+    "resume_summary": {
+        "instructions": "Draft a 3-bullet point resume summary that directly targets this job.",
+        "max_chars": 1_200,
+    },
+}
+
+
+async def _retrieve_experience(retriever, data: JobDescription, user: User, query_embedding: list[float] | None) -> str:
     """
-    This agent analyzes a job description and uses Retrieval-Augmented Generation (RAG)
-    to create application documents tailored to the user's experience stored in Pinecone.
+    Uses the vector DB service to retrieve user-specific context (RAG).
+    Candidates are re-ranked, de-duplicated and packed into the context token budget.
+    """
+    if not retriever:
+        print("WARN: Retrieval backend not available. Proceeding without RAG context.")
+        return ""
 
-    Args:
-        data: The input containing the job description.
-        user: The authenticated user object from the auth dependency.
+    print("Retrieving context from vector database...")
+    retrieved_experience, _ = await retrieve_context(
+        retriever, data.job_description, user.uid, query_embedding=query_embedding,
+    )
+    return retrieved_experience
+
+
+def _context_graph(data: JobDescription, user: User) -> TaskGraph:
     """
-    print(f"Agent 'generateFlow' started for user: {user.uid} ({user.email}).")
-    
-    # 3. Use the vector DB service to retrieve user-specific context (RAG)
-    context_from_db = []
-    if pinecone_client:
-        print("Retrieving context from vector database...")
-        context_from_db = await pinecone_client.query_for_context(
-            query_text=data.job_description,
-            user_id=user.uid,
-            top_k=3
-        )
-    else:
-        print("WARN: Pinecone client not available. Proceeding without RAG context.")
+    Declares the steps that gather the prompt's context.
+
+    The retriever (Pinecone client) lookup and the job-description embedding are independent
+    and run concurrently; the vector search then uses that embedding (or embeds the job
+    description itself if the embedding step failed).
+    Every step is optional: if retrieval is slow or fails, we generate without RAG context.
+    """
+    graph = TaskGraph("generateFlow")
+    graph.step("retriever", get_retriever, timeout=RAG_STEP_TIMEOUT_SECONDS, fallback=None)
+    graph.step(
+        "query_embedding",
+        lambda: embedding_service.embed(data.job_description),
+        timeout=EMBEDDING_STEP_TIMEOUT_SECONDS,
+        fallback=None,
+    )
+    graph.step(
+        "retrieved_experience",
+        lambda retriever, query_embedding: _retrieve_experience(retriever, data, user, query_embedding),
+        depends_on=("retriever", "query_embedding"),
+        timeout=RAG_STEP_TIMEOUT_SECONDS,
+        fallback="",
+    )
+    return graph
+
+
+def build_generation_prompt(job_description: str, retrieved_experience: str) -> SplitPrompt:
+    """
+    Constructs the document-writer prompt from the job description and retrieved context.
+
+    The instructions and output schema, which are the same for every request, come first
+    so they can be reused from the context cache.
+    """
+    prefix = f"""
+        You are an expert career document writer for the Australian Community Services sector.
+        {schema_instructions(GENERATED_CONTENT_FIELDS)}
+
+        Based on BOTH the job description and the user's specific experience below, perform the following tasks:
+        1.  **Analysis:** Provide a brief analysis of the job.
+        2.  **Cover Letter:** Draft a paragraph for a cover letter that highlights the user's relevant experience.
+        3.  **Resume Summary:** Draft a 3-bullet point resume summary that directly targets this job.
+"""
+    suffix = f"""
+        A user is applying for a job with the following description:
+        ---
+        JOB DESCRIPTION: {job_description}
+        ---
+
+        I have retrieved the most relevant experience from the user's stored documents:
+        ---
+        RELEVANT USER EXPERIENCE:
+        - {retrieved_experience}
+        ---
+    """
+    return SplitPrompt(prefix, suffix, scope="generateFlow")
 
-    retrieved_experience = "\n- ".join(context_from_db)
 
-    # 4. Construct a powerful prompt using the retrieved context
-    prompt = f"""
+def build_section_prompt(field: str, job_description: str, retrieved_experience: str) -> str:
+    """Constructs the prompt for one GeneratedContent field in sectioned mode."""
+    return f"""
         You are an expert career document writer for the Australian Community Services sector.
-        You MUST return a valid JSON object with the following keys: "analysis", "cover_letter", "resume_summary".
 
         A user is applying for a job with the following description:
         ---
-        JOB DESCRIPTION: {data.job_description}
+        JOB DESCRIPTION: {job_description}
         ---
 
         I have retrieved the most relevant experience from the user's stored documents:
@@ -56,20 +130,36 @@ async def generateFlow(data: JobDescription, user: User) -> GeneratedContent:
         - {retrieved_experience}
         ---
 
-        Based on BOTH the job description and the user's specific experience, perform the following tasks:
-        1.  **Analysis:** Provide a brief analysis of the job.
-        2.  **Cover Letter:** Draft a paragraph for a cover letter that highlights the user's relevant experience.
-        3.  **Resume Summary:** Draft a 3-bullet point resume summary that directly targets this job.
+        Based on BOTH the job description and the user's specific experience:
+        {GENERATION_SECTIONS[field]['instructions']}
+        Return ONLY this text, at most {GENERATION_SECTIONS[field]['max_chars']} characters,
+        with no JSON, headings or commentary.
     """
 
-    # 5. Call the generative model
+
+def _section_specs(job_description: str, retrieved_experience: str) -> dict[str, dict]:
+    return {
+        field: {"prompt": build_section_prompt(field, job_description, retrieved_experience), "max_chars": spec["max_chars"]}
+        for field, spec in GENERATION_SECTIONS.items()
+    }
+
+
+def _is_sectioned(data: JobDescription) -> bool:
+    sectioned = getattr(data, "sectioned", None)
+    return GENERATION_SECTIONED if sectioned is None else bool(sectioned)
+
+
+async def _call_model(prompt: str, quality: str | None = None) -> str:
+    """Calls the routed generative model (see `model_router`) and returns its raw text output."""
     print("Generating content with the LLM...")
-    llm = genkit.get_model(DEFAULT_GENERATION_MODEL)
-    result = await llm.generate(prompt)
-    raw_text_output = result.text()
-    print(f"LLM Raw Output: {raw_text_output}")
+    raw_text_output = await model_router.generate(prompt, task="generate", quality=quality)
+    # Full model outputs are large; only a sample of requests logs a preview.
+    telemetry.log("llm_output", task="generate", chars=len(raw_text_output), preview=raw_text_output)
+    return raw_text_output
+
 
-    # 6. Parse the model's response and return the structured output
+def _parse_generated_content(raw_text_output: str) -> GeneratedContent:
+    """Parses the model's response into the output schema, falling back to error placeholders."""
     try:
         # The model should return a parsable JSON string.
         output_data = json.loads(raw_text_output)
@@ -79,7 +169,190 @@ async def generateFlow(data: JobDescription, user: User) -> GeneratedContent:
         print(f"Error decoding JSON from model response: {e}")
         # Provide a structured error that fits the schema
         return GeneratedContent(
-            analysis="Error: Failed to parse content from AI model.",
-            cover_letter="Error: Failed to parse content from AI model.",
-            resume_summary="Error: Failed to parse content from AI model."
-        )
\ No newline at end of file
+            analysis=PARSE_ERROR,
+            cover_letter=PARSE_ERROR,
+            resume_summary=PARSE_ERROR
+        )
+
+
+async def _complete_output(raw_text_output: str, prompt: str, quality: str | None, report: dict) -> str:
+    """
+    Parses and repairs the model's JSON answer, re-prompting only for fields that are
+    missing or invalid; fields that still fail get an error placeholder.
+    """
+    values, structured_report = await structured_output.enforce(
+        raw_text_output,
+        GENERATED_CONTENT_FIELDS,
+        prompt,
+        regenerate=lambda repair_prompt: model_router.generate(repair_prompt, task="structured_repair", quality=quality),
+        placeholder=PARSE_ERROR,
+    )
+    report["failed"] = structured_report["failed_fields"]
+    return json.dumps(values)
+
+
+async def _generate_structured(prompt: str, quality: str | None, report: dict) -> str:
+    """Calls the model and returns its answer as complete JSON (see `_complete_output`)."""
+    return await _complete_output(await _call_model(prompt, quality), prompt, quality, report)
+
+
+async def _generate_sectioned(sections: dict[str, dict], quality: str | None, report: dict) -> str:
+    """
+    Generates every field concurrently and merges them into the flow's JSON output.
+    Fields that fail every attempt get an error placeholder; the others are kept.
+    """
+    print(f"Generating {len(sections)} sections concurrently with the LLM...")
+    values, section_report = await generate_sections(
+        sections,
+        lambda prompt: model_router.generate(prompt, task="generate_section", quality=quality),
+    )
+    report.update(section_report)
+    if section_report["failed"]:
+        print(f"WARN: Sections {section_report['failed']} failed after {section_report['attempts']} attempts.")
+    return json.dumps({field: SECTION_ERROR if value is None else value for field, value in values.items()})
+
+
+async def _generate_raw_output(data: JobDescription, user: User, retrieved_experience: str, report: dict) -> str:
+    """
+    Constructs the prompt (or section prompts) and calls the generative model, reusing a
+    cached answer for repeated requests. Fields that failed are listed in `report["failed"]`.
+    Semantic hits are scoped to the same retrieved experience, so an answer built from
+    documents the user has since re-ingested or deleted is not reused.
+    """
+    quality = getattr(data, "quality", None)
+    experience_hash = hashlib.sha256(retrieved_experience.encode("utf-8")).hexdigest()
+    if _is_sectioned(data):
+        sections = _section_specs(data.job_description, retrieved_experience)
+        prompt = "\n".join(spec["prompt"] for spec in sections.values())
+        model = "sectioned:" + model_router.model_for(sections["analysis"]["prompt"], "generate_section", quality)
+        generate = lambda: _generate_sectioned(sections, quality, report)
+        scope = f"generateFlow:sectioned:{experience_hash}"
+    else:
+        prompt = build_generation_prompt(data.job_description, retrieved_experience)
+        model = model_router.model_for(prompt, "generate", quality)
+        generate = lambda: _generate_structured(prompt, quality, report)
+        scope = f"generateFlow:{experience_hash}"
+    return await response_cache.generate(
+        user_id=user.uid,
+        model=model,
+        prompt=prompt,
+        generate=generate,
+        semantic_text=data.job_description,
+        semantic_scope=scope,
+        validate=lambda text: is_json_response(text) and not report["failed"],
+        bypass=bool(getattr(data, "bypass_cache", False)),
+        refresh=bool(getattr(data, "refresh_cache", False)),
+        report=report,
+    )
+
+
+async def _finish_output(data: JobDescription, user: User, raw_text_output: str, report: dict) -> GeneratedContent:
+    """Parses the model's answer and, if it is complete, queues it for saving to the user's history."""
+    output = _parse_generated_content(raw_text_output)
+    if is_json_response(raw_text_output) and not report["failed"]:
+        output = await save_output("generateFlow", user, data.job_description, output, GeneratedContent, report)
+    return output
+
+
+async def generate_with_context(data: JobDescription, user: User, retrieved_experience: str) -> tuple[GeneratedContent, list[str]]:
+    """
+    Runs `generateFlow`'s generation for a job whose RAG context has already been retrieved
+    (used by batch generation, which retrieves the context for every job up front).
+
+    Returns:
+        A tuple of (the output, the fields that failed and hold an error placeholder).
+    """
+    report = {"failed": []}
+    raw_text_output = await _generate_raw_output(data, user, retrieved_experience, report)
+    return await _finish_output(data, user, raw_text_output, report), report["failed"]
+
+
+# 2. Define the Genkit flow for the "Document Writer & Job Analyzer" agent
+@genkit.flow(
+    name="generateFlow",
+    input_schema=JobDescription,
+    output_schema=GeneratedContent,
+)
+async def generateFlow(data: JobDescription, user: User) -> GeneratedContent:
+    """
+    This agent analyzes a job description and uses Retrieval-Augmented Generation (RAG)
+    to create application documents tailored to the user's experience stored in Pinecone.
+
+    Args:
+        data: The input containing the job description.
+        user: The authenticated user object from the auth dependency.
+    """
+    print(f"Agent 'generateFlow' started for user: {user.uid} ({user.email}).")
+
+    # 3. Declare the flow's steps: retrieve user-specific context (RAG), then
+    #    construct the prompt and call the generative model, reusing a cached
+    #    answer for repeated requests.
+    #    Only complete outputs (no field failed repair or every section attempt) are cached.
+    generation_report = {"failed": []}
+    graph = _context_graph(data, user)
+    graph.step(
+        "raw_text_output",
+        lambda retrieved_experience: _generate_raw_output(data, user, retrieved_experience, generation_report),
+        depends_on=("retrieved_experience",),
+    )
+
+    # 4. Run independent steps concurrently
+    results = await graph.run()
+
+    # 5. Parse the model's response, save it to the user's history in the
+    #    background, and return the structured output
+    return await _finish_output(data, user, results["raw_text_output"], generation_report)
+
+
+async def generateFlowStream(data: JobDescription, user: User):
+    """
+    Streaming variant of `generateFlow`.
+
+    Yields (event, data) pairs: a "chunk" event for every piece of model output as it
+    arrives, a "field" event as soon as each top-level field (e.g. "analysis") closes,
+    and a final "done" event carrying the complete, schema-validated output.
+    In sectioned mode there are no "chunk" events; each field is sent as it completes.
+    """
+    print(f"Agent 'generateFlow' (streaming) started for user: {user.uid} ({user.email}).")
+
+    results = await _context_graph(data, user).run()
+    quality = getattr(data, "quality", None)
+    if _is_sectioned(data):
+        sections = _section_specs(data.job_description, results["retrieved_experience"])
+        values = {}
+        async for field, value, _ in iter_sections(
+            sections,
+            lambda prompt: model_router.generate(prompt, task="generate_section", quality=quality),
+        ):
+            values[field] = SECTION_ERROR if value is None else value
+            yield "field", {"path": field, "value": values[field]}
+        output = GeneratedContent(**{field: values[field] for field in sections})
+        if SECTION_ERROR not in values.values():
+            output = await save_output("generateFlow", user, data.job_description, output, GeneratedContent)
+        yield "done", schema_to_dict(output)
+        return
+
+    prompt = build_generation_prompt(data.job_description, results["retrieved_experience"])
+
+    parser = IncrementalJSONParser()
+    parse_failed = False
+    raw_chunks = []
+    async for chunk in model_router.generate_stream(prompt, "generate", quality):
+        text = chunk.text()
+        raw_chunks.append(text)
+        yield "chunk", {"text": text}
+        if parse_failed:
+            continue
+        try:
+            for path, value in parser.feed(text):
+                yield "field", {"path": path, "value": value}
+        except json.JSONDecodeError as e:
+            # Keep forwarding chunks; the answer is repaired once the stream ends.
+            print(f"Error decoding streamed JSON field: {e}")
+            parse_failed = True
+
+    generation_report = {"failed": []}
+    output = _parse_generated_content(await _complete_output("".join(raw_chunks), prompt, quality, generation_report))
+    if not generation_report["failed"]:
+        output = await save_output("generateFlow", user, data.job_description, output, GeneratedContent)
+    yield "done", schema_to_dict(output)
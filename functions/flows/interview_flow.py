@@ -1,58 +1,105 @@
 # functions/flows/interview_flow.py
 
 import genkit
+import hashlib
 import json
 
 # 1. Import from our centralized modules
-from functions.schemas import InterviewPrepData, InterviewPrepOutput, User
-from functions.services.ai_service import perplexity_client
-from functions.config import DEFAULT_GENERATION_MODEL
+from functions.schemas import INTERVIEW_PREP_FIELDS, InterviewPrepData, InterviewPrepOutput, User
+from functions.services.ai_service import get_perplexity_client
+from functions.config import COMPANY_RESEARCH_TIMEOUT_SECONDS, EMBEDDING_STEP_TIMEOUT_SECONDS
+from functions.services.embedding_service import embedding_service
+from functions.flows.streaming import IncrementalJSONParser, schema_to_dict
+from functions.flows.response_cache import response_cache, is_json_response
+from functions.flows.model_router import model_router
+from functions.flows.context_cache import SplitPrompt
+from functions.flows.task_graph import TaskGraph
+from functions.flows.persistence import save_output
+from functions.flows.structured_output import schema_instructions, structured_output
+from functions.services.telemetry import telemetry
 
+PARSE_ERROR = "Error: Failed to parse content from AI model."
 
-# 2. Define the Genkit flow
-@genkit.flow(
-    name="interviewPrepFlow",
-    input_schema=InterviewPrepData,
-    output_schema=InterviewPrepOutput,
-)
-async def interviewPrepFlow(data: InterviewPrepData, user: User) -> InterviewPrepOutput:
-    """
-    This agent takes a job description and user documents to generate a
-    comprehensive and personalized interview preparation guide.
-    """
-    print(f"Agent 'interviewPrepFlow' started for user: {user.uid} ({user.email}).")
+# Used when company research is unavailable or too slow, so the flow still answers.
+FALLBACK_COMPANY_INSIGHTS = {
+    "culture": "No company research is available; focus on the job description.",
+    "recent_news": "",
+    "values": [],
+}
 
-    # 3. Use the imported services (Agent Tools)
-    # The Perplexity client is a mock, so this will return placeholder data.
+
+async def _research_company(perplexity_client) -> dict:
+    """Uses the Perplexity tool to gather company insights (cached per company)."""
+    if perplexity_client is None:
+        raise ValueError("Perplexity client is not available.")
     # In a real implementation, you would extract the company name from the job description.
     company_name = "ExampleCorp" # Placeholder
-    company_insights_data = perplexity_client.company_deep_dive(company_name)
+    return await perplexity_client.company_deep_dive(company_name)
+
 
-    # 4. Construct the prompt for the generative model
-    prompt = f"""
+def _context_graph(data: InterviewPrepData) -> TaskGraph:
+    """
+    Declares the steps that gather the prompt's context.
+
+    Company research runs while the job description is embedded
+    (for the response cache's semantic lookup). Both steps are optional and degrade
+    to a fallback when they fail or miss their deadline.
+    """
+    graph = TaskGraph("interviewPrepFlow")
+    graph.step("perplexity_client", get_perplexity_client, timeout=COMPANY_RESEARCH_TIMEOUT_SECONDS, fallback=None)
+    graph.step(
+        "company_insights_data",
+        _research_company,
+        depends_on=("perplexity_client",),
+        timeout=COMPANY_RESEARCH_TIMEOUT_SECONDS,
+        fallback=FALLBACK_COMPANY_INSIGHTS,
+    )
+    graph.step(
+        "job_embedding",
+        lambda: embedding_service.embed(data.job_description),
+        timeout=EMBEDDING_STEP_TIMEOUT_SECONDS,
+        fallback=None,
+    )
+    return graph
+
+
+def build_interview_prompt(data: InterviewPrepData, company_insights_data: dict, user_id: str = "") -> SplitPrompt:
+    """
+    Constructs the interview-coach prompt from the user's inputs and company insights.
+
+    The instructions, resume and cover letter come first: they stay the same while the user
+    prepares for several jobs, so that prefix is reused from the context cache (per user).
+    """
+    prefix = f"""
         You are an expert career coach for the Australian Community Services sector.
-        You MUST return a valid JSON object with the following keys: "company_insights", "key_competencies", "interview_questions".
-        The "key_competencies" and "interview_questions" fields must be arrays of strings.
+        {schema_instructions(INTERVIEW_PREP_FIELDS)}
 
         Based on the user's resume, cover letter, and deep company insights, generate
         a set of likely interview questions and key competencies to highlight.
 
+        User's Resume: {data.resume}
+        User's Cover Letter: {data.cover_letter}
+"""
+    suffix = f"""
         Company Insights: {company_insights_data['culture']}
         Job Description: {data.job_description}
-        User's Resume: {data.resume}
 
         Generate a list of 5 key competencies and 5 potential interview questions.
     """
+    return SplitPrompt(prefix, suffix, scope=f"interviewPrepFlow:{user_id}")
 
-    # 5. Call the generative model
+
+async def _call_model(prompt: str, quality: str | None = None) -> str:
+    """Calls the routed generative model (see `model_router`) and returns its raw text output."""
     print("Generating interview prep with the LLM...")
-    llm = genkit.get_model(DEFAULT_GENERATION_MODEL)
-    result = await llm.generate(prompt)
-    raw_text_output = result.text()
-    print(f"LLM Raw Output: {raw_text_output}")
+    raw_text_output = await model_router.generate(prompt, task="interview_prep", quality=quality)
+    # Full model outputs are large; only a sample of requests logs a preview.
+    telemetry.log("llm_output", task="interview_prep", chars=len(raw_text_output), preview=raw_text_output)
+    return raw_text_output
 
 
-    # 6. Format and return the structured output
+def _parse_interview_prep(raw_text_output: str) -> InterviewPrepOutput:
+    """Parses the model's response into the output schema, falling back to error placeholders."""
     try:
         output_data = json.loads(raw_text_output)
         # Use the schema to validate and instantiate the output object.
@@ -61,7 +108,118 @@ async def interviewPrepFlow(data: InterviewPrepData, user: User) -> InterviewPre
         print(f"Error decoding JSON from model response: {e}")
         # Provide a structured error that fits the schema
         return InterviewPrepOutput(
-            company_insights="Error: Failed to parse content from AI model.",
-            key_competencies=["Error: Failed to parse content from AI model."],
-            interview_questions=["Error: Failed to parse content from AI model."]
-        )
\ No newline at end of file
+            company_insights=PARSE_ERROR,
+            key_competencies=[PARSE_ERROR],
+            interview_questions=[PARSE_ERROR]
+        )
+
+
+async def _complete_output(raw_text_output: str, prompt: str, quality: str | None, report: dict) -> str:
+    """
+    Parses and repairs the model's JSON answer, re-prompting only for fields that are
+    missing or invalid; fields that still fail get an error placeholder.
+    """
+    values, structured_report = await structured_output.enforce(
+        raw_text_output,
+        INTERVIEW_PREP_FIELDS,
+        prompt,
+        regenerate=lambda repair_prompt: model_router.generate(repair_prompt, task="structured_repair", quality=quality),
+        placeholder=PARSE_ERROR,
+    )
+    report["failed"] = structured_report["failed_fields"]
+    return json.dumps(values)
+
+
+async def _generate_structured(prompt: str, quality: str | None, report: dict) -> str:
+    """Calls the model and returns its answer as complete JSON (see `_complete_output`)."""
+    return await _complete_output(await _call_model(prompt, quality), prompt, quality, report)
+
+
+# 2. Define the Genkit flow
+@genkit.flow(
+    name="interviewPrepFlow",
+    input_schema=InterviewPrepData,
+    output_schema=InterviewPrepOutput,
+)
+async def interviewPrepFlow(data: InterviewPrepData, user: User) -> InterviewPrepOutput:
+    """
+    This agent takes a job description and user documents to generate a
+    comprehensive and personalized interview preparation guide.
+    """
+    print(f"Agent 'interviewPrepFlow' started for user: {user.uid} ({user.email}).")
+
+    # 3. Declare the flow's steps: use the imported services (Agent Tools), then
+    #    construct the prompt and call the generative model, reusing a cached answer
+    #    for repeated requests. Semantic hits are scoped to the same resume and cover letter.
+    #    Only complete outputs (no field failed repair) are cached.
+    user_documents_hash = hashlib.sha256(f"{data.resume}\x00{data.cover_letter}".encode("utf-8")).hexdigest()
+    generation_report = {"failed": []}
+
+    async def _generate(company_insights_data: dict) -> str:
+        prompt = build_interview_prompt(data, company_insights_data, user.uid)
+        quality = getattr(data, "quality", None)
+        return await response_cache.generate(
+            user_id=user.uid,
+            model=model_router.model_for(prompt, "interview_prep", quality),
+            prompt=prompt,
+            generate=lambda: _generate_structured(prompt, quality, generation_report),
+            semantic_text=data.job_description,
+            semantic_scope=f"interviewPrepFlow:{user_documents_hash}",
+            validate=lambda text: is_json_response(text) and not generation_report["failed"],
+            bypass=bool(getattr(data, "bypass_cache", False)),
+            refresh=bool(getattr(data, "refresh_cache", False)),
+            report=generation_report,
+        )
+
+    graph = _context_graph(data)
+    graph.step("raw_text_output", _generate, depends_on=("company_insights_data",))
+
+    # 4. Run independent steps concurrently
+    results = await graph.run()
+    raw_text_output = results["raw_text_output"]
+
+    # 5. Format the structured output, save it to the user's history in the
+    #    background, and return it
+    output = _parse_interview_prep(raw_text_output)
+    if is_json_response(raw_text_output) and not generation_report["failed"]:
+        output = await save_output(
+            "interviewPrepFlow", user, data.job_description, output, InterviewPrepOutput, generation_report,
+        )
+    return output
+
+
+async def interviewPrepFlowStream(data: InterviewPrepData, user: User):
+    """
+    Streaming variant of `interviewPrepFlow`.
+
+    Yields (event, data) pairs: "chunk" for raw model output, "field" for each completed
+    field or array element (e.g. "key_competencies[0]"), and a final "done" event.
+    """
+    print(f"Agent 'interviewPrepFlow' (streaming) started for user: {user.uid} ({user.email}).")
+
+    results = await _context_graph(data).run()
+    prompt = build_interview_prompt(data, results["company_insights_data"], user.uid)
+    quality = getattr(data, "quality", None)
+
+    parser = IncrementalJSONParser()
+    parse_failed = False
+    raw_chunks = []
+    async for chunk in model_router.generate_stream(prompt, "interview_prep", quality):
+        text = chunk.text()
+        raw_chunks.append(text)
+        yield "chunk", {"text": text}
+        if parse_failed:
+            continue
+        try:
+            for path, value in parser.feed(text):
+                yield "field", {"path": path, "value": value}
+        except json.JSONDecodeError as e:
+            # Keep forwarding chunks; the answer is repaired once the stream ends.
+            print(f"Error decoding streamed JSON field: {e}")
+            parse_failed = True
+
+    generation_report = {"failed": []}
+    output = _parse_interview_prep(await _complete_output("".join(raw_chunks), prompt, quality, generation_report))
+    if not generation_report["failed"]:
+        output = await save_output("interviewPrepFlow", user, data.job_description, output, InterviewPrepOutput)
+    yield "done", schema_to_dict(output)
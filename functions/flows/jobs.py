@@ -0,0 +1,321 @@
+# functions/flows/jobs.py
+
+"""
+Runs flows as background jobs.
+
+A long generation should not depend on an HTTP connection (or a function
+timeout) staying open. Submitting a job returns its ID straight away; the flow
+runs on a bounded pool of worker tasks, and the job's state and result live in
+a document in the user's Firestore `documents` collection, so the result shows
+up in the user's history like any other generated document, and any instance
+can answer a status request.
+
+A submission with an idempotency key gets a document ID derived from the key,
+created at most once, so retried submissions return the existing job instead
+of starting another generation. A failed or abandoned job is re-run when it is
+submitted again with the same key.
+"""
+
+import asyncio
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from functions.config import (
+    JOB_DRAIN_TIMEOUT_SECONDS,
+    JOB_MAX_QUEUED,
+    JOB_MAX_WORKERS,
+    JOB_MODEL_MAX_WAIT_SECONDS,
+    JOB_STALE_SECONDS,
+    JOB_STATUS_POLL_SECONDS,
+    JOB_TIMEOUT_SECONDS,
+)
+from functions.schemas import InterviewPrepData, JobDescription, User
+from functions.flows.generation_flow import generateFlow
+from functions.flows.interview_flow import interviewPrepFlow
+from functions.flows.persistence import current_job_document, title_for
+from functions.flows.streaming import schema_to_dict
+from functions.services.admission_control import AdmissionRejected, admission_controller
+from functions.services.firebase_service import get_firebase_service
+from functions.services.telemetry import telemetry
+
+# Flows that can run as jobs: name -> (flow, input schema).
+JOB_FLOWS = {
+    "generate": (generateFlow, JobDescription),
+    "interview-prep": (interviewPrepFlow, InterviewPrepData),
+}
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+def job_id_for(flow: str, idempotency_key: str) -> str:
+    """The document ID for a job submitted with an idempotency key (unique per user, flow and key)."""
+    return "job-" + hashlib.sha256(f"{flow}\x00{idempotency_key}".encode("utf-8")).hexdigest()[:40]
+
+
+def _utc(value) -> datetime | None:
+    if not isinstance(value, datetime):
+        return None
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _view(job: dict) -> dict:
+    """The client-facing, JSON-serializable state of a job document."""
+    view = {"job_id": job["id"], "flow": job.get("flow"), "status": job.get("status")}
+    for field in ("created_at", "updated_at", "started_at", "completed_at"):
+        if _utc(job.get(field)):
+            view[field] = _utc(job[field]).isoformat()
+    if job.get("output") is not None:
+        view["output"] = job["output"]
+    if job.get("error"):
+        view["error"] = job["error"]
+    return view
+
+
+class JobRunner:
+    """A bounded worker pool running flows as jobs, with their state kept in Firestore."""
+
+    def __init__(
+        self,
+        flows: dict | None = None,
+        max_workers: int = JOB_MAX_WORKERS,
+        max_queued: int = JOB_MAX_QUEUED,
+        timeout_seconds: float = JOB_TIMEOUT_SECONDS,
+        get_service=get_firebase_service,
+        admission=admission_controller,
+    ):
+        """
+        Initializes the runner; worker tasks start with the first submission.
+
+        Args:
+            flows: Flow name -> (flow function, input schema); defaults to JOB_FLOWS.
+            max_workers: Jobs running at once.
+            max_queued: Jobs waiting for a worker before submissions are rejected.
+            timeout_seconds: How long one job may run.
+            get_service: Returns the FirebaseService holding the job documents.
+            admission: Attributes each job's model calls to its user.
+        """
+        self.flows = JOB_FLOWS if flows is None else flows
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.timeout_seconds = timeout_seconds
+        self.get_service = get_service
+        self.admission = admission
+        self._queue: asyncio.Queue | None = None
+        self._workers: list[asyncio.Task] = []
+        # Jobs queued or running on this instance: job ID -> user ID.
+        self._pending: dict[str, str] = {}
+        # Job ID -> events set whenever the job's state changes, for status subscribers.
+        self._watchers: dict[str, set[asyncio.Event]] = {}
+        self._stats = {"submitted": 0, "deduplicated": 0, "succeeded": 0, "failed": 0, "rejected": 0}
+        # Exponentially weighted average job duration, for the Retry-After of rejected submissions.
+        self._avg_job_seconds = 30.0
+
+    def _ensure_workers(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        while len(self._workers) < self.max_workers:
+            self._workers.append(asyncio.create_task(self._worker(), name=f"job-worker-{len(self._workers)}"))
+
+    def _is_stale(self, job: dict) -> bool:
+        updated_at = _utc(job.get("updated_at"))
+        return (
+            job.get("status") not in TERMINAL_STATUSES
+            and job["id"] not in self._pending
+            and updated_at is not None
+            and (datetime.now(timezone.utc) - updated_at).total_seconds() > JOB_STALE_SECONDS
+        )
+
+    async def submit(self, flow: str, payload: dict, user: User, idempotency_key: str | None = None) -> dict:
+        """
+        Queues a flow run and returns the job's state without waiting for it.
+
+        Args:
+            flow: The flow to run ("generate" or "interview-prep").
+            payload: The flow's input, as for the synchronous endpoint.
+            user: The authenticated user who owns the job.
+            idempotency_key: Makes the submission safe to retry; a repeat returns the same job.
+
+        Returns:
+            The job's state ("job_id", "status", ...) plus "deduplicated", True if an
+            existing job was returned instead of starting a new one.
+
+        Raises:
+            ValueError: If the flow is unknown or the payload is invalid.
+            AdmissionRejected: If too many jobs are already queued.
+        """
+        if flow not in self.flows:
+            raise ValueError(f"Unknown flow '{flow}'. Expected one of: {', '.join(self.flows)}.")
+        _, input_schema = self.flows[flow]
+        try:
+            data = input_schema(**payload)
+        except Exception as e:
+            raise ValueError(f"Invalid '{flow}' input: {e}")
+
+        self._ensure_workers()
+        if self._queue.full():
+            self._stats["rejected"] += 1
+            raise AdmissionRejected("job_queue_full", self._avg_job_seconds * self._queue.qsize() / self.max_workers)
+
+        firebase_service = await self.get_service()
+        job, created = await firebase_service.create_document(
+            user.uid,
+            {
+                "flow": flow,
+                "title": title_for(data.job_description),
+                "job_description": data.job_description,
+                "status": "queued",
+                "idempotency_key": idempotency_key,
+            },
+            document_id=job_id_for(flow, idempotency_key) if idempotency_key else None,
+        )
+        if not created:
+            if job["id"] in self._pending or (job.get("status") != "failed" and not self._is_stale(job)):
+                self._stats["deduplicated"] += 1
+                print(f"Job '{job['id']}' of user '{user.uid}' already exists ({job.get('status')}); not resubmitted.")
+                return _view(job) | {"deduplicated": True}
+            # A failed or abandoned job is run again under the same ID.
+            await firebase_service.update_document(user.uid, job["id"], {"status": "queued", "error": None, "output": None})
+            job = {**job, "status": "queued", "error": None, "output": None}
+
+        try:
+            self._queue.put_nowait((user, flow, data, job["id"]))
+        except asyncio.QueueFull:
+            # Filled up while the document was being created.
+            self._stats["rejected"] += 1
+            await self._set_state(user.uid, job["id"], {"status": "failed", "error": "The job queue was full; submit it again."})
+            raise AdmissionRejected("job_queue_full", self._avg_job_seconds * self._queue.qsize() / self.max_workers)
+        self._pending[job["id"]] = user.uid
+        self._stats["submitted"] += 1
+        print(f"Queued {flow} job '{job['id']}' for user '{user.uid}' ({self._queue.qsize()} waiting).")
+        return _view(job) | {"deduplicated": False}
+
+    async def _set_state(self, user_id: str, job_id: str, state: dict) -> None:
+        try:
+            firebase_service = await self.get_service()
+            await firebase_service.update_document(user_id, job_id, state)
+        except Exception as e:
+            print(f"ERROR: Could not record state '{state.get('status')}' of job '{job_id}': {e}")
+        for event in self._watchers.get(job_id, ()):
+            event.set()
+
+    async def _run(self, user: User, flow: str, data, job_id: str) -> bool:
+        run_flow, _ = self.flows[flow]
+        await self._set_state(user.uid, job_id, {"status": "running", "started_at": datetime.now(timezone.utc)})
+        # The flow's own save goes to this job's document, and its model calls are attributed to the user.
+        token = current_job_document.set(job_id)
+        self.admission.bind(user.uid, JOB_MODEL_MAX_WAIT_SECONDS)
+        started = time.monotonic()
+        # Replaced below unless the worker itself is stopped mid-job.
+        state = {"status": "failed", "error": "The job was interrupted by a server shutdown; submit it again to retry."}
+        try:
+            output = await asyncio.wait_for(run_flow(data, user), timeout=self.timeout_seconds)
+            output_data = {key: value for key, value in schema_to_dict(output).items() if key != "document_id"}
+            state = {"status": "succeeded", "output": output_data, "error": None}
+        except asyncio.TimeoutError:
+            state = {"status": "failed", "error": f"The job did not finish within {self.timeout_seconds}s."}
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                # The worker is being stopped (shutdown); record the job as interrupted and stop.
+                raise
+            # A cancellation that escaped the flow itself is a failure of this job only.
+            print(f"ERROR: {flow} job '{job_id}' failed: the flow was cancelled.")
+            state = {"status": "failed", "error": "The flow was cancelled."}
+        except Exception as e:
+            print(f"ERROR: {flow} job '{job_id}' failed: {e}")
+            state = {"status": "failed", "error": str(e)}
+        finally:
+            current_job_document.reset(token)
+            self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * (time.monotonic() - started)
+            self._stats[state["status"]] += 1
+            await self._set_state(user.uid, job_id, state | {"completed_at": datetime.now(timezone.utc)})
+        return state["status"] == "succeeded"
+
+    async def _worker(self) -> None:
+        while True:
+            user, flow, data, job_id = await self._queue.get()
+            try:
+                # Each job is its own trace; the worker task outlives the request that started it.
+                with telemetry.trace("job", flow=flow) as trace:
+                    succeeded = await self._run(user, flow, data, job_id)
+                    trace.status = "ok" if succeeded else "error"
+            finally:
+                self._pending.pop(job_id, None)
+                self._queue.task_done()
+
+    async def get(self, user_id: str, job_id: str) -> dict | None:
+        """
+        Returns the state of one of the user's jobs, or None if there is no such job.
+        A job abandoned by its instance is reported as failed.
+        """
+        firebase_service = await self.get_service()
+        job = await firebase_service.get_document(user_id, job_id)
+        if job is None or "status" not in job:
+            return None
+        if self._is_stale(job):
+            job = {**job, "status": "failed", "error": "The job was interrupted; submit it again to retry."}
+        return _view(job)
+
+    async def watch(self, user_id: str, job_id: str):
+        """
+        Yields the job's state now and whenever it changes, until it finishes.
+        Changes made on this instance are seen immediately; otherwise the job is
+        re-read every JOB_STATUS_POLL_SECONDS.
+        """
+        last = None
+        while True:
+            event = asyncio.Event()
+            self._watchers.setdefault(job_id, set()).add(event)
+            try:
+                job = await self.get(user_id, job_id)
+                if job is None:
+                    return
+                if (job["status"], job.get("updated_at")) != last:
+                    last = (job["status"], job.get("updated_at"))
+                    yield job
+                if job["status"] in TERMINAL_STATUSES:
+                    return
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=JOB_STATUS_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+            finally:
+                watchers = self._watchers.get(job_id)
+                if watchers is not None:
+                    watchers.discard(event)
+                    if not watchers:
+                        del self._watchers[job_id]
+
+    async def drain(self, timeout: float = JOB_DRAIN_TIMEOUT_SECONDS) -> None:
+        """
+        Lets queued and running jobs finish for up to `timeout` seconds, then stops the
+        workers and marks unfinished jobs as failed so they can be resubmitted.
+        """
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"WARN: {len(self._pending)} jobs did not finish before shutdown.")
+        unfinished = dict(self._pending)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for job_id, user_id in unfinished.items():
+            await self._set_state(user_id, job_id, {
+                "status": "failed",
+                "error": "The job was interrupted by a server shutdown; submit it again to retry.",
+            })
+        self._pending.clear()
+
+    def stats(self) -> dict:
+        """Returns job counts by outcome, plus jobs currently queued or running on this instance."""
+        return self._stats | {
+            "pending": len(self._pending),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+
+# Create the single runner shared by the API.
+job_runner = JobRunner()
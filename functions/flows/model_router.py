@@ -0,0 +1,294 @@
+# functions/flows/model_router.py
+
+"""
+Routes each generation to the fast (flash) or pro model tier.
+
+Small, latency-sensitive work does not need the slowest model. The router
+picks a tier per sub-task from the request's `quality` hint, the sub-task's
+configured default and the prompt size. A generation that times out or fails
+is retried once on the other tier, so a struggling model degrades latency or
+quality rather than failing the request. Every call holds one of its model's
+in-flight slots (see `functions.services.admission_control`). Per-model latency percentiles, token
+usage, errors and fallbacks are recorded so the thresholds can be tuned; every call is also
+reported to `telemetry` as an "llm.generate" span. Prompts with a stable prefix are sent as
+their suffix plus a provider context cache when one is available (see
+`functions.flows.context_cache` and `functions.services.gemini_context_cache`).
+"""
+
+import asyncio
+import time
+from collections import deque
+
+from functions.config import (
+    DEFAULT_GENERATION_MODEL,
+    FAST_GENERATION_MODEL,
+    FAST_MODEL_TIMEOUT_SECONDS,
+    MODEL_ROUTER_FAST_MAX_INPUT_TOKENS,
+    MODEL_ROUTER_TASK_TIERS,
+    PRO_MODEL_TIMEOUT_SECONDS,
+)
+from functions.flows.context_cache import context_cache as shared_context_cache
+from functions.flows.token_utils import estimate_tokens
+from functions.services.admission_control import AdmissionRejected, admission_controller
+from functions.services.gemini_context_cache import get_model as get_cacheable_model
+from functions.services.telemetry import percentile, telemetry
+
+QUALITY_TIERS = {"fast": "fast", "balanced": None, "best": "pro"}
+LATENCY_SAMPLES = 1_000
+
+
+def _usage(result, prompt: str, text: str, cached: bool = False) -> tuple[int, int, int]:
+    """
+    Returns (input, output, cached input) tokens, from the provider's usage report when it
+    has one. Input tokens include the cached ones.
+    """
+    usage = getattr(result, "usage", None)
+    input_tokens = getattr(usage, "input_tokens", None)
+    output_tokens = getattr(usage, "output_tokens", None)
+    cached_tokens = getattr(usage, "cached_content_tokens", None)
+    if cached_tokens is None:
+        cached_tokens = estimate_tokens(prompt.prefix) if cached else 0
+    return (
+        input_tokens if input_tokens is not None else estimate_tokens(prompt),
+        output_tokens if output_tokens is not None else estimate_tokens(text),
+        cached_tokens,
+    )
+
+
+class ModelRouter:
+    """Chooses a model tier per generation, falls back on failure and records per-model statistics."""
+
+    def __init__(
+        self,
+        models: dict[str, str] | None = None,
+        timeouts: dict[str, float] | None = None,
+        fast_max_input_tokens: int = MODEL_ROUTER_FAST_MAX_INPUT_TOKENS,
+        task_tiers: dict[str, str] | None = None,
+        get_model=None,
+        admission=None,
+        context_cache=None,
+    ):
+        """
+        Initializes the router.
+
+        Args:
+            models: Model name per tier ("fast" and "pro").
+            timeouts: Seconds a generation may take per tier before falling back; for a stream,
+                the longest wait for its first chunk and between chunks.
+            fast_max_input_tokens: The largest prompt an "auto" sub-task sends to the fast tier.
+            task_tiers: Default tier per sub-task: "fast", "pro" or "auto" (by prompt size).
+            get_model: Returns a model object for a name (by default the Genkit model, with
+                Gemini context caching when available; see `functions.services.gemini_context_cache`).
+            admission: The admission controller capping calls in flight per model.
+            context_cache: Serves stable prompt prefixes from provider caches.
+        """
+        self.models = models or {"fast": FAST_GENERATION_MODEL, "pro": DEFAULT_GENERATION_MODEL}
+        self.timeouts = timeouts or {"fast": FAST_MODEL_TIMEOUT_SECONDS, "pro": PRO_MODEL_TIMEOUT_SECONDS}
+        self.fast_max_input_tokens = fast_max_input_tokens
+        self.task_tiers = MODEL_ROUTER_TASK_TIERS if task_tiers is None else task_tiers
+        self.get_model = get_model
+        self.admission = admission or admission_controller
+        self.context_cache = context_cache or shared_context_cache
+        self._stats: dict[str, dict] = {}
+
+    def route(self, prompt: str, task: str, quality: str | None = None) -> str:
+        """
+        Picks the tier for one generation.
+
+        Args:
+            prompt: The prompt to send.
+            task: The sub-task (e.g. "generate"), looked up in the task tiers.
+            quality: The request's hint: "fast", "balanced" (default) or "best".
+
+        Returns:
+            "fast" or "pro".
+        """
+        if quality not in (None, *QUALITY_TIERS):
+            print(f"WARN: Unknown quality hint '{quality}'; using 'balanced'.")
+            quality = None
+        tier = QUALITY_TIERS.get(quality) if quality else None
+        if tier is None:
+            tier = self.task_tiers.get(task, "auto")
+        if tier == "auto":
+            tier = "fast" if estimate_tokens(prompt) <= self.fast_max_input_tokens else "pro"
+        return tier
+
+    def model_for(self, prompt: str, task: str, quality: str | None = None) -> str:
+        """Returns the name of the model `route` picks."""
+        return self.models[self.route(prompt, task, quality)]
+
+    def _model(self, name: str):
+        return (self.get_model or get_cacheable_model)(name)
+
+    def _model_stats(self, model: str) -> dict:
+        return self._stats.setdefault(model, {
+            "calls": 0, "errors": 0, "timeouts": 0, "fallbacks": 0,
+            "input_tokens": 0, "output_tokens": 0, "cached_input_tokens": 0,
+            "latencies": deque(maxlen=LATENCY_SAMPLES),
+        })
+
+    def _record(self, model: str, task: str, seconds: float, input_tokens: int = 0, output_tokens: int = 0,
+                outcome: str = "ok", fallback: bool = False, streamed: bool = False,
+                cached_input_tokens: int = 0) -> None:
+        telemetry.record(
+            "llm.generate", seconds, outcome, labels={"model": model, "task": task},
+            input_tokens=input_tokens, output_tokens=output_tokens, cached_input_tokens=cached_input_tokens,
+            fallback=fallback, streamed=streamed,
+        )
+        telemetry.count("llm_tokens", input_tokens, model=model, direction="input")
+        telemetry.count("llm_tokens", output_tokens, model=model, direction="output")
+        telemetry.count("llm_tokens", cached_input_tokens, model=model, direction="cached_input")
+        stats = self._model_stats(model)
+        stats["calls"] += 1
+        stats["fallbacks"] += fallback
+        if outcome == "ok":
+            stats["latencies"].append(seconds)
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            stats["cached_input_tokens"] += cached_input_tokens
+        else:
+            stats["timeouts" if outcome == "timeout" else "errors"] += 1
+
+    async def _send(self, model: str, prompt: str):
+        """
+        Sends the prompt, with its prefix served from the context cache when there is one.
+
+        Returns:
+            A tuple of (the model's result, True if the context cache was used).
+        """
+        model_object = self._model(model)
+        cached_content = await self.context_cache.resolve(model, model_object, prompt)
+        if cached_content is None:
+            return await model_object.generate(prompt), False
+        try:
+            return await model_object.generate(prompt.suffix, cached_content=cached_content), True
+        except Exception:
+            self.context_cache.discard(model, prompt)
+            raise
+
+    async def _generate_on(self, tier: str, prompt: str, task: str, fallback: bool) -> str:
+        model = self.models[tier]
+        async with self.admission.model_slot(model):
+            started = time.perf_counter()
+            try:
+                result, cached = await asyncio.wait_for(self._send(model, prompt), timeout=self.timeouts[tier])
+            except asyncio.TimeoutError:
+                self._record(model, task, time.perf_counter() - started, outcome="timeout", fallback=fallback)
+                raise
+            except Exception:
+                self._record(model, task, time.perf_counter() - started, outcome="error", fallback=fallback)
+                raise
+        text = result.text()
+        input_tokens, output_tokens, cached_tokens = _usage(result, prompt, text, cached)
+        self._record(
+            model, task, time.perf_counter() - started, input_tokens, output_tokens,
+            fallback=fallback, cached_input_tokens=cached_tokens,
+        )
+        return text
+
+    async def generate(self, prompt: str, task: str, quality: str | None = None) -> str:
+        """
+        Generates text on the routed tier, retrying once on the other tier on timeout or error.
+
+        Args:
+            prompt: The prompt to send.
+            task: The sub-task, used for routing and statistics.
+            quality: The request's quality hint.
+
+        Returns:
+            The model's text output.
+
+        Raises:
+            Exception: The fallback tier's error, if both tiers fail.
+        """
+        tier = self.route(prompt, task, quality)
+        try:
+            return await self._generate_on(tier, prompt, task, fallback=False)
+        except Exception as e:
+            other = "pro" if tier == "fast" else "fast"
+            reason = "timed out" if isinstance(e, asyncio.TimeoutError) else f"failed: {e}"
+            print(f"WARN: {task} on '{self.models[tier]}' {reason}. Falling back to '{self.models[other]}'.")
+            return await self._generate_on(other, prompt, task, fallback=True)
+
+    async def generate_stream(self, prompt: str, task: str, quality: str | None = None):
+        """
+        Streams chunks from the routed tier. If it fails or times out before producing any
+        output, the stream is restarted on the other tier; later failures are raised. The
+        first chunk and every gap between chunks are bounded by the tier's timeout.
+
+        Yields:
+            The model's stream chunks (objects with `.text()`).
+        """
+        tier = self.route(prompt, task, quality)
+        for attempt, current in enumerate((tier, "pro" if tier == "fast" else "fast")):
+            model = self.models[current]
+            other = self.models["pro" if current == "fast" else "fast"]
+            output = []
+            cached_content = None
+            started = time.perf_counter()
+            try:
+                async with self.admission.model_slot(model):
+                    started = time.perf_counter()
+                    model_object = self._model(model)
+                    cached_content = await self.context_cache.resolve(model, model_object, prompt)
+                    if cached_content is None:
+                        stream = model_object.generate_stream(prompt)
+                    else:
+                        stream = model_object.generate_stream(prompt.suffix, cached_content=cached_content)
+                    chunks = aiter(stream)
+                    try:
+                        while True:
+                            # Only the wait for the provider is bounded, not the time the caller
+                            # spends handling a chunk.
+                            async with asyncio.timeout(self.timeouts[current]):
+                                try:
+                                    chunk = await anext(chunks)
+                                except StopAsyncIteration:
+                                    break
+                            output.append(chunk.text())
+                            yield chunk
+                    finally:
+                        if hasattr(chunks, "aclose"):
+                            await chunks.aclose()
+            except AdmissionRejected:
+                if attempt > 0:
+                    raise
+                print(f"WARN: {task} stream has no free slot on '{model}'. Falling back to '{other}'.")
+                continue
+            except Exception as e:
+                timed_out = isinstance(e, TimeoutError)
+                self._record(
+                    model, task, time.perf_counter() - started, outcome="timeout" if timed_out else "error",
+                    fallback=attempt > 0, streamed=True,
+                )
+                if cached_content is not None:
+                    self.context_cache.discard(model, prompt)
+                if output or attempt > 0:
+                    raise
+                reason = f"timed out after {self.timeouts[current]}s" if timed_out else f"failed: {e}"
+                print(f"WARN: {task} stream on '{model}' {reason}. Falling back to '{other}'.")
+                continue
+            text = "".join(output)
+            self._record(
+                model, task, time.perf_counter() - started, estimate_tokens(prompt), estimate_tokens(text),
+                fallback=attempt > 0, streamed=True,
+                cached_input_tokens=estimate_tokens(prompt.prefix) if cached_content is not None else 0,
+            )
+            return
+
+    def stats(self) -> dict:
+        """Returns per-model call, error, timeout and fallback counts, token usage and latency percentiles (ms)."""
+        report = {}
+        for model, stats in self._stats.items():
+            latencies = stats["latencies"]
+            report[model] = {
+                key: value for key, value in stats.items() if key != "latencies"
+            } | {
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+            }
+        return report
+
+
+# Create the single router shared by all flows.
+model_router = ModelRouter()
@@ -0,0 +1,77 @@
+# functions/flows/persistence.py
+
+"""
+Saves flow outputs to the user's document history.
+
+Saves go through the Firestore write-behind queue, so persisting an output
+adds no Firestore round trip to the request; the returned output carries the
+ID the document will have once the write is committed. When a flow runs as a
+background job, its output belongs in the job's own document, which the job
+runner writes; no second document is created. An answer served from the
+response cache is not saved again: the output points at the document its
+first generation was saved in.
+"""
+
+import contextvars
+
+from functions.schemas import User
+from functions.services.firebase_service import get_firebase_service
+from functions.flows.response_cache import response_cache
+from functions.flows.streaming import schema_to_dict
+
+TITLE_MAX_CHARS = 80
+# The ID of the job document the current flow's output is saved in (set by the job runner).
+current_job_document: contextvars.ContextVar[str | None] = contextvars.ContextVar("current_job_document", default=None)
+
+
+def title_for(job_description: str) -> str:
+    """Uses the first non-empty line of the job description as the document title."""
+    first_line = next((line.strip() for line in job_description.splitlines() if line.strip()), "Untitled")
+    return first_line[:TITLE_MAX_CHARS]
+
+
+async def save_output(flow_name: str, user: User, job_description: str, output, output_schema,
+                      cache_report: dict | None = None):
+    """
+    Queues a flow's output for saving and returns it with its `document_id` set.
+
+    Args:
+        flow_name: The flow that produced the output (stored as the document's "flow").
+        user: The authenticated user who owns the document.
+        job_description: The job the output was generated for.
+        output: The parsed flow output.
+        output_schema: The output's schema, used to rebuild it with the document ID.
+        cache_report: The report filled in by `response_cache.generate`, if the output came
+            through the response cache.
+
+    Returns:
+        The output with `document_id` set, or unchanged if it could not be queued.
+    """
+    output_data = schema_to_dict(output)
+    job_document_id = current_job_document.get()
+    if job_document_id is not None:
+        output_data["document_id"] = job_document_id
+        return output_schema(**output_data)
+    cache_entry = (cache_report or {}).get("cache_entry")
+    if cache_entry is not None and cache_report.get("cache_hit"):
+        document_id = response_cache.document_for(cache_entry)
+        if document_id is not None:
+            # The same answer is already in the user's history.
+            output_data["document_id"] = document_id
+            return output_schema(**output_data)
+    try:
+        firebase_service = await get_firebase_service()
+        document_id = firebase_service.enqueue_document_metadata(user.uid, {
+            "flow": flow_name,
+            "title": title_for(job_description),
+            "job_description": job_description,
+            "output": {key: value for key, value in output_data.items() if key != "document_id"},
+        })
+    except Exception as e:
+        # Saving is best effort; the user still gets the generated output.
+        print(f"WARN: Could not queue the {flow_name} output of user '{user.uid}' for saving: {e}")
+        return output
+    if cache_entry is not None:
+        response_cache.remember_document(cache_entry, document_id)
+    output_data["document_id"] = document_id
+    return output_schema(**output_data)
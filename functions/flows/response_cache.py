@@ -0,0 +1,258 @@
+# functions/flows/response_cache.py
+
+"""
+A response cache in front of `llm.generate`.
+
+Users regularly hit "regenerate" or reload the page for the same job
+description, which would otherwise send a near-identical prompt to the model.
+The cache has two tiers, both isolated per user:
+
+* an exact-match tier keyed on (user, model, sha256(prompt)), and
+* an optional semantic tier that reuses a previous answer when the new job
+  description's embedding is within a cosine-similarity threshold of a cached
+  one generated under the same "scope" (flow plus any other inputs).
+
+Entries expire after a TTL and are evicted least-recently-used, both globally
+and per user. Requests can skip the cache (`bypass`) or force a fresh answer
+that replaces the cached one (`refresh`). An entry also remembers the history
+document its answer was saved in, so a cache hit is not saved a second time.
+"""
+
+import hashlib
+import json
+import math
+import time
+from array import array
+from collections import OrderedDict
+
+from functions.config import (
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_MAX_ENTRIES_PER_USER,
+    RESPONSE_CACHE_SEMANTIC_THRESHOLD,
+    RESPONSE_CACHE_TTL_SECONDS,
+)
+from functions.flows.token_utils import estimate_tokens
+from functions.services.embedding_service import embedding_service
+
+
+def is_json_response(text: str) -> bool:
+    """Returns True if `text` parses as JSON, i.e. the response is worth caching."""
+    try:
+        json.loads(text)
+        return True
+    except (json.JSONDecodeError, TypeError):
+        return False
+
+
+def _cosine(a: array, a_norm: float, b: array, b_norm: float) -> float:
+    if not a_norm or not b_norm or len(a) != len(b):
+        return 0.0
+    return sum(x * y for x, y in zip(a, b)) / (a_norm * b_norm)
+
+
+class ResponseCache:
+    """A per-user exact + semantic cache of raw model responses."""
+
+    def __init__(
+        self,
+        ttl_seconds: float,
+        max_entries: int,
+        max_entries_per_user: int,
+        semantic_threshold: float | None = None,
+        embed=None,
+    ):
+        """
+        Initializes the cache.
+
+        Args:
+            ttl_seconds: How long a cached response may be reused.
+            max_entries: The total number of responses kept across all users.
+            max_entries_per_user: The number of responses kept for any single user.
+            semantic_threshold: Minimum cosine similarity for a semantic hit; None disables the tier.
+            embed: An async callable returning the embedding of a text (required for the semantic tier).
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_entries_per_user = max_entries_per_user
+        self.semantic_threshold = semantic_threshold if embed is not None else None
+        self.embed = embed
+
+        # key -> (user_id, response text, expiry timestamp, estimated tokens), least recently used first.
+        self._entries: OrderedDict[tuple, tuple[str, str, float, int]] = OrderedDict()
+        # user_id -> keys of that user's entries, least recently used first.
+        self._user_keys: dict[str, OrderedDict[tuple, None]] = {}
+        # user_id -> {key: (scope, vector, norm)} for the semantic tier.
+        self._semantic: dict[str, dict[tuple, tuple[str, array, float]]] = {}
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.evictions = 0
+        self.tokens_saved = 0
+        # entry key -> ID of the history document the entry's answer was saved in
+        self._documents: dict[tuple, str] = {}
+
+    def _remove(self, key: tuple) -> None:
+        user_id = self._entries.pop(key)[0]
+        self._documents.pop(key, None)
+        user_keys = self._user_keys.get(user_id)
+        if user_keys is not None:
+            user_keys.pop(key, None)
+            if not user_keys:
+                del self._user_keys[user_id]
+        semantic = self._semantic.get(user_id)
+        if semantic is not None:
+            semantic.pop(key, None)
+            if not semantic:
+                del self._semantic[user_id]
+
+    def _get_live(self, key: tuple) -> tuple | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() >= entry[2]:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        self._user_keys[entry[0]].move_to_end(key)
+        return entry
+
+    def _store(self, key: tuple, user_id: str, text: str, tokens: int) -> None:
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (user_id, text, time.time() + self.ttl_seconds, tokens)
+        user_keys = self._user_keys.setdefault(user_id, OrderedDict())
+        user_keys[key] = None
+
+        while len(user_keys) > self.max_entries_per_user:
+            self._remove(next(iter(user_keys)))
+            self.evictions += 1
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _hit(self, entry: tuple, semantic: bool) -> str:
+        if semantic:
+            self.semantic_hits += 1
+        else:
+            self.exact_hits += 1
+        self.tokens_saved += entry[3]
+        return entry[1]
+
+    async def generate(
+        self,
+        user_id: str,
+        model: str,
+        prompt: str,
+        generate,
+        semantic_text: str | None = None,
+        semantic_scope: str = "",
+        validate=None,
+        bypass: bool = False,
+        refresh: bool = False,
+        report: dict | None = None,
+    ) -> str:
+        """
+        Returns a cached response for the prompt, or generates and caches a new one.
+
+        Args:
+            user_id: The UID of the requesting user; entries are never shared across users.
+            model: The model name, part of the cache key.
+            prompt: The full prompt text.
+            generate: An async callable with no arguments that returns the model's raw text.
+            semantic_text: The text compared by the semantic tier (e.g. the job description).
+            semantic_scope: Semantic hits only match entries with the same scope.
+            validate: An optional callable; responses for which it returns False are not cached.
+            bypass: Neither read from nor write to the cache.
+            refresh: Skip reading, but replace the cached entry with the fresh response.
+            report: If given, "cache_entry" is set to the key of the entry served or stored
+                and "cache_hit" to whether the response came from the cache.
+
+        Returns:
+            The model's raw text response.
+        """
+        if bypass:
+            self.bypasses += 1
+            return await generate()
+
+        key = (user_id, model, hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        vector, norm = None, 0.0
+
+        if not refresh:
+            entry = self._get_live(key)
+            if entry is not None:
+                if report is not None:
+                    report.update(cache_entry=key, cache_hit=True)
+                return self._hit(entry, semantic=False)
+
+        if self.semantic_threshold is not None and semantic_text:
+            try:
+                vector = array("f", await self.embed(semantic_text))
+                norm = math.sqrt(sum(x * x for x in vector))
+            except Exception as e:
+                print(f"WARN: Response cache could not embed the semantic key; exact match only. Error: {e}")
+            if vector is not None and not refresh:
+                best_key, best_score = None, self.semantic_threshold
+                for candidate_key, (scope, candidate, candidate_norm) in list(self._semantic.get(user_id, {}).items()):
+                    if scope != semantic_scope or candidate_key[1] != model:
+                        continue
+                    score = _cosine(vector, norm, candidate, candidate_norm)
+                    if score >= best_score:
+                        best_key, best_score = candidate_key, score
+                entry = self._get_live(best_key) if best_key is not None else None
+                if entry is not None:
+                    print(f"Response cache: semantic hit (similarity {best_score:.3f}) for user '{user_id}'.")
+                    if report is not None:
+                        report.update(cache_entry=best_key, cache_hit=True)
+                    return self._hit(entry, semantic=True)
+
+        self.misses += 1
+        text = await generate()
+        if validate is not None and not validate(text):
+            return text
+
+        self._store(key, user_id, text, estimate_tokens(prompt) + estimate_tokens(text))
+        if vector is not None:
+            self._semantic.setdefault(user_id, {})[key] = (semantic_scope, vector, norm)
+        if report is not None:
+            report.update(cache_entry=key, cache_hit=False)
+        return text
+
+    def document_for(self, key: tuple) -> str | None:
+        """Returns the ID of the history document an entry's answer was saved in, if it is known."""
+        return self._documents.get(key) if key in self._entries else None
+
+    def remember_document(self, key: tuple, document_id: str) -> None:
+        """Records the history document an entry's answer was saved in."""
+        if key in self._entries:
+            self._documents[key] = document_id
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Drops every cached response for a user."""
+        for key in list(self._user_keys.get(user_id, ())):
+            self._remove(key)
+
+    def stats(self) -> dict:
+        """Returns hit-rate and savings counters."""
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "evictions": self.evictions,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "tokens_saved": self.tokens_saved,
+        }
+
+
+# Create a single, reusable cache shared by all flows.
+response_cache = ResponseCache(
+    ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+    max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+    max_entries_per_user=RESPONSE_CACHE_MAX_ENTRIES_PER_USER,
+    semantic_threshold=RESPONSE_CACHE_SEMANTIC_THRESHOLD,
+    embed=embedding_service.embed,
+)
@@ -0,0 +1,129 @@
+# functions/flows/sectioned_generation.py
+
+"""
+Generates a structured output one field ("section") at a time.
+
+A single prompt that must return every field as one JSON object is as slow as
+the sum of its parts, and one malformed character loses all of them. Here each
+section gets its own short, plain-text prompt; the sections run concurrently,
+so latency is that of the slowest section, and a section whose output fails
+validation is retried on its own while the others keep their results. A
+section's attempts share one deadline, and a section whose call times out or
+fails is given up rather than retried: the model router has already tried
+both tiers by then.
+"""
+
+import asyncio
+import re
+import time
+
+from functions.config import SECTION_MAX_ATTEMPTS, SECTION_TIMEOUT_SECONDS
+from functions.services.admission_control import AdmissionRejected
+
+_FENCE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+
+
+def clean_section(text: str, field: str, max_chars: int) -> str | None:
+    """
+    Normalizes one section's model output, or rejects it.
+
+    Strips surrounding whitespace, Markdown code fences and a leading
+    "field:" label the model may add despite the instructions.
+
+    Returns:
+        The cleaned text, or None if it is empty or longer than `max_chars`.
+    """
+    text = _FENCE.sub("", (text or "").strip()).strip()
+    label = field.replace("_", " ")
+    for prefix in (f"{field}:", f"{label}:", f"**{label}**:"):
+        if text.lower().startswith(prefix.lower()):
+            text = text[len(prefix):].strip()
+            break
+    if not text or len(text) > max_chars:
+        return None
+    return text
+
+
+async def _generate_section(field: str, spec: dict, generate, max_attempts: int, timeout: float) -> tuple[str, str | None, int]:
+    """
+    Runs one section until its output validates, the attempts run out or its deadline
+    (`timeout` seconds for all attempts) passes. Only invalid output is retried.
+    """
+    deadline = time.monotonic() + timeout
+    for attempt in range(1, max_attempts + 1):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            print(f"WARN: Section '{field}' ran out of time after {attempt - 1} attempt(s).")
+            return field, None, attempt - 1
+        try:
+            text = await asyncio.wait_for(generate(spec["prompt"]), timeout=remaining)
+        except asyncio.TimeoutError:
+            print(f"WARN: Section '{field}' timed out after {timeout}s (attempt {attempt}/{max_attempts}).")
+            return field, None, attempt
+        except AdmissionRejected:
+            # Over capacity: retrying would only add load, so the whole request is rejected.
+            raise
+        except Exception as e:
+            print(f"WARN: Section '{field}' failed (attempt {attempt}/{max_attempts}): {e}")
+            return field, None, attempt
+        value = clean_section(text, field, spec["max_chars"])
+        if value is not None:
+            return field, value, attempt
+        print(f"WARN: Section '{field}' failed validation (attempt {attempt}/{max_attempts}).")
+    return field, None, max_attempts
+
+
+async def iter_sections(
+    sections: dict[str, dict],
+    generate,
+    max_attempts: int = SECTION_MAX_ATTEMPTS,
+    timeout: float = SECTION_TIMEOUT_SECONDS,
+):
+    """
+    Generates every section concurrently and yields each one as soon as it finishes.
+
+    Args:
+        sections: Field name -> {"prompt": str, "max_chars": int}.
+        generate: An async callable taking a prompt and returning the model's text.
+        max_attempts: Attempts per section before it is given up.
+        timeout: Seconds all of a section's attempts together may take.
+
+    Yields:
+        (field, value, attempts) tuples in completion order; `value` is None for a
+        section that was given up.
+    """
+    tasks = [
+        asyncio.create_task(_generate_section(field, spec, generate, max_attempts, timeout))
+        for field, spec in sections.items()
+    ]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def generate_sections(
+    sections: dict[str, dict],
+    generate,
+    max_attempts: int = SECTION_MAX_ATTEMPTS,
+    timeout: float = SECTION_TIMEOUT_SECONDS,
+) -> tuple[dict[str, str | None], dict]:
+    """
+    Generates every section concurrently (see `iter_sections`).
+
+    Returns:
+        A tuple of (field -> value, or None if the section failed; a report with the
+        number of sections and attempts, the fields that needed a retry and those that failed).
+    """
+    values: dict[str, str | None] = {}
+    report = {"sections": len(sections), "attempts": 0, "retried": [], "failed": []}
+    async for field, value, attempts in iter_sections(sections, generate, max_attempts, timeout):
+        values[field] = value
+        report["attempts"] += attempts
+        if attempts > 1:
+            report["retried"].append(field)
+        if value is None:
+            report["failed"].append(field)
+    return {field: values[field] for field in sections}, report
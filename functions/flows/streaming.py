@@ -0,0 +1,181 @@
+# functions/flows/streaming.py
+
+"""
+Helpers for streaming flow output to clients as Server-Sent Events.
+
+`IncrementalJSONParser` consumes the model's JSON answer chunk by chunk and
+reports every top-level field (and every element of a top-level array) as
+soon as its closing quote or bracket arrives, so the client can render the
+analysis while the cover letter is still being written.
+"""
+
+import json
+
+_WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONParser:
+    """Emits completed fields of a streamed top-level JSON object."""
+
+    def __init__(self):
+        self.buffer = ""
+        self.done = False
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+
+        # Top-level (depth 1) state: are we reading a key or a value?
+        self._expect_key = True
+        self._key: str | None = None
+        self._value_start: int | None = None
+        self._value_emitted = False
+
+        # Array element (depth 2) state for top-level arrays.
+        self._in_array = False
+        self._element_index = 0
+        self._element_start: int | None = None
+        self._element_emitted = False
+
+    def _parse_slice(self, start: int, end: int):
+        return json.loads(self.buffer[start:end])
+
+    def _emit_value(self, end: int, events: list) -> None:
+        if self._key is not None and self._value_start is not None and not self._value_emitted:
+            events.append((self._key, self._parse_slice(self._value_start, end)))
+            self._value_emitted = True
+
+    def _emit_element(self, end: int, events: list) -> None:
+        if self._element_start is not None and not self._element_emitted:
+            path = f"{self._key}[{self._element_index}]"
+            events.append((path, self._parse_slice(self._element_start, end)))
+            self._element_emitted = True
+
+    def feed(self, chunk: str) -> list[tuple[str, object]]:
+        """
+        Adds a chunk of model output.
+
+        Args:
+            chunk: The next piece of raw text from the model.
+
+        Returns:
+            A list of (path, value) pairs for every field completed by this chunk,
+            e.g. ("analysis", "...") or ("key_competencies[2]", "...").
+
+        Raises:
+            json.JSONDecodeError: If a completed field is not valid JSON.
+        """
+        self.buffer += chunk
+        events: list[tuple[str, object]] = []
+
+        while self._pos < len(self.buffer) and not self.done:
+            i = self._pos
+            c = self.buffer[i]
+            self._pos += 1
+
+            if not self._started:
+                # Skip code fences or any preamble before the object starts.
+                if c == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._on_string_end(i, events)
+                continue
+
+            if c in _WHITESPACE:
+                continue
+
+            self._on_token_start(i)
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c in "{[":
+                self._depth += 1
+                if self._depth == 2 and c == "[" and not self._expect_key:
+                    self._in_array = True
+                    self._element_index = 0
+                    self._element_start = None
+                    self._element_emitted = False
+            elif c in "}]":
+                self._on_close(i, events)
+            elif c == ",":
+                self._on_comma(i, events)
+            elif c == ":" and self._depth == 1:
+                self._expect_key = False
+                self._value_start = None
+                self._value_emitted = False
+
+        return events
+
+    def _on_token_start(self, i: int) -> None:
+        """Records where a value or array element begins."""
+        c = self.buffer[i]
+        if c in ",:]}":
+            return
+        if self._depth == 1 and not self._expect_key and self._value_start is None:
+            self._value_start = i
+        elif self._depth == 2 and self._in_array and self._element_start is None:
+            self._element_start = i
+
+    def _on_string_end(self, i: int, events: list) -> None:
+        if self._depth == 1:
+            if self._expect_key:
+                self._key = self._parse_slice(self._string_start, i + 1)
+            else:
+                self._emit_value(i + 1, events)
+        elif self._depth == 2 and self._in_array:
+            self._emit_element(i + 1, events)
+
+    def _on_close(self, i: int, events: list) -> None:
+        if self._depth == 2 and self._in_array:
+            # Closing the top-level array: flush a trailing scalar element, then the whole array.
+            self._emit_element(i, events)
+            self._in_array = False
+            self._depth = 1
+            self._emit_value(i + 1, events)
+        elif self._depth == 1:
+            # Closing the top-level object.
+            self._emit_value(i, events)
+            self._depth = 0
+            self.done = True
+        else:
+            self._depth -= 1
+            if self._depth == 2 and self._in_array:
+                self._emit_element(i + 1, events)
+            elif self._depth == 1:
+                self._emit_value(i + 1, events)
+
+    def _on_comma(self, i: int, events: list) -> None:
+        if self._depth == 1:
+            self._emit_value(i, events)
+            self._expect_key = True
+            self._key = None
+            self._value_start = None
+        elif self._depth == 2 and self._in_array:
+            self._emit_element(i, events)
+            self._element_index += 1
+            self._element_start = None
+            self._element_emitted = False
+
+
+def format_sse(event: str, data) -> str:
+    """Formats one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def schema_to_dict(obj) -> dict:
+    """Converts a schema instance (e.g. `GeneratedContent`) into a JSON-serializable dict."""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    return dict(vars(obj))
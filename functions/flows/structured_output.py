@@ -0,0 +1,292 @@
+# functions/flows/structured_output.py
+
+"""
+Enforces the flows' JSON output schemas without regenerating whole answers.
+
+The prompt asks for JSON matching a JSON Schema built from the output fields
+in `functions/schemas.py`. The answer is then parsed leniently: code fences
+and trailing text are ignored, and near-valid JSON (trailing commas, raw
+newlines in strings, a truncated object) is repaired locally. Each field is
+validated against its type, with obvious coercions (a bulleted string for a
+list field). Only fields that are still missing or invalid are requested
+again, with a prompt that asks for just those keys, instead of running the
+whole generation a second time. Repair rates and the tokens saved compared
+with full retries are recorded.
+"""
+
+import json
+import re
+
+from functions.config import STRUCTURED_OUTPUT_MAX_REPROMPTS
+from functions.flows.context_cache import SplitPrompt
+from functions.flows.token_utils import estimate_tokens
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.DOTALL)
+_BULLET = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+
+def json_schema(fields: dict[str, str]) -> dict:
+    """Returns the JSON Schema for an object with `fields` (name -> "string" or "string[]")."""
+    properties = {
+        name: {"type": "array", "items": {"type": "string"}} if kind == "string[]" else {"type": "string"}
+        for name, kind in fields.items()
+    }
+    return {"type": "object", "properties": properties, "required": list(fields), "additionalProperties": False}
+
+
+def schema_instructions(fields: dict[str, str]) -> str:
+    """The prompt line asking for JSON that matches the schema for `fields`."""
+    return (
+        "You MUST return a valid JSON object, and nothing else, matching this JSON Schema: "
+        + json.dumps(json_schema(fields))
+    )
+
+
+def _strip_wrapping(text: str) -> str:
+    """Returns the text from the first "{", looking inside a Markdown code fence if there is one."""
+    fenced = _FENCE.search(text)
+    if fenced and "{" in fenced.group(1):
+        text = fenced.group(1)
+    start = text.find("{")
+    return text[start:] if start >= 0 else ""
+
+
+def _close_json(text: str) -> str:
+    """
+    Rewrites near-valid JSON: escapes raw control characters in strings, drops trailing
+    commas, stops after the top-level object and closes a truncated one.
+    """
+    out: list[str] = []
+    stack: list[str] = []
+    in_string = escape = False
+    for char in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            elif char in "\n\r\t":
+                char = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}[char]
+            out.append(char)
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            while out and out[-1] in " \t\r\n,":
+                out.pop()
+            if not stack:
+                break
+            stack.pop()
+            out.append(char)
+            if not stack:
+                break
+            continue
+        out.append(char)
+
+    if in_string:
+        out.append("\\" if escape else "")
+        out.append('"')
+    repaired = "".join(out).rstrip(" \t\r\n,")
+    if repaired.endswith(":"):
+        repaired += " null"
+    elif stack and stack[-1] == "}" and repaired.endswith('"') and re.search(r'[{,]\s*"(?:[^"\\]|\\.)*"$', repaired):
+        # A key without a value at the end of a truncated object.
+        repaired += ": null"
+    return repaired + "".join(reversed(stack))
+
+
+def parse_json_object(text: str) -> tuple[dict | None, str]:
+    """
+    Parses the model's answer leniently.
+
+    Returns:
+        A tuple of (the parsed object or None, how it was obtained: "valid" for strict JSON,
+        "extracted" when fences or surrounding text were ignored, "repaired" when the JSON
+        itself had to be fixed, or "failed").
+    """
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return data, "valid"
+    except (json.JSONDecodeError, TypeError):
+        pass
+    candidate = _strip_wrapping(text or "")
+    if not candidate:
+        return None, "failed"
+    try:
+        data, _ = json.JSONDecoder().raw_decode(candidate)
+        if isinstance(data, dict):
+            return data, "extracted"
+    except json.JSONDecodeError:
+        pass
+    try:
+        data = json.loads(_close_json(candidate))
+        if isinstance(data, dict):
+            return data, "repaired"
+    except json.JSONDecodeError:
+        pass
+    return None, "failed"
+
+
+def coerce_field(value, kind: str):
+    """
+    Validates one field value against its kind, applying obvious coercions.
+
+    Returns:
+        A tuple of (the value or None if invalid, True if it had to be coerced).
+    """
+    if kind == "string[]":
+        if isinstance(value, str):
+            items = [_BULLET.sub("", line).strip() for line in value.splitlines()]
+            items = [item for item in items if item]
+            return (items or None), True
+        if isinstance(value, list):
+            coerced = any(not isinstance(item, str) or not item.strip() for item in value)
+            items = [item.strip() if isinstance(item, str) else json.dumps(item) for item in value if item is not None]
+            items = [item for item in items if item]
+            return (items or None), coerced
+        return None, False
+    if isinstance(value, str):
+        return (value.strip() or None), False
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return ("\n".join(value).strip() or None), True
+    return None, False
+
+
+def validate_fields(data: dict | None, fields: dict[str, str]) -> tuple[dict, list[str], bool]:
+    """
+    Checks every expected field of a parsed answer.
+
+    Returns:
+        A tuple of (field -> valid value, the missing or invalid fields, True if any value was coerced).
+    """
+    values, invalid, coerced = {}, [], False
+    for name, kind in fields.items():
+        value, was_coerced = coerce_field((data or {}).get(name), kind)
+        if value is None:
+            invalid.append(name)
+        else:
+            values[name] = value
+            coerced = coerced or was_coerced
+    return values, invalid, coerced
+
+
+def build_repair_prompt(prompt: str, fields: dict[str, str], invalid: list[str]) -> str:
+    """
+    Asks again for only the `invalid` fields, with the original prompt as context.
+    A `SplitPrompt` keeps its prefix, so the re-prompt can reuse its context cache.
+    """
+    subset = {name: fields[name] for name in invalid}
+    repair = f"""
+
+        Your previous answer was missing these fields or had invalid values for them: {", ".join(invalid)}.
+        Return ONLY those fields. {schema_instructions(subset)}
+    """
+    return prompt.extend(repair) if isinstance(prompt, SplitPrompt) else prompt + repair
+
+
+class StructuredOutput:
+    """Parses, repairs and completes schema-constrained model answers, and records how often each path is taken."""
+
+    def __init__(self, max_reprompts: int = STRUCTURED_OUTPUT_MAX_REPROMPTS):
+        """
+        Initializes the enforcer.
+
+        Args:
+            max_reprompts: How many times the missing fields may be requested again.
+        """
+        self.max_reprompts = max_reprompts
+        self._stats = {
+            "responses": 0,
+            "valid": 0,
+            "repaired_locally": 0,
+            "reprompted": 0,
+            "failed": 0,
+            "reprompt_tokens": 0,
+            "tokens_saved": 0,
+        }
+
+    async def enforce(self, raw_text: str, fields: dict[str, str], prompt: str, regenerate,
+                      placeholder: str) -> tuple[dict, dict]:
+        """
+        Turns a model answer into a complete, valid set of fields.
+
+        Args:
+            raw_text: The model's answer to `prompt`.
+            fields: The expected fields (name -> "string" or "string[]").
+            prompt: The prompt that produced `raw_text`, reused as context for re-prompts.
+            regenerate: An async callable taking a prompt and returning the model's text.
+            placeholder: Used for fields that are still invalid after every re-prompt
+                (wrapped in a list for "string[]" fields).
+
+        Returns:
+            A tuple of (field -> value for every field, a report with the outcome
+            ("valid", "repaired", "reprompted" or "failed"), the fields that failed and
+            the tokens spent on re-prompts and saved compared with a full retry).
+        """
+        data, parse_outcome = parse_json_object(raw_text)
+        values, invalid, coerced = validate_fields(data, fields)
+        repaired = parse_outcome in ("extracted", "repaired") or coerced
+        reprompt_tokens = 0
+        reprompts = 0
+
+        while invalid and reprompts < self.max_reprompts:
+            reprompts += 1
+            repair_prompt = build_repair_prompt(prompt, fields, invalid)
+            try:
+                text = await regenerate(repair_prompt)
+            except Exception as e:
+                print(f"WARN: Re-prompting for fields {invalid} failed: {e}")
+                break
+            reprompt_tokens += estimate_tokens(repair_prompt) + estimate_tokens(text)
+            retried, _ = parse_json_object(text)
+            subset = {name: fields[name] for name in invalid}
+            fixed, invalid, _ = validate_fields(retried, subset)
+            values.update(fixed)
+
+        if invalid:
+            print(f"ERROR: Fields {invalid} are missing or invalid in the model's answer.")
+            outcome = "failed"
+        elif reprompts:
+            outcome = "reprompted"
+        else:
+            outcome = "repaired" if repaired else "valid"
+
+        # Without repair, every fixed answer would have cost a full retry (prompt plus whole answer)
+        # per attempt; re-prompts cost their own, shorter, prompt and answer.
+        tokens_saved = 0
+        if outcome in ("repaired", "reprompted"):
+            full_retry_tokens = estimate_tokens(prompt) + estimate_tokens(raw_text or "")
+            tokens_saved = max(reprompts, 1) * full_retry_tokens - reprompt_tokens
+
+        self._stats["responses"] += 1
+        self._stats["valid" if outcome == "valid" else "repaired_locally" if outcome == "repaired" else outcome] += 1
+        self._stats["reprompt_tokens"] += reprompt_tokens
+        self._stats["tokens_saved"] += tokens_saved
+
+        for name in invalid:
+            values[name] = [placeholder] if fields[name] == "string[]" else placeholder
+        report = {
+            "outcome": outcome,
+            "failed_fields": invalid,
+            "reprompts": reprompts,
+            "reprompt_tokens": reprompt_tokens,
+            "tokens_saved": tokens_saved,
+        }
+        return {name: values[name] for name in fields}, report
+
+    def stats(self) -> dict:
+        """Returns outcome counts, the repair rate (answers fixed without a full retry) and token totals."""
+        stats = dict(self._stats)
+        needed_fixing = stats["responses"] - stats["valid"]
+        fixed = stats["repaired_locally"] + stats["reprompted"]
+        stats["repair_rate"] = fixed / needed_fixing if needed_fixing else 0.0
+        return stats
+
+
+# Create the single enforcer shared by all flows.
+structured_output = StructuredOutput()
@@ -0,0 +1,151 @@
+# functions/flows/task_graph.py
+
+"""
+A small async task-graph executor for flows.
+
+A flow declares its steps and what each one depends on; `run` starts every
+step as soon as its dependencies have finished, so independent I/O (company
+research, embedding, vector search, ...) overlaps instead of running in
+sequence. Synchronous tools are offloaded to worker threads. Each step can
+carry a deadline and a fallback value: when an optional step fails or runs
+out of time the flow degrades gracefully and continues with the fallback,
+while a failing required step aborts the whole graph. Per-step timings are
+recorded for every run and reported to `telemetry` as "flow.step" spans.
+"""
+
+import asyncio
+import time
+
+from functions.services.telemetry import telemetry
+
+_REQUIRED = object()
+
+
+class TaskGraph:
+    """Runs a set of dependent async (or blocking) steps with maximum concurrency."""
+
+    def __init__(self, name: str):
+        """
+        Initializes an empty graph.
+
+        Args:
+            name: The flow name, used in log messages.
+        """
+        self.name = name
+        self._steps: dict[str, dict] = {}
+        # step name -> {"seconds": float, "status": "ok" | "timeout" | "error" | "skipped"}
+        self.timings: dict[str, dict] = {}
+
+    def step(self, name: str, fn, depends_on: tuple[str, ...] = (), timeout: float | None = None,
+             blocking: bool = False, fallback=_REQUIRED) -> "TaskGraph":
+        """
+        Declares a step.
+
+        Args:
+            name: The step name; its result is passed to dependants as a keyword argument of this name.
+            fn: The step function. It receives one keyword argument per dependency.
+            depends_on: Names of the steps that must finish first.
+            timeout: Seconds the step may take before it is considered failed.
+            blocking: Run `fn` (a synchronous callable) in a worker thread.
+            fallback: The result to use if the step fails or times out. Steps without
+                a fallback are required: their failure aborts the graph.
+
+        Returns:
+            The graph itself, so steps can be chained.
+        """
+        if name in self._steps:
+            raise ValueError(f"Step '{name}' is already defined in flow '{self.name}'.")
+        self._steps[name] = {
+            "fn": fn,
+            "depends_on": tuple(depends_on),
+            "timeout": timeout,
+            "blocking": blocking,
+            "fallback": fallback,
+        }
+        return self
+
+    def _validate(self) -> None:
+        """Checks that every dependency exists and that the graph has no cycles."""
+        for name, spec in self._steps.items():
+            for dependency in spec["depends_on"]:
+                if dependency not in self._steps:
+                    raise ValueError(f"Step '{name}' depends on unknown step '{dependency}'.")
+
+        visiting, visited = set(), set()
+
+        def _visit(name: str) -> None:
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Flow '{self.name}' has a dependency cycle through '{name}'.")
+            visiting.add(name)
+            for dependency in self._steps[name]["depends_on"]:
+                _visit(dependency)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self._steps:
+            _visit(name)
+
+    async def _run_step(self, name: str, tasks: dict[str, asyncio.Task]):
+        spec = self._steps[name]
+        kwargs = {}
+        for dependency in spec["depends_on"]:
+            kwargs[dependency] = await tasks[dependency]
+
+        started = time.perf_counter()
+        try:
+            if spec["blocking"]:
+                call = asyncio.to_thread(spec["fn"], **kwargs)
+            else:
+                call = spec["fn"](**kwargs)
+            result = await asyncio.wait_for(call, timeout=spec["timeout"])
+            self.timings[name] = {"seconds": time.perf_counter() - started, "status": "ok"}
+            return result
+        except asyncio.TimeoutError:
+            self.timings[name] = {"seconds": time.perf_counter() - started, "status": "timeout"}
+            if spec["fallback"] is _REQUIRED:
+                raise
+            print(f"WARN: Step '{name}' of flow '{self.name}' timed out after {spec['timeout']}s. Continuing without it.")
+            return spec["fallback"]
+        except Exception as e:
+            self.timings[name] = {"seconds": time.perf_counter() - started, "status": "error"}
+            if spec["fallback"] is _REQUIRED:
+                raise
+            print(f"WARN: Step '{name}' of flow '{self.name}' failed: {e}. Continuing without it.")
+            return spec["fallback"]
+
+    async def run(self) -> dict:
+        """
+        Runs every step, each as soon as its dependencies are done.
+
+        Returns:
+            A dictionary mapping step names to their results (or fallbacks).
+
+        Raises:
+            Exception: The error of the first required step that failed; all other
+                still-running steps are cancelled.
+        """
+        self._validate()
+        tasks: dict[str, asyncio.Task] = {}
+        for name in self._steps:
+            tasks[name] = asyncio.ensure_future(self._run_step(name, tasks))
+
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            status = "error"
+            for name, task in tasks.items():
+                if not task.done():
+                    task.cancel()
+                    self.timings.setdefault(name, {"seconds": 0.0, "status": "skipped"})
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        finally:
+            for name, timing in self.timings.items():
+                telemetry.record("flow.step", timing["seconds"], timing["status"], labels={"flow": self.name, "step": name})
+            telemetry.record("flow.graph", time.perf_counter() - started, status, labels={"flow": self.name})
+
+        return {name: task.result() for name, task in tasks.items()}
@@ -0,0 +1,18 @@
+# functions/flows/token_utils.py
+
+"""
+Lightweight token accounting helpers.
+
+Gemini tokenizes English prose at roughly four characters per token, which is
+accurate enough for budgeting prompts and reporting savings without calling
+the provider's token-counting endpoint on the request path.
+"""
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Returns an approximate token count for `text`."""
+    if not text:
+        return 0
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
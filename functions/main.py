@@ -1,20 +1,62 @@
 # functions/main.py
 
-from fastapi import FastAPI, Depends
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Depends, Body, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import genkit
 from genkit.ext.fastapi import configure_genkit
 
 # Import from our new, structured modules
-from functions.config import API_TITLE, API_DESCRIPTION
-from functions.schemas import JobDescription, GeneratedContent, InterviewPrepData, InterviewPrepOutput, User
-from functions.auth import get_current_user
-from functions.flows.generation_flow import generateFlow
-from functions.flows.interview_flow import interviewPrepFlow
+from functions.config import API_TITLE, API_DESCRIPTION, SERVICE_WARMUP_ON_STARTUP, DOCUMENT_LIST_DEFAULT_PAGE_SIZE
+from functions.schemas import JobDescription, GeneratedContent, InterviewPrepData, InterviewPrepOutput, IngestDocument, User
+from functions.auth import admit_generation, admit_user, get_current_user
+from functions.flows.generation_flow import generateFlow, generateFlowStream
+from functions.flows.interview_flow import interviewPrepFlow, interviewPrepFlowStream
+from functions.flows.batch_generation import generateBatchStream, parse_batch
+from functions.flows.streaming import format_sse
+from functions.flows.jobs import job_runner
+from functions.flows.context_cache import context_cache
+from functions.flows.response_cache import response_cache
+from functions.flows.structured_output import structured_output
+from functions.services.registry import services
+from functions.services.secret_service import secret_provider
+from functions.services.ai_service import close_perplexity_client
+from functions.services.gemini_context_cache import close_gemini_cache_client
+from functions.services.embedding_service import embedding_cache
+from functions.services.firebase_service import get_firebase_service, drain_document_writes
+from functions.services.ingestion_service import get_ingestion_service
+from functions.services.local_vector_index import flush_local_index
+from functions.services.admission_control import AdmissionRejected, admission_controller
+from functions.services.telemetry import TelemetryMiddleware, telemetry
+
+
+# Service clients (Secret Manager, Pinecone, Firestore, ...) are created lazily.
+# On startup we initialize them concurrently, so the cold start costs roughly the
+# slowest client rather than the sum of all of them.
+# Secrets are loaded first (concurrently) so the client factories find them cached,
+# and they are kept fresh in the background for as long as the instance lives.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await secret_provider.load_all()
+    secret_provider.start_background_refresh()
+    if SERVICE_WARMUP_ON_STARTUP:
+        await services.warm_up()
+    yield
+    # Let running jobs finish (or mark them interrupted), then commit queued document saves
+    # and pending local index changes before the instance goes away.
+    await job_runner.drain()
+    await drain_document_writes()
+    await flush_local_index()
+    await close_perplexity_client()
+    await close_gemini_cache_client()
+    await secret_provider.close()
 
 app = FastAPI(
     title=API_TITLE,
     description=API_DESCRIPTION,
+    lifespan=lifespan,
 )
 
 # CORS Middleware
@@ -24,27 +66,209 @@ origins = [
 ]
 app.add_middleware(CORSMiddleware, allow_origins=origins, allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
+# Every request runs in a trace: its spans (auth, embeddings, Pinecone, Perplexity, model
+# calls, Firestore writes) feed the latency histograms served on /metrics.
+app.add_middleware(TelemetryMiddleware)
+
 # Define Flows with Authentication
-# We add `dependencies=[Depends(get_current_user)]` to protect the endpoint.
-# Now, a valid Firebase Auth token is required to call this flow.
+# We add `dependencies=[Depends(admit_generation)]` to protect the endpoint.
+# Now, a valid Firebase Auth token is required to call this flow, and each user's
+# generations are rate limited and share the model quota fairly (admission control).
 genkit.define_flow(
     name="generate",
     input_schema=JobDescription,
     output_schema=GeneratedContent,
-    dependencies=[Depends(get_current_user)],
+    dependencies=[Depends(admit_generation)],
 )(generateFlow)
 
 genkit.define_flow(
     name="interview-prep",
     input_schema=InterviewPrepData,
     output_schema=InterviewPrepOutput,
-    dependencies=[Depends(get_current_user)],
+    dependencies=[Depends(admit_generation)],
 )(interviewPrepFlow)
 
 # Mount Genkit flows onto the FastAPI app
 configure_genkit(app)
 
+# A model call that cannot get a slot before its deadline is rejected
+# mid-flow; it is reported like any other admission rejection.
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": exc.retry_after_header},
+    )
+
+# Streaming variants of the flows (Server-Sent Events).
+# Model output is forwarded as "chunk" events while it is generated, each completed
+# JSON field is sent as a "field" event, and a final "done" event carries the full output.
+async def _sse(events):
+    try:
+        async for event, data in events:
+            yield format_sse(event, data)
+    except AdmissionRejected as e:
+        print(f"WARN: Streaming flow rejected: {e}")
+        yield format_sse("error", {"detail": str(e), "retry_after": e.retry_after_header})
+    except Exception as e:
+        # Headers are already sent, so failures are reported in-band.
+        print(f"ERROR: Streaming flow failed: {e}")
+        yield format_sse("error", {"detail": str(e)})
+
+def _parse(schema, payload: dict):
+    """Validates a request body against a schema; invalid input is a 422, not a 500."""
+    try:
+        return schema(**payload)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Invalid request body: {e}")
+
+@app.post("/generate/stream", tags=["Flows"])
+async def generate_stream(payload: dict = Body(...), user: User = Depends(get_current_user)):
+    data = _parse(JobDescription, payload)
+    admit_user(user)
+    return StreamingResponse(_sse(generateFlowStream(data, user)), media_type="text/event-stream")
+
+@app.post("/interview-prep/stream", tags=["Flows"])
+async def interview_prep_stream(payload: dict = Body(...), user: User = Depends(get_current_user)):
+    data = _parse(InterviewPrepData, payload)
+    admit_user(user)
+    return StreamingResponse(_sse(interviewPrepFlowStream(data, user)), media_type="text/event-stream")
+
+# Batch generation: up to BATCH_MAX_JOBS job descriptions for one user in one request (SSE).
+# Embedding and retrieval are shared across the batch; each job's output is sent as a "job"
+# event as soon as it is ready, a job that fails is reported in its own event while the
+# others continue, and a final "done" event carries the counts.
+@app.post("/generate/batch", tags=["Flows"])
+async def generate_batch(payload: dict = Body(...), user: User = Depends(get_current_user)):
+    try:
+        jobs = parse_batch(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Each job counts against the user's rate limit like a separate generation.
+    admit_user(user, cost=len(jobs))
+    return StreamingResponse(_sse(generateBatchStream(jobs, user)), media_type="text/event-stream")
+
+# Background jobs for long generations.
+# Submitting returns a job ID at once (202); the flow runs on a bounded worker pool and
+# its state and output are stored in the user's `documents` collection. Poll
+# GET /jobs/{job_id}, or subscribe to its status events (SSE). Resending a submission
+# with the same Idempotency-Key header returns the existing job.
+@app.post("/jobs/{flow}", status_code=202, tags=["Jobs"])
+async def submit_job(
+    flow: str,
+    payload: dict = Body(...),
+    idempotency_key: str | None = Header(None),
+    user: User = Depends(admit_generation),
+):
+    try:
+        return await job_runner.submit(flow, payload, user, idempotency_key=idempotency_key)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/jobs/{job_id}", tags=["Jobs"])
+async def get_job(job_id: str, user: User = Depends(get_current_user)):
+    job = await job_runner.get(user.uid, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return job
+
+@app.get("/jobs/{job_id}/events", tags=["Jobs"])
+async def job_events(job_id: str, user: User = Depends(get_current_user)):
+    if await job_runner.get(user.uid, job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    events = (("status", job) async for job in job_runner.watch(user.uid, job_id))
+    return StreamingResponse(_sse(events), media_type="text/event-stream")
+
+# Paginated listing of the user's saved documents, newest first.
+# Pass `fields=title,created_at` to skip large bodies, and the returned `next_cursor`
+# as `cursor` to fetch the next page.
+@app.get("/documents", tags=["Documents"])
+async def list_documents(
+    page_size: int = DOCUMENT_LIST_DEFAULT_PAGE_SIZE,
+    cursor: str | None = None,
+    fields: str | None = None,
+    user: User = Depends(get_current_user),
+):
+    firebase_service = await get_firebase_service()
+    try:
+        return await firebase_service.list_user_documents(
+            user.uid,
+            page_size=page_size,
+            cursor=cursor,
+            fields=[field.strip() for field in fields.split(",") if field.strip()] if fields else None,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# RAG ingestion: adds (or updates) one of the user's documents in their vector namespace.
+# Re-sending an edited document only re-embeds the chunks that changed. Document IDs
+# must not contain "/" (they name a Firestore document and a URL path segment).
+@app.post("/ingest", tags=["Documents"])
+async def ingest_document(payload: dict = Body(...), user: User = Depends(get_current_user)):
+    data = _parse(IngestDocument, payload)
+    try:
+        ingestion_service = await get_ingestion_service()
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    metadata = {"source": data.source} if getattr(data, "source", None) else {}
+    try:
+        return await ingestion_service.ingest_document(user.uid, data.document_id, data.text, metadata=metadata)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/ingest/{document_id}", tags=["Documents"])
+async def delete_ingested_document(document_id: str, user: User = Depends(get_current_user)):
+    try:
+        ingestion_service = await get_ingestion_service()
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    try:
+        return {"deleted": await ingestion_service.delete_document(user.uid, document_id)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # Health check endpoint (does not require auth)
 @app.get("/", tags=["Health Check"])
 async def read_root():
-    return {"status": "API is operational"}
\ No newline at end of file
+    return {"status": "API is operational"}
+
+# Admission control metrics: queue depth, in-flight calls, rejections and queue wait per model.
+@app.get("/health/admission", tags=["Health Check"])
+async def admission_stats():
+    return admission_controller.stats()
+
+# Prometheus metrics: latency histograms and recent p50/p95/p99 per operation, model token counts.
+@app.get("/metrics", tags=["Health Check"], response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(telemetry.prometheus(), media_type="text/plain; version=0.0.4")
+
+# The same latencies as JSON (count, errors, p50/p95/p99 in ms per operation).
+@app.get("/health/latency", tags=["Health Check"])
+async def latency_stats():
+    return telemetry.stats()
+
+# Job metrics: submissions, de-duplications, outcomes and jobs pending on this instance.
+@app.get("/health/jobs", tags=["Health Check"])
+async def job_stats():
+    return job_runner.stats()
+
+# Context cache metrics: prompt-prefix cache hits, creations, invalidations and tokens served from the cache.
+@app.get("/health/context-cache", tags=["Health Check"])
+async def context_cache_stats():
+    return context_cache.stats()
+
+# Response cache metrics: exact and semantic hits, misses, hit rate and tokens saved by answers served from the cache.
+@app.get("/health/response-cache", tags=["Health Check"])
+async def response_cache_stats():
+    return response_cache.stats()
+
+# Embedding cache metrics: in-memory and SQLite hits, misses, evictions, expirations and memory used.
+@app.get("/health/embedding-cache", tags=["Health Check"])
+async def embedding_cache_stats():
+    return embedding_cache.stats()
+
+# Structured output metrics: valid, locally repaired and re-prompted answers, the repair rate and token totals.
+@app.get("/health/structured-output", tags=["Health Check"])
+async def structured_output_stats():
+    return structured_output.stats()
\ No newline at end of file
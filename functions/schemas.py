@@ -1,15 +1,46 @@
 # functions/schemas.py
 from zod import z
 
+# Output fields the models must return, by type ("string" or "string[]"). The zod output schemas
+# below and the JSON Schema the model is asked to follow (functions/flows/structured_output.py)
+# are both built from these, so they cannot drift apart.
+GENERATED_CONTENT_FIELDS = {
+    'analysis': 'string',
+    'cover_letter': 'string',
+    'resume_summary': 'string',
+}
+
+INTERVIEW_PREP_FIELDS = {
+    'company_insights': 'string',
+    'key_competencies': 'string[]',
+    'interview_questions': 'string[]',
+}
+
+
+# Model routing hints a request may give (see QUALITY_TIERS in functions/flows/model_router.py).
+QUALITY_LEVELS = ['fast', 'balanced', 'best']
+
+
+def _zod_fields(fields: dict) -> dict:
+    return {name: z.array(z.string()) if kind == 'string[]' else z.string() for name, kind in fields.items()}
+
+
 # Schema for Agent 1: Document Writer & Job Analyzer
 JobDescription = z.object({
     'job_description': z.string(),
+    # Response cache controls: skip the cache entirely, or regenerate and replace the cached answer.
+    'bypass_cache': z.boolean().optional(),
+    'refresh_cache': z.boolean().optional(),
+    # Model routing hint: "fast" (lowest latency), "balanced" (default) or "best" (highest quality).
+    'quality': z.enum(QUALITY_LEVELS).optional(),
+    # Generate each output field with its own prompt, concurrently (see GENERATION_SECTIONED).
+    'sectioned': z.boolean().optional(),
 })
 
 GeneratedContent = z.object({
-    'analysis': z.string(),
-    'cover_letter': z.string(),
-    'resume_summary': z.string(),
+    **_zod_fields(GENERATED_CONTENT_FIELDS),
+    # ID of the saved copy in the user's document history (set once the output is queued for saving).
+    'document_id': z.string().optional(),
 })
 
 # Schema for Agent 2: Supercharged Interview Coach
@@ -17,12 +48,23 @@ InterviewPrepData = z.object({
     'job_description': z.string(),
     'resume': z.string(),
     'cover_letter': z.string(),
+    'bypass_cache': z.boolean().optional(),
+    'refresh_cache': z.boolean().optional(),
+    'quality': z.enum(QUALITY_LEVELS).optional(),
 })
 
 InterviewPrepOutput = z.object({
-    'company_insights': z.string(),
-    'key_competencies': z.array(z.string()),
-    'interview_questions': z.array(z.string()),
+    **_zod_fields(INTERVIEW_PREP_FIELDS),
+    'document_id': z.string().optional(),
+})
+
+# Schema for RAG ingestion of a user's own documents (resume, past applications, ...)
+IngestDocument = z.object({
+    # A stable ID for the document, without "/" (e.g. its Firestore document ID).
+    'document_id': z.string(),
+    'text': z.string(),
+    # Where the text came from, e.g. "resume" or "cover_letter"; stored with every chunk.
+    'source': z.string().optional(),
 })
 
 # Schema for Authenticated User Data
@@ -0,0 +1,296 @@
+# functions/services/admission_control.py
+
+"""
+Admission control for LLM generations.
+
+Three limits protect the model quota and keep it shared fairly:
+
+* A token bucket per user (UID) bounds how fast one user can start
+  generations; a user who exceeds it is told when to retry.
+* A global cap per model bounds the calls in flight upstream, so bursts queue
+  here instead of ending in upstream 429s.
+* Calls over the cap wait in a bounded queue that serves users round-robin,
+  so a user with many queued calls does not delay everyone else. A call whose
+  expected wait (queue position x average call time) exceeds its deadline
+  is rejected straight away rather than after waiting in vain.
+
+Requests are admitted once (`admit`), which records the user and the longest
+queueing wait for the request's context; every model call the request makes
+then takes a slot with `model_slot`, with its own deadline counted from when
+that call starts waiting, so a late call (a fallback, a repair, a section
+retry) gets the same wait as the first. Rejections raise `AdmissionRejected`
+with a Retry-After.
+"""
+
+import asyncio
+import contextvars
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from functions.config import (
+    ADMISSION_DEFAULT_MAX_IN_FLIGHT,
+    ADMISSION_EXPECTED_CALL_SECONDS,
+    ADMISSION_MAX_QUEUED,
+    ADMISSION_MAX_TRACKED_USERS,
+    ADMISSION_MAX_WAIT_SECONDS,
+    ADMISSION_MODEL_MAX_IN_FLIGHT,
+    ADMISSION_USER_BURST,
+    ADMISSION_USER_RATE_PER_SECOND,
+)
+from functions.services.telemetry import percentile
+
+WAIT_SAMPLES = 1_000
+# The current request's (user ID, longest queueing wait per model call); set by `admit`, read by `model_slot`.
+_ticket: contextvars.ContextVar[tuple[str, float] | None] = contextvars.ContextVar("admission_ticket", default=None)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request or model call is not admitted; maps to HTTP 429."""
+
+    def __init__(self, reason: str, retry_after: float):
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"Too many requests ({reason}); retry after {self.retry_after_header}s.")
+
+    @property
+    def retry_after_header(self) -> str:
+        """The Retry-After header value (whole seconds, at least 1)."""
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1) -> float:
+        """
+        Takes `cost` tokens; returns 0 on success, else the seconds until they are available.
+        A cost above the burst is admitted from a full bucket and leaves it in debt, so the
+        user then waits until the whole cost has been refilled.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        needed = min(cost, self.burst)
+        if self.tokens >= needed:
+            self.tokens -= cost
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+
+class _ModelQueue:
+    """In-flight count and the round-robin waiting queue for one model."""
+
+    def __init__(self, max_in_flight: int, expected_call_seconds: float):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        # user ID -> that user's waiting futures, in arrival order; users are served in turn.
+        self.waiters: OrderedDict[str, deque[asyncio.Future]] = OrderedDict()
+        self.queued = 0
+        # Exponentially weighted average of how long a call holds its slot.
+        self.avg_call_seconds = expected_call_seconds
+        self.admitted = 0
+        self.rejected: dict[str, int] = {}
+        self.waits: deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self.max_queued_seen = 0
+
+    def expected_wait(self) -> float:
+        return (self.queued + 1) / self.max_in_flight * self.avg_call_seconds
+
+    def next_waiter(self) -> asyncio.Future | None:
+        while self.waiters:
+            uid, futures = next(iter(self.waiters.items()))
+            future = futures.popleft()
+            # Move the user to the back so the next slot goes to someone else.
+            del self.waiters[uid]
+            if futures:
+                self.waiters[uid] = futures
+            self.queued -= 1
+            if not future.done():
+                return future
+        return None
+
+    def remove(self, uid: str, future: asyncio.Future) -> None:
+        futures = self.waiters.get(uid)
+        if futures and future in futures:
+            futures.remove(future)
+            self.queued -= 1
+            if not futures:
+                del self.waiters[uid]
+
+
+class AdmissionController:
+    """Per-user rate limits, per-model in-flight caps and a fair, bounded, deadline-aware queue."""
+
+    def __init__(
+        self,
+        user_rate: float = ADMISSION_USER_RATE_PER_SECOND,
+        user_burst: float = ADMISSION_USER_BURST,
+        model_max_in_flight: dict[str, int] | None = None,
+        default_max_in_flight: int = ADMISSION_DEFAULT_MAX_IN_FLIGHT,
+        max_queued: int = ADMISSION_MAX_QUEUED,
+        max_wait_seconds: float = ADMISSION_MAX_WAIT_SECONDS,
+        max_tracked_users: int = ADMISSION_MAX_TRACKED_USERS,
+        expected_call_seconds: float = ADMISSION_EXPECTED_CALL_SECONDS,
+    ):
+        """
+        Initializes the controller.
+
+        Args:
+            user_rate: Generations each user may start per second, sustained.
+            user_burst: Generations a user may start at once after being idle.
+            model_max_in_flight: Model calls allowed in flight at once, per model name.
+            default_max_in_flight: The cap for models not listed above.
+            max_queued: The most model calls waiting for a slot, across all models.
+            max_wait_seconds: How long each model call may wait for a slot.
+            max_tracked_users: The most token buckets kept (least recently seen are dropped).
+            expected_call_seconds: The assumed call time until calls to a model have been measured.
+        """
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.model_max_in_flight = ADMISSION_MODEL_MAX_IN_FLIGHT if model_max_in_flight is None else model_max_in_flight
+        self.default_max_in_flight = default_max_in_flight
+        self.max_queued = max_queued
+        self.max_wait_seconds = max_wait_seconds
+        self.max_tracked_users = max_tracked_users
+        self.expected_call_seconds = expected_call_seconds
+        self._buckets: OrderedDict[str, _TokenBucket] = OrderedDict()
+        self._models: dict[str, _ModelQueue] = {}
+        self.rate_limited = 0
+
+    def _model(self, model: str) -> _ModelQueue:
+        queue = self._models.get(model)
+        if queue is None:
+            queue = self._models[model] = _ModelQueue(
+                self.model_max_in_flight.get(model, self.default_max_in_flight),
+                self.expected_call_seconds,
+            )
+        return queue
+
+    def _queued(self) -> int:
+        return sum(queue.queued for queue in self._models.values())
+
+    def admit(self, uid: str, cost: int = 1) -> None:
+        """
+        Admits a request from `uid`, or rejects it if the user is over their rate
+        or the queue is full. The user and queueing wait apply to the current context
+        (the request) and every model call made from it.
+
+        Args:
+            uid: The user making the request.
+            cost: The generations the request starts (e.g. the jobs of a batch); each
+                takes one token from the user's bucket.
+
+        Raises:
+            AdmissionRejected: With reason "rate_limited" or "queue_full".
+        """
+        bucket = self._buckets.get(uid)
+        if bucket is None:
+            bucket = self._buckets[uid] = _TokenBucket(self.user_rate, self.user_burst)
+            if len(self._buckets) > self.max_tracked_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(uid)
+        wait = bucket.take(cost)
+        if wait:
+            self.rate_limited += 1
+            raise AdmissionRejected("rate_limited", wait)
+        if self._queued() >= self.max_queued:
+            queue = max(self._models.values(), key=lambda q: q.queued)
+            queue.rejected["queue_full"] = queue.rejected.get("queue_full", 0) + 1
+            raise AdmissionRejected("queue_full", queue.expected_wait())
+        self.bind(uid)
+
+    def bind(self, uid: str, max_wait_seconds: float | None = None) -> None:
+        """
+        Attributes the current context's model calls to `uid`; each may wait up to
+        `max_wait_seconds` (default: the controller's) for a slot. `admit` does this for
+        requests; background work that was admitted earlier calls it directly.
+        """
+        wait = self.max_wait_seconds if max_wait_seconds is None else max_wait_seconds
+        _ticket.set((uid, wait))
+
+    @asynccontextmanager
+    async def model_slot(self, model: str):
+        """
+        Holds one of `model`'s in-flight slots for the duration of a model call,
+        waiting in the fair queue if they are all taken.
+
+        Raises:
+            AdmissionRejected: With reason "deadline" if the expected or actual wait
+                exceeds the call's longest queueing wait, or "queue_full".
+        """
+        uid, max_wait = _ticket.get() or ("anonymous", self.max_wait_seconds)
+        deadline = time.monotonic() + max_wait
+        queue = self._model(model)
+        started = time.monotonic()
+        if queue.in_flight < queue.max_in_flight and not queue.queued:
+            queue.in_flight += 1
+        else:
+            await self._wait(queue, uid, deadline)
+        queue.admitted += 1
+        queue.waits.append(time.monotonic() - started)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            queue.avg_call_seconds = 0.8 * queue.avg_call_seconds + 0.2 * (time.monotonic() - started)
+            self._release(queue)
+
+    async def _wait(self, queue: _ModelQueue, uid: str, deadline: float) -> None:
+        remaining = deadline - time.monotonic()
+        expected = queue.expected_wait()
+        reason = "queue_full" if self._queued() >= self.max_queued else "deadline" if expected > remaining else None
+        if reason:
+            queue.rejected[reason] = queue.rejected.get(reason, 0) + 1
+            raise AdmissionRejected(reason, expected)
+
+        future = asyncio.get_running_loop().create_future()
+        queue.waiters.setdefault(uid, deque()).append(future)
+        queue.queued += 1
+        queue.max_queued_seen = max(queue.max_queued_seen, queue.queued)
+        try:
+            await asyncio.wait_for(future, timeout=remaining)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            queue.remove(uid, future)
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the caller gave up; pass it on.
+                self._release(queue)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            queue.rejected["deadline"] = queue.rejected.get("deadline", 0) + 1
+            raise AdmissionRejected("deadline", queue.expected_wait()) from None
+
+    def _release(self, queue: _ModelQueue) -> None:
+        """Hands the slot to the next waiting user, or frees it."""
+        waiter = queue.next_waiter()
+        if waiter is None:
+            queue.in_flight -= 1
+        else:
+            waiter.set_result(True)
+
+    def stats(self) -> dict:
+        """Returns per-model in-flight and queued calls, admissions, rejections and queue wait percentiles (ms)."""
+        models = {}
+        for model, queue in self._models.items():
+            models[model] = {
+                "in_flight": queue.in_flight,
+                "max_in_flight": queue.max_in_flight,
+                "queued": queue.queued,
+                "max_queued_seen": queue.max_queued_seen,
+                "admitted": queue.admitted,
+                "rejected": dict(queue.rejected),
+                "wait_p50_ms": percentile(queue.waits, 50) * 1000,
+                "wait_p95_ms": percentile(queue.waits, 95) * 1000,
+                "avg_call_ms": queue.avg_call_seconds * 1000,
+            }
+        return {"rate_limited": self.rate_limited, "queued": self._queued(), "models": models}
+
+
+# Create the single controller shared by the API and the model router.
+admission_controller = AdmissionController()
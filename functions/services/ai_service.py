@@ -4,73 +4,330 @@
 This service acts as a dedicated client for interacting with the Perplexity API.
 It encapsulates all the logic for making API calls to Perplexity, serving as
 the 'companyDeepDive' tool for our AI agents.
+
+Calls go over one pooled, HTTP/2-capable async connection, with a cap on
+concurrent requests, jittered retries on 429/5xx, and a circuit breaker that
+fails fast while Perplexity is unhealthy. Company research changes slowly and
+many users apply to the same employers, so results are cached per company.
 """
 
-# 1. Import our custom secret service to securely fetch the API key.
-from functions.services.secret_service import get_secret
+# 1. Import necessary libraries, our custom secret service to securely fetch the
+#    API key, and the registry that creates the client lazily on first use.
+import asyncio
+import json
+import random
+import time
+from collections import OrderedDict
+
+import httpx
+
+from functions.config import (
+    COMPANY_RESEARCH_CACHE_MAX_ENTRIES,
+    COMPANY_RESEARCH_CACHE_TTL_SECONDS,
+    PERPLEXITY_BACKOFF_BASE_SECONDS,
+    PERPLEXITY_BACKOFF_MAX_SECONDS,
+    PERPLEXITY_BASE_URL,
+    PERPLEXITY_CIRCUIT_FAILURE_THRESHOLD,
+    PERPLEXITY_CIRCUIT_RESET_SECONDS,
+    PERPLEXITY_MAX_CONCURRENCY,
+    PERPLEXITY_MAX_CONNECTIONS,
+    PERPLEXITY_MAX_RETRIES,
+    PERPLEXITY_MODEL,
+    PERPLEXITY_TIMEOUT_SECONDS,
+)
+from functions.services.circuit_breaker import CircuitBreaker
+from functions.services.secret_service import get_secret, secret_provider
+from functions.services.registry import services
+from functions.services.telemetry import telemetry
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+DEEP_DIVE_PROMPT = """
+    Research the company "{company_name}" for a job applicant preparing for an interview.
+    Return ONLY a JSON object with the keys "culture" (string), "recent_news" (string)
+    and "values" (array of strings).
+"""
+
+
+class PerplexityError(Exception):
+    """Raised when the Perplexity API cannot answer a request."""
+
+
+def _company_key(company_name: str) -> str:
+    """Normalizes a company name so "Acme Inc" and " acme  inc " share a cache entry."""
+    return " ".join(company_name.lower().split())
+
 
-# 2. Fetch the API key when the application starts.
-#    If the key is not found, the get_secret function will raise an error,
-#    preventing the application from starting in an invalid state.
-PERPLEXITY_API_KEY = get_secret("PERPLEXITY_API_KEY")
+def _parse_deep_dive(company_name: str, content: str) -> dict:
+    """Extracts the JSON object from the model's answer, tolerating code fences and surrounding text."""
+    start, end = content.find("{"), content.rfind("}")
+    if start == -1 or end < start:
+        raise PerplexityError("Perplexity response did not contain a JSON object.")
+    try:
+        data = json.loads(content[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise PerplexityError(f"Could not decode Perplexity response: {e}") from e
+    values = data.get("values") or []
+    return {
+        "name": company_name,
+        "culture": str(data.get("culture", "")),
+        "recent_news": str(data.get("recent_news", "")),
+        "values": [str(value) for value in values] if isinstance(values, list) else [str(values)],
+    }
 
 
 class PerplexityClient:
     """A client class to encapsulate all Perplexity API operations."""
-    
-    def __init__(self, api_key: str):
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = PERPLEXITY_BASE_URL,
+        model: str = PERPLEXITY_MODEL,
+        timeout_seconds: float = PERPLEXITY_TIMEOUT_SECONDS,
+        max_connections: int = PERPLEXITY_MAX_CONNECTIONS,
+        max_concurrency: int = PERPLEXITY_MAX_CONCURRENCY,
+        max_retries: int = PERPLEXITY_MAX_RETRIES,
+        backoff_base_seconds: float = PERPLEXITY_BACKOFF_BASE_SECONDS,
+        backoff_max_seconds: float = PERPLEXITY_BACKOFF_MAX_SECONDS,
+        cache_ttl_seconds: float = COMPANY_RESEARCH_CACHE_TTL_SECONDS,
+        cache_max_entries: int = COMPANY_RESEARCH_CACHE_MAX_ENTRIES,
+        circuit_breaker: CircuitBreaker | None = None,
+        http2: bool = True,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
         """
         Initializes the Perplexity client.
-        
+
         Args:
             api_key: The API key for authenticating with the Perplexity API.
-        
+            base_url: The API root; point it at a local stub server for tests and benchmarks.
+            model: The Perplexity model used for company research.
+            timeout_seconds: Timeout for a single HTTP attempt.
+            max_connections: Size of the keep-alive connection pool.
+            max_concurrency: The most requests in flight at once; others wait their turn.
+            max_retries: Retries after the first attempt on 429/5xx and network errors.
+            backoff_base_seconds: Base of the exponential backoff between retries.
+            backoff_max_seconds: Upper bound of a single backoff.
+            cache_ttl_seconds: How long a company's research is reused.
+            cache_max_entries: The most companies kept in the cache.
+            circuit_breaker: The breaker guarding calls (a default one is created if omitted).
+            http2: Negotiate HTTP/2 so concurrent requests share one connection.
+            transport: An httpx transport to send requests through instead of the network
+                (e.g. an in-process fake for benchmarks).
+
         Raises:
             ValueError: If the API key is not provided.
         """
         if not api_key:
             raise ValueError("Perplexity API key is missing. The ai_service cannot be initialized.")
-        
+
         self.api_key = api_key
-        # In a real application, you might initialize a session object here.
-        # e.g., self.session = requests.Session()
-        # self.session.headers.update({"Authorization": f"Bearer {self.api_key}"})
-        
+        self.model = model
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.cache_max_entries = cache_max_entries
+        self.circuit_breaker = circuit_breaker or CircuitBreaker(
+            "perplexity",
+            failure_threshold=PERPLEXITY_CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout_seconds=PERPLEXITY_CIRCUIT_RESET_SECONDS,
+        )
+
+        # One pooled client for the whole process; connections are kept alive between calls.
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            http2=http2,
+            timeout=timeout_seconds,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            transport=transport,
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        # company key -> (result, expiry timestamp), least recently used first.
+        self._cache: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+        # Research currently being fetched, so concurrent requests for one company share it.
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.requests = 0
+        self.retries = 0
+
         print("PerplexityClient initialized successfully.")
 
-    def company_deep_dive(self, company_name: str) -> dict:
+    def set_api_key(self, api_key: str) -> None:
+        """Switches later requests to a rotated API key."""
+        self.api_key = api_key
+        self.http.headers["Authorization"] = f"Bearer {api_key}"
+
+    def _backoff(self, attempt: int, retry_after: str | None) -> float:
+        """Returns the delay before retry number `attempt` (full jitter, honouring Retry-After)."""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max_seconds)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt))
+
+    async def _chat(self, prompt: str) -> str:
+        """Sends one chat completion request with retries and returns the answer text."""
+        payload = {"model": self.model, "messages": [{"role": "user", "content": prompt}]}
+        for attempt in range(self.max_retries + 1):
+            self.circuit_breaker.before_call()
+            retry_after = None
+            try:
+                async with self._semaphore:
+                    self.requests += 1
+                    with telemetry.span("perplexity.chat", attempt=attempt + 1) as span:
+                        response = await self.http.post("/chat/completions", json=payload)
+                        span["http_status"] = response.status_code
+            except httpx.TimeoutException as e:
+                # A timed-out attempt has used up the research step's deadline (see
+                # COMPANY_RESEARCH_TIMEOUT_SECONDS); a retry could never finish inside it.
+                self.circuit_breaker.record_failure()
+                raise PerplexityError(f"Perplexity request timed out: {e!r}") from e
+            except httpx.TransportError as e:
+                self.circuit_breaker.record_failure()
+                error = PerplexityError(f"Perplexity request failed: {e!r}")
+            except BaseException:
+                # Cancelled (e.g. by the caller's deadline) or an unexpected error: count it as
+                # a failure, which also ends a half-open trial so the circuit cannot stay open forever.
+                self.circuit_breaker.record_failure()
+                raise
+            else:
+                if response.status_code < 400:
+                    try:
+                        content = response.json()["choices"][0]["message"]["content"]
+                    except (ValueError, LookupError, TypeError) as e:
+                        # A 2xx without a usable answer is a provider failure, not a success.
+                        self.circuit_breaker.record_failure()
+                        raise PerplexityError(f"Perplexity returned an unexpected response body: {e!r}") from e
+                    self.circuit_breaker.record_success()
+                    return content
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    # A client error means the request is wrong, not that Perplexity is unhealthy.
+                    self.circuit_breaker.record_success()
+                    raise PerplexityError(f"Perplexity returned HTTP {response.status_code}: {response.text[:200]}")
+                self.circuit_breaker.record_failure()
+                retry_after = response.headers.get("Retry-After")
+                error = PerplexityError(f"Perplexity returned HTTP {response.status_code}.")
+
+            if attempt == self.max_retries:
+                raise error
+            delay = self._backoff(attempt, retry_after)
+            print(f"WARN: {error} Retrying in {delay:.2f}s (attempt {attempt + 2}/{self.max_retries + 1}).")
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def _cached(self, key: str) -> dict | None:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if time.time() >= entry[1]:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry[0]
+
+    def _store(self, key: str, result: dict) -> None:
+        self._cache[key] = (result, time.time() + self.cache_ttl_seconds)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_max_entries:
+            self._cache.popitem(last=False)
+
+    async def company_deep_dive(self, company_name: str) -> dict:
         """
         Performs an in-depth search on a company using the Perplexity API.
         This method acts as a "tool" for our Genkit agents.
 
-        NOTE: This is a MOCK implementation. To enable this feature, you must
-        provide a valid PERPLEXITY_API_KEY and implement the API call below.
+        Args:
+            company_name: The employer to research.
+
+        Returns:
+            A dictionary with the company's "name", "culture", "recent_news" and "values".
+
+        Raises:
+            PerplexityError: If the API fails after all retries or returns an unusable answer.
+            CircuitOpenError: If Perplexity has been failing and calls are currently suspended.
         """
-        print("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
-        print("!!! WARNING: Using mock data for Perplexity API call.       !!!")
-        print("!!! To implement, provide a PERPLEXITY_API_KEY and          !!!")
-        print("!!! implement the API call in ai_service.py.                !!!")
-        print("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
-        print(f"MOCK-CALL: Performing deep dive for company: '{company_name}'...")
-        
-        # This is a placeholder for the actual API call.
-        response_data = {
-            "name": company_name,
-            "culture": "Reported to have a highly collaborative and innovative environment with a strong focus on professional development.",
-            "recent_news": "Recently secured Series B funding to expand their NDIS support services in Western Australia.",
-            "values": ["Client-First", "Integrity", "Community Impact", "Excellence"]
+        key = _company_key(company_name)
+        cached = self._cached(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+
+        # Concurrent requests for one company share a single fetch. It runs as its own
+        # task, so a caller that is cancelled (e.g. by its step deadline) neither cancels
+        # it for the others nor stops it from filling the cache.
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+            print(f"Performing deep dive for company: '{company_name}'...")
+            pending = self._in_flight[key] = asyncio.ensure_future(self._fetch(key, company_name))
+            pending.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(pending)
+
+    async def _fetch(self, key: str, company_name: str) -> dict:
+        content = await self._chat(DEEP_DIVE_PROMPT.format(company_name=company_name))
+        result = _parse_deep_dive(company_name, content)
+        self._store(key, result)
+        return result
+
+    def _forget(self, key: str, done: asyncio.Future) -> None:
+        del self._in_flight[key]
+        # Mark the exception as retrieved in case every caller had stopped waiting.
+        if not done.cancelled():
+            done.exception()
+
+    def stats(self) -> dict:
+        """Returns request, retry and cache counters plus the circuit state."""
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_hit_rate": self.cache_hits / lookups if lookups else 0.0,
+            "cached_companies": len(self._cache),
+            "circuit_state": self.circuit_breaker.state,
         }
-        
-        return response_data
-
-
-# 3. Create a single, reusable instance of the client for the entire application.
-#    Your flows and other services will import this 'perplexity_client' object.
-#    This pattern is called a "singleton" and is very efficient.
-try:
-    perplexity_client = PerplexityClient(api_key=PERPLEXITY_API_KEY)
-except ValueError as e:
-    # If the client fails to initialize (e.g., missing API key),
-    # log the error and set the client to None.
-    print(f"FATAL ERROR: Failed to initialize PerplexityClient: {e}")
-    perplexity_client = None
\ No newline at end of file
+
+    async def close(self) -> None:
+        """Closes the pooled HTTP connections."""
+        await self.http.aclose()
+
+
+# 2. Register a single, reusable instance of the client for the entire application.
+#    The API key is fetched (and the client created) on first use or during the
+#    startup warm-up, not at import time. Flows await `get_perplexity_client()`.
+def _create_perplexity_client() -> PerplexityClient | None:
+    try:
+        client = PerplexityClient(api_key=get_secret("PERPLEXITY_API_KEY"))
+    except ValueError as e:
+        # If the client fails to initialize (e.g., missing API key),
+        # log the error and use None for the client.
+        print(f"FATAL ERROR: Failed to initialize PerplexityClient: {e}")
+        return None
+    # Rotated keys are applied to the existing client.
+    secret_provider.on_change("PERPLEXITY_API_KEY", client.set_api_key)
+    return client
+
+
+services.register("perplexity", _create_perplexity_client)
+
+
+async def get_perplexity_client() -> PerplexityClient | None:
+    """Returns the shared PerplexityClient, creating it in a worker thread on first use."""
+    return await services.aget("perplexity")
+
+
+async def close_perplexity_client() -> None:
+    """Closes the shared client's connections if it was ever created (called on shutdown)."""
+    if services.is_initialized("perplexity"):
+        client = services.get("perplexity")
+        if client is not None:
+            await client.close()
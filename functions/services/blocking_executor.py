@@ -0,0 +1,71 @@
+# functions/services/blocking_executor.py
+
+"""
+This module runs blocking SDK calls (Pinecone, Firestore, ...) off the event loop.
+
+Each `BlockingExecutor` owns a bounded thread pool, so a slow backend can only
+ever tie up its own workers, and every call carries a timeout. When the
+awaiting coroutine times out or is cancelled, calls that have not started yet
+are withdrawn from the queue; calls that are already running finish in their
+worker thread, but their results are discarded.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BlockingExecutor:
+    """Runs synchronous callables on a dedicated, bounded thread pool."""
+
+    def __init__(self, name: str, max_workers: int, default_timeout: float | None = None):
+        """
+        Initializes the executor.
+
+        Args:
+            name: A short label used for worker thread names and log messages.
+            max_workers: The maximum number of calls that may run concurrently.
+            default_timeout: Seconds to wait for a call when `run` is not given a timeout.
+
+        Raises:
+            ValueError: If `max_workers` is not positive.
+        """
+        if max_workers < 1:
+            raise ValueError(f"BlockingExecutor '{name}' needs at least one worker.")
+
+        self.name = name
+        self.max_workers = max_workers
+        self.default_timeout = default_timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.in_flight = 0
+
+    async def run(self, fn, *args, timeout: float | None = None, **kwargs):
+        """
+        Runs `fn(*args, **kwargs)` in the pool and awaits its result.
+
+        Args:
+            fn: The blocking callable to run.
+            timeout: Seconds to wait before giving up; falls back to `default_timeout`.
+
+        Returns:
+            Whatever `fn` returns.
+
+        Raises:
+            asyncio.TimeoutError: If the call does not finish within the timeout.
+            asyncio.CancelledError: If the awaiting task is cancelled.
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        future = self._pool.submit(functools.partial(fn, *args, **kwargs))
+        self.in_flight += 1
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # Withdraw the call if it is still queued; a running call cannot be interrupted.
+            future.cancel()
+            raise
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Stops accepting work and cancels calls that have not started yet."""
+        self._pool.shutdown(wait=wait, cancel_futures=True)
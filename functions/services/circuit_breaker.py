@@ -0,0 +1,77 @@
+# functions/services/circuit_breaker.py
+
+"""
+A minimal circuit breaker for outbound API calls.
+
+After `failure_threshold` consecutive failures the circuit "opens" and calls
+fail fast for `reset_timeout_seconds`, so a struggling upstream is not hammered
+with retries and requests do not queue up behind it. Once the timeout has
+passed a single trial call is let through ("half-open"); it closes the circuit
+on success or re-opens it on failure (a cancelled trial counts as a failure).
+"""
+
+import time
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+class CircuitBreaker:
+    """Tracks consecutive failures of one upstream and decides whether to call it."""
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout_seconds: float):
+        """
+        Initializes a closed circuit.
+
+        Args:
+            name: The upstream name, used in log messages.
+            failure_threshold: Consecutive failures that open the circuit.
+            reset_timeout_seconds: How long the circuit stays open before a trial call.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        """Returns "closed", "open" or "half-open"."""
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout_seconds:
+            return "half-open"
+        return "open"
+
+    def before_call(self) -> None:
+        """
+        Checks whether a call may proceed.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a trial call already running.
+        """
+        state = self.state
+        if state == "open" or (state == "half-open" and self._trial_in_flight):
+            retry_in = self.reset_timeout_seconds - (time.monotonic() - self.opened_at)
+            raise CircuitOpenError(f"Circuit for '{self.name}' is open; retry in {max(0.0, retry_in):.1f}s.")
+        if state == "half-open":
+            self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        """Closes the circuit."""
+        if self.opened_at is not None:
+            print(f"Circuit for '{self.name}' closed again.")
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        """Counts a failure and opens the circuit once the threshold is reached."""
+        self.consecutive_failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.consecutive_failures >= self.failure_threshold:
+            if self.opened_at is None:
+                print(f"WARN: Circuit for '{self.name}' opened after {self.consecutive_failures} consecutive failures.")
+            self.opened_at = time.monotonic()
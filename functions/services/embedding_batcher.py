@@ -0,0 +1,110 @@
+# functions/services/embedding_batcher.py
+
+"""
+A micro-batcher for embedding requests.
+
+Concurrent `embed` calls are gathered for at most `max_wait_seconds` (or until
+`max_batch_size` texts are waiting) and sent to the embedder as one batched
+call. Each caller then receives its own vector. At peak this replaces many
+small embedding API calls with a few larger ones, which cuts per-request
+overhead and keeps us further away from the embedder's rate limits.
+"""
+
+import asyncio
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent single-text embedding requests into batched embedder calls."""
+
+    def __init__(self, embed_batch, max_batch_size: int, max_wait_seconds: float):
+        """
+        Initializes the batcher.
+
+        Args:
+            embed_batch: An async callable taking a list of texts and returning one vector per text.
+            max_batch_size: The largest number of texts sent in a single embedder call.
+            max_wait_seconds: How long the first request in a batch waits for company.
+
+        Raises:
+            ValueError: If `max_batch_size` is not positive.
+        """
+        if max_batch_size < 1:
+            raise ValueError("EmbeddingBatcher needs a max_batch_size of at least 1.")
+
+        self.embed_batch = embed_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+        self.requests = 0
+        self.batches = 0
+
+    async def embed(self, text: str) -> list[float]:
+        """
+        Queues `text` for the next batch and waits for its vector.
+
+        Args:
+            text: The text to embed.
+
+        Returns:
+            The embedding vector for `text`.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        self.requests += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_seconds, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        """Sends everything that is currently waiting as one batch."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+        # Keep a reference so the task is not garbage-collected while it runs.
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: list[tuple[str, asyncio.Future]]) -> None:
+        """Embeds one batch (de-duplicating identical texts) and resolves the waiting futures."""
+        # Callers that were cancelled while waiting no longer need a vector.
+        batch = [(text, future) for text, future in batch if not future.done()]
+        if not batch:
+            return
+
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+        self.batches += 1
+        try:
+            vectors = await self.embed_batch(unique_texts)
+            if len(vectors) != len(unique_texts):
+                raise ValueError(f"Embedder returned {len(vectors)} vectors for {len(unique_texts)} texts.")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_text = dict(zip(unique_texts, vectors))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+
+    def stats(self) -> dict:
+        """Returns how many requests were served and how many embedder calls they needed."""
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "average_batch_size": self.requests / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,208 @@
+# functions/services/embedding_cache.py
+
+"""
+A two-tier cache for text embeddings.
+
+The first tier is an in-process LRU bounded by a byte budget. The optional
+second tier is a persistent SQLite file (e.g. under /tmp on Cloud Functions,
+or a mounted volume locally) that survives worker restarts. Entries are keyed
+by (model, sha256 of the normalized text) and stored as packed float32
+arrays, which take a quarter of the memory of a Python list of floats.
+"""
+
+# 1. Import necessary libraries
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+# Rough per-entry bookkeeping cost (key string, tuple, OrderedDict node) counted against the budget.
+_ENTRY_OVERHEAD_BYTES = 200
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes text so trivially different inputs share a cache entry."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def embedding_key(model: str, text: str) -> str:
+    """Builds the cache key for `text` embedded with `model`."""
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+class SqliteEmbeddingStore:
+    """A persistent key -> float32 blob store backed by a local SQLite file; expired rows are purged periodically."""
+
+    def __init__(self, path: str, ttl_seconds: float, purge_interval_seconds: float = 60 * 60):
+        """
+        Opens (or creates) the SQLite store.
+
+        Args:
+            path: The database file path.
+            ttl_seconds: How long a stored embedding stays valid.
+            purge_interval_seconds: How often writes also delete the expired rows.
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.purge_interval_seconds = purge_interval_seconds
+        self.purged = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_created_at ON embeddings (created_at)")
+        self._conn.commit()
+        # Purge whatever expired while the file was not in use.
+        self._purged_at = 0.0
+        with self._lock:
+            self._purge_expired()
+
+    def get(self, key: str) -> bytes | None:
+        """Returns the stored float32 bytes for `key`, or None if missing or expired."""
+        with self._lock:
+            row = self._conn.execute("SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl_seconds:
+            return None
+        return row[0]
+
+    def put(self, key: str, vector: bytes) -> None:
+        """Stores (or replaces) the float32 bytes for `key`."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+                (key, vector, time.time()),
+            )
+            if time.time() - self._purged_at >= self.purge_interval_seconds:
+                self._purge_expired()
+            self._conn.commit()
+
+    def _purge_expired(self) -> None:
+        """Deletes the expired rows; the caller holds the lock."""
+        now = time.time()
+        deleted = self._conn.execute("DELETE FROM embeddings WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        self._conn.commit()
+        self._purged_at = now
+        if deleted:
+            self.purged += deleted
+            print(f"Purged {deleted} expired embedding(s) from '{self.path}'.")
+
+
+class EmbeddingCache:
+    """An LRU + TTL embedding cache with an optional persistent second tier."""
+
+    def __init__(self, max_bytes: int, ttl_seconds: float, store: SqliteEmbeddingStore | None = None):
+        """
+        Initializes the cache.
+
+        Args:
+            max_bytes: The memory budget for cached vectors in this process.
+            ttl_seconds: How long an entry stays valid in memory.
+            store: An optional persistent store consulted on in-memory misses.
+        """
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.store = store
+
+        # Maps key -> (float32 vector, expiry timestamp), least recently used first.
+        self._entries: OrderedDict[str, tuple[array, float]] = OrderedDict()
+        self.current_bytes = 0
+
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _entry_size(vector: array) -> int:
+        return len(vector) * vector.itemsize + _ENTRY_OVERHEAD_BYTES
+
+    def _remember(self, key: str, vector: array) -> None:
+        """Adds a vector to the in-memory tier, evicting the least recently used entries."""
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.current_bytes -= self._entry_size(previous[0])
+
+        self._entries[key] = (vector, time.time() + self.ttl_seconds)
+        self.current_bytes += self._entry_size(vector)
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.current_bytes -= self._entry_size(evicted)
+            self.evictions += 1
+
+    async def get(self, model: str, text: str) -> array | None:
+        """
+        Looks up the embedding of `text` for `model`.
+
+        Returns:
+            The cached float32 vector, or None on a miss.
+        """
+        key = embedding_key(model, text)
+        entry = self._entries.get(key)
+        if entry is not None:
+            vector, expires_at = entry
+            if time.time() < expires_at:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+            del self._entries[key]
+            self.current_bytes -= self._entry_size(vector)
+            self.expirations += 1
+
+        if self.store is not None:
+            try:
+                blob = await asyncio.to_thread(self.store.get, key)
+            except sqlite3.Error as e:
+                print(f"WARN: Could not read embedding from '{self.store.path}'. Error: {e}")
+                blob = None
+            if blob is not None:
+                vector = array("f")
+                vector.frombytes(blob)
+                self._remember(key, vector)
+                self.store_hits += 1
+                return vector
+
+        self.misses += 1
+        return None
+
+    async def put(self, model: str, text: str, embedding) -> array:
+        """
+        Stores an embedding in both tiers.
+
+        Args:
+            embedding: The vector as any iterable of floats.
+
+        Returns:
+            The packed float32 copy that was cached.
+        """
+        key = embedding_key(model, text)
+        vector = array("f", embedding)
+        self._remember(key, vector)
+        if self.store is not None:
+            try:
+                await asyncio.to_thread(self.store.put, key, vector.tobytes())
+            except sqlite3.Error as e:
+                print(f"WARN: Could not persist embedding to '{self.store.path}'. Error: {e}")
+        return vector
+
+    def stats(self) -> dict:
+        """Returns the cache counters and current memory usage."""
+        lookups = self.hits + self.store_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": (self.hits + self.store_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,147 @@
+# functions/services/embedding_service.py
+
+"""
+This service turns text into vector embeddings with a Genkit embedder.
+
+All embedding requests in the application go through here so they share one
+`EmbeddingCache`: regenerating documents against the same job description
+reuses the stored vector instead of paying for the same embedding again.
+Concurrent requests for the same text are collapsed into a single call, and
+concurrent requests for different texts are gathered by an `EmbeddingBatcher`.
+The Genkit embedder embeds one text per call, so each batch is sent as
+concurrent single-text calls.
+"""
+
+# 1. Import necessary libraries
+import asyncio
+
+import genkit
+
+from functions.config import (
+    EMBEDDING_BATCH_MAX_SIZE,
+    EMBEDDING_BATCH_MAX_WAIT_MS,
+    EMBEDDING_CACHE_DB_PATH,
+    EMBEDDING_CACHE_MAX_BYTES,
+    EMBEDDING_CACHE_PURGE_INTERVAL_SECONDS,
+    EMBEDDING_CACHE_TTL_SECONDS,
+    EMBEDDING_MODEL,
+)
+from functions.services.embedding_batcher import EmbeddingBatcher
+from functions.services.embedding_cache import EmbeddingCache, SqliteEmbeddingStore, embedding_key
+from functions.services.telemetry import telemetry
+
+
+class EmbeddingService:
+    """Embeds text with a Genkit embedder, backed by a two-tier embedding cache."""
+
+    def __init__(
+        self,
+        model: str,
+        cache: EmbeddingCache,
+        max_batch_size: int = 1,
+        max_wait_seconds: float = 0.0,
+        get_embedder=None,
+    ):
+        """
+        Initializes the embedding service.
+
+        Args:
+            model: The name of the Genkit embedder to use.
+            cache: The cache consulted before calling the embedder.
+            max_batch_size: The most texts sent to the embedder in one call.
+            max_wait_seconds: How long a cache miss waits for other misses to batch with.
+            get_embedder: Returns an embedder for a name (`genkit.get_embedder` by default).
+        """
+        self.model = model
+        self.cache = cache
+        self.get_embedder = get_embedder
+        self.batcher = EmbeddingBatcher(
+            self._embed_batch,
+            max_batch_size=max_batch_size,
+            max_wait_seconds=max_wait_seconds,
+        )
+        # Embeddings currently being computed, keyed like the cache, so duplicate requests share them.
+        self._in_flight: dict[str, asyncio.Future] = {}
+
+    async def _embed_batch(self, texts: list[str]) -> list[list[float]]:
+        """Embeds a batch of texts, bypassing the cache."""
+        print(f"Generating embeddings for a batch of {len(texts)} text(s)...")
+        # Assumes a Google embedding model is configured in the environment.
+        # The embedder takes a single text, so the batch's texts are embedded concurrently.
+        embedder = (self.get_embedder or genkit.get_embedder)(self.model)
+        with telemetry.span("embedding.embed_batch", labels={"model": self.model}, texts=len(texts)):
+            return list(await asyncio.gather(*(embedder.embed(text) for text in texts)))
+
+    async def _compute(self, text: str) -> list[float]:
+        """Embeds a single cache miss as part of the next micro-batch."""
+        return await self.batcher.embed(text)
+
+    async def embed(self, text: str) -> list[float]:
+        """
+        Returns the embedding for `text`, using the cache when possible.
+
+        Args:
+            text: The text to embed.
+
+        Returns:
+            The embedding vector.
+        """
+        cached = await self.cache.get(self.model, text)
+        if cached is not None:
+            return cached.tolist()
+
+        # Duplicate requests share one computation. It runs as its own task, so a caller
+        # that is cancelled (e.g. by its step deadline) does not cancel it for the others.
+        key = embedding_key(self.model, text)
+        pending = self._in_flight.get(key)
+        if pending is None:
+            pending = self._in_flight[key] = asyncio.ensure_future(self._compute_and_store(text))
+            pending.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(pending)
+
+    async def _compute_and_store(self, text: str) -> list[float]:
+        embedding = await self._compute(text)
+        vector = await self.cache.put(self.model, text, embedding)
+        return vector.tolist()
+
+    def _forget(self, key: str, done: asyncio.Future) -> None:
+        del self._in_flight[key]
+        # Mark the exception as retrieved in case every caller had stopped waiting.
+        if not done.cancelled():
+            done.exception()
+
+    async def embed_many(self, texts: list[str]) -> list[list[float]]:
+        """
+        Returns embeddings for several texts, sending all cache misses in batched calls.
+
+        Args:
+            texts: The texts to embed.
+
+        Returns:
+            One embedding vector per input text, in the same order.
+        """
+        return list(await asyncio.gather(*(self.embed(text) for text in texts)))
+
+
+# 2. Create the shared cache and service instances.
+#    The persistent tier is only enabled when EMBEDDING_CACHE_DB_PATH is set.
+embedding_store = (
+    SqliteEmbeddingStore(
+        EMBEDDING_CACHE_DB_PATH,
+        ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS,
+        purge_interval_seconds=EMBEDDING_CACHE_PURGE_INTERVAL_SECONDS,
+    )
+    if EMBEDDING_CACHE_DB_PATH
+    else None
+)
+embedding_cache = EmbeddingCache(
+    max_bytes=EMBEDDING_CACHE_MAX_BYTES,
+    ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS,
+    store=embedding_store,
+)
+embedding_service = EmbeddingService(
+    model=EMBEDDING_MODEL,
+    cache=embedding_cache,
+    max_batch_size=EMBEDDING_BATCH_MAX_SIZE,
+    max_wait_seconds=EMBEDDING_BATCH_MAX_WAIT_MS / 1000,
+)
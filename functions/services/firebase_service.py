@@ -4,31 +4,210 @@
 This service manages all interactions with Google Cloud Firestore.
 It handles initializing the Firebase Admin SDK and provides methods
 for database operations like saving and retrieving document metadata.
+
+Generated documents are saved write-behind: the caller gets the document ID
+immediately and the writes are committed in batches in the background.
+Document listings are paginated with opaque cursors, can be limited to a few
+fields so large bodies are never read, run on a bounded thread pool, and are
+cached per user until that user saves a new document. Documents can also be
+created with a caller-chosen ID exactly once (used to de-duplicate background
+jobs), read and updated individually.
 """
 
 # 1. Import necessary libraries
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+
 import firebase_admin
 from firebase_admin import credentials, firestore
 from datetime import datetime
+from google.api_core.exceptions import AlreadyExists
+
+from functions.config import (
+    DOCUMENT_LIST_CACHE_MAX_USERS,
+    DOCUMENT_LIST_CACHE_TTL_SECONDS,
+    DOCUMENT_LIST_DEFAULT_PAGE_SIZE,
+    DOCUMENT_LIST_MAX_PAGE_SIZE,
+    FIRESTORE_QUERY_CONCURRENCY,
+    FIRESTORE_QUERY_TIMEOUT_SECONDS,
+    FIRESTORE_WRITE_BACKOFF_BASE_SECONDS,
+    FIRESTORE_WRITE_BATCH_MAX_SIZE,
+    FIRESTORE_WRITE_DRAIN_TIMEOUT_SECONDS,
+    FIRESTORE_WRITE_FLUSH_INTERVAL_SECONDS,
+    FIRESTORE_WRITE_MAX_RETRIES,
+)
+from functions.services.blocking_executor import BlockingExecutor
+from functions.services.registry import services
+from functions.services.telemetry import telemetry
+from functions.services.write_behind import WriteBehindQueue
 
-# 2. Initialize the Firebase Admin SDK
+
+# 2. Initialize the Firebase Admin SDK (lazily, through the service registry)
 # The 'if not firebase_admin._apps:' check is a crucial best practice.
 # It prevents the SDK from being re-initialized on every "warm" invocation
 # of the Cloud Function, which would cause errors.
-if not firebase_admin._apps:
-    # In the cloud, this initializes with default credentials.
-    # For local development, you must set the GOOGLE_APPLICATION_CREDENTIALS
-    # environment variable to point to your service account key file.
-    firebase_admin.initialize_app()
+def _initialize_firebase_app() -> firebase_admin.App:
+    if not firebase_admin._apps:
+        # In the cloud, this initializes with default credentials.
+        # For local development, you must set the GOOGLE_APPLICATION_CREDENTIALS
+        # environment variable to point to your service account key file.
+        firebase_admin.initialize_app()
+    return firebase_admin.get_app()
+
 
 # 3. Get a client instance for the Firestore database
 # This object will be used for all our database operations.
-db = firestore.client()
+def _create_firestore_client():
+    return firestore.client(app=services.get("firebase_app"))
+
+
+services.register("firebase_app", _initialize_firebase_app)
+services.register("firestore", _create_firestore_client)
+
+
+def encode_cursor(created_at: datetime, doc_id: str) -> str:
+    """Encodes the position after a document as an opaque, URL-safe page cursor."""
+    raw = json.dumps({"created_at": created_at.isoformat(), "id": doc_id}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """
+    Decodes a cursor produced by `encode_cursor`.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(data["created_at"]), data["id"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid page cursor: {e}") from e
+
+
+class DocumentListCache:
+    """
+    A per-user read-through cache of listing pages, with a TTL and LRU eviction by user.
+
+    Each invalidation starts a new generation for the user; a page read from Firestore is
+    only cached if no invalidation happened since its query started (see `generation`), so
+    a query racing a write cannot cache a page without the new document.
+    """
+
+    def __init__(self, ttl_seconds: float, max_users: int):
+        """
+        Initializes the cache.
+
+        Args:
+            ttl_seconds: How long a cached page is served.
+            max_users: The most users whose pages are kept; the least recently used are dropped.
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        # user_id -> {page key -> (page, expiry timestamp)}, least recently used user first.
+        self._pages: OrderedDict[str, dict] = OrderedDict()
+        # Invalidations are numbered from one counter; user_id -> the number of their latest one,
+        # for the most recently invalidated users. Older users are treated as invalidated at
+        # `_forgotten_generation`, which can only make a page skip the cache, never serve stale data.
+        self._generation = 0
+        self._invalidated: OrderedDict[str, int] = OrderedDict()
+        self._forgotten_generation = 0
+        # Saves made through the blocking `save_document_metadata` invalidate from worker threads.
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_puts = 0
+
+    def get(self, user_id: str, key: tuple) -> dict | None:
+        with self._lock:
+            entry = self._pages.get(user_id, {}).get(key)
+            if entry is None or time.time() >= entry[1]:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._pages.move_to_end(user_id)
+            return entry[0]
+
+    def generation(self) -> int:
+        """Returns the current generation; take it before querying and pass it to `put`."""
+        return self._generation
+
+    def put(self, user_id: str, key: tuple, page: dict, generation: int) -> None:
+        """Caches a page queried at `generation`, unless the user's pages were invalidated since."""
+        with self._lock:
+            if self._invalidated.get(user_id, self._forgotten_generation) > generation:
+                self.stale_puts += 1
+                return
+            self._pages.setdefault(user_id, {})[key] = (page, time.time() + self.ttl_seconds)
+            self._pages.move_to_end(user_id)
+            while len(self._pages) > self.max_users:
+                self._pages.popitem(last=False)
+
+    def invalidate(self, user_id: str) -> None:
+        """Drops every cached page of a user, and any page whose query is still running."""
+        with self._lock:
+            self._pages.pop(user_id, None)
+            self._generation += 1
+            self._invalidated[user_id] = self._generation
+            self._invalidated.move_to_end(user_id)
+            while len(self._invalidated) > self.max_users:
+                _, forgotten = self._invalidated.popitem(last=False)
+                self._forgotten_generation = max(self._forgotten_generation, forgotten)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "stale_puts": self.stale_puts,
+            "users": len(self._pages),
+        }
 
 
 class FirebaseService:
     """A client class to encapsulate all Firestore database operations."""
 
+    def __init__(
+        self,
+        db,
+        list_cache: DocumentListCache | None = None,
+        executor: BlockingExecutor | None = None,
+        write_queue: WriteBehindQueue | None = None,
+    ):
+        """
+        Initializes the service.
+
+        Args:
+            db: The Firestore client used for all operations.
+            list_cache: The cache for document listings (a default one is created if omitted).
+            executor: The thread pool running Firestore reads (a default one is created if omitted).
+            write_queue: The write-behind queue for `enqueue_document_metadata` (a default one is created if omitted).
+        """
+        self.db = db
+        self.write_queue = write_queue or WriteBehindQueue(
+            db,
+            max_batch_size=FIRESTORE_WRITE_BATCH_MAX_SIZE,
+            flush_interval_seconds=FIRESTORE_WRITE_FLUSH_INTERVAL_SECONDS,
+            max_retries=FIRESTORE_WRITE_MAX_RETRIES,
+            backoff_base_seconds=FIRESTORE_WRITE_BACKOFF_BASE_SECONDS,
+        )
+        self.list_cache = list_cache or DocumentListCache(
+            ttl_seconds=DOCUMENT_LIST_CACHE_TTL_SECONDS,
+            max_users=DOCUMENT_LIST_CACHE_MAX_USERS,
+        )
+        self.executor = executor or BlockingExecutor(
+            name="firestore",
+            max_workers=FIRESTORE_QUERY_CONCURRENCY,
+            default_timeout=FIRESTORE_QUERY_TIMEOUT_SECONDS,
+        )
+
+    def _documents(self, user_id: str):
+        return self.db.collection('users').document(user_id).collection('documents')
+
     def save_document_metadata(self, user_id: str, document_data: dict) -> str:
         """
         Saves metadata for a generated document to a user's collection in Firestore.
@@ -43,13 +222,15 @@ class FirebaseService:
         try:
             # Create a reference to a new document in the user's 'documents' subcollection.
             # Firestore will automatically generate a unique ID for this document.
-            doc_ref = db.collection('users').document(user_id).collection('documents').document()
+            doc_ref = self._documents(user_id).document()
             
             # Add a server-side timestamp to the data
             document_data['created_at'] = datetime.utcnow()
             
             # Set the data for the new document
             doc_ref.set(document_data)
+            # The user's cached listings no longer include the newest document.
+            self.list_cache.invalidate(user_id)
             
             print(f"Successfully saved document metadata for user '{user_id}' with doc ID '{doc_ref.id}'")
             return doc_ref.id
@@ -57,9 +238,105 @@ class FirebaseService:
             print(f"FATAL ERROR: Could not save document metadata for user '{user_id}'. Error: {e}")
             raise
 
+    def enqueue_document_metadata(self, user_id: str, document_data: dict) -> str:
+        """
+        Queues metadata for a generated document to be saved in the background.
+        Unlike `save_document_metadata`, this never waits on Firestore; the write is
+        committed with others in a batch, and retried if Firestore is unavailable.
+
+        Args:
+            user_id: The UID of the user who owns the document.
+            document_data: A dictionary containing the metadata to save.
+
+        Returns:
+            The ID the document will have in Firestore (allocated client-side).
+        """
+        doc_ref = self._documents(user_id).document()
+        document_data['created_at'] = datetime.utcnow()
+        # Drop cached listings now and again once the write lands, so a listing read in
+        # between cannot stay cached without the new document.
+        self.list_cache.invalidate(user_id)
+        return self.write_queue.enqueue(doc_ref, document_data, on_committed=lambda: self.list_cache.invalidate(user_id))
+
+    def _create_document(self, user_id: str, document_data: dict, document_id: str | None) -> tuple[dict, bool]:
+        """Creates a document unless one with `document_id` already exists (blocking)."""
+        docs_ref = self._documents(user_id)
+        doc_ref = docs_ref.document(document_id) if document_id else docs_ref.document()
+        now = datetime.utcnow()
+        document_data = {**document_data, 'created_at': now, 'updated_at': now}
+        try:
+            # create() fails if the document exists, so concurrent duplicates cannot both win.
+            doc_ref.create(document_data)
+        except AlreadyExists:
+            existing = doc_ref.get().to_dict() or {}
+            existing['id'] = doc_ref.id
+            return existing, False
+        return {**document_data, 'id': doc_ref.id}, True
+
+    async def create_document(self, user_id: str, document_data: dict, document_id: str | None = None) -> tuple[dict, bool]:
+        """
+        Creates a document in the user's collection, at most once per `document_id`.
+
+        Args:
+            user_id: The UID of the user who owns the document.
+            document_data: The fields to store ('created_at' and 'updated_at' are added).
+            document_id: A caller-chosen ID (e.g. derived from an idempotency key);
+                None lets Firestore allocate one.
+
+        Returns:
+            A tuple of (the document's data including its "id", True if it was created
+            or False if a document with `document_id` already existed and was returned instead).
+        """
+        with telemetry.span("firestore.create_document") as span:
+            document, created = await self.executor.run(self._create_document, user_id, document_data, document_id)
+            span["created"] = created
+        if created:
+            # On the event loop, like every other use of the listing cache.
+            self.list_cache.invalidate(user_id)
+        return document, created
+
+    def _update_document(self, user_id: str, document_id: str, document_data: dict) -> None:
+        """Merges fields into an existing document (blocking)."""
+        self._documents(user_id).document(document_id).set(
+            {**document_data, 'updated_at': datetime.utcnow()},
+            merge=True,
+        )
+
+    async def update_document(self, user_id: str, document_id: str, document_data: dict) -> None:
+        """
+        Merges `document_data` into one of the user's documents and refreshes its 'updated_at'.
+
+        Args:
+            user_id: The UID of the user who owns the document.
+            document_id: The document to update.
+            document_data: The fields to set; other fields are kept.
+        """
+        with telemetry.span("firestore.update_document"):
+            await self.executor.run(self._update_document, user_id, document_id, document_data)
+        self.list_cache.invalidate(user_id)
+
+    def _get_document(self, user_id: str, document_id: str) -> dict | None:
+        """Reads one document (blocking)."""
+        snapshot = self._documents(user_id).document(document_id).get()
+        if not snapshot.exists:
+            return None
+        doc_data = snapshot.to_dict()
+        doc_data['id'] = snapshot.id
+        return doc_data
+
+    async def get_document(self, user_id: str, document_id: str) -> dict | None:
+        """
+        Reads one of the user's documents.
+
+        Returns:
+            The document's data including its "id", or None if it does not exist.
+        """
+        return await self.executor.run(self._get_document, user_id, document_id)
+
     def get_user_documents(self, user_id: str) -> list[dict]:
         """
-        Retrieves all document metadata for a specific user.
+        Retrieves all document metadata for a specific user (blocking).
+        Reads every document in full; prefer the paginated `list_user_documents`.
 
         Args:
             user_id: The UID of the user whose documents to retrieve.
@@ -68,7 +345,7 @@ class FirebaseService:
             A list of dictionaries, where each dictionary is a document's metadata.
         """
         try:
-            docs_ref = db.collection('users').document(user_id).collection('documents')
+            docs_ref = self._documents(user_id)
             docs = docs_ref.stream() # stream() returns an iterator of DocumentSnapshot
             
             document_list = []
@@ -83,5 +360,84 @@ class FirebaseService:
             print(f"ERROR: Could not retrieve documents for user '{user_id}'. Error: {e}")
             return []
 
-# Create a single, reusable instance of the service for the entire application.
-firebase_service = FirebaseService()
\ No newline at end of file
+    def _query_page(self, user_id: str, page_size: int, cursor: str | None, fields: tuple[str, ...] | None) -> dict:
+        """Reads one listing page from Firestore (blocking)."""
+        docs_ref = self._documents(user_id)
+        query = (
+            docs_ref
+            .order_by('created_at', direction=firestore.Query.DESCENDING)
+            .order_by('__name__', direction=firestore.Query.DESCENDING)
+        )
+        if fields is not None:
+            # The cursor of the next page is built from 'created_at', so it is always read.
+            query = query.select(sorted(set(fields) | {'created_at'}))
+        if cursor is not None:
+            created_at, doc_id = decode_cursor(cursor)
+            query = query.start_after({'created_at': created_at, '__name__': docs_ref.document(doc_id)})
+        # Read one extra document to learn whether there is a next page.
+        snapshots = list(query.limit(page_size + 1).stream())
+
+        documents = []
+        for doc in snapshots[:page_size]:
+            doc_data = doc.to_dict()
+            doc_data['id'] = doc.id
+            documents.append(doc_data)
+        next_cursor = None
+        if len(snapshots) > page_size:
+            last = documents[-1]
+            next_cursor = encode_cursor(last['created_at'], last['id'])
+        return {"documents": documents, "next_cursor": next_cursor}
+
+    async def list_user_documents(
+        self,
+        user_id: str,
+        page_size: int = DOCUMENT_LIST_DEFAULT_PAGE_SIZE,
+        cursor: str | None = None,
+        fields: list[str] | None = None,
+    ) -> dict:
+        """
+        Lists a user's documents, newest first, one page at a time.
+
+        Args:
+            user_id: The UID of the user whose documents to list.
+            page_size: The number of documents per page (at most DOCUMENT_LIST_MAX_PAGE_SIZE).
+            cursor: The `next_cursor` of the previous page, or None for the first page.
+            fields: Only read these fields (e.g. ["title", "created_at"]) so large bodies
+                are skipped; None reads whole documents.
+
+        Returns:
+            A dictionary with "documents" (each including its "id") and "next_cursor",
+            which is None on the last page.
+
+        Raises:
+            ValueError: If the page size or cursor is invalid.
+        """
+        if not 1 <= page_size <= DOCUMENT_LIST_MAX_PAGE_SIZE:
+            raise ValueError(f"page_size must be between 1 and {DOCUMENT_LIST_MAX_PAGE_SIZE}.")
+        if cursor is not None:
+            decode_cursor(cursor)
+        fields_key = tuple(sorted(fields)) if fields is not None else None
+
+        key = (page_size, cursor, fields_key)
+        page = self.list_cache.get(user_id, key)
+        if page is None:
+            generation = self.list_cache.generation()
+            page = await self.executor.run(self._query_page, user_id, page_size, cursor, fields_key)
+            self.list_cache.put(user_id, key, page, generation)
+            print(f"Retrieved {len(page['documents'])} documents for user '{user_id}'")
+        return {"documents": list(page["documents"]), "next_cursor": page["next_cursor"]}
+
+# Register a single, reusable instance of the service for the entire application.
+# It is created on first use (or during the startup warm-up), not at import time.
+services.register("firebase_service", lambda: FirebaseService(db=services.get("firestore")))
+
+
+async def get_firebase_service() -> FirebaseService:
+    """Returns the shared FirebaseService, creating it in a worker thread on first use."""
+    return await services.aget("firebase_service")
+
+
+async def drain_document_writes() -> None:
+    """Commits every queued write-behind save (called on shutdown)."""
+    if services.is_initialized("firebase_service"):
+        await services.get("firebase_service").write_queue.drain(timeout=FIRESTORE_WRITE_DRAIN_TIMEOUT_SECONDS)
@@ -0,0 +1,195 @@
+# functions/services/gemini_context_cache.py
+
+"""
+Gemini context caching for the Genkit models.
+
+Genkit's model objects have no API for the provider's context cache, so the
+model router would always send whole prompts. This module wraps a Genkit
+model with the methods `functions.flows.context_cache` looks for: prefixes are
+stored through the Gemini API's `cachedContents` resource, and a call that
+references one is sent straight to `generateContent` (or
+`streamGenerateContent`) with only the prompt's suffix. Calls without a cache
+still go through Genkit unchanged.
+
+The wrapper is only used when a Gemini API key is set in the environment (the
+same variables the Genkit Google AI plugin reads) and the context cache is
+enabled; otherwise the plain Genkit model is returned and every prompt is sent
+inline.
+"""
+
+# 1. Import necessary libraries and the registry that creates the client lazily on first use.
+import json
+import os
+import types
+
+import genkit
+import httpx
+
+from functions.config import (
+    CONTEXT_CACHE_ENABLED,
+    GEMINI_API_BASE_URL,
+    GEMINI_API_KEY_ENV_VARS,
+    GEMINI_CACHE_MIN_PREFIX_TOKENS,
+    GEMINI_CACHE_MODEL_VERSIONS,
+    GEMINI_TIMEOUT_SECONDS,
+)
+from functions.services.registry import services
+
+
+class GeminiCacheError(Exception):
+    """Raised when the Gemini API rejects a context cache or a call that uses one."""
+
+
+class _Result:
+    """A generation result or stream chunk with the `text()` and `usage` the model router reads."""
+
+    def __init__(self, response: dict):
+        candidates = response.get("candidates") or [{}]
+        parts = (candidates[0].get("content") or {}).get("parts") or []
+        self._text = "".join(part.get("text", "") for part in parts)
+        usage = response.get("usageMetadata") or {}
+        self.usage = types.SimpleNamespace(
+            input_tokens=usage.get("promptTokenCount"),
+            output_tokens=usage.get("candidatesTokenCount"),
+            cached_content_tokens=usage.get("cachedContentTokenCount"),
+        )
+
+    def text(self) -> str:
+        return self._text
+
+
+class GeminiCacheClient:
+    """Calls the Gemini API's context cache and cached-generation endpoints over one pooled connection."""
+
+    def __init__(self, api_key: str, base_url: str = GEMINI_API_BASE_URL, timeout_seconds: float = GEMINI_TIMEOUT_SECONDS,
+                 transport: httpx.AsyncBaseTransport | None = None):
+        """
+        Initializes the client.
+
+        Args:
+            api_key: A Gemini API key.
+            base_url: The API root (including the version).
+            timeout_seconds: Timeout for cache requests; generations use the router's deadline.
+            transport: An httpx transport to send requests through instead of the network.
+
+        Raises:
+            ValueError: If the API key is not provided.
+        """
+        if not api_key:
+            raise ValueError("Gemini API key is missing. Context caching is disabled.")
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout_seconds,
+            headers={"x-goog-api-key": api_key},
+            transport=transport,
+        )
+        print("GeminiCacheClient initialized successfully.")
+
+    async def _post(self, path: str, payload: dict, timeout=httpx.USE_CLIENT_DEFAULT) -> dict:
+        response = await self.http.post(path, json=payload, timeout=timeout)
+        if response.status_code >= 400:
+            raise GeminiCacheError(f"Gemini API returned HTTP {response.status_code}: {response.text[:200]}")
+        return response.json()
+
+    async def create(self, model: str, prefix: str, ttl_seconds: float) -> str:
+        """Stores `prefix` as a cached content for `model`; returns its name ("cachedContents/...")."""
+        payload = {
+            "model": f"models/{model}",
+            "contents": [{"role": "user", "parts": [{"text": prefix}]}],
+            "ttl": f"{int(ttl_seconds)}s",
+        }
+        return (await self._post("/cachedContents", payload))["name"]
+
+    async def delete(self, name: str) -> None:
+        response = await self.http.delete(f"/{name}")
+        if response.status_code >= 400 and response.status_code != 404:
+            raise GeminiCacheError(f"Gemini API returned HTTP {response.status_code}: {response.text[:200]}")
+
+    async def generate(self, model: str, prompt: str, cached_content: str) -> _Result:
+        payload = {"cachedContent": cached_content, "contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        # No client-side timeout: the model router bounds every call with its tier's deadline.
+        return _Result(await self._post(f"/models/{model}:generateContent", payload, timeout=httpx.Timeout(None)))
+
+    async def generate_stream(self, model: str, prompt: str, cached_content: str):
+        payload = {"cachedContent": cached_content, "contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        async with self.http.stream(
+            "POST", f"/models/{model}:streamGenerateContent", params={"alt": "sse"}, json=payload,
+            timeout=httpx.Timeout(None),
+        ) as response:
+            if response.status_code >= 400:
+                body = (await response.aread()).decode("utf-8", "replace")
+                raise GeminiCacheError(f"Gemini API returned HTTP {response.status_code}: {body[:200]}")
+            async for line in response.aiter_lines():
+                if line.startswith("data: "):
+                    yield _Result(json.loads(line[len("data: "):]))
+
+    async def close(self) -> None:
+        """Closes the pooled HTTP connections."""
+        await self.http.aclose()
+
+
+class CacheableModel:
+    """
+    A Genkit model with context caching. `generate` and `generate_stream` accept a
+    `cached_content` name; without one they are Genkit's own. Anything else is
+    delegated to the Genkit model.
+    """
+
+    min_cache_tokens = GEMINI_CACHE_MIN_PREFIX_TOKENS
+
+    def __init__(self, name: str, model, client: GeminiCacheClient):
+        self.name = name
+        # Explicit caches need a stable model version rather than a "-latest" alias.
+        self.cache_model = GEMINI_CACHE_MODEL_VERSIONS.get(name, name)
+        self.model = model
+        self.client = client
+
+    def __getattr__(self, attribute):
+        return getattr(self.model, attribute)
+
+    async def create_cache(self, prefix: str, ttl_seconds: float) -> str:
+        return await self.client.create(self.cache_model, prefix, ttl_seconds)
+
+    async def delete_cache(self, name: str) -> None:
+        await self.client.delete(name)
+
+    async def generate(self, prompt: str, cached_content: str | None = None):
+        if cached_content is None:
+            return await self.model.generate(prompt)
+        return await self.client.generate(self.cache_model, prompt, cached_content)
+
+    def generate_stream(self, prompt: str, cached_content: str | None = None):
+        if cached_content is None:
+            return self.model.generate_stream(prompt)
+        return self.client.generate_stream(self.cache_model, prompt, cached_content)
+
+
+# 2. Register a single, reusable client. It is None (and context caching is off) when
+#    caching is disabled or no Gemini API key is set.
+def _create_gemini_cache_client() -> GeminiCacheClient | None:
+    if not CONTEXT_CACHE_ENABLED:
+        return None
+    api_key = next((os.environ[name] for name in GEMINI_API_KEY_ENV_VARS if os.environ.get(name)), None)
+    try:
+        return GeminiCacheClient(api_key=api_key)
+    except ValueError as e:
+        print(f"WARN: {e}")
+        return None
+
+
+services.register("gemini_cache", _create_gemini_cache_client)
+
+
+def get_model(name: str):
+    """Returns the Genkit model `name`, with context caching when a Gemini API key is available."""
+    model = genkit.get_model(name)
+    client = services.get("gemini_cache")
+    return model if client is None else CacheableModel(name, model, client)
+
+
+async def close_gemini_cache_client() -> None:
+    """Closes the shared client's connections if it was ever created (called on shutdown)."""
+    if services.is_initialized("gemini_cache"):
+        client = services.get("gemini_cache")
+        if client is not None:
+            await client.close()
@@ -0,0 +1,291 @@
+# functions/services/ingestion_service.py
+
+"""
+This service populates a user's vector namespace with their documents (RAG ingestion).
+
+A document (resume, past cover letter, ...) is split into chunks at paragraph
+and sentence boundaries. Every chunk is identified by a hash of its content,
+so duplicate chunks are stored once and, when a document is edited, only the
+chunks whose text changed are embedded and upserted; chunks that disappeared
+are deleted. A per-document manifest remembers which chunk IDs are in the
+index. Chunks are embedded in windows through the shared embedding service
+(cached and micro-batched) while the previous window is being upserted in
+bulk, so large documents stream through the pipeline.
+"""
+
+# 1. Import necessary libraries
+import asyncio
+import hashlib
+import re
+import time
+from datetime import datetime
+
+from functions.config import (
+    INGEST_CHUNK_MAX_CHARS,
+    INGEST_CHUNK_MIN_CHARS,
+    INGEST_EMBED_WINDOW,
+    PINECONE_DELETE_BATCH_SIZE,
+    PINECONE_UPSERT_BATCH_SIZE,
+)
+from functions.services.embedding_cache import normalize_text
+from functions.services.embedding_service import embedding_service
+from functions.services.registry import services
+# Registers the lazily-initialized "retriever" and "firestore" services used below.
+import functions.services.firebase_service
+import functions.services.vector_db_service
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# A chunk may end after a piece whose hash is divisible by this, once it holds INGEST_CHUNK_MIN_CHARS.
+_BOUNDARY_MODULUS = 3
+
+
+def _pieces(text: str, max_chars: int) -> list[str]:
+    """Splits text into paragraphs, then sentences, then fixed-size slices, each at most `max_chars`."""
+    pieces = []
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            pieces.extend(sentence[i:i + max_chars] for i in range(0, len(sentence), max_chars))
+    return pieces
+
+
+def chunk_text(text: str, min_chars: int = INGEST_CHUNK_MIN_CHARS, max_chars: int = INGEST_CHUNK_MAX_CHARS) -> list[str]:
+    """
+    Splits a document into chunks of at most `max_chars` characters.
+
+    Pieces (paragraphs or sentences) are packed together, and a chunk is closed after a
+    piece whose content hash marks a boundary. Boundaries therefore depend on the text
+    around them rather than on everything before them, so an edit only changes the
+    chunks near it.
+
+    Args:
+        text: The document text.
+        min_chars: The smallest chunk that may be closed at a content-defined boundary.
+        max_chars: The largest chunk.
+
+    Returns:
+        The chunks, in document order.
+    """
+    chunks, current = [], []
+    size = 0
+    for piece in _pieces(text, max_chars):
+        if current and size + len(piece) + 2 > max_chars:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += len(piece) + (2 if size else 0)
+        piece_hash = int.from_bytes(hashlib.sha256(piece.encode("utf-8")).digest()[:4], "big")
+        if size >= min_chars and piece_hash % _BOUNDARY_MODULUS == 0:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def validate_document_id(document_id: str) -> str:
+    """
+    Checks that a document ID can name a Firestore manifest and be used in a URL path.
+
+    Raises:
+        ValueError: If the ID is empty, contains "/", is "." or "..", or has the
+            reserved "__name__" form.
+    """
+    if not document_id or "/" in document_id or document_id in (".", "..") or (
+        document_id.startswith("__") and document_id.endswith("__")
+    ):
+        raise ValueError(
+            f"Invalid document_id '{document_id}': use a non-empty ID without '/' (e.g. a Firestore document ID)."
+        )
+    return document_id
+
+
+def chunk_id(document_id: str, chunk: str) -> str:
+    """Returns the vector ID of a chunk: the document ID plus a hash of the normalized text."""
+    return f"{document_id}:{hashlib.sha256(normalize_text(chunk).encode('utf-8')).hexdigest()[:32]}"
+
+
+class InMemoryManifestStore:
+    """Keeps ingestion manifests in memory (local development, tests and benchmarks)."""
+
+    def __init__(self):
+        self._manifests: dict[tuple[str, str], set[str]] = {}
+
+    async def get(self, user_id: str, document_id: str) -> set[str]:
+        return set(self._manifests.get((user_id, document_id), ()))
+
+    async def put(self, user_id: str, document_id: str, chunk_ids: list[str]) -> None:
+        self._manifests[(user_id, document_id)] = set(chunk_ids)
+
+    async def delete(self, user_id: str, document_id: str) -> None:
+        self._manifests.pop((user_id, document_id), None)
+
+
+class FirestoreManifestStore:
+    """Keeps ingestion manifests in `users/{uid}/ingestion/{document_id}`."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def _ref(self, user_id: str, document_id: str):
+        return self.db.collection('users').document(user_id).collection('ingestion').document(document_id)
+
+    async def get(self, user_id: str, document_id: str) -> set[str]:
+        snapshot = await asyncio.to_thread(self._ref(user_id, document_id).get)
+        return set((snapshot.to_dict() or {}).get('chunk_ids', [])) if snapshot.exists else set()
+
+    async def put(self, user_id: str, document_id: str, chunk_ids: list[str]) -> None:
+        data = {'chunk_ids': chunk_ids, 'updated_at': datetime.utcnow()}
+        await asyncio.to_thread(self._ref(user_id, document_id).set, data)
+
+    async def delete(self, user_id: str, document_id: str) -> None:
+        await asyncio.to_thread(self._ref(user_id, document_id).delete)
+
+
+def _batched(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class IngestionService:
+    """Chunks, embeds and upserts user documents, re-embedding only what changed."""
+
+    def __init__(
+        self,
+        index,
+        manifests,
+        embed_many=None,
+        embed_window: int = INGEST_EMBED_WINDOW,
+        upsert_batch_size: int = PINECONE_UPSERT_BATCH_SIZE,
+        delete_batch_size: int = PINECONE_DELETE_BATCH_SIZE,
+    ):
+        """
+        Initializes the service.
+
+        Args:
+            index: The vector index, with async `upsert(user_id, vectors)` and `delete(user_id, ids)`
+                (the configured `Retriever`).
+            manifests: Where the chunk IDs of every ingested document are remembered.
+            embed_many: An async callable embedding a list of texts (the shared embedding
+                service by default).
+            embed_window: Chunks embedded at a time.
+            upsert_batch_size: Vectors per upsert request.
+            delete_batch_size: IDs per delete request.
+        """
+        self.index = index
+        self.manifests = manifests
+        self.embed_many = embed_many or embedding_service.embed_many
+        self.embed_window = embed_window
+        self.upsert_batch_size = upsert_batch_size
+        self.delete_batch_size = delete_batch_size
+
+    async def _embed_and_upsert(self, user_id: str, document_id: str, chunks: list[tuple[str, int, str]], metadata: dict) -> None:
+        """Embeds chunk windows one after another while the previous window is being upserted."""
+        upserting: asyncio.Future | None = None
+        try:
+            for window in _batched(chunks, self.embed_window):
+                values = await self.embed_many([text for _, _, text in window])
+                vectors = [
+                    {
+                        "id": vector_id,
+                        "values": vector,
+                        "metadata": {**metadata, "text": text, "document_id": document_id, "chunk_index": position},
+                    }
+                    for (vector_id, position, text), vector in zip(window, values)
+                ]
+                if upserting is not None:
+                    await upserting
+                upserting = asyncio.gather(*(
+                    self.index.upsert(user_id, batch) for batch in _batched(vectors, self.upsert_batch_size)
+                ))
+            if upserting is not None:
+                await upserting
+        except BaseException:
+            if upserting is not None and not upserting.done():
+                upserting.cancel()
+            raise
+
+    async def ingest_document(self, user_id: str, document_id: str, text: str, metadata: dict | None = None) -> dict:
+        """
+        Ingests (or re-ingests after an edit) one document into the user's namespace.
+
+        Args:
+            user_id: The UID of the user; also the vector namespace.
+            document_id: A stable ID for the document, without "/" (e.g. its Firestore document ID).
+            text: The document's full text.
+            metadata: Extra metadata stored with every chunk (e.g. {"source": "resume"}).
+
+        Returns:
+            Ingestion statistics: chunk counts (total, unique, embedded, deleted, unchanged)
+            and the elapsed seconds.
+
+        Raises:
+            ValueError: If the document ID is invalid (see `validate_document_id`).
+        """
+        validate_document_id(document_id)
+        started = time.perf_counter()
+        chunks = chunk_text(text)
+
+        # Content-hash dedup: identical chunks map to the same vector ID.
+        unique: dict[str, tuple[int, str]] = {}
+        for position, chunk in enumerate(chunks):
+            unique.setdefault(chunk_id(document_id, chunk), (position, chunk))
+
+        previous = await self.manifests.get(user_id, document_id)
+        new = [(vector_id, position, chunk) for vector_id, (position, chunk) in unique.items() if vector_id not in previous]
+        stale = sorted(previous - unique.keys())
+
+        # Upsert before deleting, so the document stays searchable during the update.
+        await self._embed_and_upsert(user_id, document_id, new, metadata or {})
+        await asyncio.gather(*(self.index.delete(user_id, batch) for batch in _batched(stale, self.delete_batch_size)))
+        await self.manifests.put(user_id, document_id, sorted(unique))
+
+        stats = {
+            "chunks": len(chunks),
+            "unique_chunks": len(unique),
+            "embedded": len(new),
+            "deleted": len(stale),
+            "unchanged": len(unique) - len(new),
+            "seconds": time.perf_counter() - started,
+        }
+        print(f"Ingested document '{document_id}' for user '{user_id}': {stats}")
+        return stats
+
+    async def delete_document(self, user_id: str, document_id: str) -> int:
+        """
+        Removes every chunk of a document from the user's namespace.
+
+        Returns:
+            The number of vectors deleted.
+
+        Raises:
+            ValueError: If the document ID is invalid (see `validate_document_id`).
+        """
+        validate_document_id(document_id)
+        previous = sorted(await self.manifests.get(user_id, document_id))
+        await asyncio.gather(*(self.index.delete(user_id, batch) for batch in _batched(previous, self.delete_batch_size)))
+        await self.manifests.delete(user_id, document_id)
+        return len(previous)
+
+
+# 2. Register a single, reusable instance of the service for the entire application.
+#    It needs a working retrieval backend, so it is created on first use.
+def _create_ingestion_service() -> IngestionService:
+    retriever = services.get("retriever")
+    if retriever is None:
+        raise ValueError("Retrieval backend is not available. Documents cannot be ingested.")
+    return IngestionService(index=retriever, manifests=FirestoreManifestStore(services.get("firestore")))
+
+
+services.register("ingestion_service", _create_ingestion_service)
+
+
+async def get_ingestion_service() -> IngestionService:
+    """Returns the shared IngestionService, creating it in a worker thread on first use."""
+    return await services.aget("ingestion_service")
@@ -0,0 +1,347 @@
+# functions/services/local_vector_index.py
+
+"""
+An in-process vector index, used as a local retrieval backend.
+
+Each namespace (user) keeps its vectors L2-normalized in one contiguous
+float32 NumPy matrix, so a cosine top-k search is a single matrix-vector
+product plus `argpartition`: no network round trip, and no live Pinecone for
+local development and tests. Namespaces are persisted as `.npy` files and
+memory-mapped when loaded, so only the pages a search touches are read.
+Writes mark a namespace dirty and it is rewritten at most once every
+`flush_interval_seconds` (and on shutdown), so ingesting a document in many
+batches does not rewrite the whole namespace after every batch.
+
+Large namespaces can switch to an IVF (inverted file) mode: vectors are
+clustered with spherical k-means and a search only scores the vectors in the
+`probes` clusters closest to the query, trading a little recall for much less
+work. A change invalidates the clustering; it is rebuilt on a background thread
+(started by the next search), and searches are exhaustive until it is ready,
+so a search never waits for k-means or holds the namespace lock while it runs.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from functions.config import (
+    LOCAL_INDEX_DIR,
+    LOCAL_INDEX_FLUSH_INTERVAL_SECONDS,
+    LOCAL_INDEX_IVF_MIN_VECTORS,
+    LOCAL_INDEX_IVF_PROBES,
+    PINECONE_QUERY_CONCURRENCY,
+    PINECONE_QUERY_TIMEOUT_SECONDS,
+)
+from functions.services.blocking_executor import BlockingExecutor
+from functions.services.retriever import Retriever
+from functions.services.registry import services
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Returns the positions of the `k` highest scores, best first."""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, k)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class _IVF:
+    """Spherical k-means clusters over a namespace's rows, with one inverted list per cluster."""
+
+    def __init__(self, matrix: np.ndarray, iterations: int = 8, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        count = len(matrix)
+        self.nlist = max(1, int(np.sqrt(count)))
+        # Cluster a sample, then assign every row to its nearest centroid.
+        sample = matrix[rng.choice(count, size=min(count, self.nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=self.nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = ~np.bincount(assignment, minlength=self.nlist).astype(bool)
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = _normalize(sums)
+        self.centroids = centroids.astype(np.float32)
+
+        assignment = np.empty(count, dtype=np.int64)
+        for start in range(0, count, 65_536):
+            assignment[start:start + 65_536] = np.argmax(matrix[start:start + 65_536] @ self.centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(self.nlist + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(self.nlist)]
+
+    def candidates(self, query: np.ndarray, probes: int) -> np.ndarray:
+        nearest = _top_k(self.centroids @ query, min(probes, self.nlist))
+        return np.concatenate([self.lists[i] for i in nearest])
+
+
+class _Namespace:
+    """One user's vectors: a contiguous matrix plus IDs and metadata, row for row."""
+
+    def __init__(self, dimensions: int | None = None):
+        self.ids: list[str] = []
+        self.positions: dict[str, int] = {}
+        self.metadata: list[dict] = []
+        self.matrix = np.empty((0, dimensions or 0), dtype=np.float32)
+        self.ivf: _IVF | None = None
+        # Bumped by every change, so a clustering built from an older snapshot is discarded.
+        self.version = 0
+        self.ivf_building = False
+        self.lock = threading.Lock()
+        # Changed since it was last written to disk, and when that was (monotonic clock).
+        self.dirty = False
+        self.saved_at = time.monotonic()
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    def _reserve(self, extra: int, dimensions: int) -> None:
+        """Grows the matrix geometrically; also turns a read-only memory map into an in-memory copy."""
+        if self.matrix.shape[1] != dimensions:
+            if self.size:
+                raise ValueError(f"Expected {self.matrix.shape[1]}-dimensional vectors, got {dimensions}.")
+            self.matrix = np.empty((0, dimensions), dtype=np.float32)
+        needed = self.size + extra
+        if needed > len(self.matrix) or not self.matrix.flags.writeable:
+            grown = np.empty((max(needed, 2 * len(self.matrix), 64), dimensions), dtype=np.float32)
+            grown[:self.size] = self.matrix[:self.size]
+            self.matrix = grown
+
+    def upsert(self, vectors: list[dict]) -> None:
+        if not vectors:
+            return
+        values = _normalize(np.asarray([vector["values"] for vector in vectors], dtype=np.float32))
+        self._reserve(len(vectors), values.shape[1])
+        for vector, row in zip(vectors, values):
+            position = self.positions.get(vector["id"])
+            if position is None:
+                position = self.size
+                self.positions[vector["id"]] = position
+                self.ids.append(vector["id"])
+                self.metadata.append(vector.get("metadata", {}))
+            else:
+                self.metadata[position] = vector.get("metadata", {})
+            self.matrix[position] = row
+        self.ivf = None
+        self.version += 1
+
+    def delete(self, ids: list[str]) -> None:
+        for vector_id in ids:
+            position = self.positions.pop(vector_id, None)
+            if position is None:
+                continue
+            if not self.matrix.flags.writeable:
+                self._reserve(0, self.matrix.shape[1])
+            # Move the last row into the hole so the matrix stays contiguous.
+            last = self.size - 1
+            if position != last:
+                self.matrix[position] = self.matrix[last]
+                self.ids[position] = self.ids[last]
+                self.metadata[position] = self.metadata[last]
+                self.positions[self.ids[position]] = position
+            self.ids.pop()
+            self.metadata.pop()
+        self.ivf = None
+        self.version += 1
+
+    def needs_ivf(self, ivf_min_vectors: int | None) -> bool:
+        """Whether the namespace should be searched in IVF mode but has no current clustering."""
+        return ivf_min_vectors is not None and self.size >= ivf_min_vectors and self.ivf is None
+
+    def search(self, query: np.ndarray, top_k: int, probes: int) -> list[dict]:
+        """Searches the current clustering if there is one, otherwise every vector."""
+        if not self.size:
+            return []
+        matrix = self.matrix[:self.size]
+        if self.ivf is not None:
+            rows = self.ivf.candidates(query, probes)
+            scores = matrix[rows] @ query
+            best = rows[_top_k(scores, top_k)]
+            best_scores = matrix[best] @ query
+        else:
+            scores = matrix @ query
+            best = _top_k(scores, top_k)
+            best_scores = scores[best]
+        return [
+            {"id": self.ids[row], "score": float(score), "metadata": self.metadata[row]}
+            for row, score in zip(best.tolist(), best_scores.tolist())
+        ]
+
+
+class LocalVectorIndex(Retriever):
+    """An in-process, optionally persistent vector index with the same interface as Pinecone."""
+
+    name = "local vector index"
+
+    def __init__(
+        self,
+        directory: str | None = None,
+        ivf_min_vectors: int | None = LOCAL_INDEX_IVF_MIN_VECTORS,
+        probes: int = LOCAL_INDEX_IVF_PROBES,
+        flush_interval_seconds: float = LOCAL_INDEX_FLUSH_INTERVAL_SECONDS,
+        executor: BlockingExecutor | None = None,
+    ):
+        """
+        Initializes the index.
+
+        Args:
+            directory: Where namespaces are persisted (one sub-directory each); None keeps
+                everything in memory.
+            ivf_min_vectors: Namespaces with at least this many vectors are searched in IVF
+                mode; None always searches exhaustively.
+            probes: Clusters scored per IVF search (more is slower but more accurate).
+            flush_interval_seconds: The least time between two writes of a namespace to disk;
+                later changes stay in memory until the next write or `flush()`.
+            executor: The thread pool running searches and writes (NumPy releases the GIL).
+        """
+        self.directory = directory
+        self.ivf_min_vectors = ivf_min_vectors
+        self.probes = probes
+        self.flush_interval_seconds = flush_interval_seconds
+        self.executor = executor or BlockingExecutor(
+            name="local-index",
+            max_workers=PINECONE_QUERY_CONCURRENCY,
+            default_timeout=PINECONE_QUERY_TIMEOUT_SECONDS,
+        )
+        self.default_timeout = self.executor.default_timeout
+        self._namespaces: dict[str, _Namespace] = {}
+        self._namespaces_lock = threading.Lock()
+        # IVF rebuilds run one at a time, off the search path.
+        self._ivf_builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="local-index-ivf")
+
+    def _path(self, user_id: str) -> str:
+        return os.path.join(self.directory, user_id)
+
+    def _load(self, user_id: str) -> _Namespace:
+        """Opens a persisted namespace with its vectors memory-mapped (read-only until written)."""
+        namespace = _Namespace()
+        path = self._path(user_id) if self.directory else None
+        if path and os.path.exists(os.path.join(path, "meta.json")):
+            with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            namespace.matrix = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+            namespace.ids = meta["ids"]
+            namespace.metadata = meta["metadata"]
+            namespace.positions = {vector_id: position for position, vector_id in enumerate(namespace.ids)}
+        return namespace
+
+    def _namespace(self, user_id: str) -> _Namespace:
+        with self._namespaces_lock:
+            namespace = self._namespaces.get(user_id)
+            if namespace is None:
+                namespace = self._namespaces[user_id] = self._load(user_id)
+            return namespace
+
+    def _save(self, user_id: str, namespace: _Namespace) -> None:
+        """Writes a namespace atomically (new files, then rename). Called with its lock held."""
+        namespace.dirty = False
+        namespace.saved_at = time.monotonic()
+        if not self.directory:
+            return
+        path = self._path(user_id)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "vectors.tmp.npy"), "wb") as f:
+            np.save(f, np.ascontiguousarray(namespace.matrix[:namespace.size]))
+        with open(os.path.join(path, "meta.tmp.json"), "w", encoding="utf-8") as f:
+            json.dump({"ids": namespace.ids, "metadata": namespace.metadata}, f)
+        os.replace(os.path.join(path, "vectors.tmp.npy"), os.path.join(path, "vectors.npy"))
+        os.replace(os.path.join(path, "meta.tmp.json"), os.path.join(path, "meta.json"))
+
+    def _changed(self, user_id: str, namespace: _Namespace) -> None:
+        """Marks a namespace dirty and writes it if it has not been written for a flush interval."""
+        namespace.dirty = True
+        if time.monotonic() - namespace.saved_at >= self.flush_interval_seconds:
+            self._save(user_id, namespace)
+
+    def _flush(self) -> int:
+        with self._namespaces_lock:
+            namespaces = list(self._namespaces.items())
+        flushed = 0
+        for user_id, namespace in namespaces:
+            with namespace.lock:
+                if namespace.dirty:
+                    self._save(user_id, namespace)
+                    flushed += 1
+        return flushed
+
+    def _search(self, user_id: str, vector: list[float], top_k: int) -> list[dict]:
+        namespace = self._namespace(user_id)
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+        with namespace.lock:
+            if namespace.needs_ivf(self.ivf_min_vectors) and not namespace.ivf_building:
+                namespace.ivf_building = True
+                self._ivf_builder.submit(self._build_ivf, user_id)
+            return namespace.search(query, top_k, self.probes)
+
+    def _build_ivf(self, user_id: str) -> None:
+        """Clusters a snapshot of the namespace without holding its lock (blocking)."""
+        namespace = self._namespace(user_id)
+        try:
+            with namespace.lock:
+                version = namespace.version
+                matrix = np.array(namespace.matrix[:namespace.size])
+            ivf = _IVF(matrix) if len(matrix) else None
+            with namespace.lock:
+                # Changed while clustering: drop the result; the next search starts another build.
+                if namespace.version == version:
+                    namespace.ivf = ivf
+        except Exception as e:
+            print(f"WARN: Could not build the IVF clustering of local index namespace '{user_id}': {e}")
+        finally:
+            with namespace.lock:
+                namespace.ivf_building = False
+
+    def _upsert(self, user_id: str, vectors: list[dict]) -> None:
+        namespace = self._namespace(user_id)
+        with namespace.lock:
+            namespace.upsert(vectors)
+            self._changed(user_id, namespace)
+
+    def _delete(self, user_id: str, ids: list[str]) -> None:
+        namespace = self._namespace(user_id)
+        with namespace.lock:
+            namespace.delete(ids)
+            self._changed(user_id, namespace)
+
+    async def search(self, user_id: str, vector: list[float], top_k: int, timeout: float | None = None) -> list[dict]:
+        return await self.executor.run(self._search, user_id, vector, top_k, timeout=timeout)
+
+    async def upsert(self, user_id: str, vectors: list[dict]) -> None:
+        await self.executor.run(self._upsert, user_id, vectors)
+
+    async def delete(self, user_id: str, ids: list[str]) -> None:
+        await self.executor.run(self._delete, user_id, ids)
+
+    async def flush(self) -> int:
+        """Writes every namespace changed since it was last persisted; returns how many were written."""
+        # Not bounded by the executor's query timeout: a large namespace may take a while to write.
+        return await asyncio.to_thread(self._flush)
+
+    def count(self, user_id: str) -> int:
+        """Returns the number of vectors in the user's namespace."""
+        return self._namespace(user_id).size
+
+
+# Register the index; it is only created when RETRIEVAL_BACKEND selects it.
+services.register("local_index", lambda: LocalVectorIndex(directory=LOCAL_INDEX_DIR))
+
+
+async def flush_local_index() -> None:
+    """Persists the local index's pending changes if it was ever created (called on shutdown)."""
+    index = services.get("local_index") if services.is_initialized("local_index") else None
+    if isinstance(index, LocalVectorIndex):
+        flushed = await index.flush()
+        if flushed:
+            print(f"Flushed {flushed} local index namespace(s) to disk.")
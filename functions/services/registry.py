@@ -0,0 +1,110 @@
+# functions/services/registry.py
+
+"""
+A lazy service registry.
+
+Importing a service module only registers a factory here; nothing talks to
+Secret Manager, Pinecone or Firestore until the client is first needed. At
+startup, `warm_up` can initialize every registered client concurrently in
+worker threads, so a cold start costs roughly the slowest client instead of
+the sum of all of them. Each client is created exactly once, even when
+several requests ask for it at the same time, and the time spent creating it
+is recorded for the startup-timing report.
+"""
+
+import asyncio
+import threading
+import time
+
+
+class ServiceRegistry:
+    """Creates shared service clients on first use and remembers how long each took."""
+
+    def __init__(self):
+        self._factories: dict = {}
+        self._instances: dict = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._registry_lock = threading.Lock()
+        # name -> seconds spent in the factory, including any dependencies it created first.
+        self.timings: dict[str, float] = {}
+
+    def register(self, name: str, factory) -> None:
+        """
+        Registers a zero-argument factory for a service.
+
+        Args:
+            name: The service name used with `get`.
+            factory: A callable that creates the client. It may call `get` for the
+                services it depends on, and it runs at most once per process.
+        """
+        with self._registry_lock:
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.Lock())
+
+    def override(self, name: str, instance) -> None:
+        """Replaces a service with a ready-made instance (used by benchmarks and local fakes)."""
+        with self._registry_lock:
+            self._locks.setdefault(name, threading.Lock())
+            self._instances[name] = instance
+
+    def is_initialized(self, name: str) -> bool:
+        """Returns True if the service has already been created."""
+        return name in self._instances
+
+    def get(self, name: str):
+        """
+        Returns the service, creating it on first use (blocking).
+
+        Raises:
+            KeyError: If no factory is registered under `name`.
+        """
+        if name in self._instances:
+            return self._instances[name]
+        if name not in self._factories:
+            raise KeyError(f"No service registered under '{name}'.")
+
+        with self._locks[name]:
+            # Another thread may have finished creating it while we waited for the lock.
+            if name in self._instances:
+                return self._instances[name]
+            started = time.perf_counter()
+            instance = self._factories[name]()
+            self.timings[name] = time.perf_counter() - started
+            self._instances[name] = instance
+            return instance
+
+    async def aget(self, name: str):
+        """Returns the service, creating it in a worker thread if needed so the event loop never blocks."""
+        if name in self._instances:
+            return self._instances[name]
+        return await asyncio.to_thread(self.get, name)
+
+    async def warm_up(self, names: list[str] | None = None) -> dict[str, float]:
+        """
+        Creates the given services (all registered ones by default) concurrently.
+
+        Failures are reported but not raised, so one unavailable backend does not
+        stop the application from serving the endpoints that do not need it.
+
+        Returns:
+            The startup-timing report (see `timing_report`).
+        """
+        names = list(self._factories) if names is None else names
+        started = time.perf_counter()
+        results = await asyncio.gather(*(self.aget(name) for name in names), return_exceptions=True)
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                print(f"ERROR: Failed to initialize service '{name}' during warm-up: {result}")
+
+        report = self.timing_report()
+        report["warm_up_total"] = time.perf_counter() - started
+        print("Service startup timings: " + ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in report.items()))
+        return report
+
+    def timing_report(self) -> dict[str, float]:
+        """Returns the initialization time (in seconds) of every service created so far."""
+        return dict(sorted(self.timings.items(), key=lambda item: item[1], reverse=True))
+
+
+# Create the single registry shared by all service modules.
+services = ServiceRegistry()
@@ -0,0 +1,84 @@
+# functions/services/retriever.py
+
+"""
+The interface shared by the vector retrieval backends.
+
+Flows and the ingestion pipeline talk to a `Retriever` rather than to
+Pinecone directly, so a backend can be swapped by configuration
+(`RETRIEVAL_BACKEND`): Pinecone over the network, or the in-process
+`LocalVectorIndex`. Backends implement `search`, `upsert` and `delete`; the
+text-in, texts-out `query_for_context` used by the flows is shared.
+"""
+
+import asyncio
+from abc import ABC, abstractmethod
+
+from functions.services.embedding_service import embedding_service
+
+
+class Retriever(ABC):
+    """Abstract base class for vector retrieval backends. Each user's vectors live in their own namespace."""
+
+    name = "retriever"
+    default_timeout: float | None = None
+
+    @abstractmethod
+    async def search(self, user_id: str, vector: list[float], top_k: int, timeout: float | None = None) -> list[dict]:
+        """
+        Finds the vectors most similar to `vector` in the user's namespace.
+
+        Returns:
+            Up to `top_k` matches, best first, each a dictionary with "id", "score" and "metadata".
+        """
+
+    @abstractmethod
+    async def upsert(self, user_id: str, vectors: list[dict]) -> None:
+        """Writes vectors (dictionaries with "id", "values" and "metadata") into the user's namespace."""
+
+    @abstractmethod
+    async def delete(self, user_id: str, ids: list[str]) -> None:
+        """Deletes vectors from the user's namespace."""
+
+    async def _get_embedding(self, text: str) -> list[float]:
+        """
+        Converts text to a vector embedding via the shared, cached embedding service.
+        """
+        return await embedding_service.embed(text)
+
+    async def query_matches(self, query_text: str, user_id: str, top_k: int = 3, timeout: float | None = None,
+                            query_embedding: list[float] | None = None) -> list[dict]:
+        """
+        Embeds `query_text` (unless its `query_embedding` is given) and returns the user's
+        best matches. A slow or failing backend yields no matches rather than an error.
+        """
+        if query_embedding is None:
+            print("Generating query embedding...")
+            query_embedding = await self._get_embedding(query_text)
+
+        print(f"Querying {self.name} for user {user_id}...")
+        try:
+            matches = await self.search(user_id, query_embedding, top_k, timeout=timeout)
+            print(f"Retrieved {len(matches)} contexts from {self.name} for user {user_id}.")
+            return matches
+        except asyncio.TimeoutError:
+            print(f"WARN: {self.name} query timed out after {timeout or self.default_timeout}s. Proceeding without context.")
+            return []
+        except Exception as e:
+            print(f"An error occurred while querying {self.name}: {e}")
+            return []
+
+    async def query_for_context(self, query_text: str, user_id: str, top_k: int = 3, timeout: float | None = None) -> list[str]:
+        """
+        Retrieves the text of the user's document chunks most relevant to `query_text`.
+
+        Args:
+            query_text: The text to search for (e.g. a job description).
+            user_id: The UID of the user whose namespace is searched.
+            top_k: The number of chunks to return.
+            timeout: Seconds to wait for the backend before proceeding without context.
+
+        Returns:
+            The chunk texts, most relevant first.
+        """
+        matches = await self.query_matches(query_text, user_id, top_k=top_k, timeout=timeout)
+        return [match['metadata']['text'] for match in matches]
@@ -1,42 +1,259 @@
 # functions/services/secret_service.py
 
+"""
+This service provides the application's secrets (API keys).
+
+Values come from Google Secret Manager in production, or from a local .env
+file for development. A `SecretProvider` fetches every declared secret
+concurrently at startup, caches the values with a TTL and refreshes them in
+the background shortly before they expire, so rotated keys are picked up
+without a redeploy and request handlers never wait on Secret Manager. Clients
+that hold a key (Pinecone, Perplexity) subscribe with `on_change` and are
+given the new value when it is rotated. While Secret Manager is failing, the
+refresh is retried with exponential backoff.
+"""
+
+import asyncio
 import os
+import threading
+import time
 import google.auth
 from google.cloud import secretmanager
 from dotenv import load_dotenv
 
+from functions.config import (
+    SECRET_CACHE_TTL_SECONDS,
+    SECRET_IDS,
+    SECRET_REFRESH_MARGIN_SECONDS,
+    SECRET_REFRESH_RETRY_MAX_SECONDS,
+    SECRET_REFRESH_RETRY_SECONDS,
+)
+from functions.services.registry import services
+
 # Load .env variables for local development when this module is first imported
 load_dotenv()
 
-def get_secret(secret_id: str, is_local_dev: bool = not os.getenv("GOOGLE_CLOUD_PROJECT")) -> str:
+
+def _create_secret_manager() -> tuple[secretmanager.SecretManagerServiceClient, str]:
+    """Creates the one Secret Manager client (and resolves the project ID) shared by all lookups."""
+    _, project_id = google.auth.default()
+    return secretmanager.SecretManagerServiceClient(), project_id
+
+
+services.register("secret_manager", _create_secret_manager)
+
+
+class GcpSecretBackend:
+    """Reads the latest version of a secret from Google Secret Manager."""
+
+    def fetch(self, secret_id: str) -> str:
+        client, project_id = services.get("secret_manager")
+        name = f"projects/{project_id}/secrets/{secret_id}/versions/latest"
+        response = client.access_secret_version(request={"name": name})
+        return response.payload.data.decode("UTF-8")
+
+
+class EnvSecretBackend:
+    """Reads secrets from the environment (.env) for local development."""
+
+    def fetch(self, secret_id: str) -> str:
+        # Assumes local secrets are named like "PINECONE_API_KEY_LOCAL"
+        local_secret_name = f"{secret_id}_LOCAL"
+        secret_val = os.getenv(local_secret_name)
+        if not secret_val:
+            raise ValueError(f"Missing local secret: {local_secret_name}")
+        return secret_val
+
+
+class FakeSecretBackend:
+    """An in-memory backend for tests and benchmarks; values can be changed to simulate rotation."""
+
+    def __init__(self, values: dict[str, str], latency_seconds: float = 0.0):
+        self.values = dict(values)
+        self.latency_seconds = latency_seconds
+        self.fetches = 0
+
+    def fetch(self, secret_id: str) -> str:
+        self.fetches += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        if secret_id not in self.values:
+            raise ValueError(f"Missing fake secret: {secret_id}")
+        return self.values[secret_id]
+
+
+class SecretProvider:
+    """Caches secrets from a backend and refreshes them in the background before they expire."""
+
+    def __init__(
+        self,
+        backend,
+        secret_ids: list[str],
+        ttl_seconds: float,
+        refresh_margin_seconds: float,
+        retry_seconds: float = SECRET_REFRESH_RETRY_SECONDS,
+        retry_max_seconds: float = SECRET_REFRESH_RETRY_MAX_SECONDS,
+    ):
+        """
+        Initializes the provider.
+
+        Args:
+            backend: An object with a blocking `fetch(secret_id) -> str` method.
+            secret_ids: The secrets the application declares; they are loaded and refreshed together.
+            ttl_seconds: How long a fetched value is served before it must be fetched again.
+            refresh_margin_seconds: How long before expiry the background task refreshes a value.
+            retry_seconds: The delay before retrying a failed refresh; doubled after each failure.
+            retry_max_seconds: The longest delay between retries of a failing refresh.
+        """
+        self.backend = backend
+        self.secret_ids = list(secret_ids)
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.retry_seconds = retry_seconds
+        self.retry_max_seconds = retry_max_seconds
+
+        # secret_id -> (value, expiry timestamp)
+        self._values: dict[str, tuple[str, float]] = {}
+        # secret_id -> callbacks given the new value when it changes
+        self._listeners: dict[str, list] = {}
+        self._lock = threading.Lock()
+        self._refresh_task: asyncio.Task | None = None
+        # Consecutive background refreshes in which a secret could not be fetched.
+        self._refresh_failures = 0
+
+    def _cached(self, secret_id: str) -> str | None:
+        entry = self._values.get(secret_id)
+        if entry is not None and time.time() < entry[1]:
+            return entry[0]
+        return None
+
+    def _fetch(self, secret_id: str) -> str:
+        """Fetches one secret from the backend (blocking) and caches it."""
+        try:
+            value = self.backend.fetch(secret_id)
+        except Exception as e:
+            print(f"FATAL: Could not access secret '{secret_id}'. Error: {e}")
+            raise
+        with self._lock:
+            previous = self._values.get(secret_id)
+            self._values[secret_id] = (value, time.time() + self.ttl_seconds)
+            rotated = previous is not None and previous[0] != value
+            listeners = list(self._listeners.get(secret_id, ())) if rotated else []
+        if rotated:
+            print(f"Secret '{secret_id}' was rotated; updating {len(listeners)} client(s).")
+        for listener in listeners:
+            try:
+                listener(value)
+            except Exception as e:
+                print(f"ERROR: Could not apply the rotated secret '{secret_id}'. Error: {e}")
+        return value
+
+    def on_change(self, secret_id: str, listener) -> None:
+        """
+        Calls `listener(new_value)` whenever a refresh finds that `secret_id` changed, so
+        clients created with the old value can switch to the new one. Listeners run in a
+        worker thread.
+        """
+        with self._lock:
+            self._listeners.setdefault(secret_id, []).append(listener)
+
+    def get_sync(self, secret_id: str) -> str:
+        """
+        Returns a secret, fetching it (blocking) if it is not cached.
+        Intended for synchronous code such as service factories running in worker threads.
+        """
+        value = self._cached(secret_id)
+        return value if value is not None else self._fetch(secret_id)
+
+    async def get(self, secret_id: str) -> str:
+        """
+        Returns a secret, fetching it in a worker thread if it is not cached.
+
+        Args:
+            secret_id: The name of the secret (e.g., "PINECONE_API_KEY").
+
+        Returns:
+            The secret value as a string.
+        """
+        value = self._cached(secret_id)
+        return value if value is not None else await asyncio.to_thread(self._fetch, secret_id)
+
+    async def load_all(self, secret_ids: list[str] | None = None) -> list[str]:
+        """
+        Fetches the given (by default all declared) secrets concurrently; failures are logged.
+
+        Returns:
+            The IDs of the secrets that could not be fetched.
+        """
+        secret_ids = self.secret_ids if secret_ids is None else secret_ids
+        results = await asyncio.gather(
+            *(asyncio.to_thread(self._fetch, secret_id) for secret_id in secret_ids),
+            return_exceptions=True,
+        )
+        return [secret_id for secret_id, result in zip(secret_ids, results) if isinstance(result, BaseException)]
+
+    def _seconds_until_next_refresh(self) -> float:
+        if self._refresh_failures:
+            # The backend is failing; back off rather than retrying every second once values are due.
+            return min(self.retry_max_seconds, self.retry_seconds * 2 ** (self._refresh_failures - 1))
+        delay = self.ttl_seconds
+        if any(secret_id not in self._values for secret_id in self.secret_ids):
+            # Retry secrets that failed to load soon rather than waiting a full TTL.
+            delay = self.refresh_margin_seconds
+        if self._values:
+            earliest_expiry = min(expires_at for _, expires_at in self._values.values())
+            delay = min(delay, earliest_expiry - self.refresh_margin_seconds - time.time())
+        return max(1.0, delay)
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._seconds_until_next_refresh())
+            due = [secret_id for secret_id in self.secret_ids if secret_id not in self._values]
+            due += [
+                secret_id
+                for secret_id, (_, expires_at) in list(self._values.items())
+                if expires_at - time.time() <= self.refresh_margin_seconds
+            ]
+            # A failed refresh keeps serving the previous value until it expires.
+            failed = await self.load_all(due)
+            self._refresh_failures = self._refresh_failures + 1 if failed else 0
+
+    def start_background_refresh(self) -> None:
+        """Starts refreshing cached secrets shortly before they expire (idempotent)."""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    async def close(self) -> None:
+        """Stops the background refresh."""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+
+# Production reads from Google Secret Manager; local development reads the .env file.
+IS_LOCAL_DEV = not os.getenv("GOOGLE_CLOUD_PROJECT")
+secret_provider = SecretProvider(
+    backend=EnvSecretBackend() if IS_LOCAL_DEV else GcpSecretBackend(),
+    secret_ids=SECRET_IDS,
+    ttl_seconds=SECRET_CACHE_TTL_SECONDS,
+    refresh_margin_seconds=SECRET_REFRESH_MARGIN_SECONDS,
+)
+
+
+def get_secret(secret_id: str) -> str:
     """
     Fetches a secret from Google Secret Manager in a production environment,
-    or from a local .env file for development.
-    
+    or from a local .env file for development. Values are cached by the shared
+    `secret_provider`; async code should prefer `await secret_provider.get(...)`.
+
     Args:
         secret_id: The name of the secret to fetch (e.g., "PINECONE_API_KEY").
-        is_local_dev: Flag to force local or production mode. Defaults to checking env var.
-    
+
     Returns:
         The secret value as a string.
     """
-    if not is_local_dev:
-        # Production environment: Fetch from Google Secret Manager
-        try:
-            _, project_id = google.auth.default()
-            client = secretmanager.SecretManagerServiceClient()
-            name = f"projects/{project_id}/secrets/{secret_id}/versions/latest"
-            response = client.access_secret_version(request={"name": name})
-            return response.payload.data.decode("UTF-8")
-        except Exception as e:
-            print(f"FATAL: Could not access GCP secret '{secret_id}'. Error: {e}")
-            raise  # Re-raise the exception to stop the application
-    else:
-        # Local development: Fetch from .env file
-        # Assumes local secrets are named like "PINECONE_API_KEY_LOCAL"
-        local_secret_name = f"{secret_id}_LOCAL"
-        secret_val = os.getenv(local_secret_name)
-        if not secret_val:
-            print(f"FATAL: Local secret '{local_secret_name}' not found in .env file.")
-            raise ValueError(f"Missing local secret: {local_secret_name}")
-        return secret_val
\ No newline at end of file
+    return secret_provider.get_sync(secret_id)
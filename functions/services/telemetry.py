@@ -0,0 +1,373 @@
+# functions/services/telemetry.py
+
+"""
+Request tracing, latency metrics and sampled structured logs.
+
+Every HTTP request (and background job) runs in a trace. Code wraps the
+operations worth timing (token verification, embeddings, Pinecone queries,
+Perplexity calls, model generations, Firestore writes) in `telemetry.span`;
+each span is added to the current trace and to a latency histogram for its
+name and labels. Counters hold totals such as model tokens.
+
+Metrics are kept in process and exported in the Prometheus text format: a
+cumulative histogram per operation (for aggregating across instances) and the
+p50/p95/p99 of its recent samples. Structured logs are JSON lines (which
+Cloud Logging parses) written only for a sample of requests, decided once per
+trace, so a sampled request logs all of its entries and the rest log nothing.
+A request's span breakdown is logged when it is sampled or slow.
+"""
+
+import asyncio
+import bisect
+import contextvars
+import json
+import random
+import time
+import uuid
+import zlib
+from collections import deque
+from contextlib import contextmanager
+
+from functions.config import (
+    TELEMETRY_LATENCY_BUCKETS,
+    TELEMETRY_LOG_MAX_CHARS,
+    TELEMETRY_LOG_SAMPLE_RATE,
+    TELEMETRY_QUANTILE_SAMPLES,
+    TELEMETRY_SLOW_REQUEST_SECONDS,
+    TELEMETRY_TRACE_MAX_SPANS,
+)
+
+METRIC_PREFIX = "careerpilot_"
+QUANTILES = (0.5, 0.95, 0.99)
+_current_trace: contextvars.ContextVar["Trace | None"] = contextvars.ContextVar("telemetry_trace", default=None)
+
+
+def _status(error: BaseException | None) -> str:
+    if error is None:
+        return "ok"
+    if isinstance(error, asyncio.CancelledError):
+        return "cancelled"
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    return "error"
+
+
+def _label_text(labels: tuple) -> str:
+    def _escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+
+
+def percentile(samples, pct: float) -> float:
+    """
+    Returns the `pct` percentile (0-100) of `samples`, interpolating linearly between
+    the closest ranks; 0.0 if there are none. Shared by every latency report in the app
+    and the benchmarks, so their numbers are comparable.
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+class Trace:
+    """The spans recorded while handling one request or job."""
+
+    def __init__(self, name: str, trace_id: str, sample_rate: float, max_spans: int):
+        self.name = name
+        self.trace_id = trace_id
+        # Decided from the ID, so every log entry of the request is kept or dropped together.
+        self.sampled = zlib.crc32(trace_id.encode("utf-8")) / 2**32 < sample_rate
+        self.max_spans = max_spans
+        self.started = time.perf_counter()
+        self.labels: dict[str, str] = {}
+        # Overrides the trace's status (e.g. from the HTTP status code).
+        self.status: str | None = None
+        self.spans: list[dict] = []
+        self.dropped_spans = 0
+        self.finished = False
+
+    def add(self, name: str, seconds: float, status: str, attributes: dict) -> None:
+        # Background tasks inherit the context of the request that started them; they
+        # must not add to its trace once the request is over.
+        if self.finished:
+            return
+        if len(self.spans) >= self.max_spans:
+            self.dropped_spans += 1
+            return
+        self.spans.append({
+            "name": name,
+            "start_ms": round((time.perf_counter() - seconds - self.started) * 1000, 2),
+            "duration_ms": round(seconds * 1000, 2),
+            "status": status,
+            **attributes,
+        })
+
+
+class _Histogram:
+    def __init__(self, buckets: tuple, samples: int):
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.samples: deque[float] = deque(maxlen=samples)
+
+    def observe(self, buckets: tuple, seconds: float) -> None:
+        position = bisect.bisect_left(buckets, seconds)
+        if position < len(self.bucket_counts):
+            self.bucket_counts[position] += 1
+        self.count += 1
+        self.sum += seconds
+        self.samples.append(seconds)
+
+
+class Telemetry:
+    """Spans, latency histograms, counters and sampled structured logs, kept in process."""
+
+    def __init__(
+        self,
+        buckets: tuple = TELEMETRY_LATENCY_BUCKETS,
+        quantile_samples: int = TELEMETRY_QUANTILE_SAMPLES,
+        log_sample_rate: float = TELEMETRY_LOG_SAMPLE_RATE,
+        slow_request_seconds: float = TELEMETRY_SLOW_REQUEST_SECONDS,
+        log_max_chars: int = TELEMETRY_LOG_MAX_CHARS,
+        trace_max_spans: int = TELEMETRY_TRACE_MAX_SPANS,
+        write=print,
+    ):
+        """
+        Initializes the collector.
+
+        Args:
+            buckets: Upper bounds (seconds) of the histogram buckets, ascending.
+            quantile_samples: Recent samples kept per histogram for quantiles.
+            log_sample_rate: Fraction of traces whose structured logs are written.
+            slow_request_seconds: Traces at least this slow always log their spans.
+            log_max_chars: Longest string field written to a log entry.
+            trace_max_spans: Most spans kept per trace.
+            write: Writes one log line (print by default).
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.quantile_samples = quantile_samples
+        self.log_sample_rate = log_sample_rate
+        self.slow_request_seconds = slow_request_seconds
+        self.log_max_chars = log_max_chars
+        self.trace_max_spans = trace_max_spans
+        self.write = write
+        # (span name, sorted label pairs) -> histogram.
+        self._histograms: dict[tuple, _Histogram] = {}
+        # (counter name, sorted label pairs) -> total.
+        self._counters: dict[tuple, float] = {}
+        self.logs_written = 0
+        self.logs_dropped = 0
+
+    @contextmanager
+    def trace(self, name: str, trace_id: str | None = None, **labels):
+        """
+        Runs the block as a new trace (one request or job); spans inside it are added to it.
+        Its total duration is recorded as a span named `name` with `labels`, which the
+        block can extend through the yielded trace's `labels`.
+
+        Args:
+            name: The operation, e.g. "http.request".
+            trace_id: An ID propagated by the caller; a random one is generated otherwise.
+        """
+        trace = Trace(name, trace_id or uuid.uuid4().hex, self.log_sample_rate, self.trace_max_spans)
+        trace.labels.update(labels)
+        token = _current_trace.set(trace)
+        error = None
+        try:
+            yield trace
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current_trace.reset(token)
+            trace.finished = True
+            seconds = time.perf_counter() - trace.started
+            status = trace.status or _status(error)
+            self.record(name, seconds, status, labels=trace.labels)
+            slow = seconds >= self.slow_request_seconds
+            if trace.sampled or slow:
+                self._emit("WARNING" if slow else "INFO", "trace", trace.trace_id, {
+                    "operation": name,
+                    "duration_ms": round(seconds * 1000, 2),
+                    "status": status,
+                    **trace.labels,
+                    "spans": trace.spans,
+                    "dropped_spans": trace.dropped_spans,
+                })
+
+    @contextmanager
+    def span(self, name: str, labels: dict | None = None, **attributes):
+        """
+        Times the block as an operation of the current trace.
+
+        Args:
+            name: The operation, e.g. "pinecone.query".
+            labels: Low-cardinality dimensions of the latency histogram (e.g. the model).
+            **attributes: Details kept on the trace only (e.g. token counts).
+
+        Yields:
+            The attributes dict, which the block may add to.
+        """
+        started = time.perf_counter()
+        error = None
+        try:
+            yield attributes
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.record(name, time.perf_counter() - started, _status(error), labels=labels, **attributes)
+
+    def record(self, name: str, seconds: float, status: str = "ok", labels: dict | None = None, **attributes) -> None:
+        """Records an operation timed elsewhere, like `span`."""
+        key = (name, tuple(sorted({"status": status, **(labels or {})}.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = _Histogram(self.buckets, self.quantile_samples)
+        histogram.observe(self.buckets, seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, seconds, status, {**(labels or {}), **attributes})
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        """Adds `value` to the counter `name` (exported as `<name>_total`)."""
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def current_trace_id(self) -> str | None:
+        trace = _current_trace.get()
+        return trace.trace_id if trace is not None else None
+
+    def log(self, event: str, severity: str = "INFO", **fields) -> None:
+        """
+        Writes a structured log entry if the current trace is sampled (outside a trace,
+        entries are sampled one by one). Long string fields are truncated.
+        """
+        trace = _current_trace.get()
+        sampled = trace.sampled if trace is not None else random.random() < self.log_sample_rate
+        if not sampled:
+            self.logs_dropped += 1
+            return
+        self._emit(severity, event, trace.trace_id if trace is not None else None, fields)
+
+    def _emit(self, severity: str, event: str, trace_id: str | None, fields: dict) -> None:
+        entry = {"severity": severity, "message": event, "trace_id": trace_id}
+        for key, value in fields.items():
+            if isinstance(value, str) and len(value) > self.log_max_chars:
+                value = value[:self.log_max_chars] + f"... [{len(value) - self.log_max_chars} more chars]"
+            entry[key] = value
+        self.logs_written += 1
+        self.write(json.dumps(entry, default=str))
+
+    def prometheus(self) -> str:
+        """Renders every histogram and counter in the Prometheus text exposition format."""
+        histogram = f"{METRIC_PREFIX}span_duration_seconds"
+        summary = f"{METRIC_PREFIX}span_duration_recent_seconds"
+        lines = [
+            f"# HELP {histogram} Duration of traced operations.",
+            f"# TYPE {histogram} histogram",
+        ]
+        for (name, labels), values in sorted(self._histograms.items()):
+            label_text = _label_text((("span", name), *labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets, values.bucket_counts):
+                cumulative += count
+                lines.append(f'{histogram}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{histogram}_bucket{{{label_text},le="+Inf"}} {values.count}')
+            lines.append(f"{histogram}_sum{{{label_text}}} {values.sum}")
+            lines.append(f"{histogram}_count{{{label_text}}} {values.count}")
+
+        lines += [
+            f"# HELP {summary} Quantiles of the most recent {self.quantile_samples} durations per operation on this instance.",
+            f"# TYPE {summary} summary",
+        ]
+        for (name, labels), values in sorted(self._histograms.items()):
+            label_text = _label_text((("span", name), *labels))
+            ordered = sorted(values.samples)
+            for q in QUANTILES:
+                lines.append(f'{summary}{{{label_text},quantile="{q}"}} {percentile(ordered, q * 100)}')
+            lines.append(f"{summary}_sum{{{label_text}}} {sum(ordered)}")
+            lines.append(f"{summary}_count{{{label_text}}} {len(ordered)}")
+
+        for name in sorted({name for name, _ in self._counters}):
+            metric = f"{METRIC_PREFIX}{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (counter, labels), value in sorted(self._counters.items()):
+                if counter == name:
+                    lines.append(f"{metric}{{{_label_text(labels)}}} {value}" if labels else f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def stats(self) -> dict:
+        """Returns count, errors and p50/p95/p99 latency (ms) per operation, plus counters and log volume."""
+        spans = {}
+        for (name, labels), values in sorted(self._histograms.items()):
+            labels = dict(labels)
+            status = labels.pop("status")
+            key = name + (f"{{{_label_text(tuple(labels.items()))}}}" if labels else "")
+            entry = spans.setdefault(key, {"count": 0, "errors": 0, "samples": []})
+            entry["count"] += values.count
+            if status != "ok":
+                entry["errors"] += values.count
+            entry["samples"].extend(values.samples)
+        for entry in spans.values():
+            ordered = sorted(entry.pop("samples"))
+            for q in QUANTILES:
+                entry[f"p{int(q * 100)}_ms"] = percentile(ordered, q * 100) * 1000
+        counters = {
+            name + (f"{{{_label_text(labels)}}}" if labels else ""): value
+            for (name, labels), value in sorted(self._counters.items())
+        }
+        return {
+            "spans": spans,
+            "counters": counters,
+            "logs": {"written": self.logs_written, "dropped": self.logs_dropped},
+        }
+
+
+class TelemetryMiddleware:
+    """
+    ASGI middleware that runs each HTTP request in a trace, labelled with its route
+    template, method and status code. Unlike a response hook, it times streamed
+    responses until their last byte. A trace ID arriving in Google Cloud's
+    X-Cloud-Trace-Context header is reused, so logs line up with the platform's traces.
+    """
+
+    def __init__(self, app, collector: Telemetry | None = None):
+        self.app = app
+        self.collector = collector
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        collector = self.collector or telemetry
+        headers = dict(scope.get("headers") or ())
+        cloud_trace = headers.get(b"x-cloud-trace-context", b"").decode("latin-1")
+        trace_id = cloud_trace.split("/", 1)[0] or None
+        status_code = 500
+
+        async def _send(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        with collector.trace("http.request", trace_id=trace_id, method=scope.get("method", "")) as trace:
+            try:
+                await self.app(scope, receive, _send)
+            finally:
+                # The router stores the matched route in the scope; templates keep label cardinality low.
+                route = scope.get("route")
+                trace.labels["route"] = getattr(route, "path", None) or "unmatched"
+                trace.labels["code"] = str(status_code)
+                trace.status = "error" if status_code >= 500 else "ok"
+
+
+# Create the single collector shared by the API, flows and services.
+telemetry = Telemetry()
@@ -0,0 +1,196 @@
+# functions/services/token_service.py
+
+"""
+This service verifies Firebase ID tokens locally instead of calling the
+synchronous `firebase_admin.auth.verify_id_token` on every request.
+
+Google's public signing certificates are kept in memory for as long as their
+Cache-Control max-age allows, signature checks run in a worker thread so they
+never block the event loop, and successfully decoded tokens are kept in a
+bounded LRU cache until the token's own `exp` claim is reached.
+"""
+
+# 1. Import necessary libraries
+import asyncio
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+
+import google.auth.transport.requests
+from google.auth import jwt
+
+from functions.config import (
+    AUTH_CERTS_DEFAULT_MAX_AGE_SECONDS,
+    AUTH_CERTS_MIN_REFRESH_INTERVAL_SECONDS,
+    AUTH_CLOCK_SKEW_SECONDS,
+    AUTH_TOKEN_CACHE_MAX_ENTRIES,
+)
+
+# 2. The public endpoint that serves the X.509 certificates used to sign Firebase ID tokens.
+FIREBASE_CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+FIREBASE_ISSUER_PREFIX = "https://securetoken.google.com/"
+# Firebase ID tokens are always signed with RS256.
+FIREBASE_SIGNING_ALGORITHM = "RS256"
+
+_MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+
+class FirebaseTokenVerifier:
+    """Verifies Firebase ID tokens locally with cached signing keys and decoded claims."""
+
+    def __init__(
+        self,
+        project_id: str | None,
+        certs_url: str = FIREBASE_CERTS_URL,
+        max_cached_tokens: int = AUTH_TOKEN_CACHE_MAX_ENTRIES,
+        clock_skew_seconds: int = AUTH_CLOCK_SKEW_SECONDS,
+        min_refresh_interval_seconds: float = AUTH_CERTS_MIN_REFRESH_INTERVAL_SECONDS,
+    ):
+        """
+        Initializes the token verifier.
+
+        Args:
+            project_id: The Firebase project ID that tokens must be issued for.
+            certs_url: The URL serving Google's public signing certificates.
+            max_cached_tokens: Upper bound on the number of decoded tokens kept in memory.
+            clock_skew_seconds: Tolerance applied to the `iat` and `exp` claims.
+            min_refresh_interval_seconds: The least time between two forced certificate refreshes
+                (triggered by tokens with an unknown key ID).
+        """
+        self.project_id = project_id
+        self.certs_url = certs_url
+        self.max_cached_tokens = max_cached_tokens
+        self.clock_skew_seconds = clock_skew_seconds
+        self.min_refresh_interval_seconds = min_refresh_interval_seconds
+
+        self._certs: dict[str, str] = {}
+        self._certs_expire_at = 0.0
+        self._certs_fetched_at = 0.0
+        self._certs_lock = asyncio.Lock()
+        # Maps sha256(token) -> (decoded claims, expiry timestamp), oldest first.
+        self._token_cache: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+
+    def _fetch_certs(self) -> tuple[dict[str, str], int]:
+        """
+        Downloads the current signing certificates (blocking).
+
+        Returns:
+            A tuple of (key ID -> PEM certificate mapping, max-age in seconds).
+        """
+        request = google.auth.transport.requests.Request()
+        response = request(self.certs_url, method="GET")
+        if response.status != 200:
+            raise ValueError(f"Could not fetch Firebase signing certificates (HTTP {response.status}).")
+
+        cache_control = response.headers.get("cache-control") or response.headers.get("Cache-Control") or ""
+        match = _MAX_AGE_PATTERN.search(cache_control)
+        max_age = int(match.group(1)) if match else AUTH_CERTS_DEFAULT_MAX_AGE_SECONDS
+
+        data = response.data.decode("utf-8") if isinstance(response.data, bytes) else response.data
+        return json.loads(data), max_age
+
+    async def _get_certs(self, force_refresh: bool = False) -> dict[str, str]:
+        """
+        Returns the cached signing certificates, refreshing them once they have expired.
+        A forced refresh is skipped if the keys were fetched less than
+        `min_refresh_interval_seconds` ago.
+        """
+        if not self._stale(force_refresh):
+            return self._certs
+
+        async with self._certs_lock:
+            # Another coroutine may have refreshed the keys while we were waiting.
+            if not self._stale(force_refresh):
+                return self._certs
+            certs, max_age = await asyncio.to_thread(self._fetch_certs)
+            self._certs = certs
+            self._certs_fetched_at = time.time()
+            self._certs_expire_at = self._certs_fetched_at + max_age
+            print(f"Refreshed {len(certs)} Firebase signing keys (max-age {max_age}s).")
+            return self._certs
+
+    def _stale(self, force_refresh: bool) -> bool:
+        now = time.time()
+        if not self._certs or now >= self._certs_expire_at:
+            return True
+        return force_refresh and now - self._certs_fetched_at >= self.min_refresh_interval_seconds
+
+    def _decode(self, token: str, certs: dict[str, str]) -> dict:
+        """Checks the token signature and claims (blocking, CPU-bound)."""
+        if not self.project_id:
+            raise ValueError("Firebase project ID is not configured; cannot verify ID tokens.")
+
+        claims = jwt.decode(
+            token,
+            certs=certs,
+            audience=self.project_id,
+            clock_skew_in_seconds=self.clock_skew_seconds,
+        )
+
+        expected_issuer = FIREBASE_ISSUER_PREFIX + self.project_id
+        if claims.get("iss") != expected_issuer:
+            raise ValueError(f"Token has incorrect 'iss' claim. Expected '{expected_issuer}'.")
+        subject = claims.get("sub")
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise ValueError("Token has an invalid 'sub' claim.")
+
+        claims["uid"] = subject
+        return claims
+
+    def _cache_get(self, key: str) -> dict | None:
+        """Returns cached claims for a token hash, dropping the entry if it has expired."""
+        entry = self._token_cache.get(key)
+        if entry is None:
+            return None
+        claims, expires_at = entry
+        if time.time() >= expires_at:
+            del self._token_cache[key]
+            return None
+        self._token_cache.move_to_end(key)
+        return claims
+
+    def _cache_put(self, key: str, claims: dict) -> None:
+        """Stores decoded claims until the token's `exp`, evicting the least recently used entries."""
+        self._token_cache[key] = (claims, float(claims["exp"]))
+        self._token_cache.move_to_end(key)
+        while len(self._token_cache) > self.max_cached_tokens:
+            self._token_cache.popitem(last=False)
+
+    async def verify(self, token: str) -> dict:
+        """
+        Verifies a Firebase ID token and returns its decoded claims.
+
+        Args:
+            token: The raw ID token sent by the client.
+
+        Returns:
+            The decoded claims, with the Firebase UID available under 'uid'.
+
+        Raises:
+            ValueError: If the token is malformed, expired or not signed by Google.
+        """
+        key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        claims = self._cache_get(key)
+        if claims is not None:
+            return claims
+
+        header = jwt.decode_header(token)
+        if header.get("alg") != FIREBASE_SIGNING_ALGORITHM:
+            raise ValueError(f"Token has incorrect 'alg' header. Expected '{FIREBASE_SIGNING_ALGORITHM}'.")
+        certs = await self._get_certs()
+        key_id = header.get("kid")
+        if key_id not in certs:
+            # Google rotates its keys regularly; refresh (rate-limited) before rejecting the token.
+            certs = await self._get_certs(force_refresh=True)
+            if key_id not in certs:
+                raise ValueError(f"Token has an unknown 'kid' header '{key_id}'.")
+
+        claims = await asyncio.to_thread(self._decode, token, certs)
+        self._cache_put(key, claims)
+        return claims
+
+    def clear(self) -> None:
+        """Drops every cached token (e.g. after a user's tokens have been revoked)."""
+        self._token_cache.clear()
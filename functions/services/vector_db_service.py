@@ -5,84 +5,157 @@ This service handles all interactions with the Pinecone vector database.
 It provides an abstraction layer for querying and managing vector embeddings,
 which is essential for the RAG (Retrieval-Augmented Generation) capabilities
 of the AI agents.
+
+Pinecone is one of the `Retriever` backends; `get_retriever()` returns the one
+selected by RETRIEVAL_BACKEND (Pinecone or the in-process `LocalVectorIndex`).
 """
 
 # 1. Import necessary libraries and our custom secret service
 import pinecone
-import genkit
-from functions.services.secret_service import get_secret
+from functions.config import PINECONE_QUERY_CONCURRENCY, PINECONE_QUERY_TIMEOUT_SECONDS, RETRIEVAL_BACKEND
+from functions.services.blocking_executor import BlockingExecutor
+from functions.services.retriever import Retriever
+from functions.services.registry import services
+from functions.services.secret_service import get_secret, secret_provider
+from functions.services.telemetry import telemetry
+# Registers the "local_index" backend.
+import functions.services.local_vector_index
 
-# 2. Initialize Pinecone connection details
-PINECONE_API_KEY = get_secret("PINECONE_API_KEY")
+# 2. Pinecone connection details (the API key is fetched when the client is first created)
 PINECONE_ENVIRONMENT = "us-west1-gcp"
 PINECONE_INDEX_NAME = "career-pilot-index"
 
 
-class PineconeClient:
+class PineconeClient(Retriever):
     """A client class to encapsulate all Pinecone database operations."""
-    
-    def __init__(self, api_key: str, environment: str):
+
+    name = "Pinecone"
+
+    def __init__(self, api_key: str, environment: str, index=None):
         """
         Initializes the Pinecone client. Raises ValueError if config is missing.
+        A ready-made `index` (e.g. a benchmark fake) is used as is, without connecting.
         """
         if not api_key or not environment:
             raise ValueError("Pinecone API key and environment must be set.")
-        
-        pinecone.init(api_key=api_key, environment=environment)
-        
-        self.index = None
+
+        self.environment = environment
+        self.index = index
+        if index is None:
+            self._connect(api_key)
+
+        # The Pinecone client library is synchronous, so index calls run on a bounded
+        # thread pool instead of blocking the event loop for every other request.
+        self.executor = BlockingExecutor(
+            name="pinecone",
+            max_workers=PINECONE_QUERY_CONCURRENCY,
+            default_timeout=PINECONE_QUERY_TIMEOUT_SECONDS,
+        )
+        self.default_timeout = self.executor.default_timeout
+
+    def _connect(self, api_key: str) -> None:
+        pinecone.init(api_key=api_key, environment=self.environment)
         if PINECONE_INDEX_NAME in pinecone.list_indexes():
             self.index = pinecone.Index(PINECONE_INDEX_NAME)
             print(f"Successfully connected to Pinecone index: '{PINECONE_INDEX_NAME}'")
         else:
             print(f"WARN: Pinecone index '{PINECONE_INDEX_NAME}' not found. Queries will fail.")
 
-    async def _get_embedding(self, text: str) -> list[float]:
-        """
-        Converts text to a vector embedding using a Genkit embedder.
-        """
-        print(f"Generating embedding for text: '{text[:30]}...'")
-        # Assumes a Google embedding model is configured in the environment.
-        embedder = genkit.get_embedder("text-embedding-004")
-        result = await embedder.embed(text)
-        return result
+    def set_api_key(self, api_key: str) -> None:
+        """Reconnects with a rotated API key; the index handle is replaced once the new one is ready."""
+        self._connect(api_key)
 
-    async def query_for_context(self, query_text: str, user_id: str, top_k: int = 3) -> list[str]:
+    async def search(self, user_id: str, vector: list[float], top_k: int, timeout: float | None = None) -> list[dict]:
         """
-        Queries the Pinecone index asynchronously to retrieve relevant document chunks.
+        Queries the Pinecone index for the user's nearest vectors.
+        The index call runs on the client's thread pool and is abandoned after `timeout`
+        seconds (PINECONE_QUERY_TIMEOUT_SECONDS by default).
+
+        Raises:
+            ValueError: If the index is not available.
+            asyncio.TimeoutError: If the query does not finish in time.
         """
         if not self.index:
-            print("ERROR: Cannot query because Pinecone index is not available.")
-            return []
-
-        print("Generating query embedding...")
-        query_embedding = await self._get_embedding(query_text)
-
-        print(f"Querying Pinecone index '{PINECONE_INDEX_NAME}'...")
-        try:
-            # Note: The Pinecone client library's query method is synchronous.
-            # In a high-throughput production app, you might run this in a thread pool.
-            # For Firebase Cloud Functions, this is generally acceptable.
-            results = self.index.query(
-                vector=query_embedding,
+            raise ValueError(f"Cannot query because Pinecone index '{PINECONE_INDEX_NAME}' is not available.")
+
+        with telemetry.span("pinecone.query", top_k=top_k) as span:
+            results = await self.executor.run(
+                self.index.query,
+                vector=vector,
                 top_k=top_k,
                 include_metadata=True,
-                namespace=user_id
+                namespace=user_id,
+                timeout=timeout,
             )
-            
-            retrieved_texts = [match['metadata']['text'] for match in results['matches']]
-            print(f"Retrieved {len(retrieved_texts)} contexts from Pinecone for user {user_id}.")
-            return retrieved_texts
-            
-        except Exception as e:
-            print(f"An error occurred while querying Pinecone: {e}")
-            return []
-
-
-# 3. Create a single, reusable instance of the client for the entire application.
-#    Your flows and other services will import this 'pinecone_client' object.
-try:
-    pinecone_client = PineconeClient(api_key=PINECONE_API_KEY, environment=PINECONE_ENVIRONMENT)
-except ValueError as e:
-    print(e)
-    pinecone_client = None
\ No newline at end of file
+            span["matches"] = len(results['matches'])
+        return [
+            {"id": match['id'], "score": match['score'], "metadata": match['metadata']}
+            for match in results['matches']
+        ]
+
+    async def upsert(self, user_id: str, vectors: list[dict]) -> None:
+        """
+        Writes vectors into the user's namespace in one request.
+
+        Args:
+            user_id: The namespace to write to.
+            vectors: Dictionaries with "id", "values" and "metadata" (which must include "text").
+
+        Raises:
+            ValueError: If the index is not available.
+        """
+        if not self.index:
+            raise ValueError(f"Cannot upsert because Pinecone index '{PINECONE_INDEX_NAME}' is not available.")
+        with telemetry.span("pinecone.upsert", vectors=len(vectors)):
+            await self.executor.run(self.index.upsert, vectors=vectors, namespace=user_id)
+
+    async def delete(self, user_id: str, ids: list[str]) -> None:
+        """
+        Deletes vectors from the user's namespace in one request.
+
+        Raises:
+            ValueError: If the index is not available.
+        """
+        if not self.index:
+            raise ValueError(f"Cannot delete because Pinecone index '{PINECONE_INDEX_NAME}' is not available.")
+        with telemetry.span("pinecone.delete", ids=len(ids)):
+            await self.executor.run(self.index.delete, ids=ids, namespace=user_id)
+
+
+# 3. Register a single, reusable instance of the client for the entire application.
+#    It is created on first use (or during the startup warm-up), not at import time.
+#    Your flows and other services await `get_pinecone_client()`.
+def _create_pinecone_client() -> PineconeClient | None:
+    try:
+        client = PineconeClient(api_key=get_secret("PINECONE_API_KEY"), environment=PINECONE_ENVIRONMENT)
+    except ValueError as e:
+        print(e)
+        return None
+    # Rotated keys reconnect the existing client.
+    secret_provider.on_change("PINECONE_API_KEY", client.set_api_key)
+    return client
+
+
+services.register("pinecone", _create_pinecone_client)
+
+
+async def get_pinecone_client() -> PineconeClient | None:
+    """Returns the shared PineconeClient, creating it in a worker thread on first use."""
+    return await services.aget("pinecone")
+
+
+# 4. Register the retrieval backend the flows and the ingestion pipeline use.
+def _create_retriever() -> Retriever | None:
+    if RETRIEVAL_BACKEND == "local":
+        return services.get("local_index")
+    if RETRIEVAL_BACKEND == "pinecone":
+        return services.get("pinecone")
+    raise ValueError(f"Unknown RETRIEVAL_BACKEND '{RETRIEVAL_BACKEND}'. Use 'pinecone' or 'local'.")
+
+
+services.register("retriever", _create_retriever)
+
+
+async def get_retriever() -> Retriever | None:
+    """Returns the configured retrieval backend (None if Pinecone is selected but unavailable)."""
+    return await services.aget("retriever")
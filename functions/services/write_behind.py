@@ -0,0 +1,213 @@
+# functions/services/write_behind.py
+
+"""
+A write-behind queue for Firestore.
+
+Saves are queued in memory and the caller continues immediately with the
+document ID it pre-allocated. A background task coalesces queued saves into
+Firestore batched writes (up to 500 operations each), committing when a batch
+is full or when the oldest save has waited `flush_interval_seconds`. Failed
+commits are retried with exponential backoff and then re-queued, and `drain`
+flushes everything on shutdown so no save is lost when the instance is
+recycled.
+"""
+
+import asyncio
+import random
+import time
+
+from functions.services.blocking_executor import BlockingExecutor
+from functions.services.telemetry import telemetry
+
+# Firestore rejects batched writes with more operations than this.
+FIRESTORE_MAX_BATCH_SIZE = 500
+
+
+class WriteBehindQueue:
+    """Coalesces document writes into batched Firestore commits in the background."""
+
+    def __init__(
+        self,
+        db,
+        max_batch_size: int = FIRESTORE_MAX_BATCH_SIZE,
+        flush_interval_seconds: float = 0.5,
+        max_retries: int = 5,
+        backoff_base_seconds: float = 0.2,
+        backoff_max_seconds: float = 10.0,
+        executor: BlockingExecutor | None = None,
+    ):
+        """
+        Initializes the queue. The flusher starts with the first `enqueue`.
+
+        Args:
+            db: The Firestore client whose `batch()` is used for commits.
+            max_batch_size: Operations per batched write (at most 500).
+            flush_interval_seconds: The longest a save waits for others to batch with.
+            max_retries: Commit retries before the batch is put back and retried later.
+            backoff_base_seconds: Base of the exponential backoff between retries.
+            backoff_max_seconds: Upper bound of a single backoff.
+            executor: The thread pool running the blocking commits.
+
+        Raises:
+            ValueError: If `max_batch_size` is not between 1 and 500.
+        """
+        if not 1 <= max_batch_size <= FIRESTORE_MAX_BATCH_SIZE:
+            raise ValueError(f"max_batch_size must be between 1 and {FIRESTORE_MAX_BATCH_SIZE}.")
+
+        self.db = db
+        self.max_batch_size = max_batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.executor = executor or BlockingExecutor(name="firestore-writes", max_workers=1)
+
+        # (doc_ref, data, on_committed, enqueued_at), oldest first.
+        self._pending: list[tuple] = []
+        self._wakeup: asyncio.Event | None = None
+        self._flusher: asyncio.Task | None = None
+        self._closing = False
+
+        self.enqueued = 0
+        self.written = 0
+        self.commits = 0
+        self.retries = 0
+        self.max_write_delay_seconds = 0.0
+
+    @property
+    def pending(self) -> int:
+        """The number of saves not yet committed."""
+        return len(self._pending)
+
+    def enqueue(self, doc_ref, data: dict, on_committed=None) -> str:
+        """
+        Queues `doc_ref.set(data)` and returns immediately. Must be called from the event loop.
+
+        Args:
+            doc_ref: A document reference with its ID already allocated.
+            data: The document data.
+            on_committed: An optional callable run after the write has been committed.
+
+        Returns:
+            The document's ID.
+
+        Raises:
+            RuntimeError: If the queue has been drained for shutdown.
+        """
+        if self._closing:
+            raise RuntimeError("The write-behind queue is shutting down.")
+        self._pending.append((doc_ref, data, on_committed, time.monotonic()))
+        self.enqueued += 1
+
+        if self._flusher is None or self._flusher.done():
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+        if len(self._pending) >= self.max_batch_size:
+            self._wakeup.set()
+        return doc_ref.id
+
+    def _commit(self, writes: list[tuple]) -> None:
+        """Commits one batched write (blocking)."""
+        batch = self.db.batch()
+        for doc_ref, data, _, _ in writes:
+            batch.set(doc_ref, data)
+        batch.commit()
+
+    async def _commit_with_retries(self, writes: list[tuple]) -> bool:
+        """Commits a batch, retrying with backoff. Returns False if every attempt failed."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                with telemetry.span("firestore.batch_write", documents=len(writes), attempt=attempt + 1):
+                    await self.executor.run(self._commit, writes)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"ERROR: Batched write of {len(writes)} document(s) failed after {attempt + 1} attempts: {e}")
+                    return False
+                delay = random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt))
+                print(f"WARN: Batched write of {len(writes)} document(s) failed: {e}. Retrying in {delay:.2f}s.")
+                self.retries += 1
+                await asyncio.sleep(delay)
+            else:
+                break
+
+        now = time.monotonic()
+        self.commits += 1
+        self.written += len(writes)
+        self.max_write_delay_seconds = max(self.max_write_delay_seconds, now - writes[0][3])
+        for _, _, on_committed, _ in writes:
+            if on_committed is not None:
+                on_committed()
+        return True
+
+    async def _flush_once(self) -> bool:
+        """Commits the oldest batch of pending writes. Returns False if it had to be put back."""
+        writes = self._pending[:self.max_batch_size]
+        del self._pending[:len(writes)]
+        try:
+            if await self._commit_with_retries(writes):
+                return True
+        except asyncio.CancelledError:
+            # The commit may or may not have landed; writing the same pre-allocated
+            # document again is harmless, so keep the writes for `drain`.
+            self._pending[:0] = writes
+            raise
+        # Keep the writes (in order) and try again later rather than dropping them.
+        self._pending[:0] = writes
+        return False
+
+    async def _flush_loop(self) -> None:
+        while self._pending:
+            # Wait until the batch is full or the oldest write has waited long enough.
+            oldest_age = time.monotonic() - self._pending[0][3]
+            if len(self._pending) < self.max_batch_size and oldest_age < self.flush_interval_seconds:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval_seconds - oldest_age)
+                except asyncio.TimeoutError:
+                    pass
+            if not await self._flush_once():
+                await asyncio.sleep(self.backoff_max_seconds)
+
+    async def drain(self, timeout: float | None = None) -> None:
+        """
+        Stops accepting writes and commits everything still queued (called on shutdown).
+
+        Args:
+            timeout: Seconds to keep trying; writes still pending afterwards are reported as lost.
+        """
+        self._closing = True
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._pending and (deadline is None or time.monotonic() < deadline):
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                # A hanging commit (and its retries) must not hold shutdown past the deadline;
+                # a cancelled flush puts its writes back, so they are reported below.
+                flushed = await asyncio.wait_for(self._flush_once(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if not flushed:
+                remaining = self.backoff_base_seconds if deadline is None else max(0.0, deadline - time.monotonic())
+                await asyncio.sleep(min(self.backoff_base_seconds, remaining))
+        if self._pending:
+            lost = ", ".join(doc_ref.id for doc_ref, _, _, _ in self._pending)
+            print(f"FATAL: {len(self._pending)} queued write(s) could not be committed before shutdown: {lost}")
+        print(f"Write-behind queue drained: {self.stats()}")
+
+    def stats(self) -> dict:
+        """Returns queue and commit counters."""
+        return {
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "pending": self.pending,
+            "commits": self.commits,
+            "retries": self.retries,
+            "avg_batch_size": self.written / self.commits if self.commits else 0.0,
+            "max_write_delay_ms": self.max_write_delay_seconds * 1000,
+        }